@@ -0,0 +1,510 @@
+"""
+Settings, request parsing, writer plumbing and the routes shared by the
+HTTP API over a single dispatch service (app.api.endpoints) and over
+region-sharded dispatch (app.api.sharded).
+
+Both APIs wrap their backend, a DispatchService or a ShardedDispatcher, in
+a DispatchRuntime and register the shared routes on their own router with
+the add_*_routes functions, passing in what differs per backend.
+"""
+import asyncio
+import functools
+import json
+import os
+import time
+from typing import Callable, List, Literal, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter, ValidationError
+
+from app.api.responses import FastJSONResponse, dumps
+from app.models.models import Location, RideRequestCreate, set_grid_size
+from app.services.clock import SimulationClock
+from app.services.diagnostics import ProfilerBusy, SamplingProfiler, SlowRequestLog, request_timings
+from app.services.events import EventBroadcaster
+from app.services.metrics import MetricsRegistry
+from app.services.writer import SingleWriter, WriterBusy
+
+# City size in blocks; locations off the grid are rejected. The packed
+# positions feed sends int16 coordinates, which bounds both sides.
+grid_width = int(os.environ.get("GRID_WIDTH", 100))
+grid_height = int(os.environ.get("GRID_HEIGHT", 100))
+if not (0 < grid_width <= 32767 and 0 < grid_height <= 32767):
+    raise ValueError("GRID_WIDTH and GRID_HEIGHT must be between 1 and 32767")
+set_grid_size(grid_width, grid_height)
+
+# Instrumentation served by GET /metrics; METRICS_ENABLED=0 turns it off,
+# leaving plain routes and a backend that skips every measurement.
+metrics_registry = MetricsRegistry() if os.environ.get("METRICS_ENABLED", "1") != "0" else None
+if metrics_registry is not None:
+    request_seconds = metrics_registry.histogram(
+        "http_request_seconds", "API request latency", labels=("method", "route", "status")
+    )
+
+# Requests slower than SLOW_REQUEST_MS are kept for GET /admin/slow-requests
+# (recorded by the middleware in app.main); profiles run on demand.
+slow_requests = SlowRequestLog(
+    threshold_ms=float(os.environ.get("SLOW_REQUEST_MS", 250)),
+    size=int(os.environ.get("SLOW_REQUEST_LOG_SIZE", 200)),
+)
+profiler = SamplingProfiler()
+
+
+class _TimedRoute(APIRoute):
+    """Route that records each request's latency in request_seconds, by route template."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route = self.path_format
+
+        async def timed_handler(request: Request) -> Response:
+            started = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            finally:
+                request_seconds.labels(request.method, route, str(status)).observe(time.perf_counter() - started)
+
+        return timed_handler
+
+
+def api_router() -> APIRouter:
+    """A router whose routes are timed when metrics are on."""
+    return APIRouter(
+        route_class=_TimedRoute if metrics_registry is not None else APIRoute,
+        default_response_class=FastJSONResponse,
+    )
+
+
+def _timed_writer_call(timings: dict, fn, args, kwargs):
+    """Wrap fn to add its queue wait and run time on the writer to the request's timings."""
+    queued = time.perf_counter()
+
+    def call():
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings["writer_wait_ms"] += (started - queued) * 1000
+            timings["writer_ms"] += (time.perf_counter() - started) * 1000
+            timings["writer_calls"] += 1
+
+    return call
+
+
+def writer_busy() -> HTTPException:
+    return HTTPException(status_code=503, detail="Dispatch queue is full, retry later", headers={"Retry-After": "1"})
+
+
+def run_on_writer(writer: SingleWriter, fn, *args, **kwargs):
+    """Run fn on the writer thread and return its result; 503 when the queue is full."""
+    timings = request_timings.get()
+    if timings is not None:
+        fn, args, kwargs = _timed_writer_call(timings, fn, args, kwargs), (), {}
+    try:
+        return writer.call(fn, *args, **kwargs)
+    except WriterBusy:
+        raise writer_busy()
+
+
+async def run_on_writer_async(writer: SingleWriter, fn, *args, **kwargs):
+    timings = request_timings.get()
+    if timings is not None:
+        fn, args, kwargs = _timed_writer_call(timings, fn, args, kwargs), (), {}
+    try:
+        return await writer.call_async(fn, *args, **kwargs)
+    except WriterBusy:
+        raise writer_busy()
+
+
+def sse(event: str, data: bytes) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+
+class DispatchRuntime:
+    """
+    What both APIs run their dispatch backend with: the single writer
+    thread every access goes through (so endpoints never race each other),
+    the broadcaster feeding /stream, and the simulation clock.
+
+    The backend is a DispatchService or a ShardedDispatcher; either has
+    tick(), tick_many(), current_tick and the change and tick listener lists.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.writer = SingleWriter(max_pending=int(os.environ.get("WRITER_QUEUE_SIZE", 1024)))
+
+        # Push tick events and state changes to stream subscribers
+        self.broadcaster = EventBroadcaster()
+        backend.change_listeners.append(self.broadcaster.notify_changed)
+        backend.tick_listeners.append(
+            lambda tick, events: self.broadcaster.publish({"tick": tick, "events": events})
+        )
+
+        # Server-side simulation clock, started with the app (see app.main). With
+        # AUTO_TICK_RATE set it runs at that many ticks per second from startup;
+        # otherwise it waits, paused, for POST /clock/resume.
+        auto_tick_rate = os.environ.get("AUTO_TICK_RATE")
+        self.clock = SimulationClock(self._clock_ticks, rate=float(auto_tick_rate) if auto_tick_rate else 10.0)
+        if auto_tick_rate:
+            self.clock.resume()
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn on the writer thread and return its result; 503 when the queue is full."""
+        return run_on_writer(self.writer, fn, *args, **kwargs)
+
+    async def call_async(self, fn, *args, **kwargs):
+        return await run_on_writer_async(self.writer, fn, *args, **kwargs)
+
+    def serialized(self, endpoint):
+        """Decorator running a (sync) endpoint's body on the writer thread."""
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            return self.call(endpoint, *args, **kwargs)
+        return wrapper
+
+    async def _clock_ticks(self, n: int):
+        await self.call_async(self.backend.tick_many, n)
+
+
+# Bulk ingestion: rows are parsed and validated this many at a time
+BULK_CHUNK_ROWS = 1000
+location_rows = TypeAdapter(List[Location])
+location_row = TypeAdapter(Location)
+ride_rows = TypeAdapter(List[RideRequestCreate])
+ride_row = TypeAdapter(RideRequestCreate)
+
+
+async def bulk_chunks(request: Request):
+    """
+    Parse a bulk upload body into chunks of at most BULK_CHUNK_ROWS rows.
+
+    NDJSON bodies are split into lines as they stream in, so validation and
+    inserts can start before the upload finishes. A body starting with "["
+    is read whole and parsed as a JSON array. Lines that are not valid JSON
+    are yielded as ValueError instances so they get a per-row error.
+    """
+    is_array = None
+    parts = []
+    buffer = b""
+    chunk = []
+    async for data in request.stream():
+        if is_array is None:
+            head = (buffer + data).lstrip()
+            if not head:
+                continue
+            is_array = head.startswith(b"[")
+        if is_array:
+            parts.append(data)
+            continue
+        *lines, buffer = (buffer + data).split(b"\n")
+        for line in lines:
+            if line.strip():
+                chunk.append(_parse_line(line))
+        if len(chunk) >= BULK_CHUNK_ROWS:
+            yield chunk
+            chunk = []
+
+    if is_array:
+        try:
+            rows = json.loads(b"".join(parts))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON array: {e}")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array or NDJSON")
+        for start in range(0, len(rows), BULK_CHUNK_ROWS):
+            yield rows[start:start + BULK_CHUNK_ROWS]
+        return
+    if buffer.strip():
+        chunk.append(_parse_line(buffer))
+    if chunk:
+        yield chunk
+
+
+def _parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return e
+
+
+def validate_chunk(rows_adapter: TypeAdapter, row_adapter: TypeAdapter, rows: list) -> list:
+    """
+    Validate a chunk of rows with one TypeAdapter call. If any row is
+    invalid, fall back to row-by-row validation so each error is reported
+    against its own row. Returns a list of (value, error) pairs.
+    """
+    try:
+        return [(value, None) for value in rows_adapter.validate_python(rows)]
+    except ValidationError:
+        pass
+    results = []
+    for row in rows:
+        if isinstance(row, ValueError):
+            results.append((None, f"invalid JSON: {row}"))
+            continue
+        try:
+            results.append((row_adapter.validate_python(row), None))
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            results.append((None, f"{field}: {error['msg']}" if field else error["msg"]))
+    return results
+
+
+def bulk_response(results: list) -> FastJSONResponse:
+    """Compact per-row result: {"id": ...} (plus "status" for rides) or {"error": ...}, in upload order."""
+    failed = sum(1 for result in results if "error" in result)
+    return FastJSONResponse({"inserted": len(results) - failed, "failed": failed, "results": results})
+
+
+def bounding_box(
+    bbox: Optional[str] = Query(None, description="Viewport as x0,y0,x1,y1 (inclusive); only entities inside it are returned"),
+) -> Optional[Tuple[int, int, int, int]]:
+    if bbox is None:
+        return None
+    try:
+        x0, y0, x1, y1 = (int(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be four integers: x0,y0,x1,y1")
+    if x0 > x1 or y0 > y1:
+        raise HTTPException(status_code=400, detail="bbox must have x0 <= x1 and y0 <= y1")
+    return x0, y0, x1, y1
+
+
+def add_bulk_routes(
+    router: APIRouter,
+    runtime: DispatchRuntime,
+    add_drivers: Callable[[List[Location]], List[str]],
+    add_riders: Callable[[List[Location]], List[str]],
+    add_rides: Callable[[list, set, list], list],
+    dispatch_rides: Callable[[list], List[Tuple[str, str]]],
+) -> None:
+    """
+    Register the bulk ingestion routes. All four callables run on the
+    writer: add_drivers and add_riders create one chunk of entities and
+    return their IDs; add_rides checks one chunk of validated ride rows
+    (against the riders requesting earlier in the upload, in the set it is
+    given), appends {"error": ...} or {} per row to the results and returns
+    the accepted rows; dispatch_rides dispatches every accepted row of the
+    upload and returns (ride_id, status) for each.
+    """
+
+    @router.post("/drivers/bulk")
+    async def create_drivers_bulk(request: Request):
+        """Create many drivers from an NDJSON stream or JSON array of locations."""
+        results = []
+        async for rows in bulk_chunks(request):
+            validated = validate_chunk(location_rows, location_row, rows)
+            locations = [location for location, error in validated if error is None]
+            driver_ids = iter(await runtime.call_async(add_drivers, locations))
+            results.extend({"error": error} if error else {"id": next(driver_ids)} for _, error in validated)
+        return bulk_response(results)
+
+    @router.post("/riders/bulk")
+    async def create_riders_bulk(request: Request):
+        """Create many riders from an NDJSON stream or JSON array of locations."""
+        results = []
+        async for rows in bulk_chunks(request):
+            validated = validate_chunk(location_rows, location_row, rows)
+            locations = [location for location, error in validated if error is None]
+            rider_ids = iter(await runtime.call_async(add_riders, locations))
+            results.extend({"error": error} if error else {"id": next(rider_ids)} for _, error in validated)
+        return bulk_response(results)
+
+    @router.post("/rides/bulk")
+    async def request_rides_bulk(request: Request):
+        """
+        Create many ride requests from an NDJSON stream or JSON array of
+        {"rider_id", "pickup", "dropoff"} rows, then dispatch them together.
+        Rows are checked like POST /rides/request, including against earlier
+        rows of the same upload.
+        """
+        results = []
+        accepted = []
+        requesting = set()  # riders given a request earlier in this upload
+        async for rows in bulk_chunks(request):
+            validated = validate_chunk(ride_rows, ride_row, rows)
+            accepted.extend(await runtime.call_async(add_rides, validated, requesting, results))
+
+        dispatched = iter(await runtime.call_async(dispatch_rides, accepted))
+        for result in results:
+            if "error" not in result:
+                ride_id, status = next(dispatched)
+                result.update(id=ride_id, status=status)
+        return bulk_response(results)
+
+
+def add_simulation_routes(
+    router: APIRouter, runtime: DispatchRuntime, state_response: Callable[[Optional[int]], Tuple[int, bytes]]
+) -> None:
+    """
+    Register /tick, the clock routes and /stream. state_response(since)
+    returns (version, JSON body) of the state GET /state?since= would send,
+    and must not be called on the writer thread.
+    """
+    clock = runtime.clock
+
+    @router.post("/tick")
+    @runtime.serialized
+    def advance_simulation(
+        n: int = Query(1, ge=1, le=100000, description="Number of ticks to advance"),
+        summary: bool = Query(False, description="Return only aggregate counts instead of events")
+    ):
+        """Advance the simulation by one or more time steps."""
+        if summary:
+            return {
+                "message": f"Advanced simulation by {n} tick(s)",
+                "summary": runtime.backend.tick_many(n, summary=True)
+            }
+        if n == 1:
+            events = runtime.backend.tick()
+            return {"message": "Advanced simulation by one tick", "events": events}
+        return {
+            "message": f"Advanced simulation by {n} ticks",
+            "ticks": runtime.backend.tick_many(n)
+        }
+
+    @router.get("/clock")
+    def get_clock():
+        """Server-side clock: whether it is running, its rate and counters, and the current tick."""
+        return {**clock.status(), "current_tick": runtime.backend.current_tick}
+
+    @router.post("/clock/resume")
+    async def resume_clock():
+        """Start advancing the simulation automatically at the clock's rate."""
+        clock.resume()
+        return get_clock()
+
+    @router.post("/clock/pause")
+    async def pause_clock():
+        """Stop the automatic ticks; POST /tick still works."""
+        clock.pause()
+        return get_clock()
+
+    @router.put("/clock/speed")
+    async def set_clock_speed(rate: float = Query(..., gt=0, le=10000, description="Ticks per second")):
+        """Change how many ticks per second the clock advances."""
+        clock.set_rate(rate)
+        return get_clock()
+
+    @router.get("/stream")
+    async def stream_updates(
+        request: Request,
+        since: Optional[int] = Query(None, ge=0),
+        interval_ms: int = Query(0, ge=0, le=60000, description="Minimum time between deltas")
+    ):
+        """
+        Server-Sent Events stream of tick events ("tick") and state deltas
+        ("delta", same shape as GET /state?since=). The first delta brings the
+        client up to date from `since`, or is a full state without it. With
+        interval_ms, deltas are sent at most that often, each covering
+        everything that changed since the previous one; this lets a display
+        sample a fast-running simulation.
+        """
+        subscription = runtime.broadcaster.subscribe()
+
+        async def events():
+            version = since
+            try:
+                version, state = await run_in_threadpool(state_response, version)
+                yield sse("delta", state)
+                while not await request.is_disconnected():
+                    messages = await subscription.next(timeout=15)
+                    if messages is None:
+                        yield ": keep-alive\n\n"
+                        continue
+                    for message in messages:
+                        yield sse("tick", dumps(message))
+                    if subscription.changed.is_set() or subscription.lagged:
+                        subscription.changed.clear()
+                        version, state = await run_in_threadpool(
+                            state_response, None if subscription.lagged else version
+                        )
+                        subscription.lagged = False
+                        yield sse("delta", state)
+                        if interval_ms:
+                            await asyncio.sleep(interval_ms / 1000)
+            finally:
+                runtime.broadcaster.unsubscribe(subscription)
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+def add_diagnostic_routes(router: APIRouter, runtime: DispatchRuntime) -> None:
+    """Register /dispatch/pending, /consistency, /metrics and the admin routes."""
+
+    @router.get("/dispatch/pending")
+    @runtime.serialized
+    def get_pending_report():
+        """Get the depth of the pending-request queue and its wait-time percentiles (in ticks)."""
+        return runtime.backend.pending_report()
+
+    @router.get("/consistency")
+    @runtime.serialized
+    def get_consistency():
+        """Cross-check the dispatch indexes against the primary state; `problems` is empty when consistent."""
+        problems = runtime.backend.check_consistency()
+        return {"ok": not problems, "problems": problems}
+
+    @router.get("/metrics")
+    def get_metrics():
+        """
+        Prometheus metrics: request, dispatch and tick latency histograms,
+        dispatch counters and state sizes. Rendered outside the writer so that
+        scrapes keep working when the command queue is full; gauges may be a
+        command apart from each other.
+        """
+        if metrics_registry is None:
+            raise HTTPException(status_code=404, detail="Metrics are disabled")
+        return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+    @router.post("/admin/profile")
+    async def run_profiler(
+        seconds: float = Query(5, gt=0, le=60, description="Length of the profiling window"),
+        mode: Literal["sample", "cprofile"] = Query("sample", description="Statistical sampling of all threads, or cProfile of the dispatch writer"),
+        interval_ms: float = Query(5, ge=1, le=1000, description="Sampling interval (sample mode)"),
+        thread: Optional[str] = Query(None, description="Only sample threads with this name, e.g. dispatch-writer"),
+        format: Literal["collapsed", "json"] = Query("collapsed", description="Output of sample mode"),
+    ):
+        """
+        Profile the server for a bounded window and return the result once it
+        ends. Sample mode returns hot stacks in collapsed-stack format (input
+        for flamegraph.pl or speedscope) or as JSON; cprofile mode returns a
+        pstats report of the writer thread, sorted by cumulative time.
+        """
+        try:
+            if mode == "cprofile":
+                report = await run_in_threadpool(profiler.profile, seconds, runtime.call)
+                return Response(report, media_type="text/plain")
+            result = await run_in_threadpool(profiler.sample, seconds, interval_ms / 1000, thread)
+        except ProfilerBusy as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if format == "json":
+            return result
+        return Response(SamplingProfiler.collapsed(result["stacks"]), media_type="text/plain")
+
+    @router.get("/admin/slow-requests")
+    def get_slow_requests(
+        limit: int = Query(50, ge=1, le=1000),
+        path: Optional[str] = Query(None, description="Only requests for this path")
+    ):
+        """
+        Requests that took longer than SLOW_REQUEST_MS, newest first, with their
+        timing breakdown (waiting for and running on the dispatch writer, and
+        the rest) and the dispatch state sizes when they finished.
+        """
+        return {
+            "threshold_ms": slow_requests.threshold_ms,
+            "recorded": slow_requests.recorded,
+            "requests": slow_requests.entries(limit, path),
+        }
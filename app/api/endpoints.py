@@ -1,14 +1,250 @@
-from fastapi import APIRouter, HTTPException, Body, Query, Depends
-from typing import Dict, List, Optional
+from fastapi import HTTPException, Body, Query, Depends, Request, Response
+from typing import List, Optional, Tuple
+import atexit
+import os
 import uuid
 
+import numpy as np
+
+from app.api.common import (
+    DispatchRuntime, add_bulk_routes, add_diagnostic_routes, add_simulation_routes, api_router, bounding_box,
+    grid_height, grid_width, metrics_registry, writer_busy,
+)
+from app.api.responses import EncodedJSONResponse, FastJSONResponse, dumps
+from app.models.entities import Point, RideEntity, RiderEntity
 from app.models.models import Driver, Rider, RideRequest, Location, DriverStatus, RideStatus
 from app.services.dispatch import DispatchService
+from app.services.fleet import REMOVED, STATUS_BY_CODE
+from app.services.metrics import DispatchMetrics, MetricsRegistry
+from app.services.persistence import PersistentStore
+from app.services.roadmap import RoadMap
+from app.services.writer import SnapshotCache, WriterBusy
+
+router = api_router()
 
-router = APIRouter()
+grid_config = {"grid_width": grid_width, "grid_height": grid_height}
 
 # Create a global instance of the dispatch service
-dispatch_service = DispatchService()
+batch_window_ms = os.environ.get("BATCH_WINDOW_MS")
+max_wait_ticks = os.environ.get("MAX_WAIT_TICKS")
+rebalance_every = os.environ.get("REBALANCE_EVERY")
+dispatch_config = {
+    "dispatch_mode": os.environ.get("DISPATCH_MODE", "greedy"),
+    "batch_window_ms": float(batch_window_ms) if batch_window_ms else None,
+    "max_wait_ticks": int(max_wait_ticks) if max_wait_ticks else None,
+    "rebalance_every": int(rebalance_every) if rebalance_every else None,
+}
+
+# With DATA_DIR set, state survives restarts: the service is recovered from
+# the latest snapshot plus the event log, and every command is logged.
+data_dir = os.environ.get("DATA_DIR")
+if data_dir:
+    store = PersistentStore(data_dir, snapshot_every=int(os.environ.get("SNAPSHOT_EVERY", 100_000)))
+    dispatch_service = store.open(lambda: DispatchService(**grid_config))
+    dispatch_service.configure(**dispatch_config)
+    atexit.register(store.close)
+else:
+    store = None
+    dispatch_service = DispatchService(**dispatch_config, **grid_config)
+
+# With ROAD_MAP set to a JSON file of RoadMap fields, drivers route around
+# blocked cells and one-way streets instead of crossing the open grid
+road_map_path = os.environ.get("ROAD_MAP")
+if road_map_path:
+    road_map_spec = RoadMap.load(road_map_path).to_dict()
+    if dispatch_service.road_map is None or dispatch_service.road_map.to_dict() != road_map_spec:
+        dispatch_service.set_road_map(road_map_spec)
+
+# Every access to dispatch_service runs on the runtime's writer thread.
+# Whole-collection reads are served from snapshots that are rebuilt at most
+# once per version.
+runtime = DispatchRuntime(dispatch_service)
+dispatch_writer = runtime.writer
+simulation_clock = runtime.clock
+_on_writer = runtime.call
+_on_writer_async = runtime.call_async
+serialized = runtime.serialized
+snapshots = SnapshotCache(dispatch_writer)
+
+
+def _register_state_metrics(registry: MetricsRegistry) -> None:
+    """Gauges read at scrape time; they look dispatch_service up on each scrape."""
+    def driver_counts():
+        live = dispatch_service.fleet.status[:dispatch_service.fleet.size]
+        counts = np.bincount(live[live != REMOVED], minlength=len(STATUS_BY_CODE))
+        return {(STATUS_BY_CODE[code].value,): int(count) for code, count in enumerate(counts.tolist())}
+
+    registry.gauge("dispatch_active_trips", "Trips in progress", lambda: len(dispatch_service.active_trips))
+    registry.gauge("dispatch_drivers", "Drivers by status", driver_counts, labels=("status",))
+    registry.gauge(
+        "dispatch_state_entries", "Entries in the dispatch service's state collections",
+        lambda: {
+            ("riders",): len(dispatch_service.riders),
+            ("ride_requests",): len(dispatch_service.ride_requests),
+            ("archived_rides",): len(dispatch_service.archive),
+            ("active_requests_by_rider",): len(dispatch_service.active_request_by_rider),
+            ("batch_queue",): len(dispatch_service.batch_queue),
+            ("pending",): len(dispatch_service.pending),
+            ("repositioning",): len(dispatch_service.repositioning),
+            ("changelog",): len(dispatch_service._changelog),
+        },
+        labels=("collection",),
+    )
+    registry.gauge("dispatch_writer_pending", "Commands waiting for the writer thread", lambda: dispatch_writer.pending)
+    registry.gauge("dispatch_writer_rejected", "Commands refused because the writer queue was full",
+                   lambda: dispatch_writer.rejected)
+    registry.gauge("dispatch_tick", "Current simulation tick", lambda: dispatch_service.current_tick)
+    if store is not None:
+        registry.gauge("dispatch_replay_failures", "Logged commands that raised when replayed at startup",
+                       lambda: store.replay_failures)
+
+
+if metrics_registry is not None:
+    dispatch_service.metrics = DispatchMetrics(metrics_registry)
+    _register_state_metrics(metrics_registry)
+
+
+def dispatch_sizes() -> dict:
+    """Sizes of the dispatch state, read without the writer (for diagnostics only)."""
+    return {
+        "drivers": len(dispatch_service.fleet),
+        "riders": len(dispatch_service.riders),
+        "ride_requests": len(dispatch_service.ride_requests),
+        "archived_rides": len(dispatch_service.archive),
+        "active_trips": len(dispatch_service.active_trips),
+        "batch_queue": len(dispatch_service.batch_queue),
+        "writer_pending": dispatch_writer.pending,
+    }
+
+
+def _snapshot(name: str, version, build):
+    """(version, view) from the snapshot cache; 503 when a rebuild cannot be queued."""
+    try:
+        return snapshots.get(name, version, build)
+    except WriterBusy:
+        raise writer_busy()
+
+
+def _encoded_snapshot(name: str, version, build) -> Tuple[int, bytes]:
+    """(version, JSON-encoded view) from the snapshot cache, encoded once per version."""
+    try:
+        return snapshots.encoded(name, version, build, dumps)
+    except WriterBusy:
+        raise writer_busy()
+
+
+def _driver_response(driver_id: str) -> dict:
+    """Build the API representation of a driver from the fleet store."""
+    return _all_driver_responses(np.array([dispatch_service.fleet.rows[driver_id]]))[0]
+
+
+def _all_driver_responses(rows=None) -> List[dict]:
+    """
+    Build API representations (JSON-ready dicts in the shape of Driver) of
+    fleet rows, default all live rows, in one pass over the columns.
+    """
+    fleet = dispatch_service.fleet
+    return fleet.to_dicts(fleet.live_rows() if rows is None else rows)
+
+
+def _not_modified(
+    request: Request, response: Response, kind: str, variant: str = "", version: Optional[int] = None
+) -> bool:
+    """
+    Set a weak ETag derived from the collection's version (or the version of
+    the snapshot being sent) and report whether the client's If-None-Match
+    already matches it.
+    """
+    if version is None:
+        version = dispatch_service.collection_versions[kind]
+    etag = f'W/"{kind}-{version}{variant}"'
+    response.headers["ETag"] = etag
+    return request.headers.get("if-none-match") == etag
+
+
+def _trip_response(ride_id: str) -> dict:
+    driver_id, step = dispatch_service.active_trips[ride_id]
+    return {"ride_id": ride_id, "driver_id": driver_id, "step": step}
+
+
+def _state_response(since: Optional[int] = None) -> Tuple[int, bytes]:
+    """
+    (version, JSON body) of the full system state, or of only what changed
+    after `since` when the changelog allows.
+    """
+    if since is not None:
+        state = _on_writer(_delta_state, since)
+        if state is not None:
+            return state["version"], dumps(state)
+    return _encoded_snapshot("state", lambda: dispatch_service.version, _full_state)
+
+
+def _full_state() -> dict:
+    return {
+        "version": dispatch_service.version,
+        "full": True,
+        "drivers": _all_driver_responses(),
+        "riders": [rider.to_dict() for rider in dispatch_service.riders.values()],
+        "ride_requests": [ride.to_dict() for ride in dispatch_service.ride_requests.values()],
+        "archived_rides": len(dispatch_service.archive),
+        "active_trips": [_trip_response(ride_id) for ride_id in dispatch_service.active_trips]
+    }
+
+
+def _delta_state(since: int) -> Optional[dict]:
+    """What changed after `since`, or None when the changelog no longer reaches back that far."""
+    changes = dispatch_service.changes_since(since)
+    if changes is None:
+        return None
+    fleet = dispatch_service.fleet
+    driver_rows = changes["drivers"]
+    removed = fleet.status[driver_rows] == REMOVED
+    riders, rides, trips = changes["riders"], changes["rides"], changes["trips"]
+    hot_rides = dispatch_service.ride_requests
+    return {
+        "version": changes["version"],
+        "since": since,
+        "full": False,
+        "drivers": _all_driver_responses(driver_rows[~removed]),
+        "riders": [dispatch_service.riders[r].to_dict() for r in riders if r in dispatch_service.riders],
+        "ride_requests": [hot_rides[r].to_dict() for r in rides if r in hot_rides],
+        "archived_rides": len(dispatch_service.archive),
+        "active_trips": [_trip_response(r) for r in trips if r in dispatch_service.active_trips],
+        # Archived rides leave ride_requests as they do in the full state
+        "deleted": {
+            "drivers": [fleet.ids[row] for row in driver_rows[removed].tolist()],
+            "riders": [r for r in riders if r not in dispatch_service.riders],
+            "ride_requests": [r for r in rides if r not in hot_rides],
+            "active_trips": [r for r in trips if r not in dispatch_service.active_trips]
+        }
+    }
+
+
+def _new_id(prefix: str, *taken) -> str:
+    """Random short ID not present in any of the `taken` containers (they collide at bulk volumes)."""
+    while True:
+        new_id = f"{prefix}_{uuid.uuid4().hex[:8]}"
+        if not any(new_id in container for container in taken):
+            return new_id
+
+
+def _add_driver_rows(locations: List[Location]) -> List[str]:
+    """Register one chunk of bulk drivers under fresh IDs; runs on the writer."""
+    driver_ids = {}
+    for _ in locations:
+        driver_ids[_new_id("driver", dispatch_service.fleet, driver_ids)] = None
+    dispatch_service.add_drivers(list(driver_ids), [Point.of(location) for location in locations])
+    return list(driver_ids)
+
+
+def _add_rider_rows(locations: List[Location]) -> List[str]:
+    """Register one chunk of bulk riders under fresh IDs; runs on the writer."""
+    riders = {}
+    for location in locations:
+        rider_id = _new_id("rider", dispatch_service.riders, riders)
+        riders[rider_id] = RiderEntity(rider_id, Point.of(location))
+    dispatch_service.add_riders(list(riders.values()))
+    return list(riders)
 
 
 @router.get("/")
@@ -19,203 +255,337 @@ def health_check():
 
 @router.get("/grid-info")
 def get_grid_info():
-    """Get information about the grid dimensions."""
-    return {"width": 100, "height": 100}
+    """Get information about the grid dimensions and the side of the tiles GET /tiles counts in."""
+    return {"width": grid_width, "height": grid_height, "tile_size": dispatch_service.fleet.tile_size}
+
+
+@router.get("/tiles")
+@serialized
+def get_tile_counts(box: Optional[Tuple[int, int, int, int]] = Depends(bounding_box)):
+    """
+    Drivers (all and available) and riders per occupied tile of tile_size
+    x tile_size blocks, over the whole grid or the tiles overlapping bbox.
+    """
+    return dispatch_service.tile_report(*(box or (0, 0, grid_width - 1, grid_height - 1)))
 
 
 # Driver endpoints
 @router.post("/drivers/", response_model=Driver)
+@serialized
 def create_driver(location: Location = Body(...)):
     """Create a new driver at the specified location."""
     driver_id = f"driver_{uuid.uuid4().hex[:8]}"
-    driver = Driver(
-        id=driver_id,
-        location=location,
-        status=DriverStatus.AVAILABLE
-    )
-    dispatch_service.drivers[driver_id] = driver
-    return driver
+    dispatch_service.add_driver(driver_id, Point.of(location))
+    return _driver_response(driver_id)
 
 
 @router.get("/drivers/", response_model=List[Driver])
-def get_all_drivers():
-    """Get all drivers in the system."""
-    return list(dispatch_service.drivers.values())
+def get_all_drivers(request: Request, response: Response, box: Optional[Tuple[int, int, int, int]] = Depends(bounding_box)):
+    """Get all drivers in the system, or with bbox only those inside the viewport."""
+    if box is not None:
+        drivers = _on_writer(_drivers_in_box, request, response, box)
+        if drivers is None:
+            return Response(status_code=304, headers=dict(response.headers))
+        return FastJSONResponse(drivers, headers=dict(response.headers))
+    version, drivers = _encoded_snapshot(
+        "drivers",
+        lambda: dispatch_service.collection_versions["drivers"],
+        _all_driver_responses
+    )
+    if _not_modified(request, response, "drivers", version=version):
+        return Response(status_code=304, headers=dict(response.headers))
+    return EncodedJSONResponse(drivers, headers=dict(response.headers))
+
+
+def _drivers_in_box(request: Request, response: Response, box: Tuple[int, int, int, int]) -> Optional[list]:
+    """Drivers inside the box, from the occupied tiles it overlaps; None when the client's copy is current."""
+    if _not_modified(request, response, "drivers", f"-{request.url.query}"):
+        return None
+    return _all_driver_responses(dispatch_service.fleet.rows_in(*box))
+
+
+@router.get("/drivers/positions", response_class=Response)
+def get_driver_positions(request: Request, response: Response, box: Optional[Tuple[int, int, int, int]] = Depends(bounding_box)):
+    """
+    Positions and statuses of all drivers (or, with bbox, of those inside
+    the viewport) as packed little-endian arrays, for drawing large fleets:
+    x as int16[n], then y as int16[n], then the status code as int8[n]
+    (0 available, 1 on trip, 2 offline), in the same order as GET /drivers/.
+    n is in the X-Driver-Count header.
+    """
+    if box is not None:
+        positions = _on_writer(_positions_in_box, request, response, box)
+        if positions is None:
+            return Response(status_code=304, headers=dict(response.headers))
+    else:
+        version, positions = _snapshot(
+            "driver_positions",
+            lambda: dispatch_service.collection_versions["drivers"],
+            _driver_positions
+        )
+        if _not_modified(request, response, "drivers", "-positions", version=version):
+            return Response(status_code=304, headers=dict(response.headers))
+    response.headers["X-Driver-Count"] = str(len(positions) // 5)
+    return Response(positions, media_type="application/octet-stream", headers=dict(response.headers))
+
+
+def _positions_in_box(request: Request, response: Response, box: Tuple[int, int, int, int]) -> Optional[bytes]:
+    if _not_modified(request, response, "drivers", f"-positions-{request.url.query}"):
+        return None
+    return _driver_positions(dispatch_service.fleet.rows_in(*box))
+
+
+def _driver_positions(rows=None) -> bytes:
+    fleet = dispatch_service.fleet
+    rows = fleet.live_rows() if rows is None else rows
+    # Grids fit int16 (see GRID_WIDTH); only drivers added off the grid are clamped
+    return b"".join((
+        np.clip(fleet.x[rows], -32768, 32767).astype("<i2").tobytes(),
+        np.clip(fleet.y[rows], -32768, 32767).astype("<i2").tobytes(),
+        fleet.status[rows].tobytes(),
+    ))
 
 
 @router.get("/drivers/{driver_id}", response_model=Driver)
+@serialized
 def get_driver(driver_id: str):
     """Get a specific driver by ID."""
-    if driver_id not in dispatch_service.drivers:
+    if driver_id not in dispatch_service.fleet:
         raise HTTPException(status_code=404, detail="Driver not found")
-    return dispatch_service.drivers[driver_id]
+    return _driver_response(driver_id)
 
 
 @router.delete("/drivers/{driver_id}")
+@serialized
 def delete_driver(driver_id: str):
     """Remove a driver from the system."""
-    if driver_id not in dispatch_service.drivers:
+    if driver_id not in dispatch_service.fleet:
         raise HTTPException(status_code=404, detail="Driver not found")
     
     # Check if driver is on a trip
-    if dispatch_service.drivers[driver_id].status == DriverStatus.ON_TRIP:
+    if dispatch_service.driver_status(driver_id) == DriverStatus.ON_TRIP:
         raise HTTPException(status_code=400, detail="Cannot remove driver who is on a trip")
     
-    del dispatch_service.drivers[driver_id]
+    dispatch_service.remove_driver(driver_id)
     return {"message": f"Driver {driver_id} removed"}
 
 
 @router.put("/drivers/{driver_id}/status")
+@serialized
 def update_driver_status(driver_id: str, status: DriverStatus):
     """Update a driver's status."""
-    if driver_id not in dispatch_service.drivers:
+    if driver_id not in dispatch_service.fleet:
         raise HTTPException(status_code=404, detail="Driver not found")
     
     # Prevent changing status if driver is on a trip
-    if dispatch_service.drivers[driver_id].status == DriverStatus.ON_TRIP and status != DriverStatus.ON_TRIP:
+    if dispatch_service.driver_status(driver_id) == DriverStatus.ON_TRIP and status != DriverStatus.ON_TRIP:
         raise HTTPException(status_code=400, detail="Cannot change status of driver who is on a trip")
     
-    dispatch_service.drivers[driver_id].status = status
+    dispatch_service.set_driver_status(driver_id, status)
     return {"message": f"Driver {driver_id} status updated to {status}"}
 
 
 # Rider endpoints
 @router.post("/riders/", response_model=Rider)
+@serialized
 def create_rider(location: Location = Body(...)):
     """Create a new rider at the specified location."""
     rider_id = f"rider_{uuid.uuid4().hex[:8]}"
-    rider = Rider(
-        id=rider_id,
-        location=location
-    )
-    dispatch_service.riders[rider_id] = rider
-    return rider
+    rider = RiderEntity(rider_id, Point.of(location))
+    dispatch_service.add_rider(rider)
+    return rider.to_dict()
 
 
 @router.get("/riders/", response_model=List[Rider])
-def get_all_riders():
-    """Get all riders in the system."""
-    return list(dispatch_service.riders.values())
+def get_all_riders(request: Request, response: Response, box: Optional[Tuple[int, int, int, int]] = Depends(bounding_box)):
+    """Get all riders in the system, or with bbox only those inside the viewport (ordered by ID)."""
+    if box is not None:
+        riders = _on_writer(_riders_in_box, request, response, box)
+        if riders is None:
+            return Response(status_code=304, headers=dict(response.headers))
+        return FastJSONResponse(riders, headers=dict(response.headers))
+    version, riders = _encoded_snapshot(
+        "riders",
+        lambda: dispatch_service.collection_versions["riders"],
+        lambda: [rider.to_dict() for rider in dispatch_service.riders.values()]
+    )
+    if _not_modified(request, response, "riders", version=version):
+        return Response(status_code=304, headers=dict(response.headers))
+    return EncodedJSONResponse(riders, headers=dict(response.headers))
+
+
+def _riders_in_box(request: Request, response: Response, box: Tuple[int, int, int, int]) -> Optional[list]:
+    if _not_modified(request, response, "riders", f"-{request.url.query}"):
+        return None
+    return [rider.to_dict() for rider in dispatch_service.riders_in(*box)]
 
 
 @router.get("/riders/{rider_id}", response_model=Rider)
+@serialized
 def get_rider(rider_id: str):
     """Get a specific rider by ID."""
     if rider_id not in dispatch_service.riders:
         raise HTTPException(status_code=404, detail="Rider not found")
-    return dispatch_service.riders[rider_id]
+    return dispatch_service.riders[rider_id].to_dict()
 
 
 @router.delete("/riders/{rider_id}")
+@serialized
 def delete_rider(rider_id: str):
     """Remove a rider from the system."""
     if rider_id not in dispatch_service.riders:
         raise HTTPException(status_code=404, detail="Rider not found")
     
     # Check if rider has an active ride request
-    for request in dispatch_service.ride_requests.values():
-        if request.rider_id == rider_id and request.status in [RideStatus.WAITING, RideStatus.ASSIGNED]:
-            raise HTTPException(status_code=400, detail="Cannot remove rider with active ride request")
+    if dispatch_service.active_request_for(rider_id):
+        raise HTTPException(status_code=400, detail="Cannot remove rider with active ride request")
     
-    del dispatch_service.riders[rider_id]
+    dispatch_service.remove_rider(rider_id)
     return {"message": f"Rider {rider_id} removed"}
 
 
 # Ride request endpoints
 @router.post("/rides/request", response_model=RideRequest)
+@serialized
 def request_ride(rider_id: str = Body(...), pickup: Location = Body(...), dropoff: Location = Body(...)):
     """Create a new ride request."""
     if rider_id not in dispatch_service.riders:
         raise HTTPException(status_code=404, detail="Rider not found")
     
     # Check if rider already has an active request
-    for request in dispatch_service.ride_requests.values():
-        if request.rider_id == rider_id and request.status in [RideStatus.WAITING, RideStatus.ASSIGNED]:
-            raise HTTPException(status_code=400, detail="Rider already has an active request")
+    if dispatch_service.active_request_for(rider_id):
+        raise HTTPException(status_code=400, detail="Rider already has an active request")
     
     request_id = f"ride_{uuid.uuid4().hex[:8]}"
-    ride_request = RideRequest(
-        id=request_id,
-        rider_id=rider_id,
-        pickup=pickup,
-        dropoff=dropoff,
-        status=RideStatus.WAITING
-    )
-    dispatch_service.ride_requests[request_id] = ride_request
+    ride_request = RideEntity(request_id, rider_id, Point.of(pickup), Point.of(dropoff), RideStatus.WAITING)
+    dispatch_service.add_ride_request(ride_request)
     
-    # Try to assign a driver
-    success, message = dispatch_service.assign_ride(request_id)
+    # Try to assign a driver (or queue the request for batch dispatch)
+    success, message = dispatch_service.submit_ride(request_id)
     
-    return ride_request
+    # A dict, not the live entity, which the writer keeps updating after we return
+    return ride_request.to_dict()
+
+
+def _add_ride_rows(validated: list, requesting: set, results: list) -> List[RideEntity]:
+    """Check and register one chunk of validated bulk ride rows; runs on the writer."""
+    created = []
+    created_ids = set()
+    for row, error in validated:
+        if error is None and row.rider_id not in dispatch_service.riders:
+            error = "Rider not found"
+        elif error is None and (row.rider_id in requesting or dispatch_service.active_request_for(row.rider_id)):
+            error = "Rider already has an active request"
+        if error:
+            results.append({"error": error})
+            continue
+        ride_request = RideEntity(
+            _new_id("ride", dispatch_service.ride_requests, dispatch_service.archive, created_ids),
+            row.rider_id, Point.of(row.pickup), Point.of(row.dropoff), RideStatus.WAITING
+        )
+        requesting.add(row.rider_id)
+        created_ids.add(ride_request.id)
+        created.append(ride_request)
+        results.append({})
+    dispatch_service.add_ride_requests(created)
+    return created
+
+
+def _submit_ride_rows(ride_requests: List[RideEntity]) -> List[Tuple[str, str]]:
+    """Dispatch the rides of a bulk upload together as batches; runs on the writer."""
+    dispatch_service.submit_rides([ride_request.id for ride_request in ride_requests])
+    return [(ride_request.id, ride_request.status.value) for ride_request in ride_requests]
+
+
+add_bulk_routes(router, runtime, _add_driver_rows, _add_rider_rows, _add_ride_rows, _submit_ride_rows)
 
 
 @router.get("/rides/", response_model=List[RideRequest])
-def get_all_rides():
-    """Get all ride requests in the system."""
-    return list(dispatch_service.ride_requests.values())
+def get_all_rides(
+    request: Request,
+    response: Response,
+    status: Optional[RideStatus] = None,
+    rider_id: Optional[str] = None,
+    driver_id: Optional[str] = None,
+    cursor: Optional[int] = Query(None, ge=0, description="Value of X-Next-Cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    Page through ride requests (active and archived) in creation order,
+    optionally filtered by status, rider and assigned driver. The cursor for
+    the next page is returned in the X-Next-Cursor header, absent on the
+    last page.
+    """
+    rides = _on_writer(_ride_page, request, response, status, rider_id, driver_id, cursor, limit)
+    if rides is None:
+        return Response(status_code=304, headers=dict(response.headers))
+    # Encoded here rather than on the writer, without response_model validation
+    return FastJSONResponse(rides, headers=dict(response.headers))
+
+
+def _ride_page(request: Request, response: Response, status, rider_id, driver_id, cursor, limit) -> Optional[list]:
+    """A page of rides as dicts, or None when the client's copy is current."""
+    if _not_modified(request, response, "rides", f"-{request.url.query}"):
+        return None
+    rides, next_cursor = dispatch_service.list_rides(cursor, limit, status, rider_id, driver_id)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return [ride.to_dict() for ride in rides]
 
 
 @router.get("/rides/{ride_id}", response_model=RideRequest)
+@serialized
 def get_ride(ride_id: str):
-    """Get a specific ride request by ID."""
-    if ride_id not in dispatch_service.ride_requests:
+    """Get a specific ride request by ID, including archived ones."""
+    ride_request = dispatch_service.get_ride(ride_id)
+    if ride_request is None:
         raise HTTPException(status_code=404, detail="Ride request not found")
-    return dispatch_service.ride_requests[ride_id]
+    return ride_request.to_dict()
 
 
 @router.put("/rides/{ride_id}/accept")
+@serialized
 def accept_ride(ride_id: str, driver_id: str = Body(...)):
     """Driver accepts a ride request."""
-    if ride_id not in dispatch_service.ride_requests:
+    ride_request = dispatch_service.get_ride(ride_id)
+    if ride_request is None:
         raise HTTPException(status_code=404, detail="Ride request not found")
-    if driver_id not in dispatch_service.drivers:
+    if driver_id not in dispatch_service.fleet:
         raise HTTPException(status_code=404, detail="Driver not found")
     
-    ride_request = dispatch_service.ride_requests[ride_id]
-    driver = dispatch_service.drivers[driver_id]
+    driver_status = dispatch_service.driver_status(driver_id)
     
     if ride_request.status != RideStatus.WAITING:
         raise HTTPException(status_code=400, detail=f"Ride is not in waiting status (current: {ride_request.status})")
     
-    if driver.status != DriverStatus.AVAILABLE:
-        raise HTTPException(status_code=400, detail=f"Driver is not available (current: {driver.status})")
-    
-    # Update statuses
-    ride_request.status = RideStatus.ASSIGNED
-    ride_request.assigned_driver_id = driver_id
-    driver.status = DriverStatus.ON_TRIP
-    driver.assigned_rides += 1
+    if driver_status != DriverStatus.AVAILABLE:
+        raise HTTPException(status_code=400, detail=f"Driver is not available (current: {driver_status})")
     
-    # Track active trip
-    dispatch_service.active_trips[ride_id] = (driver_id, "to_pickup")
+    # Update statuses and track the active trip
+    dispatch_service.start_trip(ride_request, driver_id)
     
     return {"message": f"Driver {driver_id} accepted ride {ride_id}"}
 
 
 @router.put("/rides/{ride_id}/reject")
+@serialized
 def reject_ride(ride_id: str, driver_id: str = Body(...)):
-    """Driver rejects a ride request."""
-    if ride_id not in dispatch_service.ride_requests:
+    """
+    Driver rejects a ride request: a waiting ride, or the ride they were
+    assigned if they have not picked the rider up yet.
+    """
+    ride_request = dispatch_service.get_ride(ride_id)
+    if ride_request is None:
         raise HTTPException(status_code=404, detail="Ride request not found")
-    if driver_id not in dispatch_service.drivers:
+    if driver_id not in dispatch_service.fleet:
         raise HTTPException(status_code=404, detail="Driver not found")
     
-    ride_request = dispatch_service.ride_requests[ride_id]
-    driver = dispatch_service.drivers[driver_id]
-    
-    if ride_request.status != RideStatus.WAITING:
+    declining = dispatch_service.active_trips.get(ride_id) == (driver_id, "to_pickup")
+    if ride_request.status != RideStatus.WAITING and not declining:
         raise HTTPException(status_code=400, detail=f"Ride is not in waiting status (current: {ride_request.status})")
     
-    # Add driver to rejected list
-    if driver_id not in ride_request.rejected_by:
-        ride_request.rejected_by.append(driver_id)
-    
-    # Add ride to driver's rejected rides
-    if ride_id not in driver.rejected_rides:
-        driver.rejected_rides.append(ride_id)
-    
-    # Try to find another driver
-    success, message = dispatch_service.assign_ride(ride_id)
+    # Record the rejection, free the driver if it was theirs and try the next driver
+    success, message = dispatch_service.reject_ride(ride_request, driver_id)
     
     if not success and ride_request.status == RideStatus.FAILED:
         return {"message": "No available drivers to fulfill this request", "status": "failed"}
@@ -224,59 +594,98 @@ def reject_ride(ride_id: str, driver_id: str = Body(...)):
 
 
 @router.put("/rides/{ride_id}/cancel")
+@serialized
 def cancel_ride(ride_id: str):
     """Cancel a ride request."""
-    if ride_id not in dispatch_service.ride_requests:
+    ride_request = dispatch_service.get_ride(ride_id)
+    if ride_request is None:
         raise HTTPException(status_code=404, detail="Ride request not found")
     
-    ride_request = dispatch_service.ride_requests[ride_id]
-    
     # Only allow cancellation of waiting or assigned rides
     if ride_request.status not in [RideStatus.WAITING, RideStatus.ASSIGNED]:
         raise HTTPException(status_code=400, detail=f"Cannot cancel ride with status: {ride_request.status}")
     
-    # If ride was assigned to a driver, free up the driver
-    if ride_request.status == RideStatus.ASSIGNED and ride_request.assigned_driver_id:
-        driver_id = ride_request.assigned_driver_id
-        if driver_id in dispatch_service.drivers:
-            driver = dispatch_service.drivers[driver_id]
-            driver.status = DriverStatus.AVAILABLE
-            # Decrease assigned rides count since this ride is being cancelled
-            if driver.assigned_rides > 0:
-                driver.assigned_rides -= 1
-        
-        # Remove from active trips if it was there
-        if ride_id in dispatch_service.active_trips:
-            del dispatch_service.active_trips[ride_id]
-    
-    # Mark ride as cancelled (we'll use FAILED status for cancelled rides)
-    ride_request.status = RideStatus.FAILED
-    ride_request.assigned_driver_id = None
+    # Free up the driver if needed and mark the ride as cancelled
+    dispatch_service.cancel_ride(ride_request)
     
     return {"message": f"Ride {ride_id} has been cancelled successfully"}
 
 
+# Dispatch endpoints
+@router.get("/dispatch/batches")
+@serialized
+def get_batch_reports():
+    """Get the dispatch configuration and recent batch matching reports."""
+    return {
+        "mode": dispatch_service.dispatch_mode,
+        "batch_window_ms": dispatch_service.batch_window_ms,
+        "batch_candidates": dispatch_service.batch_candidates,
+        "queued": len(dispatch_service.batch_queue),
+        "batches": list(dispatch_service.batch_reports)
+    }
+
+
+@router.get("/dispatch/demand")
+@serialized
+def get_demand_heatmap(top: int = Query(10, ge=0, le=1000, description="Number of hottest cells to list")):
+    """
+    Get the rolling demand heatmap: decay-weighted ride requests per tick
+    of each cell with recent demand ([cx, cy, rate] in cells), the hottest
+    cells with their idle drivers, and how many idle drivers are being
+    repositioned.
+    """
+    return dispatch_service.demand_report(top)
+
+
+add_diagnostic_routes(router, runtime)
+
+
 # Simulation endpoints
-@router.post("/tick")
-def advance_simulation():
-    """Advance the simulation by one time step."""
-    events = dispatch_service.tick()
-    return {"message": "Advanced simulation by one tick", "events": events}
+@router.get("/roadmap")
+@serialized
+def get_road_map(cells: bool = False):
+    """
+    Get the road map's size, street counts and routing cache statistics;
+    with `cells`, also its blocked cells, one-way streets and edge costs.
+    """
+    return _road_map_status(cells)
+
+
+def _road_map_status(cells: bool = False) -> dict:
+    road_map = dispatch_service.road_map
+    if road_map is None:
+        return {"enabled": False}
+    return {"enabled": True, **road_map.stats(), **({"map": road_map.to_dict()} if cells else {})}
+
+
+@router.put("/roadmap")
+@serialized
+def set_road_map(spec: Optional[dict] = Body(None)):
+    """
+    Load a road map: {"width", "height", "blocked": [[x, y]], "one_way":
+    [[x1, y1, x2, y2]], "costs": [[x1, y1, x2, y2, ticks]], "hotspots":
+    [[x, y]]}, all optional (the size defaults to the grid's). A null body
+    goes back to the open grid.
+    Active trips are rerouted.
+    """
+    if spec is not None:
+        try:
+            spec = RoadMap.from_dict({"width": grid_width, "height": grid_height, **spec}).to_dict()
+        except (TypeError, ValueError, IndexError) as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid road map: {exc}")
+    dispatch_service.set_road_map(spec)
+    return _road_map_status()
 
 
 @router.get("/state")
-def get_system_state():
-    """Get the current state of the entire system."""
-    return {
-        "drivers": list(dispatch_service.drivers.values()),
-        "riders": list(dispatch_service.riders.values()),
-        "ride_requests": list(dispatch_service.ride_requests.values()),
-        "active_trips": [
-            {
-                "ride_id": ride_id,
-                "driver_id": driver_id,
-                "step": step
-            }
-            for ride_id, (driver_id, step) in dispatch_service.active_trips.items()
-        ]
-    }
+def get_system_state(since: Optional[int] = Query(None, ge=0, description="Only return entities changed after this version")):
+    """
+    Get the current state of the entire system, tagged with its version.
+    With `since`, only entities changed after that version are returned along
+    with the IDs of deleted ones; `full` is true when a full state was sent
+    instead because the version is too old.
+    """
+    return EncodedJSONResponse(_state_response(since)[1])
+
+
+add_simulation_routes(router, runtime, _state_response)
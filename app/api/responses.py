@@ -0,0 +1,30 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder is used without it
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content as compact JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with dumps(); the router's default response class."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class EncodedJSONResponse(JSONResponse):
+    """JSONResponse for a body that is already encoded (such as a cached snapshot)."""
+
+    def render(self, content: bytes) -> bytes:
+        return content
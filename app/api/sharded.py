@@ -0,0 +1,371 @@
+"""
+The HTTP API served by region-sharded dispatch (ShardedDispatcher), used
+instead of app.api.endpoints when SHARDS is above 1 (see app.main).
+
+Drivers, riders, rides, ticks, the clock, /state, /stream, metrics and the
+admin routes behave as in the single-service API (the shared routes are in
+app.api.common). Batch dispatch, persistence, road maps, rebalancing and
+tile counts are single-service features: their settings are refused at
+startup and their routes are not served. /state always returns the full
+state, and list responses carry no ETags. The dispatch metrics cover what
+the coordinator sees (ticks, assignment outcomes, rejections and pending
+waits), not the searches inside the worker processes.
+"""
+import atexit
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from fastapi import Body, Depends, HTTPException, Query, Response
+
+from app.api.common import (
+    DispatchRuntime, add_bulk_routes, add_diagnostic_routes, add_simulation_routes, api_router, bounding_box,
+    grid_height, grid_width, metrics_registry,
+)
+from app.api.responses import EncodedJSONResponse, FastJSONResponse, dumps
+from app.models.entities import Point
+from app.models.models import Driver, Rider, RideRequest, Location, DriverStatus, RideStatus
+from app.services.fleet import TILE_SIZE
+from app.services.metrics import DispatchMetrics, MetricsRegistry
+from app.services.sharding import ShardedDispatcher
+
+UNSUPPORTED_SETTINGS = ("DATA_DIR", "ROAD_MAP", "REBALANCE_EVERY", "BATCH_WINDOW_MS")
+
+for name in UNSUPPORTED_SETTINGS:
+    if os.environ.get(name):
+        raise ValueError(f"{name} is not supported with SHARDS")
+if os.environ.get("DISPATCH_MODE", "greedy") != "greedy":
+    raise ValueError("Only DISPATCH_MODE=greedy is supported with SHARDS")
+
+router = api_router()
+
+# One worker process per region; the coordinator lives in this process
+max_wait_ticks = os.environ.get("MAX_WAIT_TICKS")
+dispatcher = ShardedDispatcher(
+    int(os.environ["SHARDS"]), grid_width, grid_height, max_wait_ticks=int(max_wait_ticks) if max_wait_ticks else None
+)
+atexit.register(dispatcher.close)
+
+# The coordinator talks to the workers over pipes that must not be shared,
+# so every call runs on the runtime's writer thread
+runtime = DispatchRuntime(dispatcher)
+simulation_clock = runtime.clock
+_on_writer = runtime.call
+serialized = runtime.serialized
+
+
+def _register_state_metrics(registry: MetricsRegistry) -> None:
+    """Gauges read at scrape time from the coordinator's own state (the workers are only reached on the writer)."""
+    registry.gauge("dispatch_active_trips", "Trips in progress", dispatcher.active_trip_count)
+    registry.gauge(
+        "dispatch_state_entries", "Entries in the coordinator's state collections",
+        lambda: {
+            ("drivers",): len(dispatcher.driver_regions),
+            ("riders",): len(dispatcher.riders),
+            ("rides",): len(dispatcher.ride_regions),
+            ("active_requests_by_rider",): len(dispatcher.active_request_by_rider),
+            ("pending",): len(dispatcher.pending),
+        },
+        labels=("collection",),
+    )
+    registry.gauge("dispatch_writer_pending", "Commands waiting for the writer thread", lambda: runtime.writer.pending)
+    registry.gauge("dispatch_writer_rejected", "Commands refused because the writer queue was full",
+                   lambda: runtime.writer.rejected)
+    registry.gauge("dispatch_tick", "Current simulation tick", lambda: dispatcher.current_tick)
+    registry.gauge("dispatch_cross_region_searches", "Rides that needed a cross-region search",
+                   lambda: dispatcher.escalations)
+    registry.gauge("dispatch_handoffs", "Drivers handed off to another region", lambda: dispatcher.handoffs)
+
+
+if metrics_registry is not None:
+    dispatcher.metrics = DispatchMetrics(metrics_registry)
+    _register_state_metrics(metrics_registry)
+
+
+def dispatch_sizes() -> dict:
+    """Sizes of the coordinator's state, read without the writer (for diagnostics only)."""
+    return {
+        "drivers": len(dispatcher.driver_regions),
+        "riders": len(dispatcher.riders),
+        "rides": len(dispatcher.ride_regions),
+        "active_trips": dispatcher.active_trip_count(),
+        "pending": len(dispatcher.pending),
+        "writer_pending": runtime.writer.pending,
+    }
+
+
+def _driver_or_404(driver_id: str) -> dict:
+    driver = dispatcher.driver(driver_id)
+    if driver is None:
+        raise HTTPException(status_code=404, detail="Driver not found")
+    return driver
+
+
+def _ride_or_404(ride_id: str) -> dict:
+    ride = dispatcher.get_ride(ride_id)
+    if ride is None:
+        raise HTTPException(status_code=404, detail="Ride request not found")
+    return ride
+
+
+@router.get("/")
+def health_check():
+    """Simple health check endpoint."""
+    return {"status": "ok", "shards": dispatcher.shards}
+
+
+@router.get("/grid-info")
+def get_grid_info():
+    """Get information about the grid dimensions."""
+    return {"width": grid_width, "height": grid_height, "tile_size": TILE_SIZE}
+
+
+# Driver endpoints
+@router.post("/drivers/", response_model=Driver)
+@serialized
+def create_driver(location: Location = Body(...)):
+    """Create a new driver at the specified location."""
+    driver_id, = dispatcher.add_drivers([Point.of(location)])
+    return dispatcher.driver(driver_id)
+
+
+@router.get("/drivers/", response_model=List[Driver])
+def get_all_drivers(box: Optional[Tuple[int, int, int, int]] = Depends(bounding_box)):
+    """Get all drivers in the system, or with bbox only those inside the viewport."""
+    return FastJSONResponse(_on_writer(dispatcher.drivers, box))
+
+
+@router.get("/drivers/positions", response_class=Response)
+def get_driver_positions(box: Optional[Tuple[int, int, int, int]] = Depends(bounding_box)):
+    """
+    Positions and statuses of all drivers (or, with bbox, of those inside
+    the viewport) as packed little-endian arrays, for drawing large fleets:
+    x as int16[n], then y as int16[n], then the status code as int8[n]
+    (0 available, 1 on trip, 2 offline), in the same order as GET /drivers/.
+    n is in the X-Driver-Count header.
+    """
+    x, y, status = _on_writer(dispatcher.driver_positions, box)
+    positions = b"".join((
+        np.clip(x, -32768, 32767).astype("<i2").tobytes(),
+        np.clip(y, -32768, 32767).astype("<i2").tobytes(),
+        status.tobytes(),
+    ))
+    return Response(positions, media_type="application/octet-stream", headers={"X-Driver-Count": str(len(x))})
+
+
+@router.get("/drivers/{driver_id}", response_model=Driver)
+@serialized
+def get_driver(driver_id: str):
+    """Get a specific driver by ID."""
+    return _driver_or_404(driver_id)
+
+
+@router.delete("/drivers/{driver_id}")
+@serialized
+def delete_driver(driver_id: str):
+    """Remove a driver from the system."""
+    if _driver_or_404(driver_id)["status"] == DriverStatus.ON_TRIP.value:
+        raise HTTPException(status_code=400, detail="Cannot remove driver who is on a trip")
+    dispatcher.remove_driver(driver_id)
+    return {"message": f"Driver {driver_id} removed"}
+
+
+@router.put("/drivers/{driver_id}/status")
+@serialized
+def update_driver_status(driver_id: str, status: DriverStatus):
+    """Update a driver's status."""
+    if _driver_or_404(driver_id)["status"] == DriverStatus.ON_TRIP.value and status != DriverStatus.ON_TRIP:
+        raise HTTPException(status_code=400, detail="Cannot change status of driver who is on a trip")
+    dispatcher.set_driver_status(driver_id, status)
+    return {"message": f"Driver {driver_id} status updated to {status}"}
+
+
+# Rider endpoints
+@router.post("/riders/", response_model=Rider)
+@serialized
+def create_rider(location: Location = Body(...)):
+    """Create a new rider at the specified location."""
+    rider_id, = dispatcher.add_riders([Point.of(location)])
+    return dispatcher.riders[rider_id].to_dict()
+
+
+@router.get("/riders/", response_model=List[Rider])
+@serialized
+def get_all_riders(box: Optional[Tuple[int, int, int, int]] = Depends(bounding_box)):
+    """Get all riders in the system, or with bbox only those inside the viewport (ordered by ID)."""
+    riders = dispatcher.riders.values() if box is None else dispatcher.riders_in(*box)
+    return FastJSONResponse([rider.to_dict() for rider in riders])
+
+
+@router.get("/riders/{rider_id}", response_model=Rider)
+@serialized
+def get_rider(rider_id: str):
+    """Get a specific rider by ID."""
+    if rider_id not in dispatcher.riders:
+        raise HTTPException(status_code=404, detail="Rider not found")
+    return dispatcher.riders[rider_id].to_dict()
+
+
+@router.delete("/riders/{rider_id}")
+@serialized
+def delete_rider(rider_id: str):
+    """Remove a rider from the system."""
+    if rider_id not in dispatcher.riders:
+        raise HTTPException(status_code=404, detail="Rider not found")
+    if dispatcher.active_request_for(rider_id):
+        raise HTTPException(status_code=400, detail="Cannot remove rider with active ride request")
+    dispatcher.remove_rider(rider_id)
+    return {"message": f"Rider {rider_id} removed"}
+
+
+# Ride request endpoints
+@router.post("/rides/request", response_model=RideRequest)
+@serialized
+def request_ride(rider_id: str = Body(...), pickup: Location = Body(...), dropoff: Location = Body(...)):
+    """Create a new ride request and dispatch it."""
+    if rider_id not in dispatcher.riders:
+        raise HTTPException(status_code=404, detail="Rider not found")
+    if dispatcher.active_request_for(rider_id):
+        raise HTTPException(status_code=400, detail="Rider already has an active request")
+    (ride_id, _), = dispatcher.request_rides([(rider_id, Point.of(pickup), Point.of(dropoff))])
+    return dispatcher.get_ride(ride_id)
+
+
+def _add_driver_rows(locations: List[Location]) -> List[str]:
+    return dispatcher.add_drivers([Point.of(location) for location in locations])
+
+
+def _add_rider_rows(locations: List[Location]) -> List[str]:
+    return dispatcher.add_riders([Point.of(location) for location in locations])
+
+
+def _request_ride_rows(validated: list, requesting: set, results: list) -> list:
+    """Check one chunk of validated bulk ride rows like POST /rides/request; runs on the writer."""
+    accepted = []
+    for row, error in validated:
+        if error is None and row.rider_id not in dispatcher.riders:
+            error = "Rider not found"
+        elif error is None and (row.rider_id in requesting or dispatcher.active_request_for(row.rider_id)):
+            error = "Rider already has an active request"
+        if error:
+            results.append({"error": error})
+            continue
+        requesting.add(row.rider_id)
+        accepted.append((row.rider_id, Point.of(row.pickup), Point.of(row.dropoff)))
+        results.append({})
+    return accepted
+
+
+def _dispatch_ride_rows(accepted: list) -> List[Tuple[str, str]]:
+    """Request the rides of a bulk upload together; each region assigns those picked up inside it in parallel."""
+    return [
+        (ride_id, (RideStatus.ASSIGNED if driver_id else RideStatus.WAITING).value)
+        for ride_id, driver_id in dispatcher.request_rides(accepted)
+    ]
+
+
+add_bulk_routes(router, runtime, _add_driver_rows, _add_rider_rows, _request_ride_rows, _dispatch_ride_rows)
+
+
+@router.get("/rides/", response_model=List[RideRequest])
+def get_all_rides(
+    response: Response,
+    status: Optional[RideStatus] = None,
+    rider_id: Optional[str] = None,
+    driver_id: Optional[str] = None,
+    cursor: Optional[int] = Query(None, ge=0, description="Value of X-Next-Cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    Page through ride requests (active and archived) in creation order,
+    optionally filtered by status, rider and assigned driver. The cursor for
+    the next page is returned in the X-Next-Cursor header, absent on the
+    last page.
+    """
+    rides, next_cursor = _on_writer(dispatcher.list_rides, cursor, limit, status, rider_id, driver_id)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return FastJSONResponse(rides, headers=dict(response.headers))
+
+
+@router.get("/rides/{ride_id}", response_model=RideRequest)
+@serialized
+def get_ride(ride_id: str):
+    """Get a specific ride request by ID, including archived ones."""
+    return _ride_or_404(ride_id)
+
+
+@router.put("/rides/{ride_id}/accept")
+@serialized
+def accept_ride(ride_id: str, driver_id: str = Body(...)):
+    """Driver accepts a ride request."""
+    ride = _ride_or_404(ride_id)
+    driver = _driver_or_404(driver_id)
+    if ride["status"] != RideStatus.WAITING.value:
+        raise HTTPException(status_code=400, detail=f"Ride is not in waiting status (current: {ride['status']})")
+    if driver["status"] != DriverStatus.AVAILABLE.value:
+        raise HTTPException(status_code=400, detail=f"Driver is not available (current: {driver['status']})")
+    dispatcher.accept_ride(ride_id, driver_id)
+    return {"message": f"Driver {driver_id} accepted ride {ride_id}"}
+
+
+@router.put("/rides/{ride_id}/reject")
+@serialized
+def reject_ride(ride_id: str, driver_id: str = Body(...)):
+    """
+    Driver rejects a ride request: a waiting ride, or the ride they were
+    assigned if they have not picked the rider up yet.
+    """
+    ride = _ride_or_404(ride_id)
+    _driver_or_404(driver_id)
+    declining = dispatcher.trip(ride_id) == (driver_id, "to_pickup")
+    if ride["status"] != RideStatus.WAITING.value and not declining:
+        raise HTTPException(status_code=400, detail=f"Ride is not in waiting status (current: {ride['status']})")
+
+    if dispatcher.reject_ride(ride_id, driver_id) == RideStatus.FAILED:
+        return {"message": "No available drivers to fulfill this request", "status": "failed"}
+    return {"message": f"Driver {driver_id} rejected ride {ride_id}, finding another driver", "status": "reassigning"}
+
+
+@router.put("/rides/{ride_id}/cancel")
+@serialized
+def cancel_ride(ride_id: str):
+    """Cancel a ride request."""
+    ride = _ride_or_404(ride_id)
+    if ride["status"] not in (RideStatus.WAITING.value, RideStatus.ASSIGNED.value):
+        raise HTTPException(status_code=400, detail=f"Cannot cancel ride with status: {ride['status']}")
+    dispatcher.cancel_ride(ride_id)
+    return {"message": f"Ride {ride_id} has been cancelled successfully"}
+
+
+# Dispatch endpoints
+@router.get("/dispatch/regions")
+@serialized
+def get_region_stats():
+    """Per-region driver, waiting-ride and trip counts, plus cross-region searches and hand-offs so far."""
+    return {
+        "regions": dispatcher.stats(),
+        "cross_region_searches": dispatcher.escalations,
+        "handoffs": dispatcher.handoffs,
+    }
+
+
+add_diagnostic_routes(router, runtime)
+
+
+def _state_response(since: Optional[int] = None) -> Tuple[int, bytes]:
+    """(version, JSON body) of the full state; sharded dispatch keeps no changelog, so `since` is ignored."""
+    state = _on_writer(dispatcher.state)
+    return state["version"], dumps(state)
+
+
+@router.get("/state")
+def get_system_state(since: Optional[int] = Query(None, ge=0, description="Accepted for compatibility; ignored")):
+    """
+    Get the current state of the entire system, tagged with its version.
+    Always the full state (`full` is true), whatever `since` says.
+    """
+    return EncodedJSONResponse(_state_response(since)[1])
+
+
+add_simulation_routes(router, runtime, _state_response)
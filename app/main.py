@@ -1,13 +1,93 @@
+import os
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 # from app.api.endpoints import router
 from fastapi.staticfiles import StaticFiles
-from app.api.endpoints import router as api_router
+from app.api.common import slow_requests
+from app.services.diagnostics import SlowRequestLog, request_timings
+
+# SHARDS above 1 serves the API from region-sharded worker processes
+# (app.api.sharded); otherwise from one in-process dispatch service
+if int(os.environ.get("SHARDS", 1)) > 1:
+    from app.api.sharded import router as api_router, dispatch_sizes, simulation_clock
+else:
+    from app.api.endpoints import router as api_router, dispatch_sizes, simulation_clock
+
+
+class SlowRequestMiddleware:
+    """
+    ASGI middleware that times every HTTP request and records the ones over
+    the log's threshold: the request, its status, a timing breakdown (time
+    to the response start, waiting for and running on the dispatch writer,
+    everything else) and the dispatch state sizes. Event streams and the
+    `exclude` paths (long by design) are skipped.
+    """
+
+    def __init__(self, app, log: SlowRequestLog, sizes, exclude=()):
+        self.app = app
+        self.log = log
+        self.sizes = sizes
+        self.exclude = frozenset(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        timings = {"writer_wait_ms": 0.0, "writer_ms": 0.0, "writer_calls": 0}
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+        response = {"status": 500, "start_ms": None, "stream": False}
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["start_ms"] = (time.perf_counter() - started) * 1000
+                response["stream"] = any(
+                    name == b"content-type" and value.startswith(b"text/event-stream")
+                    for name, value in message.get("headers", ())
+                )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            request_timings.reset(token)
+            total_ms = (time.perf_counter() - started) * 1000
+            if total_ms >= self.log.threshold_ms and not response["stream"]:
+                writer_ms = timings["writer_wait_ms"] + timings["writer_ms"]
+                self.log.record({
+                    "at": time.time(),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query": scope["query_string"].decode("latin-1"),
+                    "status": response["status"],
+                    "total_ms": round(total_ms, 3),
+                    "response_start_ms": None if response["start_ms"] is None else round(response["start_ms"], 3),
+                    "writer_wait_ms": round(timings["writer_wait_ms"], 3),
+                    "writer_ms": round(timings["writer_ms"], 3),
+                    "writer_calls": timings["writer_calls"],
+                    "other_ms": round(total_ms - writer_ms, 3),
+                    "dispatch": self.sizes(),
+                })
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The simulation clock ticks from this event loop for the app's lifetime
+    simulation_clock.start()
+    yield
+    await simulation_clock.stop()
+
+
 # Create FastAPI application
 app = FastAPI(
     title="Ride Dispatch System",
     description="A simplified ride-hailing backend system with grid-based city simulation",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Configure CORS to allow requests from the frontend
@@ -19,6 +99,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Keep requests slower than SLOW_REQUEST_MS for GET /api/admin/slow-requests
+app.add_middleware(SlowRequestMiddleware, log=slow_requests, sizes=dispatch_sizes, exclude=("/api/admin/profile",))
+
 # Include our router
 # app.include_router(router)
 
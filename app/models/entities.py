@@ -0,0 +1,140 @@
+from typing import Dict, Iterable, Optional, Union
+
+from app.models.models import RideRequest, RideStatus
+
+
+# Internal counterparts of the API models. The dispatch service keeps these
+# plain __slots__ objects in its hot paths; the pydantic models in
+# app.models.models only describe requests and responses, and are converted
+# at the endpoint boundary with from_model()/to_dict().
+
+# A ride's status is kept as a small int code (its position in RideStatus);
+# the enum is only built at the edges.
+RIDE_STATUS_CODES = {status: code for code, status in enumerate(RideStatus)}
+RIDE_STATUS_BY_CODE = tuple(RideStatus)
+RIDE_WAITING = RIDE_STATUS_CODES[RideStatus.WAITING]
+RIDE_ASSIGNED = RIDE_STATUS_CODES[RideStatus.ASSIGNED]
+RIDE_COMPLETED = RIDE_STATUS_CODES[RideStatus.COMPLETED]
+RIDE_FAILED = RIDE_STATUS_CODES[RideStatus.FAILED]
+
+
+class Point:
+    """A grid position (internal Location)."""
+
+    __slots__ = ("x", "y")
+
+    def __init__(self, x: int, y: int):
+        self.x = x
+        self.y = y
+
+    @classmethod
+    def of(cls, location) -> "Point":
+        """Copy anything with x and y, e.g. a Location."""
+        return cls(location.x, location.y)
+
+    def to_dict(self) -> dict:
+        return {"x": self.x, "y": self.y}
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Point) and self.x == other.x and self.y == other.y
+
+    def __repr__(self) -> str:
+        return f"Point({self.x}, {self.y})"
+
+    def __reduce__(self):
+        return Point, (self.x, self.y)
+
+
+class RiderEntity:
+    """A rider (internal Rider)."""
+
+    __slots__ = ("id", "location")
+
+    def __init__(self, id: str, location: Point):
+        self.id = id
+        self.location = location
+
+    def to_dict(self) -> dict:
+        """JSON-ready dict in the shape of the Rider schema."""
+        return {"id": self.id, "location": {"x": self.location.x, "y": self.location.y}}
+
+    def __reduce__(self):
+        return RiderEntity, (self.id, self.location)
+
+
+class RideEntity:
+    """
+    A ride request (internal RideRequest). `status_code` is the status as a
+    RIDE_STATUS_CODES code; `status` reads and writes it as a RideStatus.
+    `rejected_by` is an ordered set (dict with None values) of the drivers
+    who turned the ride down.
+    """
+
+    __slots__ = ("id", "rider_id", "pickup", "dropoff", "status_code", "assigned_driver_id", "rejected_by")
+
+    def __init__(
+        self,
+        id: str,
+        rider_id: str,
+        pickup: Point,
+        dropoff: Point,
+        status: Union[RideStatus, int],
+        assigned_driver_id: Optional[str] = None,
+        rejected_by: Iterable[str] = (),
+    ):
+        self.id = id
+        self.rider_id = rider_id
+        self.pickup = pickup
+        self.dropoff = dropoff
+        self.status_code = status if type(status) is int else RIDE_STATUS_CODES[status]
+        self.assigned_driver_id = assigned_driver_id
+        self.rejected_by: Dict[str, None] = dict.fromkeys(rejected_by)
+
+    @property
+    def status(self) -> RideStatus:
+        return RIDE_STATUS_BY_CODE[self.status_code]
+
+    @status.setter
+    def status(self, status: RideStatus) -> None:
+        self.status_code = RIDE_STATUS_CODES[status]
+
+    @classmethod
+    def from_model(cls, ride_request: RideRequest) -> "RideEntity":
+        return cls(
+            ride_request.id, ride_request.rider_id,
+            Point.of(ride_request.pickup), Point.of(ride_request.dropoff),
+            ride_request.status, ride_request.assigned_driver_id, ride_request.rejected_by,
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RideEntity":
+        """Inverse of to_dict()."""
+        return cls(
+            data["id"], data["rider_id"],
+            Point(data["pickup"]["x"], data["pickup"]["y"]), Point(data["dropoff"]["x"], data["dropoff"]["y"]),
+            RideStatus(data["status"]), data["assigned_driver_id"], data["rejected_by"],
+        )
+
+    def to_dict(self) -> dict:
+        """JSON-ready dict in the shape of the RideRequest schema."""
+        return {
+            "id": self.id,
+            "rider_id": self.rider_id,
+            "pickup": {"x": self.pickup.x, "y": self.pickup.y},
+            "dropoff": {"x": self.dropoff.x, "y": self.dropoff.y},
+            "status": RIDE_STATUS_BY_CODE[self.status_code].value,
+            "assigned_driver_id": self.assigned_driver_id,
+            "rejected_by": list(self.rejected_by),
+        }
+
+    def to_model(self) -> RideRequest:
+        return RideRequest(**self.to_dict())
+
+    def __repr__(self) -> str:
+        return f"RideEntity({self.id!r}, status={self.status.value})"
+
+    def __reduce__(self):
+        return RideEntity, (
+            self.id, self.rider_id, self.pickup, self.dropoff, self.status_code,
+            self.assigned_driver_id, tuple(self.rejected_by),
+        )
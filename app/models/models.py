@@ -1,8 +1,17 @@
 from enum import Enum
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from typing import List, Optional, Dict
 
 
+# Grid dimensions that locations must fall within, see set_grid_size()
+GRID_SIZE = {"width": 100, "height": 100}
+
+
+def set_grid_size(width: int, height: int) -> None:
+    """Set the grid dimensions that Location coordinates are validated against."""
+    GRID_SIZE.update(width=width, height=height)
+
+
 class DriverStatus(str, Enum):
     AVAILABLE = "available"
     ON_TRIP = "on_trip"
@@ -21,6 +30,13 @@ class Location(BaseModel):
     x: int
     y: int
 
+    @model_validator(mode="after")
+    def _on_grid(self) -> "Location":
+        # One check per location rather than per field keeps bulk uploads fast
+        if not (0 <= self.x < GRID_SIZE["width"] and 0 <= self.y < GRID_SIZE["height"]):
+            raise ValueError(f"({self.x}, {self.y}) is off the {GRID_SIZE['width']}x{GRID_SIZE['height']} grid")
+        return self
+
 
 class Driver(BaseModel):
     id: str
@@ -43,3 +59,10 @@ class RideRequest(BaseModel):
     status: RideStatus
     assigned_driver_id: Optional[str] = None
     rejected_by: List[str] = []  # List of driver IDs who rejected this ride
+
+
+class RideRequestCreate(BaseModel):
+    """One row of a bulk ride request upload."""
+    rider_id: str
+    pickup: Location
+    dropoff: Location
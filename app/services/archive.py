@@ -0,0 +1,144 @@
+import sys
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.models.entities import RIDE_STATUS_CODES, Point, RideEntity
+from app.models.models import RideStatus
+
+
+NO_DRIVER = -1
+
+
+class RideArchive:
+    """
+    Append-only columnar store for rides that reached a terminal status.
+
+    Each archived ride is one position across NumPy columns (creation
+    sequence, status code, pickup/dropoff coordinates, rider and driver
+    string references). Rider and driver IDs are interned in a shared string
+    table, and the per-ride rejected_by lists are flattened into one array
+    with offsets. RideEntity objects are only rebuilt on lookup.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.seq = np.zeros(capacity, dtype=np.int64)
+        self.status = np.zeros(capacity, dtype=np.int8)
+        self.pickup_x = np.zeros(capacity, dtype=np.int32)
+        self.pickup_y = np.zeros(capacity, dtype=np.int32)
+        self.dropoff_x = np.zeros(capacity, dtype=np.int32)
+        self.dropoff_y = np.zeros(capacity, dtype=np.int32)
+        self.rider = np.zeros(capacity, dtype=np.int32)  # string table reference
+        self.driver = np.full(capacity, NO_DRIVER, dtype=np.int32)  # string table reference
+        self.rejected_end = np.zeros(capacity, dtype=np.int64)  # end offset into rejected
+        self.rejected = np.zeros(capacity, dtype=np.int32)  # flattened rejected_by references
+        self.ids: List[str] = []  # position -> ride_id
+        self.positions: Dict[str, int] = {}  # ride_id -> position
+        self._strings: List[str] = []
+        self._string_refs: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, ride_id: str) -> bool:
+        return ride_id in self.positions
+
+    def append(self, ride_request: RideEntity, seq: int) -> None:
+        """Archive a ride; `seq` is its creation sequence number."""
+        position = len(self.ids)
+        if position == len(self.seq):
+            self._grow()
+        self.seq[position] = seq
+        self.status[position] = ride_request.status_code
+        self.pickup_x[position] = ride_request.pickup.x
+        self.pickup_y[position] = ride_request.pickup.y
+        self.dropoff_x[position] = ride_request.dropoff.x
+        self.dropoff_y[position] = ride_request.dropoff.y
+        self.rider[position] = self._intern(ride_request.rider_id)
+        driver_id = ride_request.assigned_driver_id
+        self.driver[position] = self._intern(driver_id) if driver_id else NO_DRIVER
+
+        start = self.rejected_end[position - 1] if position else 0
+        end = start + len(ride_request.rejected_by)
+        while end > len(self.rejected):
+            self.rejected = np.resize(self.rejected, len(self.rejected) * 2)
+        for offset, rejected_id in enumerate(ride_request.rejected_by):
+            self.rejected[start + offset] = self._intern(rejected_id)
+        self.rejected_end[position] = end
+
+        self.ids.append(ride_request.id)
+        self.positions[ride_request.id] = position
+
+    def get(self, ride_id: str) -> Optional[RideEntity]:
+        position = self.positions.get(ride_id)
+        return None if position is None else self.ride_at(position)
+
+    def ride_at(self, position: int) -> RideEntity:
+        """Rebuild the RideEntity stored at an archive position."""
+        start = int(self.rejected_end[position - 1]) if position else 0
+        end = int(self.rejected_end[position])
+        driver = int(self.driver[position])
+        return RideEntity(
+            id=self.ids[position],
+            rider_id=self._strings[int(self.rider[position])],
+            pickup=Point(int(self.pickup_x[position]), int(self.pickup_y[position])),
+            dropoff=Point(int(self.dropoff_x[position]), int(self.dropoff_y[position])),
+            status=int(self.status[position]),
+            assigned_driver_id=self._strings[driver] if driver != NO_DRIVER else None,
+            rejected_by=(self._strings[ref] for ref in self.rejected[start:end].tolist())
+        )
+
+    def select(
+        self,
+        after_seq: int = -1,
+        limit: Optional[int] = None,
+        status: Optional[RideStatus] = None,
+        rider_id: Optional[str] = None,
+        driver_id: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Positions of archived rides matching the filters with a creation
+        sequence above `after_seq`, ordered by sequence, at most `limit`.
+        """
+        size = len(self.ids)
+        mask = self.seq[:size] > after_seq
+        if status is not None:
+            mask &= self.status[:size] == RIDE_STATUS_CODES[status]
+        for column, value in ((self.rider, rider_id), (self.driver, driver_id)):
+            if value is not None:
+                ref = self._string_refs.get(value)
+                if ref is None:
+                    return np.empty(0, dtype=np.int64)
+                mask &= column[:size] == ref
+        positions = np.flatnonzero(mask)
+        if limit is not None and len(positions) > limit:
+            positions = positions[np.argpartition(self.seq[positions], limit - 1)[:limit]]
+        return positions[np.argsort(self.seq[positions], kind="stable")]
+
+    def memory_bytes(self) -> int:
+        """Approximate memory held by the archive, including ID strings and maps."""
+        columns = (
+            self.seq, self.status, self.pickup_x, self.pickup_y, self.dropoff_x,
+            self.dropoff_y, self.rider, self.driver, self.rejected_end, self.rejected,
+        )
+        total = sum(column.nbytes for column in columns)
+        total += sys.getsizeof(self.ids) + sys.getsizeof(self.positions)
+        total += sum(sys.getsizeof(ride_id) for ride_id in self.ids)
+        total += sys.getsizeof(self._strings) + sys.getsizeof(self._string_refs)
+        total += sum(sys.getsizeof(string) for string in self._strings)
+        return total
+
+    def _intern(self, value: str) -> int:
+        ref = self._string_refs.get(value)
+        if ref is None:
+            ref = self._string_refs[value] = len(self._strings)
+            self._strings.append(value)
+        return ref
+
+    def _grow(self) -> None:
+        capacity = len(self.seq) * 2
+        for name in ("seq", "status", "pickup_x", "pickup_y", "dropoff_x", "dropoff_y", "rider", "rejected_end"):
+            setattr(self, name, np.resize(getattr(self, name), capacity))
+        driver = np.full(capacity, NO_DRIVER, dtype=np.int32)
+        driver[:len(self.driver)] = self.driver
+        self.driver = driver
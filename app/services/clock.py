@@ -0,0 +1,116 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+
+class SimulationClock:
+    """
+    Advances the simulation at a fixed rate from the asyncio event loop.
+
+    Ticks are scheduled against a fixed origin, so the rate does not drift
+    with the time each tick takes. When a step overruns its period, the
+    next step advances every tick that came due at once (one `advance(n)`
+    call); when the clock falls more than max_catch_up ticks behind, the
+    excess is dropped rather than replayed in a burst. Pausing, resuming
+    and changing the rate re-anchor the schedule at the current time.
+    """
+
+    def __init__(
+        self,
+        advance: Callable[[int], Awaitable],
+        rate: float = 10.0,
+        max_catch_up: int = 100,
+    ):
+        self.rate = rate  # ticks per second
+        self.max_catch_up = max_catch_up
+        self.running = False
+        self.ticks = 0  # ticks advanced by the clock
+        self.steps = 0  # advance() calls
+        self.overruns = 0  # steps that advanced more than one tick to catch up
+        self.dropped = 0  # ticks skipped because the clock fell too far behind
+        self.failed = 0  # advance() calls that raised (e.g. the writer queue was full)
+        self._advance = advance
+        self._changed: Optional[asyncio.Event] = None  # created on the loop the clock runs on
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the clock's task on the running event loop (paused or not)."""
+        if self._task is None:
+            self._changed = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def resume(self) -> None:
+        self.running = True
+        self._wake()
+
+    def pause(self) -> None:
+        self.running = False
+        self._wake()
+
+    def set_rate(self, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self._wake()
+
+    def _wake(self) -> None:
+        """Make the running task re-anchor its schedule; call from the clock's event loop."""
+        if self._changed is not None:
+            self._changed.set()
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "rate": self.rate,
+            "ticks": self.ticks,
+            "steps": self.steps,
+            "overruns": self.overruns,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        origin, scheduled = loop.time(), 0
+        while True:
+            if self._changed.is_set():
+                self._changed.clear()
+                origin, scheduled = loop.time(), 0
+            if not self.running:
+                await self._changed.wait()
+                continue
+
+            due = int((loop.time() - origin) * self.rate) - scheduled
+            if due <= 0:
+                # Sleep until the next tick is due, or until paused or re-rated
+                delay = origin + (scheduled + 1) / self.rate - loop.time()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), max(0.0, delay))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if due > self.max_catch_up:
+                self.dropped += due - self.max_catch_up
+                scheduled += due - self.max_catch_up
+                due = self.max_catch_up
+            if due > 1:
+                self.overruns += 1
+
+            try:
+                await self._advance(due)
+            except Exception:
+                # Retried with the next step; the missed ticks stay due
+                self.failed += 1
+                await asyncio.sleep(1 / self.rate)
+                continue
+            scheduled += due
+            self.ticks += due
+            self.steps += 1
@@ -0,0 +1,106 @@
+import heapq
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+class DemandHeatmap:
+    """
+    Rolling, time-decayed count of ride requests per grid cell.
+
+    The grid is divided into square cells of `cell_size` units. Requests are
+    counted into the bucket of the current period (`bucket_ticks` ticks),
+    one array increment each; the last `window` buckets are kept in a ring
+    and a bucket `age` periods old weighs decay ** age when rates are read,
+    so recent demand dominates and older demand drops out of the window.
+
+    Cells are grouped into tiles of `tile_cells` x `tile_cells`, and the
+    counts of a tile are only allocated once a request falls in it (and
+    dropped when its requests have all left the window), so a large city
+    costs memory and time in proportion to where demand actually is.
+    """
+
+    def __init__(
+        self,
+        width: int = 100,
+        height: int = 100,
+        cell_size: int = 10,
+        bucket_ticks: int = 10,
+        window: int = 6,
+        decay: float = 0.7,
+        tile_cells: int = 8,
+    ):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.bucket_ticks = bucket_ticks
+        self.window = window
+        self.decay = decay
+        self.tile_cells = tile_cells
+        self.shape = (-(-width // cell_size), -(-height // cell_size))
+        self.tiles: Dict[Tuple[int, int], np.ndarray] = {}  # tile -> ring of per-period buckets [slot, i, j]
+        self.period = 0  # period of the newest bucket (tick // bucket_ticks)
+        self.recorded = 0  # requests counted so far
+
+    def cell_of(self, x: int, y: int) -> Tuple[int, int]:
+        """The cell holding (x, y); points off the grid count towards the nearest edge cell."""
+        return (
+            min(max(x // self.cell_size, 0), self.shape[0] - 1),
+            min(max(y // self.cell_size, 0), self.shape[1] - 1),
+        )
+
+    def cells_of(self, xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """cell_of() for arrays of points."""
+        return (
+            np.clip(xs // self.cell_size, 0, self.shape[0] - 1),
+            np.clip(ys // self.cell_size, 0, self.shape[1] - 1),
+        )
+
+    def center(self, cx: int, cy: int) -> Tuple[int, int]:
+        """The grid point at the middle of cell (cx, cy)."""
+        return (
+            min(cx * self.cell_size + self.cell_size // 2, self.width - 1),
+            min(cy * self.cell_size + self.cell_size // 2, self.height - 1),
+        )
+
+    def record(self, x: int, y: int, tick: int) -> None:
+        """Count a ride request with its pickup at (x, y)."""
+        self._roll(tick)
+        cx, cy = self.cell_of(x, y)
+        t = self.tile_cells
+        counts = self.tiles.get((cx // t, cy // t))
+        if counts is None:
+            counts = self.tiles[(cx // t, cy // t)] = np.zeros((self.window, t, t), dtype=np.int32)
+        counts[self.period % self.window, cx % t, cy % t] += 1
+        self.recorded += 1
+
+    def _roll(self, tick: int) -> None:
+        """Clear the buckets of the periods that started since the newest one."""
+        period = tick // self.bucket_ticks
+        if period <= self.period:
+            return
+        stale = [p % self.window for p in range(self.period + 1, min(period, self.period + self.window) + 1)]
+        for tile, counts in list(self.tiles.items()):
+            counts[stale] = 0
+            if not counts.any():
+                del self.tiles[tile]
+        self.period = period
+
+    def rates(self, tick: int) -> Dict[Tuple[int, int], float]:
+        """Decay-weighted mean requests per tick of every cell with demand in the window."""
+        self._roll(tick)
+        if not self.tiles:
+            return {}
+        ages = (self.period - np.arange(self.window)) % self.window  # age of each ring slot
+        weights = self.decay ** ages
+        tiles = list(self.tiles)
+        rates = np.einsum("nsij,s->nij", np.stack([self.tiles[tile] for tile in tiles]), weights)
+        rates /= weights.sum() * self.bucket_ticks
+        n, i, j = np.nonzero(rates)
+        origins = np.array(tiles, dtype=np.int64)[n] * self.tile_cells
+        cells = zip((origins[:, 0] + i).tolist(), (origins[:, 1] + j).tolist())
+        return dict(zip(cells, rates[n, i, j].tolist()))
+
+    def hottest(self, rates: Dict[Tuple[int, int], float], count: int) -> List[Tuple[int, int]]:
+        """The `count` cells with the highest rates, hottest first."""
+        return heapq.nsmallest(count, rates, key=lambda cell: (-rates[cell], cell))
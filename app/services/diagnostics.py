@@ -0,0 +1,135 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+
+# Timing breakdown of the request being handled, set by the slow-request
+# middleware; code that knows where time goes (e.g. waiting for the
+# dispatch writer) adds to it. None outside a request.
+request_timings: ContextVar[Optional[dict]] = ContextVar("request_timings", default=None)
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_label(code) -> str:
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler over all threads of the process.
+
+    While running, the calling thread snapshots every other thread's stack
+    with sys._current_frames() each `interval` seconds and counts identical
+    stacks. The result is in the collapsed-stack format flame graph tools
+    read ("thread;outer;...;inner count"). Sampling costs the profiled
+    threads only the GIL hand-offs, so it is safe to run in production for a
+    bounded window. Only one profile runs at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def sample(self, seconds: float, interval: float = 0.005, thread_name: Optional[str] = None) -> dict:
+        """
+        Sample for `seconds` and return {"samples", "interval_ms", "stacks"}
+        where stacks maps collapsed stacks to sample counts. With
+        thread_name, only threads of that name are sampled.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            return self._sample(seconds, interval, thread_name)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float, thread_name: Optional[str]) -> dict:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        labels: Dict[object, str] = {}  # code object -> frame label
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                name = names.get(ident, str(ident))
+                if ident == me or (thread_name is not None and name != thread_name):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = _frame_label(code)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(name)
+                stacks[";".join(reversed(stack))] += 1
+            samples += 1
+            time.sleep(interval)
+        return {"samples": samples, "interval_ms": interval * 1000, "stacks": dict(stacks.most_common())}
+
+    def profile(self, seconds: float, run_on: Callable[[Callable], object], limit: int = 50) -> str:
+        """
+        Deterministic profile (cProfile) of one thread for `seconds`.
+
+        cProfile only sees the thread that enables it, so enable and disable
+        are called through run_on, e.g. the dispatch writer's call(). Returns
+        the pstats report of the `limit` functions with the most cumulative
+        time.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            profile = cProfile.Profile()
+            run_on(profile.enable)
+            try:
+                time.sleep(seconds)
+            finally:
+                run_on(profile.disable)
+            out = io.StringIO()
+            pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(limit)
+            return out.getvalue()
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def collapsed(stacks: Dict[str, int]) -> str:
+        """Collapsed-stack text, one "stack count" line per stack."""
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.items())
+
+
+class SlowRequestLog:
+    """
+    Bounded ring buffer of requests that took longer than threshold_ms,
+    newest last. Entries are plain dicts built by the caller.
+    """
+
+    def __init__(self, threshold_ms: float = 250, size: int = 200):
+        self.threshold_ms = threshold_ms
+        self.recorded = 0  # slow requests seen, including ones since evicted
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, entry: dict) -> None:
+        with self._lock:
+            self._entries.append(entry)
+            self.recorded += 1
+
+    def entries(self, limit: Optional[int] = None, path: Optional[str] = None) -> List[dict]:
+        """The newest `limit` entries (all by default), optionally only those for `path`, newest first."""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        if path is not None:
+            entries = [entry for entry in entries if entry["path"] == path]
+        return entries[:limit]
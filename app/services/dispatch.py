@@ -1,77 +1,969 @@
-from typing import List, Optional, Tuple
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Tuple
 
-from app.models.models import Driver, RideRequest, RideStatus, Location, DriverStatus
+import numpy as np
+
+from app.models.entities import (
+    RIDE_ASSIGNED, RIDE_COMPLETED, RIDE_FAILED, RIDE_STATUS_BY_CODE, RIDE_STATUS_CODES, RIDE_WAITING,
+    Point, RideEntity, RiderEntity,
+)
+from app.models.models import RideStatus, DriverStatus
+from app.services.archive import RideArchive
+from app.services.demand import DemandHeatmap
+from app.services.fleet import FleetStore, STATUS_CODES
+from app.services.metrics import timed
+from app.services.pending import PendingQueue
+from app.services.matching import UNREACHABLE, connected_components, greedy_assignment, solve_assignment
+from app.services.persistence import journaled
+from app.services.roadmap import UNREACHABLE as ROAD_UNREACHABLE, RoadMap
+from app.services.spatial_index import SpatialIndex, box_tiles
+from app.services.trips import PICKUP, TripTable
+
+
+# Entity collections tracked for delta sync
+CHANGE_KINDS = ("drivers", "riders", "rides", "trips")
+
+# Rides in these statuses are moved from ride_requests to the archive
+TERMINAL_STATUSES = (RideStatus.COMPLETED, RideStatus.FAILED)
+TERMINAL_CODES = (RIDE_COMPLETED, RIDE_FAILED)
+
+# Settings that configure() may change
+CONFIG_ATTRIBUTES = (
+    "fairness_weight", "eta_weight", "max_rejection_attempts", "dispatch_mode",
+    "batch_window_ms", "batch_candidates", "bulk_batch_size", "changelog_limit",
+    "max_wait_ticks", "candidate_cache_size", "rejection_distance", "fail_fast_rejections",
+    "rebalance_every", "rebalance_max_drivers", "rebalance_max_distance",
+)
+
+
+def _check_dispatch_mode(dispatch_mode: str) -> None:
+    if dispatch_mode not in ("greedy", "batch"):
+        raise ValueError(f"Unknown dispatch mode: {dispatch_mode}")
 
 
 class DispatchService:
-    def __init__(self):
-        """Initialize the dispatch service with empty state."""
-        self.drivers = {}  # driver_id -> Driver
-        self.riders = {}  # rider_id -> Rider
-        self.ride_requests = {}  # request_id -> RideRequest
+    def __init__(
+        self,
+        dispatch_mode: str = "greedy",
+        batch_window_ms: Optional[float] = None,
+        batch_candidates: int = 8,
+        max_wait_ticks: Optional[int] = None,
+        rebalance_every: Optional[int] = None,
+        grid_width: int = 100,
+        grid_height: int = 100,
+    ):
+        """
+        Initialize the dispatch service with empty state.
+
+        dispatch_mode is "greedy" (assign each request as it arrives) or
+        "batch" (collect requests and solve them together). In batch mode,
+        batch_window_ms bounds how long a batch stays open; None means the
+        batch is solved at the start of the next tick. Requests that find
+        no driver wait in the pending queue for one to free up; after
+        max_wait_ticks ticks (None: forever) they are FAILED. Every
+        rebalance_every ticks (None: never), idle drivers are sent towards
+        cells where recent demand outstrips the drivers nearby. The city is
+        a grid_width x grid_height grid of unit blocks.
+        """
+        _check_dispatch_mode(dispatch_mode)
+        self.fleet = FleetStore()  # Driver state, one row per driver
+        self.riders = {}  # rider_id -> RiderEntity
+        self.rider_tiles: Dict[Tuple[int, int], Dict[str, None]] = {}  # fleet tile -> rider IDs
+        self.ride_requests = {}  # request_id -> RideEntity, non-terminal rides only
+        self.archive = RideArchive()  # COMPLETED and FAILED rides
+        self._ride_seq = {}  # request_id -> creation sequence, for hot rides
+        self._next_ride_seq = 0
         self.active_trips = {}  # request_id -> (driver_id, step)
-        
+        self.active_request_by_rider = {}  # rider_id -> WAITING or ASSIGNED request_id
+        self.rides_by_status = [{} for _ in RideStatus]  # status code -> ordered set of request_ids
+        self.available_index = SpatialIndex()  # fleet rows of AVAILABLE drivers
+        self.road_map = None  # RoadMap with blocked cells and one-way streets, None for the open grid
+        self.pending = PendingQueue()  # WAITING rides that found no driver
+        self.grid_width = grid_width
+        self.grid_height = grid_height
+        self.demand = DemandHeatmap(grid_width, grid_height)  # recent ride requests per cell
+        self.repositioning: Dict[int, Point] = {}  # fleet row of an idle driver -> cell it is sent to
+        self._candidates = {}  # request_id -> [index generation, normalization, ranked (score, row)], see find_best_driver
+        self.current_tick = 0
+
+        # Array mirror of active_trips used by the tick engine. New and ended
+        # trips are buffered and folded in at the start of the next tick
+        # (ended ones first, so a ride can end one trip and start another).
+        self.trip_table = TripTable()
+        self._started_trips = []
+        self._ended_trips = set()
+
+        # Change tracking for delta sync. Every mutation bumps `version`;
+        # drivers are stamped in fleet.version, other entities in the
+        # changelog, which is ordered oldest change first.
+        self.version = 0
+        self.collection_versions = {kind: 0 for kind in CHANGE_KINDS}
+        self.changelog_limit = 100_000
+        self._changelog: Dict[Tuple[str, str], int] = OrderedDict()  # (kind, entity_id) -> version
+        self._changelog_floor = 0  # changes up to this version may have been forgotten
+        self.change_listeners: List[Callable[[], None]] = []  # called after each change
+        self.tick_listeners: List[Callable[[int, List[dict]], None]] = []  # called with each tick's events
+
         # Configuration parameters
         self.fairness_weight = 0.3  # Weight for fairness in driver selection
         self.eta_weight = 0.7  # Weight for ETA in driver selection
         self.max_rejection_attempts = 3  # Max number of drivers to try before failing
+        self.fail_fast_rejections = False  # Fail at max_rejection_attempts even while drivers are left
+        self.rejection_distance = 20  # simulate_driver_decision rejects pickups farther than this
+        self.dispatch_mode = dispatch_mode
+        self.batch_window_ms = batch_window_ms
+        self.batch_candidates = batch_candidates  # Drivers considered per request in a batch
+        self.bulk_batch_size = 256  # Max requests solved together by submit_rides
+        self.max_wait_ticks = max_wait_ticks  # Ticks a pending request waits before failing
+        self.candidate_cache_size = 8  # Ranked drivers remembered per ride for reject-and-retry
+        self.rebalance_every = rebalance_every  # Ticks between rebalancing steps, None to leave idle drivers be
+        self.rebalance_max_drivers = 50  # Idle drivers sent off per rebalancing step
+        self.rebalance_max_distance = 20  # Farthest an idle driver is sent
 
-    def calculate_distance(self, loc1: Location, loc2: Location) -> float:
-        """Calculate Manhattan distance between two locations."""
+        # Batch matching state
+        self.batch_queue = []  # ride request IDs waiting for the next batch
+        self._batch_opened_at = None
+        self.batch_reports = deque(maxlen=100)  # per-batch solve statistics
+
+        # Command journal (see app.services.persistence), None when not persisted
+        self.journal = None
+        self._journal_depth = 0
+        self._replaying = False  # replay re-runs logged batch flushes instead of timing them
+
+        # Instrumentation (a DispatchMetrics from app.services.metrics), None when disabled
+        self.metrics = None
+
+    @journaled
+    def configure(self, **settings) -> None:
+        """Change configuration parameters by name (see CONFIG_ATTRIBUTES)."""
+        for name, value in settings.items():
+            if name not in CONFIG_ATTRIBUTES:
+                raise ValueError(f"Unknown setting: {name}")
+            if name == "dispatch_mode":
+                _check_dispatch_mode(value)
+            setattr(self, name, value)
+        self._candidates.clear()  # cached scores may use the old weights
+
+    @journaled
+    def set_road_map(self, spec: Optional[dict]) -> None:
+        """
+        Drive on the road map described by `spec` (RoadMap.to_dict() fields),
+        or on the open grid again with None. Active trips are rerouted.
+        """
+        self.road_map = RoadMap.from_dict(spec) if spec is not None else None
+        self.trip_table.road_map = self.road_map
+        self.trip_table.reroute()
+        self._candidates.clear()
+
+    def calculate_distance(self, loc1: Point, loc2: Point) -> float:
+        """Calculate the travel distance between two locations (Manhattan on the open grid)."""
+        if self.road_map is not None:
+            return self.road_map.distance(loc1.x, loc1.y, loc2.x, loc2.y)
         return abs(loc1.x - loc2.x) + abs(loc1.y - loc2.y)
-    
-    def calculate_eta(self, driver: Driver, pickup: Location) -> float:
+
+    def calculate_eta(self, driver_id: str, pickup: Point) -> float:
         """Calculate ETA for a driver to reach pickup location."""
-        # Using Manhattan distance as ETA (1 unit per tick)
-        return self.calculate_distance(driver.location, pickup)
-    
-    def find_best_driver(self, ride_request: RideRequest) -> Optional[Driver]:
+        # Travel distance as ETA (1 unit per tick)
+        x, y = self.fleet.location_of(self.fleet.rows[driver_id])
+        if self.road_map is not None:
+            return self.road_map.distance(x, y, pickup.x, pickup.y)
+        return abs(x - pickup.x) + abs(y - pickup.y)
+
+    def _etas(self, rows: np.ndarray, px: int, py: int) -> np.ndarray:
+        """ETAs of the drivers in fleet `rows` to (px, py)."""
+        if self.road_map is not None:
+            return self.road_map.distances_to(px, py, self.fleet.x[rows], self.fleet.y[rows])
+        return np.abs(self.fleet.x[rows] - px) + np.abs(self.fleet.y[rows] - py)
+
+    @journaled
+    def add_driver(self, driver_id: str, location: Point) -> None:
+        """Register a new available driver at the given location."""
+        row = self.fleet.add(driver_id, location.x, location.y)
+        self._reindex_row(row)
+        self._dispatch_pending(row)
+
+    @journaled
+    def add_drivers(self, driver_ids: List[str], locations: List[Point]) -> None:
+        """Register many available drivers in one pass over the fleet columns."""
+        if not driver_ids:
+            return
+        rows = self.fleet.add_many(
+            driver_ids,
+            np.fromiter((loc.x for loc in locations), dtype=np.int32, count=len(locations)),
+            np.fromiter((loc.y for loc in locations), dtype=np.int32, count=len(locations)),
+        )
+        for row, loc in zip(rows.tolist(), locations):
+            self.available_index.insert(row, loc.x, loc.y, 0)
+        self._touch_drivers(rows)
+        if self.pending:
+            for row in rows.tolist():
+                self._dispatch_pending(row)
+
+    @journaled
+    def remove_driver(self, driver_id: str) -> None:
+        """Remove a driver from the fleet and the spatial index."""
+        row = self.fleet.remove(driver_id)
+        self.available_index.remove(row)
+        self.repositioning.pop(row, None)
+        self._touch_drivers(row)
+
+    def driver_status(self, driver_id: str) -> DriverStatus:
+        return self.fleet.status_of(self.fleet.rows[driver_id])
+
+    @journaled
+    def set_driver_status(self, driver_id: str, status: DriverStatus) -> None:
+        """Change a driver's status, keeping the available-driver index in sync."""
+        row = self.fleet.rows[driver_id]
+        self.fleet.status[row] = STATUS_CODES[status]
+        self._reindex_row(row)
+        if status == DriverStatus.AVAILABLE:
+            self._dispatch_pending(row)
+
+    def _reindex_row(self, row: int) -> None:
+        """Refresh the index and change stamp of a driver row that changed."""
+        fleet = self.fleet
+        if fleet.status[row] == STATUS_CODES[DriverStatus.AVAILABLE]:
+            self.available_index.update(row, int(fleet.x[row]), int(fleet.y[row]), int(fleet.rides[row]))
+        else:
+            self.available_index.remove(row)
+            self.repositioning.pop(row, None)
+        self._touch_drivers(row)
+
+    def _dispatch_pending(self, row: int) -> None:
+        """
+        Give a driver who just became available the nearest pending ride
+        that has not rejected them, if there is one.
+
+        Rides are ranked by the driver's ETA to the pickup, on the road map
+        when one is loaded, which for one driver is the same order as the
+        dispatch score: its fairness term is the driver's own for every ride.
+        """
+        if not self.pending or row not in self.available_index:
+            return
+        driver_id = self.fleet.ids[row]
+        x, y = self.fleet.location_of(row)
+        ride_id = self.pending.nearest(
+            x, y, lambda r: driver_id not in self.ride_requests[r].rejected_by, self._pending_eta(x, y)
+        )
+        if ride_id is None:
+            return
+        wait = self.pending.take(ride_id, self.current_tick)
+        if self.metrics is not None:
+            self.metrics.pending_wait.labels("matched").observe(wait)
+        self.start_trip(self.ride_requests[ride_id], driver_id)
+
+    def _expire_pending(self) -> None:
+        """Fail the pending rides that have waited max_wait_ticks or longer."""
+        if self.max_wait_ticks is None or not self.pending:
+            return
+        for ride_id in list(self.pending.waiting_since(self.current_tick - self.max_wait_ticks)):
+            self.pending.expired += 1
+            if self.metrics is not None:
+                self.metrics.pending_wait.labels("expired").observe(self.current_tick - self.pending.entries[ride_id][0])
+            self.set_ride_status(self.ride_requests[ride_id], RideStatus.FAILED)
+
+    def _pending_eta(self, x: int, y: int) -> Optional[Callable[[int, int], Optional[int]]]:
+        """ETA from (x, y) to a pickup for PendingQueue.nearest; None (Manhattan distance) on the open grid."""
+        road_map = self.road_map
+        if road_map is None:
+            return None
+
+        def eta(px: int, py: int) -> Optional[int]:
+            distance = road_map.distance(x, y, px, py)
+            return distance if distance < ROAD_UNREACHABLE else None
+
+        return eta
+
+    def pending_report(self) -> dict:
+        """Pending queue depth, outcomes and wait-time percentiles in ticks."""
+        return {**self.pending.report(self.current_tick), "max_wait_ticks": self.max_wait_ticks}
+
+    def _idle_supply(self) -> Counter:
+        """Available drivers per demand cell, counting repositioning drivers at their destination."""
+        demand = self.demand
+        rows = np.fromiter(self.available_index.entries, dtype=np.int64, count=len(self.available_index))
+        cx, cy = demand.cells_of(self.fleet.x[rows], self.fleet.y[rows])
+        cells, counts = np.unique(cx.astype(np.int64) * demand.shape[1] + cy, return_counts=True)
+        supply = Counter(dict(zip(
+            zip((cells // demand.shape[1]).tolist(), (cells % demand.shape[1]).tolist()), counts.tolist()
+        )))
+        for row, target in self.repositioning.items():
+            supply[demand.cell_of(*self.fleet.location_of(row))] -= 1
+            supply[demand.cell_of(target.x, target.y)] += 1
+        return supply
+
+    def _rebalance(self) -> int:
+        """
+        Send idle drivers towards under-served cells: each cell's fair share
+        of the available drivers follows its share of recent demand, and the
+        cells furthest below it (most under-served first) draw the nearest
+        drivers from cells above theirs, at most rebalance_max_distance away
+        and rebalance_max_drivers per step. Returns the drivers sent.
+        """
+        demand = self.demand
+        rates = demand.rates(self.current_tick)
+        total = sum(rates.values())
+        if not self.available_index or total <= 0:
+            return 0
+        surplus = self._idle_supply()  # positive where drivers outnumber demand
+        share = len(self.available_index) / total
+        for cell, rate in rates.items():
+            surplus[cell] -= rate * share
+        # Only cells with demand can fall short of their share
+        short = sorted((cell for cell in rates if surplus[cell] <= -1), key=lambda cell: (surplus[cell], cell))
+        sent = 0
+        for cell in short:
+            if sent >= self.rebalance_max_drivers:
+                break
+            target = Point(*demand.center(*cell))
+            for row in self._idle_near(target):
+                donor = demand.cell_of(*self.fleet.location_of(row))
+                if surplus[donor] < 1 or donor == cell:
+                    continue
+                self.repositioning[row] = target
+                surplus[donor] -= 1
+                surplus[cell] += 1
+                sent += 1
+                if surplus[cell] > -1 or sent >= self.rebalance_max_drivers:
+                    break
+        return sent
+
+    def _idle_near(self, target: Point) -> List[int]:
+        """Available drivers not already repositioning within rebalance_max_distance of target, nearest first."""
+        index = self.available_index
+        rows = []
+        ring = 0
+        while index.ring_min_distance(ring) <= self.rebalance_max_distance and len(rows) < len(index):
+            rows.extend(row for row in index.ring(target.x, target.y, ring) if row not in self.repositioning)
+            ring += 1
+        if not rows:
+            return []
+        rows = np.array(rows, dtype=np.int64)
+        etas = self._etas(rows, target.x, target.y)
+        order = np.argsort(etas, kind="stable")
+        return rows[order][etas[order] <= self.rebalance_max_distance].tolist()
+
+    def _reposition(self) -> None:
+        """Move each repositioning driver one step towards their cell."""
+        for row, target in list(self.repositioning.items()):
+            if self._move_towards(row, target):
+                del self.repositioning[row]
+
+    def demand_report(self, top: int = 10) -> dict:
+        """The demand heatmap (requests per tick per cell), its hottest cells and the rebalancing state."""
+        demand = self.demand
+        rates = demand.rates(self.current_tick)
+        supply = self._idle_supply()
+        return {
+            "tick": self.current_tick,
+            "cell_size": demand.cell_size,
+            "columns": demand.shape[0],
+            "rows": demand.shape[1],
+            "window_ticks": demand.window * demand.bucket_ticks,
+            "requests": demand.recorded,
+            "cells": [[cx, cy, round(rate, 4)] for (cx, cy), rate in sorted(rates.items())],
+            "hottest": [
+                {"cell": [cx, cy], "center": list(demand.center(cx, cy)), "rate": round(rates[cx, cy], 4),
+                 "idle_drivers": supply[cx, cy]}
+                for cx, cy in demand.hottest(rates, top)
+            ],
+            "rebalance_every": self.rebalance_every,
+            "repositioning": len(self.repositioning),
+        }
+
+    @journaled
+    def add_rider(self, rider: RiderEntity) -> None:
+        self._unfile_rider(rider.id)
+        self.riders[rider.id] = rider
+        self._file_rider(rider)
+        self._touch("riders", rider.id)
+
+    @journaled
+    def add_riders(self, riders: List[RiderEntity]) -> None:
+        for rider in riders:
+            self._unfile_rider(rider.id)
+            self.riders[rider.id] = rider
+            self._file_rider(rider)
+        self._touch_many("riders", [rider.id for rider in riders])
+
+    @journaled
+    def remove_rider(self, rider_id: str) -> None:
+        self._unfile_rider(rider_id)
+        del self.riders[rider_id]
+        self._touch("riders", rider_id)
+
+    def _rider_tile(self, rider: RiderEntity) -> Tuple[int, int]:
+        return rider.location.x // self.fleet.tile_size, rider.location.y // self.fleet.tile_size
+
+    def _file_rider(self, rider: RiderEntity) -> None:
+        self.rider_tiles.setdefault(self._rider_tile(rider), {})[rider.id] = None
+
+    def _unfile_rider(self, rider_id: str) -> None:
+        rider = self.riders.get(rider_id)
+        if rider is None:
+            return
+        tile = self._rider_tile(rider)
+        rider_ids = self.rider_tiles[tile]
+        del rider_ids[rider_id]
+        if not rider_ids:
+            del self.rider_tiles[tile]
+
+    def riders_in(self, x0: int, y0: int, x1: int, y1: int) -> List[RiderEntity]:
+        """Riders inside the box from (x0, y0) to (x1, y1), inclusive, ordered by ID."""
+        tile_size = self.fleet.tile_size
+        riders = (
+            self.riders[rider_id]
+            for tile in box_tiles(self.rider_tiles, tile_size, x0, y0, x1, y1)
+            for rider_id in self.rider_tiles[tile]
+        )
+        return sorted(
+            (rider for rider in riders if x0 <= rider.location.x <= x1 and y0 <= rider.location.y <= y1),
+            key=lambda rider: rider.id,
+        )
+
+    def tile_report(self, x0: int, y0: int, x1: int, y1: int) -> dict:
+        """
+        Per-tile counts of drivers (all and available) and riders in the
+        occupied tiles overlapping the box; tiles are fleet.tile_size units
+        a side, and only occupied ones are visited.
+        """
+        fleet_tiles, rider_tiles = self.fleet.tiles, self.rider_tiles
+        tile_size = self.fleet.tile_size
+        available = self.available_index.tile_counts
+        tiles = set(box_tiles(fleet_tiles, tile_size, x0, y0, x1, y1))
+        tiles.update(box_tiles(rider_tiles, tile_size, x0, y0, x1, y1))
+        return {
+            "tile_size": tile_size,
+            "columns": ["tx", "ty", "drivers", "available", "riders"],
+            "tiles": [
+                [tile[0], tile[1], len(fleet_tiles.get(tile, ())), available.get(tile, 0), len(rider_tiles.get(tile, ()))]
+                for tile in sorted(tiles)
+            ],
+        }
+
+    def _touch(self, kind: str, entity_id: str) -> None:
+        """Record that an entity changed (or was created or deleted)."""
+        self._touch_many(kind, (entity_id,))
+
+    def _touch_many(self, kind: str, entity_ids) -> None:
+        """Record that several entities of one kind changed, as a single version."""
+        if not entity_ids:
+            return
+        self.version += 1
+        self.collection_versions[kind] = self.version
+        changelog = self._changelog
+        for entity_id in entity_ids:
+            key = (kind, entity_id)
+            changelog[key] = self.version
+            changelog.move_to_end(key)
+        # popitem(last=False) is O(1); next(iter(dict)) would rescan the
+        # slots freed by earlier trims
+        while len(changelog) > self.changelog_limit:
+            self._changelog_floor = changelog.popitem(last=False)[1]
+        for listener in self.change_listeners:
+            listener()
+
+    def _touch_drivers(self, rows) -> None:
+        """Record that one or more fleet rows changed."""
+        self.version += 1
+        self.collection_versions["drivers"] = self.version
+        self.fleet.version[rows] = self.version
+        for listener in self.change_listeners:
+            listener()
+
+    def changes_since(self, version: int) -> Optional[dict]:
+        """
+        Return what changed after `version`: the current version, changed
+        fleet rows (including removed ones) and, per other collection, the
+        IDs of changed entities. Entities that no longer exist were deleted.
+        Returns None when the changelog no longer reaches back that far.
+        """
+        if version < self._changelog_floor or version > self.version:
+            return None
+        changes = {kind: [] for kind in CHANGE_KINDS if kind != "drivers"}
+        for (kind, entity_id), changed_at in reversed(self._changelog.items()):
+            if changed_at <= version:
+                break
+            changes[kind].append(entity_id)
+        changes["drivers"] = self.fleet.rows_changed_since(version)
+        changes["version"] = self.version
+        return changes
+
+    @journaled
+    def add_ride_request(self, ride_request: RideEntity) -> None:
+        """Register a new ride request and index it by status and rider."""
+        self.add_ride_requests([ride_request])
+
+    @journaled
+    def add_ride_requests(self, ride_requests: List[RideEntity]) -> None:
+        """Register many ride requests, recording them as a single change."""
+        for ride_request in ride_requests:
+            seq = self._next_ride_seq
+            self._next_ride_seq += 1
+            code = ride_request.status_code
+            if code in TERMINAL_CODES:
+                self.archive.append(ride_request, seq)
+                continue
+            self.ride_requests[ride_request.id] = ride_request
+            self._ride_seq[ride_request.id] = seq
+            self.rides_by_status[code][ride_request.id] = None
+            if code == RIDE_WAITING or code == RIDE_ASSIGNED:
+                self.active_request_by_rider[ride_request.rider_id] = ride_request.id
+            if code == RIDE_WAITING:
+                self.demand.record(ride_request.pickup.x, ride_request.pickup.y, self.current_tick)
+        self._touch_many("rides", [ride_request.id for ride_request in ride_requests])
+
+    @journaled
+    def set_ride_status(self, ride_request: RideEntity, status: RideStatus) -> None:
+        """
+        Change a ride's status, keeping the status and rider indexes in sync.
+        A ride reaching a terminal status is moved to the archive, so set
+        every other field before calling this.
+        """
+        self.rides_by_status[ride_request.status_code].pop(ride_request.id, None)
+        code = ride_request.status_code = RIDE_STATUS_CODES[status]
+        if code != RIDE_WAITING:
+            self.pending.remove(ride_request.id)
+
+        if code == RIDE_WAITING or code == RIDE_ASSIGNED:
+            self.active_request_by_rider[ride_request.rider_id] = ride_request.id
+        elif self.active_request_by_rider.get(ride_request.rider_id) == ride_request.id:
+            del self.active_request_by_rider[ride_request.rider_id]
+
+        if code in TERMINAL_CODES:
+            self._candidates.pop(ride_request.id, None)
+            del self.ride_requests[ride_request.id]
+            self.archive.append(ride_request, self._ride_seq.pop(ride_request.id))
+        else:
+            self.rides_by_status[code][ride_request.id] = None
+        self._touch("rides", ride_request.id)
+
+    def get_ride(self, ride_id: str) -> Optional[RideEntity]:
+        """
+        Look up a ride, hot or archived. Archived rides come back as fresh
+        copies, so changing them has no effect.
+        """
+        ride_request = self.ride_requests.get(ride_id)
+        return ride_request if ride_request is not None else self.archive.get(ride_id)
+
+    def ride_count(self) -> int:
+        return len(self.ride_requests) + len(self.archive)
+
+    def rides_with_status(self, status: RideStatus) -> List[RideEntity]:
+        """Return the ride requests currently in the given status."""
+        if status in TERMINAL_STATUSES:
+            return [self.archive.ride_at(p) for p in self.archive.select(status=status).tolist()]
+        return [self.ride_requests[ride_id] for ride_id in self.rides_by_status[RIDE_STATUS_CODES[status]]]
+
+    def list_rides(
+        self,
+        after: Optional[int] = None,
+        limit: int = 100,
+        status: Optional[RideStatus] = None,
+        rider_id: Optional[str] = None,
+        driver_id: Optional[str] = None,
+    ) -> Tuple[List[RideEntity], Optional[int]]:
+        """
+        Page through hot and archived rides in creation order.
+        `after` is the cursor returned by the previous page. Returns the page
+        and the cursor for the next one (None on the last page).
+        """
+        after = -1 if after is None else after
+        hot = []
+        if status not in TERMINAL_STATUSES:
+            candidates = self.rides_by_status[RIDE_STATUS_CODES[status]] if status is not None else self.ride_requests
+            for ride_id in candidates:
+                seq = self._ride_seq[ride_id]
+                ride_request = self.ride_requests[ride_id]
+                if seq <= after or (rider_id is not None and ride_request.rider_id != rider_id):
+                    continue
+                if driver_id is not None and ride_request.assigned_driver_id != driver_id:
+                    continue
+                hot.append((seq, ride_request))
+        hot.sort(key=lambda item: item[0])
+
+        archived = []
+        if status is None or status in TERMINAL_STATUSES:
+            positions = self.archive.select(after, limit + 1, status, rider_id, driver_id)
+            archived = list(zip(self.archive.seq[positions].tolist(), positions.tolist()))
+
+        merged = sorted(hot[:limit + 1] + archived, key=lambda item: item[0])
+        page = merged[:limit]
+        rides = [
+            item if isinstance(item, RideEntity) else self.archive.ride_at(item)
+            for _, item in page
+        ]
+        next_cursor = page[-1][0] if len(merged) > limit else None
+        return rides, next_cursor
+
+    def active_request_for(self, rider_id: str) -> Optional[RideEntity]:
+        """Return the rider's WAITING or ASSIGNED request, if any."""
+        ride_id = self.active_request_by_rider.get(rider_id)
+        return self.ride_requests[ride_id] if ride_id else None
+
+    @journaled
+    def start_trip(self, ride_request: RideEntity, driver_id: str) -> None:
+        """Assign a ride to a driver and start tracking the trip."""
+        self.set_ride_status(ride_request, RideStatus.ASSIGNED)
+        ride_request.assigned_driver_id = driver_id
+
+        self.fleet.rides[self.fleet.rows[driver_id]] += 1
+        self.set_driver_status(driver_id, DriverStatus.ON_TRIP)
+
+        # Track active trip
+        self.active_trips[ride_request.id] = (driver_id, "to_pickup")
+        self._touch("trips", ride_request.id)
+        self._started_trips.append(
+            (ride_request.id, driver_id, self.fleet.rows[driver_id], ride_request.pickup, ride_request.dropoff, False)
+        )
+
+    def _end_trip(self, ride_id: str) -> None:
+        """Drop a trip that was removed from active_trips from the trip table."""
+        started = len(self._started_trips)
+        self._started_trips = [trip for trip in self._started_trips if trip[0] != ride_id]
+        if len(self._started_trips) == started:
+            self._ended_trips.add(ride_id)
+        self._touch("trips", ride_id)
+
+    @journaled
+    def cancel_ride(self, ride_request: RideEntity) -> None:
+        """Cancel a waiting or assigned ride, freeing its driver if needed."""
+        # If ride was assigned to a driver, free up the driver
+        if ride_request.status_code == RIDE_ASSIGNED and ride_request.assigned_driver_id:
+            driver_id = ride_request.assigned_driver_id
+            if driver_id in self.fleet:
+                row = self.fleet.rows[driver_id]
+                # Decrease assigned rides count since this ride is being cancelled
+                if self.fleet.rides[row] > 0:
+                    self.fleet.rides[row] -= 1
+                self.set_driver_status(driver_id, DriverStatus.AVAILABLE)
+
+            # Remove from active trips if it was there
+            if self.active_trips.pop(ride_request.id, None):
+                self._end_trip(ride_request.id)
+
+        # Mark ride as cancelled (we'll use FAILED status for cancelled rides)
+        ride_request.assigned_driver_id = None
+        self.set_ride_status(ride_request, RideStatus.FAILED)
+
+    @journaled
+    def record_rejection(self, ride_request: RideEntity, driver_id: str) -> None:
+        """Remember that a driver turned down a ride."""
+        if driver_id not in ride_request.rejected_by:
+            ride_request.rejected_by[driver_id] = None
+            self._touch("rides", ride_request.id)
+            if self.metrics is not None:
+                self.metrics.rejections.labels("driver").inc()
+
+        if driver_id not in self.fleet:
+            return  # held by another shard, which records its side
+        row = self.fleet.rows[driver_id]
+        rejected_rides = self.fleet.rejected_rides[row]
+        if ride_request.id not in rejected_rides:
+            rejected_rides[ride_request.id] = None
+            self._touch_drivers(row)
+
+    @journaled
+    def reject_ride(self, ride_request: RideEntity, driver_id: str) -> Tuple[bool, str]:
+        """
+        A driver turns down a waiting ride, or the ride they were assigned
+        before picking it up; the ride is then offered to the next best
+        driver. Returns assign_ride's result.
+        """
+        self.record_rejection(ride_request, driver_id)
+        if self.active_trips.get(ride_request.id) == (driver_id, "to_pickup"):
+            self.release_trip(ride_request)
+        return self.assign_ride(ride_request.id)
+
+    @journaled
+    def release_trip(self, ride_request: RideEntity) -> None:
+        """Undo the assignment of a ride not picked up yet: the ride waits again and its driver is available."""
+        driver_id, _ = self.active_trips.pop(ride_request.id)
+        row = self.fleet.rows[driver_id]
+        if self.fleet.rides[row] > 0:
+            self.fleet.rides[row] -= 1
+        self._end_trip(ride_request.id)
+        ride_request.assigned_driver_id = None
+        self.set_ride_status(ride_request, RideStatus.WAITING)
+        self.set_driver_status(driver_id, DriverStatus.AVAILABLE)
+
+    @journaled
+    def detach_ride(self, ride_id: str) -> RideEntity:
+        """
+        Remove a live (non-terminal) ride from this service without archiving
+        it, e.g. to hand it to another shard. Any active trip must have been
+        detached first.
+        """
+        ride_request = self.ride_requests.pop(ride_id)
+        del self._ride_seq[ride_id]
+        self.rides_by_status[ride_request.status_code].pop(ride_id, None)
+        self.pending.remove(ride_id)
+        self._candidates.pop(ride_id, None)
+        if self.active_request_by_rider.get(ride_request.rider_id) == ride_id:
+            del self.active_request_by_rider[ride_request.rider_id]
+        self._touch("rides", ride_id)
+        return ride_request
+
+    @journaled
+    def detach_driver(self, driver_id: str, ride_id: Optional[str] = None) -> dict:
+        """
+        Remove a driver, and the trip of `ride_id` it is driving if given,
+        returning a plain-data packet that attach_driver() restores.
+        """
+        fleet = self.fleet
+        row = fleet.rows[driver_id]
+        packet = {
+            "id": driver_id,
+            "x": int(fleet.x[row]),
+            "y": int(fleet.y[row]),
+            "status": fleet.status_of(row).value,
+            "rides": int(fleet.rides[row]),
+            "rejected_rides": list(fleet.rejected_rides[row]),
+            "trip": None,
+        }
+        if ride_id is not None:
+            _, step = self.active_trips.pop(ride_id)
+            self._end_trip(ride_id)
+            packet["trip"] = {"ride": self.detach_ride(ride_id).to_dict(), "step": step}
+        fleet.remove(driver_id)
+        self.available_index.remove(row)
+        self._touch_drivers(row)
+        return packet
+
+    @journaled
+    def attach_driver(self, packet: dict) -> int:
+        """Add a driver (and its trip) from a detach_driver() packet; returns its fleet row."""
+        fleet = self.fleet
+        row = fleet.add(packet["id"], packet["x"], packet["y"], DriverStatus(packet["status"]))
+        fleet.rides[row] = packet["rides"]
+        fleet.rejected_rides[row] = dict.fromkeys(packet["rejected_rides"])
+        self._reindex_row(row)
+
+        trip = packet["trip"]
+        if trip is not None:
+            ride_request = RideEntity.from_dict(trip["ride"])
+            self.add_ride_request(ride_request)
+            self.active_trips[ride_request.id] = (packet["id"], trip["step"])
+            self._touch("trips", ride_request.id)
+            self._started_trips.append((
+                ride_request.id, packet["id"], row, ride_request.pickup, ride_request.dropoff,
+                trip["step"] == "to_dropoff"
+            ))
+        return row
+
+    @timed("decision_seconds")
+    def find_best_driver(self, ride_request: RideEntity) -> Optional[str]:
         """
         Find the best available driver for a ride request based on:
         1. ETA (distance to pickup)
         2. Fairness (number of rides previously assigned)
         3. Avoiding drivers who already rejected this request
+
+        Returns the chosen driver's ID, see rank_drivers for the search.
+
+        The search keeps the candidate_cache_size best drivers, so that a
+        retry after a rejection takes the next one still available instead
+        of searching again. The list is only used while the normalization
+        maxima are those it was scored with; drivers indexed since it was
+        built are scored and merged into it, and once it runs out (or too
+        many drivers changed to tell) the fleet is searched again. Either
+        way the choice is the one a fresh search would make.
         """
-        available_drivers = [
-            d for d in self.drivers.values() 
-            if d.status == DriverStatus.AVAILABLE and d.id not in ride_request.rejected_by
+        cached = self._candidates.get(ride_request.id)
+        if cached is not None:
+            driver_id = self._cached_best(ride_request, cached)
+            if driver_id is not None:
+                self._count_cache("hit")
+                return driver_id
+        self._count_cache("miss")
+
+        ranked = self.rank_drivers(ride_request, max(1, self.candidate_cache_size))
+        if not ranked:
+            self._candidates.pop(ride_request.id, None)
+            return None
+        self._candidates[ride_request.id] = [
+            self.available_index.generation, self._normalization(ride_request, self._excluded_rows(ride_request)), ranked
         ]
-        
-        if not available_drivers:
+        return self.fleet.ids[ranked[0][1]]
+
+    def _cached_best(self, ride_request: RideEntity, cached: list) -> Optional[str]:
+        """
+        The best driver from a ride's cached ranking brought up to date, or
+        None when the ranking can no longer be trusted and the fleet has to
+        be searched again.
+        """
+        generation, normalization, ranked = cached
+        index = self.available_index
+        inserted = index.inserted_since(generation)
+        if inserted is None:
+            return None
+        excluded = self._excluded_rows(ride_request)
+        if self._normalization(ride_request, excluded) != normalization:
+            return None  # every score would change
+
+        ids, rejected = self.fleet.ids, ride_request.rejected_by
+        fresh = {row for row in inserted if row in index and ids[row] not in rejected}
+        # Drop drivers that left the index or rejected the ride, and those
+        # re-indexed since (their score may have changed)
+        ranked[:] = [
+            (score, row) for score, row in ranked
+            if row in index and row not in fresh and ids[row] not in rejected
+        ]
+        if not ranked:
             return None
-            
-        # Calculate scores for each driver (lower is better)
-        driver_scores = []
-        
-        # Find max values for normalization
-        max_eta = 1
-        max_rides = 1
-        
-        for driver in available_drivers:
-            eta = self.calculate_eta(driver, ride_request.pickup)
-            max_eta = max(max_eta, eta)
-            max_rides = max(max_rides, driver.assigned_rides)
-        
-        for driver in available_drivers:
-            eta = self.calculate_eta(driver, ride_request.pickup)
-            # Normalize ETA and assigned_rides to [0,1] range
-            normalized_eta = eta / max_eta if max_eta > 0 else 0
-            normalized_rides = driver.assigned_rides / max_rides if max_rides > 0 else 0
-            
-            # Calculate weighted score (lower is better)
-            score = (
-                self.eta_weight * normalized_eta +
-                self.fairness_weight * (1 - normalized_rides)  # Invert so fewer rides = better score
+        if fresh:
+            # Drivers indexed since the list was built that rank before its
+            # last entry belong in it; the rest rank after every entry
+            rows = np.fromiter(sorted(fresh), dtype=np.int64, count=len(fresh))
+            px, py = ride_request.pickup.x, ride_request.pickup.y
+            eta = self._etas(rows, px, py)
+            max_eta, max_rides = normalization
+            scores = self.fleet.score(
+                rows, px, py, max_eta, max_rides, self.eta_weight, self.fairness_weight, eta=eta
+            )
+            last = ranked[-1]
+            ranked.extend(
+                (score, row) for score, row, e in zip(scores.tolist(), rows.tolist(), eta.tolist())
+                if (score, row) < last and e < ROAD_UNREACHABLE
+            )
+            ranked.sort()
+        cached[0] = index.generation
+        return ids[ranked[0][1]]
+
+    def _excluded_rows(self, ride_request: RideEntity) -> List[int]:
+        """Fleet rows of the indexed drivers who rejected the ride."""
+        rows, index = self.fleet.rows, self.available_index
+        return [rows[d] for d in ride_request.rejected_by if d in rows and rows[d] in index]
+
+    def _normalization(self, ride_request: RideEntity, excluded: List[int]) -> Tuple[int, int]:
+        """
+        The (max_eta, max_rides) that scores for the ride are normalized by:
+        the largest ETA and assigned ride count among its candidates.
+        """
+        index = self.available_index
+        px, py = ride_request.pickup.x, ride_request.pickup.y
+        max_rides = max(1, index.max_rides(excluded))
+        if self.road_map is None:
+            return max(1, index.max_distance(px, py, excluded)), max_rides
+        candidates = np.fromiter(index.entries, dtype=np.int64, count=len(index))
+        if excluded:
+            candidates = candidates[~np.isin(candidates, excluded)]
+        eta = self._etas(candidates, px, py)
+        eta = eta[eta < ROAD_UNREACHABLE]
+        return max(1, int(eta.max()) if len(eta) else 1), max_rides
+
+    def _count_cache(self, result: str) -> None:
+        if self.metrics is not None:
+            self.metrics.candidate_cache.labels(result).inc()
+
+    def rank_drivers(
+        self, ride_request: RideEntity, k: int, normalization: Optional[Tuple[int, int]] = None
+    ) -> List[Tuple[float, int]]:
+        """
+        Return the k best (score, fleet row) candidates for a ride, best first.
+
+        Searches the available-driver index ring by ring outward from the
+        pickup cell (a ring of tiles at a time once past the pickup's
+        neighbourhood, skipping empty ones) and stops once no farther ring
+        can beat the k-th best score. Each ring is scored in one vectorized pass over the fleet
+        arrays. Ties are broken by fleet row (insertion order), so the
+        ranking matches a full scan sorted by score.
+
+        On a road map, Manhattan distance is no bound on the ETA, so every
+        available driver is scored against the pickup's distance field
+        instead; drivers who cannot reach the pickup are left out.
+
+        Scores are normalized by the candidates' own (max_eta, max_rides)
+        unless `normalization` gives them, e.g. those of the whole fleet when
+        this service holds one region of it; they must not be below the
+        candidates' own.
+        """
+        if self.road_map is not None:
+            return self._rank_on_road_map(ride_request, k, normalization)
+        index = self.available_index
+        excluded = self._excluded_rows(ride_request)
+        remaining = len(index) - len(excluded)
+        if remaining <= 0 or k <= 0:
+            return []
+
+        px, py = ride_request.pickup.x, ride_request.pickup.y
+        # Normalization maxima over all candidates, as in a full scan
+        max_eta, max_rides = normalization or self._normalization(ride_request, excluded)
+        # No candidate can have a smaller fairness term than this
+        fairness_floor = self.fairness_weight * (1 - index.max_rides(excluded) / max_rides)
+
+        best_scores = np.empty(0)
+        best_rows = np.empty(0, dtype=np.int64)
+        band = 0
+        examined = 0
+        while remaining > 0:
+            lower_bound = (
+                self.eta_weight * (index.band_min_distance(band) / max_eta) + fairness_floor
+            )
+            if len(best_rows) == k and lower_bound > best_scores[-1]:
+                break
+            # Once k candidates are in hand, tiles too far away to beat them are skipped
+            limit = None
+            if len(best_rows) == k and self.eta_weight > 0:
+                limit = (best_scores[-1] - fairness_floor) / self.eta_weight * max_eta + 1
+            candidates = np.fromiter(index.band(px, py, band, limit), dtype=np.int64)
+            if excluded:
+                candidates = candidates[~np.isin(candidates, excluded)]
+            band += 1
+            if not len(candidates):
+                band = index.next_band(px, py, band)
+                continue
+            remaining -= len(candidates)
+            examined += len(candidates)
+
+            scores = self.fleet.score(
+                candidates, px, py, max_eta, max_rides, self.eta_weight, self.fairness_weight
             )
-            
-            driver_scores.append((driver, score))
-        
-        # Sort by score (lower is better)
-        driver_scores.sort(key=lambda x: x[1])
-        
-        # Return the best driver
-        return driver_scores[0][0] if driver_scores else None
-    
+            if len(scores) > k:
+                # Only this ring's k best (plus ties) can make the overall top k
+                keep = scores <= np.partition(scores, k - 1)[k - 1]
+                candidates, scores = candidates[keep], scores[keep]
+            best_scores = np.concatenate((best_scores, scores))
+            best_rows = np.concatenate((best_rows, candidates))
+            order = np.lexsort((best_rows, best_scores))[:k]
+            best_scores, best_rows = best_scores[order], best_rows[order]
+
+        if self.metrics is not None:
+            self.metrics.candidates.observe(examined)
+        return list(zip(best_scores.tolist(), best_rows.tolist()))
+
+    def _rank_on_road_map(
+        self, ride_request: RideEntity, k: int, normalization: Optional[Tuple[int, int]] = None
+    ) -> List[Tuple[float, int]]:
+        """rank_drivers() with ETAs from the road map's distance field of the pickup."""
+        rows = self.fleet.rows
+        excluded = [rows[d] for d in ride_request.rejected_by if d in rows]
+        candidates = np.fromiter(self.available_index.entries, dtype=np.int64, count=len(self.available_index))
+        if excluded:
+            candidates = candidates[~np.isin(candidates, excluded)]
+        if not len(candidates) or k <= 0:
+            return []
+
+        px, py = ride_request.pickup.x, ride_request.pickup.y
+        eta = self._etas(candidates, px, py)
+        reachable = eta < ROAD_UNREACHABLE
+        candidates, eta = candidates[reachable], eta[reachable]
+        if self.metrics is not None:
+            self.metrics.candidates.observe(len(candidates))
+        if not len(candidates):
+            return []
+        if normalization is None:
+            normalization = max(1, int(eta.max())), max(1, self.available_index.max_rides(excluded))
+        max_eta, max_rides = normalization
+        scores = self.fleet.score(
+            candidates, px, py, max_eta, max_rides, self.eta_weight, self.fairness_weight, eta=eta
+        )
+        order = np.lexsort((candidates, scores))[:k]
+        return list(zip(scores[order].tolist(), candidates[order].tolist()))
+
+    @journaled
+    @timed("assign_seconds")
     def assign_ride(self, ride_request_id: str) -> Tuple[bool, str]:
         """
         Attempt to assign a ride request to the best available driver.
@@ -79,41 +971,172 @@ class DispatchService:
         """
         ride_request = self.ride_requests.get(ride_request_id)
         if not ride_request:
+            archived = self.archive.get(ride_request_id)
+            if archived:
+                return False, f"Ride request {ride_request_id} is already {archived.status}"
             return False, f"Ride request {ride_request_id} not found"
-        
+
         # Skip if already assigned or completed
-        if ride_request.status in [RideStatus.ASSIGNED, RideStatus.COMPLETED]:
+        if ride_request.status_code == RIDE_ASSIGNED or ride_request.status_code == RIDE_COMPLETED:
             return False, f"Ride request {ride_request_id} is already {ride_request.status}"
-        
-        best_driver = self.find_best_driver(ride_request)
-        if not best_driver:
+
+        if ride_request.rejected_by and self.metrics is not None:
+            self.metrics.retries.inc()
+
+        # With fail_fast_rejections, give up as soon as max_rejection_attempts
+        # drivers have turned the ride down
+        too_many_rejections = len(ride_request.rejected_by) >= self.max_rejection_attempts
+        if too_many_rejections and self.fail_fast_rejections:
+            return self._fail_ride(ride_request)
+
+        best_driver_id = self.find_best_driver(ride_request)
+        if not best_driver_id:
             # If too many rejections or no available drivers
-            if len(ride_request.rejected_by) >= self.max_rejection_attempts:
-                ride_request.status = RideStatus.FAILED
-                return False, f"No available drivers for ride {ride_request_id}"
+            if too_many_rejections:
+                return self._fail_ride(ride_request)
+            # Wait for a driver to free up
+            self.pending.add(ride_request.id, ride_request.pickup.x, ride_request.pickup.y, self.current_tick)
+            self._count_assignment("no_driver")
             return False, "No available drivers at the moment"
-        
+
         # Simulate driver acceptance/rejection (for now, always accept)
         # In a real implementation, this would be a separate endpoint
         accepted = True
-        
+
         if accepted:
             # Update ride and driver status
-            ride_request.status = RideStatus.ASSIGNED
-            ride_request.assigned_driver_id = best_driver.id
-            
-            best_driver.status = DriverStatus.ON_TRIP
-            best_driver.assigned_rides += 1
-            
-            # Track active trip
-            self.active_trips[ride_request_id] = (best_driver.id, "to_pickup")
-            
-            return True, f"Ride {ride_request_id} assigned to driver {best_driver.id}"
+            self.start_trip(ride_request, best_driver_id)
+            self._count_assignment("assigned")
+            return True, f"Ride {ride_request_id} assigned to driver {best_driver_id}"
         else:
             # If rejected, add to rejected_by list and try again
-            ride_request.rejected_by.append(best_driver.id)
+            ride_request.rejected_by[best_driver_id] = None
+            return self.assign_ride(ride_request_id)
+
+    def _fail_ride(self, ride_request: RideEntity) -> Tuple[bool, str]:
+        self.set_ride_status(ride_request, RideStatus.FAILED)
+        self._count_assignment("failed")
+        return False, f"No available drivers for ride {ride_request.id}"
+
+    def _count_assignment(self, result: str) -> None:
+        if self.metrics is not None:
+            self.metrics.assignments.labels(result).inc()
+
+    @journaled
+    def submit_ride(self, ride_request_id: str) -> Tuple[bool, str]:
+        """
+        Dispatch a newly created ride request according to dispatch_mode.
+        In batch mode the request is queued and solved with the next batch.
+        """
+        if self.dispatch_mode == "greedy":
             return self.assign_ride(ride_request_id)
-    
+
+        if not self.batch_queue:
+            self._batch_opened_at = time.monotonic()
+        self.batch_queue.append(ride_request_id)
+
+        if self.batch_window_ms is not None and not self._replaying:
+            elapsed_ms = (time.monotonic() - self._batch_opened_at) * 1000
+            if elapsed_ms >= self.batch_window_ms:
+                self.flush_batch()
+        return False, f"Ride {ride_request_id} queued for batch dispatch"
+
+    @journaled
+    def submit_rides(self, ride_request_ids: List[str]) -> List[dict]:
+        """
+        Dispatch many new ride requests as batches, whatever the dispatch_mode.
+
+        Requests are solved bulk_batch_size at a time (together with anything
+        already queued) so the cost matrix stays small. Returns the batch
+        reports.
+        """
+        reports = []
+        for start in range(0, len(ride_request_ids), self.bulk_batch_size):
+            self.batch_queue.extend(ride_request_ids[start:start + self.bulk_batch_size])
+            report = self.flush_batch()
+            if report is not None:
+                reports.append(report)
+        return reports
+
+    @journaled(nested=True)
+    def flush_batch(self) -> Optional[dict]:
+        """
+        Solve all queued ride requests together as a min-cost bipartite
+        assignment, using the find_best_driver score as the cost.
+
+        Each request only considers its batch_candidates best drivers, and
+        requests that share no candidates are solved independently. Requests
+        left unmatched fall back to greedy assign_ride. Returns the batch
+        report, which is also kept in batch_reports.
+        """
+        queued, self.batch_queue = self.batch_queue, []
+        requests = [
+            self.ride_requests[ride_id] for ride_id in dict.fromkeys(queued)
+            if ride_id in self.ride_requests and self.ride_requests[ride_id].status_code == RIDE_WAITING
+        ]
+        if not requests:
+            return None
+
+        started = time.perf_counter()
+        columns = {}  # fleet row -> column
+        candidates = []
+        for request in requests:
+            ranked = self.rank_drivers(request, self.batch_candidates)
+            candidates.append([(score, columns.setdefault(row, len(columns))) for score, row in ranked])
+        driver_rows = np.fromiter(columns, dtype=np.int64, count=len(columns))
+
+        cost = np.full((len(requests), len(columns)), UNREACHABLE)
+        for i, ranked in enumerate(candidates):
+            for score, column in ranked:
+                cost[i, column] = score
+
+        pairs = []
+        groups = connected_components([[column for _, column in ranked] for ranked in candidates])
+        for group in groups:
+            group_columns = sorted({column for i in group for _, column in candidates[i]})
+            if not group_columns:
+                continue
+            sub_cost = cost[np.ix_(group, group_columns)]
+            pairs.extend((group[i], group_columns[j]) for i, j in solve_assignment(sub_cost))
+        solve_ms = (time.perf_counter() - started) * 1000
+        if self.metrics is not None:
+            self.metrics.batch_seconds.observe(solve_ms / 1000)
+            self.metrics.batch_size.observe(len(requests))
+
+        pickup_x = np.array([r.pickup.x for r in requests])[:, None]
+        pickup_y = np.array([r.pickup.y for r in requests])[:, None]
+        if self.road_map is not None:
+            eta = np.array([self._etas(driver_rows, r.pickup.x, r.pickup.y) for r in requests])
+        else:
+            eta = np.abs(self.fleet.x[driver_rows] - pickup_x) + np.abs(self.fleet.y[driver_rows] - pickup_y)
+        greedy_pairs = greedy_assignment(cost)
+        total_eta = int(sum(eta[i, j] for i, j in pairs))
+        greedy_total_eta = int(sum(eta[i, j] for i, j in greedy_pairs))
+
+        for i, j in sorted(pairs):
+            self.start_trip(requests[i], self.fleet.ids[driver_rows[j]])
+        matched = {i for i, _ in pairs}
+        fallback_assigned = 0
+        for i, request in enumerate(requests):
+            if i not in matched and self.assign_ride(request.id)[0]:
+                fallback_assigned += 1
+
+        report = {
+            "batch_size": len(requests),
+            "drivers_considered": len(columns),
+            "components": len(groups),
+            "assigned": len(pairs),
+            "fallback_assigned": fallback_assigned,
+            "greedy_assigned": len(greedy_pairs),
+            "total_eta": total_eta,
+            "greedy_total_eta": greedy_total_eta,
+            "eta_saved": greedy_total_eta - total_eta,
+            "solve_ms": round(solve_ms, 3),
+        }
+        self.batch_reports.append(report)
+        return report
+
+    @journaled
     def simulate_driver_decision(self, driver_id: str, ride_request_id: str) -> bool:
         """
         Simulate whether a driver accepts or rejects a ride.
@@ -123,97 +1146,247 @@ class DispatchService:
         - Driver preferences
         - Time of day
         - etc.
-        
-        For now, we'll use a simple implementation where drivers reject 
+
+        For now, we'll use a simple implementation where drivers reject
         if they've already rejected too many rides recently.
         """
-        driver = self.drivers.get(driver_id)
-        ride_request = self.ride_requests.get(ride_request_id)
-        
-        if not driver or not ride_request:
+        ride_request = self.get_ride(ride_request_id)
+
+        if driver_id not in self.fleet or not ride_request:
             return False
-            
+
         # Calculate pickup distance
-        pickup_distance = self.calculate_distance(driver.location, ride_request.pickup)
-        
-        # For now, simple logic: reject if pickup is too far (> 20 units)
+        pickup_distance = self.calculate_eta(driver_id, ride_request.pickup)
+
+        # For now, simple logic: reject if pickup is too far (> rejection_distance)
         # In a real implementation, this would depend on various factors
-        if pickup_distance > 20:
-            if ride_request_id not in driver.rejected_rides:
-                driver.rejected_rides.append(ride_request_id)
+        if pickup_distance > self.rejection_distance:
+            row = self.fleet.rows[driver_id]
+            rejected_rides = self.fleet.rejected_rides[row]
+            if ride_request_id not in rejected_rides:
+                rejected_rides[ride_request_id] = None
+                self._touch_drivers(row)
+            if self.metrics is not None:
+                self.metrics.rejections.labels("simulated").inc()
             return False
-        
+
         return True
-    
+
+    @journaled
     def tick(self) -> List[dict]:
         """
         Advance the simulation by one time step.
         Returns a list of events that occurred during this tick.
         """
-        events = []
-        
-        # Process active trips
-        trips_to_remove = []
-        
-        for request_id, (driver_id, step) in self.active_trips.items():
-            driver = self.drivers.get(driver_id)
-            request = self.ride_requests.get(request_id)
-            
-            if not driver or not request:
-                continue
-                
-            if step == "to_pickup":
-                # Driver is heading to pickup
-                if self._move_towards(driver, request.pickup):
-                    # Arrived at pickup
-                    events.append({
-                        "type": "pickup",
-                        "ride_id": request_id,
-                        "driver_id": driver_id,
-                        "location": {"x": driver.location.x, "y": driver.location.y}
-                    })
-                    self.active_trips[request_id] = (driver_id, "to_dropoff")
-                
-            elif step == "to_dropoff":
-                # Driver is heading to dropoff
-                if self._move_towards(driver, request.dropoff):
-                    # Arrived at dropoff, ride is complete
-                    events.append({
-                        "type": "dropoff",
-                        "ride_id": request_id,
-                        "driver_id": driver_id,
-                        "location": {"x": driver.location.x, "y": driver.location.y}
-                    })
-                    
-                    # Update statuses
-                    request.status = RideStatus.COMPLETED
-                    driver.status = DriverStatus.AVAILABLE
-                    
-                    # Remove from active trips
-                    trips_to_remove.append(request_id)
-        
-        # Clean up completed trips
-        for request_id in trips_to_remove:
-            self.active_trips.pop(request_id, None)
-            
+        events = [
+            {
+                "type": kind,
+                "ride_id": ride_id,
+                "driver_id": driver_id,
+                "location": {"x": x, "y": y}
+            }
+            for kind, ride_id, driver_id, x, y in self._advance_tick()
+        ]
+        for listener in self.tick_listeners:
+            listener(self.current_tick, events)
         return events
-    
-    def _move_towards(self, driver: Driver, target: Location) -> bool:
+
+    @journaled
+    def tick_many(self, n: int, summary: bool = False):
+        """
+        Advance the simulation by n time steps in one call.
+        Returns the events grouped by tick, or, when summary is True, only
+        the pickup and dropoff counts (skipping event construction).
         """
-        Move driver one step towards the target location.
+        if not summary:
+            return [self.tick() for _ in range(n)]
+
+        pickups = dropoffs = 0
+        for _ in range(n):
+            for arrival in self._advance_tick():
+                if arrival[0] == PICKUP:
+                    pickups += 1
+                else:
+                    dropoffs += 1
+        return {
+            "ticks": n,
+            "current_tick": self.current_tick,
+            "pickups": pickups,
+            "dropoffs": dropoffs,
+            "active_trips": len(self.active_trips)
+        }
+
+    @timed("tick_seconds")
+    def _advance_tick(self) -> list:
+        """
+        Move every active trip one step in a single array pass and apply the
+        resulting pickup and dropoff transitions.
+        Returns the arrivals as (kind, ride_id, driver_id, x, y) tuples.
+        """
+        # A batch without a time window is solved once per tick
+        if self.batch_queue:
+            self.flush_batch()
+        self._expire_pending()
+
+        table = self.trip_table
+        if self._ended_trips:
+            table.discard(self._ended_trips)
+            self._ended_trips = set()
+        if self._started_trips:
+            table.extend(self._started_trips)
+            self._started_trips = []
+
+        moving = table.rows  # advance() drops the trips that reach their dropoff
+        if len(moving):
+            self._touch_drivers(moving)
+        arrivals = table.advance(self.fleet.x, self.fleet.y)
+        if len(moving):
+            self.fleet.retile(moving)
+        for kind, ride_id, driver_id, x, y in arrivals:
+            if kind == PICKUP:
+                self.active_trips[ride_id] = (driver_id, "to_dropoff")
+                self._candidates.pop(ride_id, None)
+                self._touch("trips", ride_id)
+            else:
+                # Arrived at dropoff, ride is complete
+                self.set_ride_status(self.ride_requests[ride_id], RideStatus.COMPLETED)
+                self.set_driver_status(driver_id, DriverStatus.AVAILABLE)
+                self.active_trips.pop(ride_id, None)
+                self._touch("trips", ride_id)
+
+        if self.repositioning:
+            self._reposition()
+        if self.rebalance_every and self.current_tick % self.rebalance_every == 0:
+            self._rebalance()
+
+        self.current_tick += 1
+        return arrivals
+
+    def check_consistency(self) -> List[str]:
+        """
+        Cross-check every derived structure against the primary state.
+        Returns a list of human-readable problems; empty means consistent.
+        """
+        problems = []
+        fleet = self.fleet
+
+        # Ride status and rider indexes
+        for code, ride_ids in enumerate(self.rides_by_status):
+            for ride_id in ride_ids:
+                ride = self.ride_requests.get(ride_id)
+                if ride is None or ride.status_code != code:
+                    problems.append(f"rides_by_status[{RIDE_STATUS_BY_CODE[code].value}] has stale ride {ride_id}")
+        indexed = sum(len(ride_ids) for ride_ids in self.rides_by_status)
+        if indexed != len(self.ride_requests):
+            problems.append(f"rides_by_status holds {indexed} rides, expected {len(self.ride_requests)}")
+        if set(self._ride_seq) != set(self.ride_requests):
+            problems.append("_ride_seq does not match the hot rides")
+        for ride_id, ride in self.ride_requests.items():
+            if ride.status_code in TERMINAL_CODES:
+                problems.append(f"terminal ride {ride_id} was not archived")
+            if ride_id in self.archive:
+                problems.append(f"ride {ride_id} is both hot and archived")
+
+        active_by_rider = {}
+        for ride in self.ride_requests.values():
+            if ride.status_code == RIDE_WAITING or ride.status_code == RIDE_ASSIGNED:
+                if ride.rider_id in active_by_rider:
+                    problems.append(f"rider {ride.rider_id} has several active rides")
+                active_by_rider[ride.rider_id] = ride.id
+        if active_by_rider != self.active_request_by_rider:
+            problems.append("active_request_by_rider does not match the active rides")
+
+        # Trips, drivers and the available-driver index
+        drivers_on_trips = {}
+        for ride_id, (driver_id, step) in self.active_trips.items():
+            ride = self.ride_requests.get(ride_id)
+            if ride is None or ride.status_code != RIDE_ASSIGNED or ride.assigned_driver_id != driver_id:
+                problems.append(f"active trip {ride_id} does not match its ride")
+            if driver_id in drivers_on_trips:
+                problems.append(f"driver {driver_id} is on several trips")
+            drivers_on_trips[driver_id] = ride_id
+            if driver_id not in fleet or self.driver_status(driver_id) != DriverStatus.ON_TRIP:
+                problems.append(f"driver {driver_id} of active trip {ride_id} is not on a trip")
+        for ride_id in self.rides_by_status[RIDE_ASSIGNED]:
+            if ride_id not in self.active_trips:
+                problems.append(f"assigned ride {ride_id} has no active trip")
+
+        available = set(fleet.rows_with_status(DriverStatus.AVAILABLE).tolist())
+        if available != set(self.available_index.entries):
+            problems.append("available_index does not match the AVAILABLE drivers")
+        for row in available & set(self.available_index.entries):
+            if self.available_index.entries[row] != (int(fleet.x[row]), int(fleet.y[row]), int(fleet.rides[row])):
+                problems.append(f"available_index entry for row {row} is stale")
+        index = self.available_index
+        tiled = {}
+        for cell, bucket in index.buckets.items():
+            tiled.setdefault(index.tile_of(cell), {})[cell] = len(bucket)
+        if {tile: set(cells) for tile, cells in tiled.items()} != {tile: set(cells) for tile, cells in index.tiles.items()}:
+            problems.append("available_index tiles do not match its buckets")
+        if {tile: sum(cells.values()) for tile, cells in tiled.items()} != dict(index.tile_counts):
+            problems.append("available_index tile counts do not match its buckets")
+
+        # Fleet tiles
+        live = fleet.live_rows()
+        filed = {row: tile for tile, tile_rows in fleet.tiles.items() for row in tile_rows}
+        if set(filed) != set(live.tolist()):
+            problems.append("fleet tiles do not match the live drivers")
+        for row in live[(fleet.x[live] // fleet.tile_size != fleet.tile_x[live])
+                        | (fleet.y[live] // fleet.tile_size != fleet.tile_y[live])].tolist():
+            problems.append(f"fleet row {row} is filed under a stale tile")
+        for row, tile in filed.items():
+            if tile != (int(fleet.tile_x[row]), int(fleet.tile_y[row])):
+                problems.append(f"fleet row {row} is filed under the wrong tile")
+        filed_riders = {rider_id: tile for tile, rider_ids in self.rider_tiles.items() for rider_id in rider_ids}
+        if filed_riders != {rider_id: self._rider_tile(rider) for rider_id, rider in self.riders.items()}:
+            problems.append("rider tiles do not match the riders")
+
+        # The trip table only catches up at the next tick, so compare its
+        # pending view (table + started - ended) with active_trips.
+        tabled = [ride_id for ride_id in self.trip_table.ride_ids.tolist() if ride_id not in self._ended_trips]
+        tabled += [trip[0] for trip in self._started_trips]
+        if tabled != list(self.active_trips):
+            problems.append("trip_table is out of sync with active_trips")
+        for ride_id in self._candidates:
+            ride = self.ride_requests.get(ride_id)
+            if ride is None or ride_id in self.active_trips and self.active_trips[ride_id][1] != "to_pickup":
+                problems.append(f"candidate list kept for ride {ride_id}, which can no longer be rejected")
+
+        for row in self.repositioning:
+            if row not in self.available_index:
+                problems.append(f"repositioning driver in row {row} is not available")
+
+        # Pending queue
+        for ride_id in self.pending.entries:
+            ride = self.ride_requests.get(ride_id)
+            if ride is None or ride.status_code != RIDE_WAITING:
+                problems.append(f"pending ride {ride_id} is not waiting")
+        bucketed = {ride_id for bucket in self.pending.buckets.values() for ride_id in bucket}
+        if bucketed != set(self.pending.entries):
+            problems.append("pending buckets do not match the pending rides")
+
+        return problems
+
+    def _move_towards(self, row: int, target: Point) -> bool:
+        """
+        Move the driver in fleet row `row` one step towards the target location.
         Returns True if driver reached the target, False otherwise.
         """
-        # Calculate direction
-        dx = target.x - driver.location.x
-        dy = target.y - driver.location.y
-        
+        x, y = self.fleet.location_of(row)
+
+        if self.road_map is not None:
+            # Next cell of a cheapest route
+            x, y = self.road_map.step(x, y, target.x, target.y)
         # Move in x direction first, then y (Manhattan style)
-        if dx != 0:
+        elif target.x != x:
             # Move one step in x direction
-            driver.location.x += 1 if dx > 0 else -1
-        elif dy != 0:
+            x += 1 if target.x > x else -1
+        elif target.y != y:
             # Move one step in y direction
-            driver.location.y += 1 if dy > 0 else -1
-            
+            y += 1 if target.y > y else -1
+        self.fleet.move(row, x, y)
+
+        self._reindex_row(row)
+
         # Check if we've reached the target
-        return driver.location.x == target.x and driver.location.y == target.y
+        return x == target.x and y == target.y
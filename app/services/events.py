@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from typing import List, Optional, Set
+
+
+class Subscription:
+    """A single stream consumer: a bounded message queue plus a change flag."""
+
+    def __init__(self, max_queue: int):
+        self.messages: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.changed = asyncio.Event()
+        self.lagged = False  # messages were dropped; the consumer should resync
+
+    async def next(self, timeout: float) -> Optional[List[dict]]:
+        """
+        Wait until a message arrives or the state changes.
+        Returns the queued messages (possibly empty), or None on timeout.
+        """
+        drained = []
+        if self.messages.empty() and not self.changed.is_set():
+            getter = asyncio.ensure_future(self.messages.get())
+            waiter = asyncio.ensure_future(self.changed.wait())
+            done, pending = await asyncio.wait(
+                {getter, waiter}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in pending:
+                task.cancel()
+            if not done:
+                return None
+            if getter in done:
+                drained.append(getter.result())
+        while not self.messages.empty():
+            drained.append(self.messages.get_nowait())
+        return drained
+
+
+class EventBroadcaster:
+    """
+    Fans dispatch notifications out to asyncio subscribers such as the SSE
+    stream. publish() and notify_changed() are safe to call from any thread;
+    delivery always happens on the event loop the subscribers live on.
+    State changes are coalesced: any number of notify_changed() calls before
+    the loop runs result in a single wake-up per subscriber.
+    """
+
+    def __init__(self, max_queue: int = 256):
+        self.max_queue = max_queue
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._change_pending = False
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> Subscription:
+        """Register a subscriber; must be called from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(self.max_queue)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def publish(self, message: dict) -> None:
+        """Queue a message for every subscriber."""
+        if self._subscribers and self._loop is not None:
+            self._call_soon(self._deliver, message)
+
+    def notify_changed(self) -> None:
+        """Flag that the dispatch state changed."""
+        if not self._subscribers or self._loop is None:
+            return
+        with self._lock:
+            if self._change_pending:
+                return
+            self._change_pending = True
+        self._call_soon(self._flag_changed)
+
+    def _call_soon(self, callback, *args) -> None:
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The loop has been closed (e.g. during shutdown)
+            self._subscribers.clear()
+
+    def _deliver(self, message: dict) -> None:
+        for subscription in self._subscribers:
+            try:
+                subscription.messages.put_nowait(message)
+            except asyncio.QueueFull:
+                subscription.lagged = True
+
+    def _flag_changed(self) -> None:
+        with self._lock:
+            self._change_pending = False
+        for subscription in self._subscribers:
+            subscription.changed.set()
@@ -0,0 +1,229 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.models.models import DriverStatus
+from app.services.spatial_index import box_tiles
+
+
+# Small integer codes for driver status, stored in the `status` column
+STATUS_CODES = {
+    DriverStatus.AVAILABLE: 0,
+    DriverStatus.ON_TRIP: 1,
+    DriverStatus.OFFLINE: 2,
+}
+STATUS_BY_CODE = {code: status for status, code in STATUS_CODES.items()}
+REMOVED = -1  # status code of a deleted driver's row
+
+# Side of a fleet tile in grid units; matches the tiles of the available-driver
+# SpatialIndex (8 cells of 8 units), so per-tile counts line up
+TILE_SIZE = 64
+
+
+class FleetStore:
+    """
+    Struct-of-arrays storage for the driver fleet.
+
+    Each driver occupies one row across contiguous NumPy columns (x, y,
+    status code, assigned_rides). Rows are handed out in insertion order and
+    never reused, so row order doubles as the fleet's insertion order for
+    tie-breaking; deleted drivers leave a REMOVED tombstone behind. The
+    `version` column records the service state version of each row's last
+    change, which is how driver deltas are found without a per-driver log.
+
+    Every live driver is also filed under the square tile of `tile_size`
+    units holding its position (tile_x/tile_y columns, and `tiles` from tile
+    to rows), so viewport queries and per-tile counts only visit occupied
+    tiles. Positions written straight into the x/y columns are filed again
+    by retile().
+    """
+
+    def __init__(self, capacity: int = 1024, tile_size: int = TILE_SIZE):
+        self.tile_size = tile_size
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.tile_x = np.zeros(capacity, dtype=np.int32)
+        self.tile_y = np.zeros(capacity, dtype=np.int32)
+        self.tiles: Dict[Tuple[int, int], Dict[int, None]] = {}  # tile -> rows of live drivers
+        self.status = np.full(capacity, REMOVED, dtype=np.int8)
+        self.rides = np.zeros(capacity, dtype=np.int32)
+        self.version = np.zeros(capacity, dtype=np.int64)
+        self.ids: List[str] = []  # row -> driver_id, kept after removal
+        self.rows: Dict[str, int] = {}  # driver_id -> row
+        self.rejected_rides: List[Dict[str, None]] = []  # row -> rejected ride IDs (ordered set)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, driver_id: str) -> bool:
+        return driver_id in self.rows
+
+    @property
+    def size(self) -> int:
+        """Number of rows handed out, including tombstones."""
+        return len(self.ids)
+
+    def add(self, driver_id: str, x: int, y: int, status: DriverStatus = DriverStatus.AVAILABLE) -> int:
+        """Append a driver and return its row."""
+        row = len(self.ids)
+        if row == len(self.x):
+            self._grow()
+        self.x[row] = x
+        self.y[row] = y
+        self.status[row] = STATUS_CODES[status]
+        self.rides[row] = 0
+        self.ids.append(driver_id)
+        self.rows[driver_id] = row
+        self.rejected_rides.append({})
+        self._file(row, x // self.tile_size, y // self.tile_size)
+        return row
+
+    def add_many(self, driver_ids: List[str], x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Append AVAILABLE drivers in one pass and return their rows."""
+        first = len(self.ids)
+        end = first + len(driver_ids)
+        while end > len(self.x):
+            self._grow()
+        self.x[first:end] = x
+        self.y[first:end] = y
+        self.status[first:end] = STATUS_CODES[DriverStatus.AVAILABLE]
+        self.rides[first:end] = 0
+        self.ids.extend(driver_ids)
+        self.rows.update(zip(driver_ids, range(first, end)))
+        self.rejected_rides.extend({} for _ in driver_ids)
+        rows = np.arange(first, end)
+        tile_x, tile_y = self.x[first:end] // self.tile_size, self.y[first:end] // self.tile_size
+        for row, tx, ty in zip(rows.tolist(), tile_x.tolist(), tile_y.tolist()):
+            self._file(row, tx, ty)
+        return rows
+
+    def remove(self, driver_id: str) -> int:
+        """Tombstone a driver's row and return it."""
+        row = self.rows.pop(driver_id)
+        self.status[row] = REMOVED
+        self.rejected_rides[row] = {}
+        self._unfile(row)
+        return row
+
+    def move(self, row: int, x: int, y: int) -> None:
+        """Set a driver's position."""
+        self.x[row] = x
+        self.y[row] = y
+        tx, ty = x // self.tile_size, y // self.tile_size
+        if tx != self.tile_x[row] or ty != self.tile_y[row]:
+            self._unfile(row)
+            self._file(row, tx, ty)
+
+    def retile(self, rows: np.ndarray) -> None:
+        """File `rows` again after their positions were written into the x/y columns."""
+        rows = rows[self.status[rows] != REMOVED]
+        tile_x, tile_y = self.x[rows] // self.tile_size, self.y[rows] // self.tile_size
+        moved = np.flatnonzero((tile_x != self.tile_x[rows]) | (tile_y != self.tile_y[rows]))
+        for row, tx, ty in zip(rows[moved].tolist(), tile_x[moved].tolist(), tile_y[moved].tolist()):
+            self._unfile(row)
+            self._file(row, tx, ty)
+
+    def _file(self, row: int, tx: int, ty: int) -> None:
+        self.tile_x[row] = tx
+        self.tile_y[row] = ty
+        self.tiles.setdefault((tx, ty), {})[row] = None
+
+    def _unfile(self, row: int) -> None:
+        tile = (int(self.tile_x[row]), int(self.tile_y[row]))
+        rows = self.tiles[tile]
+        del rows[row]
+        if not rows:
+            del self.tiles[tile]
+
+    def rows_in(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """Rows of the live drivers inside the box from (x0, y0) to (x1, y1), inclusive, in insertion order."""
+        tiles = box_tiles(self.tiles, self.tile_size, x0, y0, x1, y1)
+        rows = np.fromiter(
+            (row for tile in tiles for row in self.tiles[tile]),
+            dtype=np.int64,
+            count=sum(len(self.tiles[tile]) for tile in tiles),
+        )
+        x, y = self.x[rows], self.y[rows]
+        rows = rows[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+        rows.sort()
+        return rows
+
+    def status_of(self, row: int) -> DriverStatus:
+        return STATUS_BY_CODE[int(self.status[row])]
+
+    def location_of(self, row: int) -> Tuple[int, int]:
+        return int(self.x[row]), int(self.y[row])
+
+    def is_removed(self, row: int) -> bool:
+        return self.status[row] == REMOVED
+
+    def live_rows(self) -> np.ndarray:
+        """Rows of all drivers that have not been removed, in insertion order."""
+        return np.flatnonzero(self.status[:self.size] != REMOVED)
+
+    def rows_changed_since(self, version: int) -> np.ndarray:
+        """Rows (live or removed) whose last change is newer than `version`."""
+        return np.flatnonzero(self.version[:self.size] > version)
+
+    def rows_with_status(self, status: DriverStatus) -> np.ndarray:
+        return np.flatnonzero(self.status[:self.size] == STATUS_CODES[status])
+
+    def to_dicts(self, rows: np.ndarray) -> List[dict]:
+        """JSON-ready dicts in the shape of the Driver schema for `rows`, in one pass over the columns."""
+        return [
+            {
+                "id": self.ids[row],
+                "location": {"x": x, "y": y},
+                "status": STATUS_BY_CODE[code].value,
+                "assigned_rides": rides,
+                "rejected_rides": list(self.rejected_rides[row])
+            }
+            for row, x, y, code, rides in zip(
+                rows.tolist(),
+                self.x[rows].tolist(),
+                self.y[rows].tolist(),
+                self.status[rows].tolist(),
+                self.rides[rows].tolist(),
+            )
+        ]
+
+    def score(
+        self,
+        rows: np.ndarray,
+        px: int,
+        py: int,
+        max_eta: int,
+        max_rides: int,
+        eta_weight: float,
+        fairness_weight: float,
+        eta: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Dispatch scores (lower is better) of `rows` for a pickup at (px, py).
+
+        Computes the same weighted ETA/fairness score as the scalar dispatch
+        code, element for element, so results compare equal bit for bit.
+        The ETA is the Manhattan distance unless given (e.g. road distances).
+        """
+        if eta is None:
+            eta = np.abs(self.x[rows] - px) + np.abs(self.y[rows] - py)
+        normalized_eta = eta / max_eta
+        normalized_rides = self.rides[rows] / max_rides
+        return eta_weight * normalized_eta + fairness_weight * (1 - normalized_rides)
+
+    def best(self, rows: np.ndarray, scores: np.ndarray) -> Tuple[float, int]:
+        """Return (score, row) of the lowest score, lowest row on ties."""
+        best_score = scores.min()
+        return float(best_score), int(rows[scores == best_score].min())
+
+    def _grow(self) -> None:
+        capacity = len(self.x) * 2
+        self.x = np.resize(self.x, capacity)
+        self.y = np.resize(self.y, capacity)
+        self.tile_x = np.resize(self.tile_x, capacity)
+        self.tile_y = np.resize(self.tile_y, capacity)
+        self.rides = np.resize(self.rides, capacity)
+        self.version = np.resize(self.version, capacity)
+        status = np.full(capacity, REMOVED, dtype=np.int8)
+        status[:len(self.status)] = self.status
+        self.status = status
@@ -0,0 +1,112 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+# Cost given to request/driver pairs that were pruned from the candidate lists
+UNREACHABLE = 1e6
+
+
+def solve_assignment(cost: np.ndarray) -> List[Tuple[int, int]]:
+    """
+    Solve a rectangular min-cost bipartite assignment.
+
+    Implements the shortest augmenting path form of the Hungarian algorithm
+    (Jonker-Volgenant potentials) with the inner column scan vectorized.
+    Every row is matched when rows <= columns and vice versa; pairs whose
+    cost is UNREACHABLE or more are dropped from the result.
+    Returns a list of (row, column) pairs.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    if n == 0:
+        return []
+
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)  # column -> 1-based row, 0 if free
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        min_v = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            improved = free & (reduced < min_v[1:])
+            min_v[1:][improved] = reduced[improved]
+            way[1:][improved] = j0
+
+            masked = np.where(free, min_v[1:], np.inf)
+            j1 = int(masked.argmin()) + 1
+            delta = masked[j1 - 1]
+
+            u[owner[used]] += delta
+            v[used] -= delta
+            min_v[1:][free] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        # Flip the augmenting path
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+
+    pairs = []
+    for j in range(1, m + 1):
+        i = owner[j]
+        if i and cost[i - 1, j - 1] < UNREACHABLE:
+            pairs.append((j - 1, i - 1) if transposed else (i - 1, j - 1))
+    return pairs
+
+
+def connected_components(candidates: List[List[int]]) -> List[List[int]]:
+    """
+    Group requests that share at least one candidate driver.
+
+    `candidates[i]` lists the driver columns request i may be matched to.
+    Returns lists of request indexes; each group can be solved on its own.
+    """
+    parent = list(range(len(candidates)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_request: Dict[int, int] = {}  # driver column -> first request using it
+    for i, columns in enumerate(candidates):
+        for column in columns:
+            j = first_request.setdefault(column, i)
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parent[root_i] = root_j
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(candidates)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def greedy_assignment(cost: np.ndarray) -> List[Tuple[int, int]]:
+    """Assign rows in order, each to its cheapest still-free column."""
+    taken = np.zeros(cost.shape[1], dtype=bool)
+    pairs = []
+    for i in range(cost.shape[0]):
+        row = np.where(taken, np.inf, cost[i])
+        if not len(row):
+            break
+        j = int(row.argmin())
+        if row[j] < UNREACHABLE:
+            taken[j] = True
+            pairs.append((i, j))
+    return pairs
@@ -0,0 +1,207 @@
+import functools
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+
+# Bucket upper bounds in seconds, for operations from microseconds up to a second
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+# Bucket upper bounds for counts (drivers examined, batch sizes)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus sense.
+
+    observe() is one bisect and two additions; bucket counts are kept
+    per bucket and only made cumulative when rendered.
+    """
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Family:
+    """A named metric with one child (Histogram or Counter) per label value tuple."""
+
+    def __init__(self, name: str, kind: str, help: str, labels: Tuple[str, ...], make: Callable):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.label_names = labels
+        self._make = make
+        self.children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """The child for these label values, created on first use."""
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._make()
+        return child
+
+
+class Gauge:
+    """A value read at scrape time: fn() returns a number, or {label values: number} when labelled."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.fn = fn
+
+
+class MetricsRegistry:
+    """
+    Metrics exposed together in the Prometheus text format.
+
+    histogram() and counter() return the metric itself when it has no
+    labels, or its Family otherwise. Instruments are not locked: each one
+    should be updated from a single thread (the dispatch writer or the
+    event loop), and a scrape may see an update half applied.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS, labels=()):
+        return self._register(Family(name, "histogram", help, tuple(labels), lambda: Histogram(buckets)))
+
+    def counter(self, name: str, help: str, labels=()):
+        return self._register(Family(name, "counter", help, tuple(labels), Counter))
+
+    def gauge(self, name: str, help: str, fn: Callable, labels=()) -> Gauge:
+        return self._register(Gauge(name, help, fn, tuple(labels)))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        if isinstance(metric, Gauge) or metric.label_names:
+            return metric
+        return metric.labels()
+
+    def get(self, name: str):
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if isinstance(metric, Gauge):
+                value = metric.fn()
+                samples = value.items() if metric.label_names else [((), value)]
+                for values, sample in samples:
+                    lines.append(f"{metric.name}{_labels(metric.label_names, values)} {_number(sample)}")
+                continue
+            for values, child in list(metric.children.items()):
+                if metric.kind == "counter":
+                    lines.append(f"{metric.name}_total{_labels(metric.label_names, values)} {_number(child.value)}")
+                    continue
+                cumulative = 0
+                counts = list(child.counts)
+                for bound, count in zip(child.bounds + (math.inf,), counts):
+                    cumulative += count
+                    le = _labels(metric.label_names + ("le",), values + (_number(bound),))
+                    lines.append(f"{metric.name}_bucket{le} {cumulative}")
+                labels = _labels(metric.label_names, values)
+                lines.append(f"{metric.name}_sum{labels} {_number(child.sum)}")
+                lines.append(f"{metric.name}_count{labels} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    return "+Inf" if value == math.inf else repr(value)
+
+
+class DispatchMetrics:
+    """The instruments a DispatchService updates when its `metrics` is set."""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.assign_seconds = registry.histogram(
+            "dispatch_assign_ride_seconds", "Time spent in assign_ride, including the driver search")
+        self.decision_seconds = registry.histogram(
+            "dispatch_find_best_driver_seconds", "Time to pick the best driver for one ride")
+        self.candidates = registry.histogram(
+            "dispatch_candidates_examined", "Drivers scored per driver search", COUNT_BUCKETS)
+        self.tick_seconds = registry.histogram(
+            "dispatch_tick_seconds", "Duration of one simulation tick")
+        self.batch_seconds = registry.histogram(
+            "dispatch_batch_solve_seconds", "Time to solve one matching batch")
+        self.batch_size = registry.histogram(
+            "dispatch_batch_size", "Ride requests per matching batch", COUNT_BUCKETS)
+        self.assignments = registry.counter(
+            "dispatch_assignments", "assign_ride outcomes", labels=("result",))
+        self.rejections = registry.counter(
+            "dispatch_rejections", "Rides turned down by a driver", labels=("source",))
+        self.retries = registry.counter(
+            "dispatch_retries", "Dispatch attempts for rides that were already rejected")
+        self.candidate_cache = registry.counter(
+            "dispatch_candidate_cache", "Driver searches answered from a ride's cached candidates",
+            labels=("result",))
+        self.pending_wait = registry.histogram(
+            "dispatch_pending_wait_ticks", "Ticks a pending ride waited, by how it left the queue",
+            COUNT_BUCKETS, labels=("outcome",))
+
+
+def timed(attribute: str):
+    """
+    Decorator for DispatchService methods: when self.metrics is set, observe
+    the call's duration in the histogram named `attribute` on it. Costs one
+    attribute check when metrics are off.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            metrics = self.metrics
+            if metrics is None:
+                return method(self, *args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                getattr(metrics, attribute).observe(time.perf_counter() - started)
+        return wrapper
+    return decorate
@@ -0,0 +1,127 @@
+from collections import deque
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from app.services.spatial_index import ring_members
+
+
+class PendingQueue:
+    """
+    Ride requests that found no driver, waiting for one to free up.
+
+    Entries are kept in the order the rides started waiting (oldest first)
+    and are also hashed into pickup buckets of `cell_size` grid units, like
+    SpatialIndex, so a driver who becomes available can find the nearest
+    waiting ride by searching outward ring by ring.
+    """
+
+    def __init__(self, cell_size: int = 8, history: int = 1000):
+        self.cell_size = cell_size
+        self.entries: Dict[str, Tuple[int, int, int]] = {}  # ride_id -> (since tick, x, y), oldest first
+        self.buckets: Dict[Tuple[int, int], Dict[str, None]] = {}  # cell -> ride_ids
+        self.matched = 0  # rides that left the queue with a driver
+        self.expired = 0  # rides failed after waiting too long
+        self.recent_waits = deque(maxlen=history)  # ticks waited by recently matched rides
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, ride_id: str) -> bool:
+        return ride_id in self.entries
+
+    def cell_of(self, x: int, y: int) -> Tuple[int, int]:
+        return x // self.cell_size, y // self.cell_size
+
+    def add(self, ride_id: str, x: int, y: int, tick: int) -> None:
+        """Queue a ride; a ride already queued keeps its original wait start."""
+        if ride_id in self.entries:
+            return
+        self.entries[ride_id] = (tick, x, y)
+        self.buckets.setdefault(self.cell_of(x, y), {})[ride_id] = None
+
+    def remove(self, ride_id: str) -> Optional[int]:
+        """Drop a ride from the queue if present; returns the tick it started waiting."""
+        entry = self.entries.pop(ride_id, None)
+        if entry is None:
+            return None
+        since, x, y = entry
+        cell = self.cell_of(x, y)
+        bucket = self.buckets[cell]
+        del bucket[ride_id]
+        if not bucket:
+            del self.buckets[cell]
+        return since
+
+    def take(self, ride_id: str, tick: int) -> int:
+        """Remove a ride that is being matched, recording how long it waited."""
+        wait = tick - self.remove(ride_id)
+        self.matched += 1
+        self.recent_waits.append(wait)
+        return wait
+
+    def waiting_since(self, tick: int) -> Iterator[str]:
+        """Yield the rides that started waiting at or before `tick`, oldest first."""
+        for ride_id, (since, _, _) in self.entries.items():
+            if since > tick:
+                return
+            yield ride_id
+
+    def nearest(
+        self,
+        x: int,
+        y: int,
+        accept: Callable[[str], bool],
+        eta: Optional[Callable[[int, int], Optional[int]]] = None,
+    ) -> Optional[str]:
+        """
+        The waiting ride whose pickup is closest to (x, y) among those
+        `accept` allows, the longest-waiting first on ties.
+
+        Distance is eta(px, py), the travel time from (x, y) to a pickup (None
+        when it cannot be reached), or the Manhattan distance without it. It
+        must never be below the Manhattan distance, which is what lets the
+        search go ring by ring and stop once no farther ring can hold a closer
+        pickup; eta is only called for pickups that could still win.
+        """
+        cell = self.cell_of(x, y)
+        best = None  # (distance, since, ride_id)
+        remaining = len(self.entries)
+        ring = 0
+        while remaining > 0:
+            if best is not None and best[0] < (ring - 1) * self.cell_size + 1:
+                break
+            for ride_id in ring_members(self.buckets, cell, ring):
+                remaining -= 1
+                since, px, py = self.entries[ride_id]
+                candidate = (abs(px - x) + abs(py - y), since)
+                if best is not None and candidate > best[:2]:
+                    continue
+                if eta is not None:
+                    distance = eta(px, py)
+                    if distance is None:
+                        continue
+                    candidate = (distance, since)
+                if (best is None or candidate < best[:2]) and accept(ride_id):
+                    best = (*candidate, ride_id)
+            ring += 1
+        return best[2] if best is not None else None
+
+    def report(self, tick: int) -> dict:
+        """Queue depth and wait-time percentiles (in ticks)."""
+        waiting = np.fromiter((tick - since for since, _, _ in self.entries.values()), dtype=np.int64,
+                              count=len(self.entries))
+        return {
+            "depth": len(self.entries),
+            "matched": self.matched,
+            "expired": self.expired,
+            "waiting_ticks": _percentiles(waiting),
+            "matched_wait_ticks": _percentiles(np.array(self.recent_waits, dtype=np.int64)),
+        }
+
+
+def _percentiles(values: np.ndarray) -> Optional[dict]:
+    if not len(values):
+        return None
+    p50, p90, p99 = (round(p, 1) for p in np.percentile(values, (50, 90, 99)).tolist())
+    return {"p50": p50, "p90": p90, "p99": p99, "max": int(values.max())}
@@ -0,0 +1,516 @@
+import functools
+import io
+import logging
+import os
+import pickle
+import re
+import shutil
+import struct
+import threading
+import time
+import zlib
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+from pydantic import BaseModel
+
+from app.models.entities import RideEntity
+from app.models.models import DriverStatus, Location, Rider, RideRequest, RideStatus
+
+logger = logging.getLogger(__name__)
+
+# Event log record header: payload length, CRC-32 of the payload, sequence number
+RECORD_HEADER = struct.Struct("<IIQ")
+
+SEGMENT_PATTERN = re.compile(r"events-(\d{12})\.log$")
+SNAPSHOT_PATTERN = re.compile(r"snapshot-(\d{12})$")
+
+# Service attributes that are wiring, not state, and are left out of snapshots
+TRANSIENT_ATTRIBUTES = (
+    "change_listeners", "tick_listeners", "journal", "_journal_depth", "_replaying", "metrics",
+)
+
+# NumPy arrays at least this large are stored as .npy files next to the
+# snapshot so they can be memory-mapped on load
+MMAP_MIN_BYTES = 64 * 1024
+
+_MODELS = {cls.__name__: cls for cls in (Location, Rider, RideRequest)}
+_ENUMS = {cls.__name__: cls for cls in (DriverStatus, RideStatus)}
+
+
+class _Model(NamedTuple):
+    kind: str
+    data: dict
+
+
+class _Enum(NamedTuple):
+    kind: str
+    value: str
+
+
+class _LiveRide(NamedTuple):
+    ride_id: str
+
+
+_PLAIN_TYPES = (str, int, float, bool, type(None))
+
+
+def _encode(value, service):
+    """
+    Prepare a logged argument for pickling: rides the service already holds
+    become references by ID and pydantic models become dicts. Entities
+    (app.models.entities) pickle as they are.
+    """
+    if type(value) in _PLAIN_TYPES:
+        return value
+    if isinstance(value, RideEntity) and service.ride_requests.get(value.id) is value:
+        return _LiveRide(value.id)
+    if isinstance(value, BaseModel):
+        return _Model(type(value).__name__, value.model_dump())
+    if isinstance(value, Enum):
+        return _Enum(type(value).__name__, value.value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_encode(item, service) for item in value)
+    if isinstance(value, dict):
+        return {key: _encode(item, service) for key, item in value.items()}
+    return value
+
+
+def _decode(value, service):
+    """Inverse of _encode, against the service being replayed into."""
+    if type(value) in _PLAIN_TYPES:
+        return value
+    if isinstance(value, _LiveRide):
+        return service.ride_requests[value.ride_id]
+    if isinstance(value, _Model):
+        return _MODELS[value.kind](**value.data)
+    if isinstance(value, _Enum):
+        return _ENUMS[value.kind](value.value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_decode(item, service) for item in value)
+    if isinstance(value, dict):
+        return {key: _decode(item, service) for key, item in value.items()}
+    return value
+
+
+def journaled(method=None, *, nested: bool = False):
+    """
+    Decorator for DispatchService methods that mutate state.
+
+    While a journal is attached, each call is appended to it before it runs,
+    so replaying the log re-executes the same commands in the same order.
+    Calls made from inside another journaled method are part of that command
+    and are not logged again, unless `nested` is set: that is for steps whose
+    triggering is not deterministic (flush_batch runs when a batch window
+    expires), which replay re-runs from the log instead.
+    """
+    if method is None:
+        return functools.partial(journaled, nested=nested)
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        journal = self.journal
+        if journal is None:
+            return method(self, *args, **kwargs)
+        outermost = not self._journal_depth
+        if outermost or nested:
+            journal.append(self, name, args, kwargs)
+        self._journal_depth += 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._journal_depth -= 1
+            if outermost:
+                journal.command_done(self)
+    return wrapper
+
+
+class EventLog:
+    """
+    Append-only binary log of records with group commit.
+
+    append() only frames the record and queues it; a background thread
+    waits commit_interval seconds for more records to arrive, then writes
+    the whole group with one write() and one fsync(). Callers never wait
+    for the disk, at the price of losing up to commit_interval of commands
+    on a crash. The log is split into segments named after their first
+    sequence number so that segments covered by a snapshot can be deleted.
+
+    Records are pickled, and unpickling runs whatever the bytes ask for: the
+    log and snapshots must only ever be readable and writable by the
+    service itself. Never open a directory whose files came from elsewhere.
+    """
+
+    def __init__(self, directory, next_seq: int = 1, commit_interval: float = 0.005, fsync: bool = True):
+        self.directory = Path(directory)
+        self.commit_interval = commit_interval
+        self.fsync = fsync
+        self.next_seq = next_seq
+        self.durable_seq = next_seq - 1  # last sequence number written (and synced)
+        self.commits = 0  # groups written
+        self.bytes_written = 0
+        self._buffer: List[Union[bytes, int]] = []  # framed records, and the first seq of each new segment
+        self._cond = threading.Condition()
+        self._closed = False
+        self._file = open(self.directory / segment_name(next_seq), "ab")
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+
+    def append(self, payload: bytes) -> int:
+        """Queue a record and return its sequence number."""
+        with self._cond:
+            seq = self.next_seq
+            self.next_seq += 1
+            self._buffer.append(RECORD_HEADER.pack(len(payload), zlib.crc32(payload), seq) + payload)
+            if len(self._buffer) == 1:
+                self._cond.notify_all()
+        return seq
+
+    def flush(self) -> None:
+        """Block until every appended record is on disk."""
+        with self._cond:
+            target = self.next_seq - 1
+            while self.durable_seq < target:
+                self._cond.wait()
+
+    def rotate(self) -> None:
+        """
+        Start a new segment at the next sequence number. Does not wait: the
+        records already appended are written to the current segment first.
+        """
+        with self._cond:
+            self._buffer.append(self.next_seq)
+            if len(self._buffer) == 1:
+                self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._file.close()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer:
+                    return
+            # Give concurrent commands a moment to join this group
+            if not self._closed:
+                time.sleep(self.commit_interval)
+            with self._cond:
+                group, self._buffer = self._buffer, []
+                last_seq = self.next_seq - 1
+            written = 0
+            records = []
+            for item in group + [None]:
+                if isinstance(item, bytes):
+                    records.append(item)
+                    continue
+                if records:
+                    data = b"".join(records)
+                    self._file.write(data)
+                    self._file.flush()
+                    if self.fsync:
+                        os.fsync(self._file.fileno())
+                    written += len(data)
+                    records = []
+                if item is not None:
+                    self._file.close()
+                    self._file = open(self.directory / segment_name(item), "ab")
+            with self._cond:
+                self.durable_seq = last_seq
+                self.commits += 1
+                self.bytes_written += written
+                self._cond.notify_all()
+
+
+def segment_name(first_seq: int) -> str:
+    return f"events-{first_seq:012d}.log"
+
+
+def _numbered(directory: Path, pattern) -> List[Tuple[int, Path]]:
+    """(number, path) of the directory entries matching pattern, in order."""
+    found = []
+    for path in directory.iterdir():
+        match = pattern.match(path.name)
+        if match:
+            found.append((int(match.group(1)), path))
+    return sorted(found)
+
+
+def read_records(directory, after_seq: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """
+    Yield (seq, payload) for the records logged after `after_seq`. A torn or corrupt record (a crash in
+    the middle of a group write) ends the log: the segment is truncated
+    there and any later segments are removed.
+    """
+    segments = _numbered(Path(directory), SEGMENT_PATTERN)
+    for index, (first_seq, path) in enumerate(segments):
+        if index + 1 < len(segments) and segments[index + 1][0] <= after_seq + 1:
+            continue  # every record in this segment is older
+        with open(path, "rb") as file:
+            data = file.read()
+        offset = 0
+        while offset < len(data):
+            header_end = offset + RECORD_HEADER.size
+            if header_end > len(data):
+                break
+            length, crc, seq = RECORD_HEADER.unpack_from(data, offset)
+            payload = data[header_end:header_end + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            offset = header_end + length
+            if seq > after_seq:
+                yield seq, payload
+        if offset < len(data):
+            with open(path, "r+b") as file:
+                file.truncate(offset)
+            for _, later in segments[index + 1:]:
+                later.unlink()
+            return
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """Pickler that sets large plain NumPy arrays aside, copied, to be stored as .npy files."""
+
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.arrays: List[Tuple[str, np.ndarray]] = []
+
+    def persistent_id(self, obj):
+        if isinstance(obj, np.ndarray) and obj.dtype != object and obj.nbytes >= MMAP_MIN_BYTES:
+            name = f"array-{len(self.arrays)}.npy"
+            self.arrays.append((name, obj.copy()))
+            return name
+        return None
+
+
+class CapturedState(NamedTuple):
+    """A copy of the service state, detached from the live service."""
+    pickled: bytes
+    arrays: List[Tuple[str, np.ndarray]]
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    def __init__(self, file, directory: Path, mmap: bool):
+        super().__init__(file)
+        self.directory = directory
+        self.mmap = mmap
+
+    def persistent_load(self, name):
+        if not self.mmap:
+            return np.load(self.directory / name)
+        # Copy-on-write mapping: pages load on first touch, writes stay
+        # private. Viewed as a plain ndarray, since indexing a memmap goes
+        # through Python-level __getitem__.
+        return np.load(self.directory / name, mmap_mode="c").view(np.ndarray)
+
+
+def capture_state(service) -> CapturedState:
+    """
+    Copy the service state for write_snapshot. Call it while no command is
+    running; the copy can then be written out on any thread while the
+    service carries on.
+    """
+    state = {key: value for key, value in vars(service).items() if key not in TRANSIENT_ATTRIBUTES}
+    buffer = io.BytesIO()
+    pickler = _SnapshotPickler(buffer)
+    pickler.dump(state)
+    return CapturedState(buffer.getvalue(), pickler.arrays)
+
+
+def write_snapshot(captured: CapturedState, directory, seq: int) -> Path:
+    """
+    Write captured state as snapshot-<seq> in directory and return its
+    path. The snapshot is assembled under a temporary name and renamed into
+    place, so a crash never leaves a partial snapshot behind.
+    """
+    directory = Path(directory)
+    final = directory / f"snapshot-{seq:012d}"
+    partial = directory / f".snapshot-{seq:012d}.partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir()
+    with open(partial / "state.pkl", "wb") as file:
+        file.write(captured.pickled)
+    for name, array in captured.arrays:
+        np.save(partial / name, array)
+    for path in partial.iterdir():
+        with open(path, "rb") as file:
+            os.fsync(file.fileno())
+    os.rename(partial, final)
+    _fsync_directory(directory)
+    return final
+
+
+def load_snapshot(service, path, mmap: bool = True) -> None:
+    """Replace the service's state with the snapshot at path."""
+    path = Path(path)
+    with open(path / "state.pkl", "rb") as file:
+        state = _SnapshotUnpickler(file, path, mmap).load()
+    vars(service).update(state)
+
+
+def _fsync_directory(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class PersistentStore:
+    """
+    Durable storage for a DispatchService: a snapshot plus an event log.
+
+    open() rebuilds the service from the newest snapshot (its arrays
+    memory-mapped) and replays the logged commands that came after it, then
+    attaches itself as the service's journal so every further command is
+    logged. A new snapshot is taken after every snapshot_every commands:
+    the state is copied on the thread running the command, while the
+    service is quiescent, and written out on a background thread. Once it
+    is on disk the log segments and snapshots it makes redundant are
+    deleted, keeping the previous snapshot as a fallback.
+
+    A logged command that raises on replay is skipped; it may have failed
+    the same way when it was first run (commands are logged before they
+    run), or the recovered state may have drifted from what was
+    acknowledged. Each one is logged with its sequence number and counted
+    in replay_failures.
+    """
+
+    def __init__(
+        self,
+        directory,
+        snapshot_every: int = 100_000,
+        commit_interval: float = 0.005,
+        fsync: bool = True,
+        mmap: bool = True,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.snapshot_every = snapshot_every
+        self.commit_interval = commit_interval
+        self.fsync = fsync
+        self.mmap = mmap
+        self.log: Optional[EventLog] = None
+        self.snapshot_seq = 0  # sequence number covered by the newest snapshot on disk
+        self.captured_seq = 0  # sequence number covered by the newest snapshot taken
+        self._snapshot_thread: Optional[threading.Thread] = None
+        self.recovery = {}  # timings of the last open()
+        self.replay_failures = 0  # logged commands that raised during the last open()
+
+    def open(self, factory: Callable[[], object]):
+        """Return the recovered service, with journaling switched on."""
+        started = time.perf_counter()
+        for partial in self.directory.glob(".snapshot-*.partial"):
+            shutil.rmtree(partial)
+        service = factory()
+        snapshots = _numbered(self.directory, SNAPSHOT_PATTERN)
+        if snapshots:
+            self.snapshot_seq, path = snapshots[-1]
+            self.captured_seq = self.snapshot_seq
+            load_snapshot(service, path, self.mmap)
+        loaded = time.perf_counter()
+
+        last_seq = self.snapshot_seq
+        replayed = 0
+        self.replay_failures = 0
+        service._replaying = True
+        try:
+            for seq, payload in read_records(self.directory, self.snapshot_seq):
+                method, args, kwargs = pickle.loads(payload)
+                try:
+                    getattr(service, method)(*_decode(args, service), **_decode(kwargs, service))
+                except Exception as e:
+                    self.replay_failures += 1
+                    logger.warning("Skipped journal entry %d (%s) that failed on replay: %r", seq, method, e)
+                last_seq = seq
+                replayed += 1
+        finally:
+            service._replaying = False
+        finished = time.perf_counter()
+
+        self.recovery = {
+            "snapshot_seq": self.snapshot_seq,
+            "replayed": replayed,
+            "replay_failures": self.replay_failures,
+            "snapshot_load_s": loaded - started,
+            "replay_s": finished - loaded,
+            "total_s": finished - started,
+        }
+        self.log = EventLog(self.directory, last_seq + 1, self.commit_interval, self.fsync)
+        service.journal = self
+        return service
+
+    def append(self, service, method: str, args: tuple, kwargs: dict) -> int:
+        """Log a command about to run on service."""
+        record = (method, _encode(args, service), _encode(kwargs, service))
+        return self.log.append(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def command_done(self, service) -> None:
+        """Snapshot once snapshot_every commands have been logged since the last one was taken."""
+        if self.log.next_seq - 1 - self.captured_seq < self.snapshot_every:
+            return
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return  # the previous snapshot is still being written
+        self.snapshot(service, background=True)
+
+    def snapshot(self, service, background: bool = False) -> Optional[Path]:
+        """
+        Snapshot the service now; only call while no command is running.
+        Returns the snapshot's path once it is written, or None right away
+        with `background` set, leaving the write to a background thread.
+        """
+        self.wait_for_snapshot()
+        seq = self.log.next_seq - 1
+        captured = capture_state(service)
+        self.captured_seq = seq
+        self.log.rotate()
+        if not background:
+            return self._write_snapshot(captured, seq)
+        self._snapshot_thread = threading.Thread(
+            target=self._write_snapshot, args=(captured, seq), name="snapshot", daemon=True
+        )
+        self._snapshot_thread.start()
+        return None
+
+    def wait_for_snapshot(self) -> None:
+        """Block until a snapshot being written in the background is on disk."""
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+            self._snapshot_thread = None
+
+    def _write_snapshot(self, captured: CapturedState, seq: int) -> Optional[Path]:
+        try:
+            path = write_snapshot(captured, self.directory, seq)
+        except Exception:
+            logger.exception("Failed to write snapshot %d; recovery falls back to the previous one", seq)
+            return None
+        self.snapshot_seq = seq
+        self._prune()
+        return path
+
+    def close(self) -> None:
+        """Finish any snapshot being written, write out pending log records and stop the log thread."""
+        self.wait_for_snapshot()
+        if self.log is not None:
+            self.log.flush()
+            self.log.close()
+            self.log = None
+
+    def _prune(self) -> None:
+        """Drop all but the two newest snapshots and the log segments neither needs."""
+        snapshots = _numbered(self.directory, SNAPSHOT_PATTERN)
+        for _, path in snapshots[:-2]:
+            shutil.rmtree(path)
+        oldest_kept = snapshots[-2][0] if len(snapshots) > 1 else 0
+        segments = _numbered(self.directory, SEGMENT_PATTERN)
+        for (_, path), (next_first, _) in zip(segments, segments[1:]):
+            if next_first <= oldest_kept + 1:
+                path.unlink()
@@ -0,0 +1,250 @@
+import json
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+# Move directions of next-hop fields, in tie-break order: along x before
+# along y, like movement on the open grid
+DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+NO_MOVE = -1
+
+# Edge cost of a closed edge (blocked cell, one-way street, map border).
+# Large enough that no open path reaches it, small enough that sums of
+# costs along a row or column stay within int64.
+CLOSED = 1 << 40
+UNREACHABLE = np.iinfo(np.int32).max  # distance field value of cells cut off from the destination
+_INFINITY = 1 << 62
+
+
+class RoadMap:
+    """
+    Grid road network over width x height cells: blocked cells, one-way
+    streets and per-edge travel costs in ticks (1 by default).
+
+    Routing works from distance fields: for one destination, the cost from
+    every cell to it and the first move of a cheapest path, computed with
+    directional sweeps (each pass relaxes whole rows and columns at once,
+    repeated until nothing changes). Fields of hotspot cells are computed
+    when the map is loaded and kept; the others live in an LRU cache, as do
+    the routes built from them. Locations outside the map are routed as on
+    the open grid.
+    """
+
+    def __init__(
+        self,
+        width: int = 100,
+        height: int = 100,
+        blocked: List[Tuple[int, int]] = (),
+        one_way: List[Tuple[int, int, int, int]] = (),
+        costs: List[Tuple[int, int, int, int, int]] = (),
+        hotspots: List[Tuple[int, int]] = (),
+        cache_size: int = 1024,
+        route_cache_size: int = 4096,
+    ):
+        self.width = width
+        self.height = height
+        self.blocked = [tuple(cell) for cell in blocked]
+        self.one_way = [tuple(edge) for edge in one_way]  # (x1, y1, x2, y2): only x1,y1 -> x2,y2 is allowed
+        self.costs = [tuple(edge) for edge in costs]  # (x1, y1, x2, y2, ticks) for moving x1,y1 -> x2,y2
+        self.hotspots = [tuple(cell) for cell in hotspots]
+        self.cache_size = cache_size
+        self.route_cache_size = route_cache_size
+
+        # edge_cost[d, x, y]: ticks to move from (x, y) in DIRECTIONS[d]
+        edge_cost = np.ones((len(DIRECTIONS), width, height), dtype=np.int64)
+        edge_cost[0, -1, :] = edge_cost[1, 0, :] = edge_cost[2, :, -1] = edge_cost[3, :, 0] = CLOSED
+        for x1, y1, x2, y2, ticks in self.costs:
+            edge_cost[self._direction(x1, y1, x2, y2), x1, y1] = ticks
+        for x1, y1, x2, y2 in self.one_way:
+            edge_cost[self._direction(x2, y2, x1, y1), x2, y2] = CLOSED
+        for x, y in self.blocked:
+            edge_cost[:, x, y] = CLOSED
+            for d, (dx, dy) in enumerate(DIRECTIONS):
+                if 0 <= x - dx < width and 0 <= y - dy < height:
+                    edge_cost[d, x - dx, y - dy] = CLOSED
+        if (edge_cost < 1).any():
+            raise ValueError("Edge costs must be at least 1 tick")
+        self.edge_cost = edge_cost
+
+        self._pinned = {}  # hotspot cell -> (dist, hops)
+        self._fields = OrderedDict()  # cell -> (dist, hops), least recently used first
+        self._routes = OrderedDict()  # (sx, sy, tx, ty) -> route, least recently used first
+        self.hits = 0
+        self.misses = 0
+        for x, y in self.hotspots:
+            self._pinned[x, y] = self._compute(x, y)
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> "RoadMap":
+        return cls(**spec)
+
+    @classmethod
+    def load(cls, path: str) -> "RoadMap":
+        """Read a map from a JSON file holding to_dict()'s fields."""
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self) -> dict:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "blocked": [list(cell) for cell in self.blocked],
+            "one_way": [list(edge) for edge in self.one_way],
+            "costs": [list(edge) for edge in self.costs],
+            "hotspots": [list(cell) for cell in self.hotspots],
+            "cache_size": self.cache_size,
+            "route_cache_size": self.route_cache_size,
+        }
+
+    def __getstate__(self):
+        # Caches are rebuilt on demand rather than saved with snapshots
+        state = self.__dict__.copy()
+        state["_pinned"], state["_fields"], state["_routes"] = {}, OrderedDict(), OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for x, y in self.hotspots:
+            self._pinned[x, y] = self._compute(x, y)
+
+    def stats(self) -> dict:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "blocked": len(self.blocked),
+            "one_way": len(self.one_way),
+            "costs": len(self.costs),
+            "hotspots": len(self._pinned),
+            "cached_fields": len(self._fields),
+            "cached_routes": len(self._routes),
+            "field_hits": self.hits,
+            "field_misses": self.misses,
+        }
+
+    def contains(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def _direction(self, x1: int, y1: int, x2: int, y2: int) -> int:
+        if not (self.contains(x1, y1) and self.contains(x2, y2)):
+            raise ValueError(f"Edge ({x1}, {y1}) -> ({x2}, {y2}) is outside the map")
+        try:
+            return DIRECTIONS.index((x2 - x1, y2 - y1))
+        except ValueError:
+            raise ValueError(f"({x1}, {y1}) and ({x2}, {y2}) are not neighbouring cells") from None
+
+    def field(self, x: int, y: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The (dist, hops) fields of destination (x, y), both indexed [x, y]:
+        dist is the cost to reach it (UNREACHABLE if it cannot be reached),
+        hops the DIRECTIONS index of the first move (NO_MOVE at the
+        destination and at unreachable cells).
+        """
+        pinned = self._pinned.get((x, y))
+        if pinned is not None:
+            self.hits += 1
+            return pinned
+        cached = self._fields.get((x, y))
+        if cached is not None:
+            self.hits += 1
+            self._fields.move_to_end((x, y))
+            return cached
+        self.misses += 1
+        cached = self._fields[x, y] = self._compute(x, y)
+        if len(self._fields) > self.cache_size:
+            self._fields.popitem(last=False)
+        return cached
+
+    def _compute(self, x: int, y: int) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.contains(x, y):
+            raise ValueError(f"({x}, {y}) is outside the map")
+        cost = self.edge_cost
+        # Prefix sums of edge costs along each axis, for moving east/north
+        # (exclusive) and west/south (inclusive of the cell moved from)
+        east = np.concatenate((np.zeros((1, self.height), np.int64), np.cumsum(cost[0, :-1], axis=0)), axis=0)
+        west = np.concatenate((np.zeros((1, self.height), np.int64), np.cumsum(cost[1, 1:], axis=0)), axis=0)
+        north = np.concatenate((np.zeros((self.width, 1), np.int64), np.cumsum(cost[2, :, :-1], axis=1)), axis=1)
+        south = np.concatenate((np.zeros((self.width, 1), np.int64), np.cumsum(cost[3, :, 1:], axis=1)), axis=1)
+
+        dist = np.full((self.width, self.height), _INFINITY, dtype=np.int64)
+        dist[x, y] = 0
+        while True:
+            before = dist
+            # Cost of reaching the destination by first driving straight
+            # east/west/north/south to some cell of the same row or column
+            dist = np.minimum(dist, np.minimum.accumulate((dist + east)[::-1], axis=0)[::-1] - east)
+            dist = np.minimum(dist, np.minimum.accumulate(dist - west, axis=0) + west)
+            dist = np.minimum(dist, np.minimum.accumulate((dist + north)[:, ::-1], axis=1)[:, ::-1] - north)
+            dist = np.minimum(dist, np.minimum.accumulate(dist - south, axis=1) + south)
+            if np.array_equal(dist, before):
+                break
+
+        reachable = dist < CLOSED
+        # Cost of each first move plus the distance from the cell it leads to
+        via = np.full((len(DIRECTIONS), self.width, self.height), _INFINITY, dtype=np.int64)
+        via[0, :-1] = cost[0, :-1] + dist[1:]
+        via[1, 1:] = cost[1, 1:] + dist[:-1]
+        via[2, :, :-1] = cost[2, :, :-1] + dist[:, 1:]
+        via[3, :, 1:] = cost[3, :, 1:] + dist[:, :-1]
+        hops = np.argmin(via, axis=0).astype(np.int8)
+        hops[~reachable] = NO_MOVE
+        hops[x, y] = NO_MOVE
+        return np.where(reachable, dist, UNREACHABLE).astype(np.int32), hops
+
+    def distance(self, x1: int, y1: int, x2: int, y2: int) -> int:
+        """Travel cost from (x1, y1) to (x2, y2); UNREACHABLE if there is no way."""
+        if not (self.contains(x1, y1) and self.contains(x2, y2)):
+            return abs(x1 - x2) + abs(y1 - y2)
+        return int(self.field(x2, y2)[0][x1, y1])
+
+    def distances_to(self, x: int, y: int, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """Travel costs from every (xs[i], ys[i]) to (x, y), as int64."""
+        manhattan = np.abs(xs - x) + np.abs(ys - y)
+        if not self.contains(x, y):
+            return manhattan.astype(np.int64)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        dist = self.field(x, y)[0]
+        return np.where(inside, dist[np.where(inside, xs, 0), np.where(inside, ys, 0)], manhattan).astype(np.int64)
+
+    def step(self, x: int, y: int, tx: int, ty: int) -> Tuple[int, int]:
+        """The cell after (x, y) on a cheapest route to (tx, ty)."""
+        if self.contains(x, y) and self.contains(tx, ty):
+            hop = self.field(tx, ty)[1][x, y]
+            if hop != NO_MOVE:
+                dx, dy = DIRECTIONS[hop]
+                return x + dx, y + dy
+        # Off the map or cut off: drive straight there, x first
+        if x != tx:
+            return x + (1 if tx > x else -1), y
+        if y != ty:
+            return x, y + (1 if ty > y else -1)
+        return x, y
+
+    def route(self, x: int, y: int, tx: int, ty: int) -> Optional[np.ndarray]:
+        """
+        The cells after (x, y) on a cheapest route to (tx, ty), as rows of
+        (x, y, ticks to get there from the previous cell). None when the
+        route leaves the map or there is no way there.
+        """
+        key = (x, y, tx, ty)
+        cached = self._routes.get(key)
+        if cached is not None or key in self._routes:
+            self._routes.move_to_end(key)
+            return cached
+        route = None
+        if self.contains(x, y) and self.contains(tx, ty):
+            dist, hops = self.field(tx, ty)
+            if dist[x, y] != UNREACHABLE:
+                cells = []
+                while (x, y) != (tx, ty):
+                    hop = int(hops[x, y])
+                    ticks = int(self.edge_cost[hop, x, y])
+                    dx, dy = DIRECTIONS[hop]
+                    x, y = x + dx, y + dy
+                    cells.append((x, y, ticks))
+                route = np.array(cells, dtype=np.int32).reshape(-1, 3)
+        self._routes[key] = route
+        if len(self._routes) > self.route_cache_size:
+            self._routes.popitem(last=False)
+        return route
@@ -0,0 +1,913 @@
+import multiprocessing
+import signal
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.models.entities import RIDE_ASSIGNED, RIDE_WAITING, Point, RideEntity, RiderEntity
+from app.models.models import DriverStatus, RideStatus
+from app.services.dispatch import DispatchService
+from app.services.metrics import timed
+from app.services.pending import PendingQueue
+from app.services.trips import DROPOFF, PICKUP
+
+class RegionGrid:
+    """
+    Splits the grid into vertical strips of columns, one per shard.
+    Strip i covers x in [bounds[i], bounds[i + 1]).
+    """
+
+    def __init__(self, shards: int, width: int):
+        if not 1 <= shards <= width:
+            raise ValueError(f"Cannot split a grid of width {width} into {shards} regions")
+        self.shards = shards
+        self.width = width
+        self.bounds = [i * width // shards for i in range(shards + 1)]
+
+    def region_of(self, x) -> np.ndarray:
+        """Region of one x coordinate or an array of them."""
+        return np.searchsorted(self.bounds, np.clip(x, 0, self.width - 1), side="right") - 1
+
+    def border_distance(self, region: int, x: int) -> float:
+        """Manhattan distance from column x to the nearest cell of another region."""
+        left, right = self.bounds[region], self.bounds[region + 1]
+        distance = float("inf")
+        if left > 0:
+            distance = x - left + 1
+        if right < self.width:
+            distance = min(distance, right - x)
+        return distance
+
+
+class ShardWorker:
+    """
+    The state of one region, run inside its own worker process.
+
+    Wraps a DispatchService holding the drivers located in the region, the
+    waiting rides whose pickup is in it, and the trips of its drivers.
+    `seq` records each fleet row's global insertion order so cross-region
+    ties are broken the same way as in a single service. Rides are stored
+    under their global creation number (see _ride_number), so every
+    region lists them in the same order.
+
+    The service's own pending queue stays empty: rides are assigned with
+    start_trip, never assign_ride, and the coordinator keeps the rides
+    waiting for a driver.
+    """
+
+    def __init__(self, region: int, grid: RegionGrid, grid_height: int):
+        self.region = region
+        self.grid = grid
+        self.service = DispatchService(grid_width=grid.width, grid_height=grid_height)
+        self.seq = np.zeros(1024, dtype=np.int64)  # fleet row -> global driver sequence
+
+    def handle(self, command: str, *args):
+        return getattr(self, command)(*args)
+
+    def add_drivers(self, drivers: List[Tuple[str, int, int, int]]) -> None:
+        """Add (driver_id, x, y, seq) drivers in one pass."""
+        service = self.service
+        first = service.fleet.size
+        service.add_drivers([d[0] for d in drivers], [Point(d[1], d[2]) for d in drivers])
+        self._set_seq(np.arange(first, first + len(drivers)), [d[3] for d in drivers])
+
+    def remove_driver(self, driver_id: str) -> None:
+        self.service.remove_driver(driver_id)
+
+    def set_driver_status(self, driver_id: str, status: DriverStatus) -> Tuple[int, int]:
+        """Change a driver's status; returns the driver's location."""
+        self.service.set_driver_status(driver_id, status)
+        return self.service.fleet.location_of(self.service.fleet.rows[driver_id])
+
+    def driver(self, driver_id: str) -> Optional[dict]:
+        fleet = self.service.fleet
+        if driver_id not in fleet:
+            return None
+        return fleet.to_dicts(np.array([fleet.rows[driver_id]]))[0]
+
+    def drivers(self, box: Optional[tuple] = None) -> Tuple[List[int], List[dict]]:
+        """(global sequences, driver dicts) of all drivers, or of those inside the (x0, y0, x1, y1) box."""
+        fleet = self.service.fleet
+        rows = fleet.live_rows() if box is None else fleet.rows_in(*box)
+        return self.seq[rows].tolist(), fleet.to_dicts(rows)
+
+    def positions(self, box: Optional[tuple] = None) -> Tuple[np.ndarray, ...]:
+        """(global sequence, x, y, status code) columns of all drivers, or of those inside the box."""
+        fleet = self.service.fleet
+        rows = fleet.live_rows() if box is None else fleet.rows_in(*box)
+        return self.seq[rows], fleet.x[rows], fleet.y[rows], fleet.status[rows]
+
+    def note_rejection(self, driver_id: str, ride_id: str) -> None:
+        """Record on a local driver that they turned down a ride held by another region."""
+        fleet = self.service.fleet
+        row = fleet.rows[driver_id]
+        if ride_id not in fleet.rejected_rides[row]:
+            fleet.rejected_rides[row][ride_id] = None
+            self.service._touch_drivers(row)
+
+    def summary(self) -> Tuple[Optional[tuple], int]:
+        """(extent, max_rides) of the available drivers, see SpatialIndex.extent."""
+        index = self.service.available_index
+        return index.extent(), index.max_rides()
+
+    def dispatch(self, rides: List[dict], outside: Tuple[Optional[tuple], int]) -> List[Optional[str]]:
+        """
+        Register new rides and try to assign each one to a driver of this
+        region, in order.
+
+        `outside` is the summary() of the available drivers of every other
+        region. The region's drivers are ranked by the service's own scoring,
+        normalized by the maxima over the whole fleet, so the scores are the
+        ones a single service would compute. The best one is assigned only
+        if no driver elsewhere can score as well: those are at least the
+        border distance away and have at most the outside max_rides. Ties
+        are left to the coordinator, which breaks them in global order.
+        Otherwise the ride stays WAITING and None is returned so the
+        coordinator can search across regions.
+        """
+        service = self.service
+        index = service.available_index
+        outside_extent, outside_rides = outside
+        assigned = []
+        for packet in rides:
+            ride_request = RideEntity.from_dict(packet)
+            self._add_ride(ride_request)
+            px, py = ride_request.pickup.x, ride_request.pickup.y
+            max_eta = max(1, index.max_distance(px, py), farthest(outside_extent, px, py))
+            max_rides = max(1, index.max_rides(), outside_rides)
+            ranked = service.rank_drivers(ride_request, 2, normalization=(max_eta, max_rides))
+            driver_id = None
+            if ranked and (len(ranked) == 1 or ranked[0][0] < ranked[1][0]):
+                score, row = ranked[0]
+                if outside_extent is None or score < self._outside_floor(px, max_eta, max_rides, outside_rides):
+                    driver_id = service.fleet.ids[row]
+                    service.start_trip(ride_request, driver_id)
+            assigned.append(driver_id)
+        return assigned
+
+    def _outside_floor(self, px: int, max_eta: int, max_rides: int, outside_rides: int) -> float:
+        """Lowest score a driver of another region could have for a pickup in column px."""
+        border = self.grid.border_distance(self.region, px)
+        return (self.service.eta_weight * (border / max_eta)
+                + self.service.fairness_weight * (1 - outside_rides / max_rides))
+
+    def frontier(self, px: int, py: int, rejected: List[str]) -> Optional[tuple]:
+        """
+        Candidates of this region for a global driver search.
+
+        Returns (max_eta, max_rides, points) over the available drivers not in
+        `rejected`, or None if there are none. `points` holds one
+        (eta, rides, seq, driver_id) per Pareto-optimal (low ETA, high ride
+        count) combination: whatever the normalization constants, the best
+        dispatch score is always among them.
+        """
+        fleet = self.service.fleet
+        rows = fleet.rows_with_status(DriverStatus.AVAILABLE)
+        if rejected:
+            excluded = [fleet.rows[d] for d in rejected if d in fleet.rows]
+            rows = rows[~np.isin(rows, excluded)]
+        if not len(rows):
+            return None
+        eta = self.service._etas(rows, px, py)
+        rides = fleet.rides[rows]
+        seq = self.seq[rows]
+
+        # First entry per ride count (most rides first) has the lowest ETA, then seq
+        order = np.lexsort((seq, eta, -rides))
+        _, first = np.unique(-rides[order], return_index=True)
+        best = order[first]
+        # Keep a ride count only if it beats the ETA of every higher count
+        best_eta = eta[best]
+        better = np.concatenate(([True], best_eta[1:] < np.minimum.accumulate(best_eta)[:-1]))
+        best = best[better]
+        points = [
+            (e, r, s, fleet.ids[row])
+            for e, r, s, row in zip(eta[best].tolist(), rides[best].tolist(), seq[best].tolist(), rows[best].tolist())
+        ]
+        return int(eta.max()), int(rides.max()), points
+
+    def assign(self, ride_id: str, driver_id: str) -> None:
+        self.service.start_trip(self.service.ride_requests[ride_id], driver_id)
+
+    def take_ride(self, ride_id: str) -> dict:
+        """Hand a waiting ride over to another region."""
+        return self.service.detach_ride(ride_id).to_dict()
+
+    def import_ride(self, packet: dict, driver_id: str) -> None:
+        """Accept a waiting ride from another region and assign it to a local driver."""
+        ride_request = RideEntity.from_dict(packet)
+        self._add_ride(ride_request)
+        self.service.start_trip(ride_request, driver_id)
+
+    def ride(self, ride_id: str) -> Optional[dict]:
+        ride_request = self.service.get_ride(ride_id)
+        return ride_request.to_dict() if ride_request is not None else None
+
+    def trip(self, ride_id: str) -> Optional[Tuple[str, str]]:
+        return self.service.active_trips.get(ride_id)
+
+    def rides(self, after: Optional[int], limit: int, status: Optional[RideStatus], rider_id: Optional[str],
+              driver_id: Optional[str]) -> Tuple[List[dict], bool]:
+        """A page of this region's rides after the global creation number `after`, and whether more follow."""
+        rides, next_cursor = self.service.list_rides(after, limit, status, rider_id, driver_id)
+        return [ride_request.to_dict() for ride_request in rides], next_cursor is not None
+
+    def reject(self, ride_id: str, driver_id: str) -> Tuple[dict, Optional[Tuple[int, int]]]:
+        """
+        Record that a driver turned down a ride of this region; if it was
+        the ride they were driving to pick up, they are freed and the ride
+        waits again. Returns the ride and the freed driver's location (None
+        when no driver was freed).
+        """
+        service = self.service
+        ride_request = service.ride_requests[ride_id]
+        service.record_rejection(ride_request, driver_id)
+        freed = None
+        if service.active_trips.get(ride_id) == (driver_id, "to_pickup"):
+            service.release_trip(ride_request)
+            freed = service.fleet.location_of(service.fleet.rows[driver_id])
+        return ride_request.to_dict(), freed
+
+    def cancel(self, ride_id: str) -> Optional[Tuple[str, int, int]]:
+        """Cancel a ride; returns (driver_id, x, y) of the driver it freed, if any."""
+        service = self.service
+        ride_request = service.ride_requests[ride_id]
+        driver_id = ride_request.assigned_driver_id if ride_request.status_code == RIDE_ASSIGNED else None
+        service.cancel_ride(ride_request)
+        if driver_id is None or driver_id not in service.fleet:
+            return None
+        return (driver_id, *service.fleet.location_of(service.fleet.rows[driver_id]))
+
+    def fail(self, ride_ids: List[str]) -> None:
+        """Fail waiting rides, e.g. ones that waited too long for a driver."""
+        for ride_id in ride_ids:
+            self.service.set_ride_status(self.service.ride_requests[ride_id], RideStatus.FAILED)
+
+    def tick(self) -> Tuple[List[dict], List[Tuple[int, dict]]]:
+        """
+        Advance one tick. Returns the tick's events and the (region, packet)
+        hand-offs of drivers that moved out of the region: those driving a
+        trip, and those whose dropoff was across the border.
+        """
+        service = self.service
+        fleet = service.fleet
+        events = service.tick()
+
+        table = service.trip_table
+        regions = self.grid.region_of(fleet.x[table.rows]) if len(table) else np.empty(0, dtype=np.int64)
+        leaving = [
+            (int(regions[i]), table.driver_ids[i], table.ride_ids[i])
+            for i in np.flatnonzero(regions != self.region).tolist()
+        ]
+        for event in events:
+            if event["type"] == DROPOFF:
+                region = int(self.grid.region_of(event["location"]["x"]))
+                if region != self.region:
+                    leaving.append((region, event["driver_id"], None))
+
+        handoffs = []
+        for region, driver_id, ride_id in leaving:
+            seq = int(self.seq[fleet.rows[driver_id]])
+            packet = service.detach_driver(driver_id, ride_id)
+            packet["seq"] = seq
+            handoffs.append((region, packet))
+        return events, handoffs
+
+    def import_drivers(self, packets: List[dict]) -> None:
+        """Take over drivers (with their trips) that moved into this region."""
+        for packet in packets:
+            if packet["trip"] is not None:
+                self.service._next_ride_seq = _ride_number(packet["trip"]["ride"]["id"])
+            row = self.service.attach_driver(packet)
+            self._set_seq(np.array([row]), [packet["seq"]])
+
+    def state(self) -> dict:
+        """This region's part of the full system state."""
+        service = self.service
+        seqs, drivers = self.drivers()
+        return {
+            "driver_seqs": seqs,
+            "drivers": drivers,
+            "ride_requests": [ride_request.to_dict() for ride_request in service.ride_requests.values()],
+            "archived_rides": len(service.archive),
+            "active_trips": [
+                {"ride_id": ride_id, "driver_id": driver_id, "step": step}
+                for ride_id, (driver_id, step) in service.active_trips.items()
+            ],
+        }
+
+    def stats(self) -> dict:
+        service = self.service
+        return {
+            "region": self.region,
+            "drivers": len(service.fleet),
+            "available": len(service.available_index),
+            "waiting": len(service.rides_by_status[RIDE_WAITING]),
+            "active_trips": len(service.active_trips),
+            "completed": len(service.archive),
+            "problems": service.check_consistency() + self._misplaced(),
+        }
+
+    def _misplaced(self) -> List[str]:
+        """Drivers outside the region; border crossings are handed off at the end of each tick."""
+        fleet = self.service.fleet
+        rows = fleet.live_rows()
+        outside = rows[self.grid.region_of(fleet.x[rows]) != self.region]
+        return [f"driver {fleet.ids[row]} is outside region {self.region}" for row in outside.tolist()]
+
+    def _add_ride(self, ride_request: RideEntity) -> None:
+        self.service._next_ride_seq = _ride_number(ride_request.id)  # list rides in global creation order
+        self.service.add_ride_request(ride_request)
+
+    def _set_seq(self, rows: np.ndarray, seqs: List[int]) -> None:
+        while self.service.fleet.size > len(self.seq):
+            self.seq = np.resize(self.seq, len(self.seq) * 2)
+        self.seq[rows] = seqs
+
+
+def farthest(extent: Optional[tuple], x: int, y: int) -> int:
+    """Manhattan distance from (x, y) to the farthest driver of an extent (0 for None)."""
+    if extent is None:
+        return 0
+    u_min, u_max, v_min, v_max = extent
+    u, v = x + y, x - y
+    return max(u_max - u, u - u_min, v_max - v, v - v_min)
+
+
+def combine(summaries: List[Tuple[Optional[tuple], int]]) -> Tuple[Optional[tuple], int]:
+    """The summary() of the drivers of several regions together."""
+    extents = [extent for extent, _ in summaries if extent is not None]
+    extent = None
+    if extents:
+        u_min, u_max, v_min, v_max = zip(*extents)
+        extent = (min(u_min), max(u_max), min(v_min), max(v_max))
+    return extent, max((rides for _, rides in summaries), default=0)
+
+
+def _ride_number(ride_id: str) -> int:
+    """Global creation number of a ride, from its ride_%08x ID."""
+    return int(ride_id[5:], 16)
+
+
+def _serve(connection, region: int, shards: int, grid_width: int, grid_height: int) -> None:
+    """Worker process main loop: run commands from the coordinator until told to stop."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C reaches the whole group; the coordinator stops us
+    worker = ShardWorker(region, RegionGrid(shards, grid_width), grid_height)
+    while True:
+        command, args = connection.recv()
+        if command == "stop":
+            connection.close()
+            return
+        try:
+            connection.send((True, worker.handle(command, *args)))
+        except Exception as e:  # report to the coordinator instead of killing the shard
+            connection.send((False, e))
+
+
+class ShardedDispatcher:
+    """
+    Region-sharded dispatch on one machine: the grid is split into strips
+    (RegionGrid) and each strip is owned by a worker process holding its own
+    DispatchService. This process routes requests and keeps the riders, a
+    directory of the region holding each driver and ride, and the queue of
+    rides waiting for a driver.
+
+    Ride requests go to the region of their pickup, which scores its
+    drivers with normalization constants taken over the whole fleet and
+    assigns the best one when no driver of another region could score as
+    well. Otherwise the coordinator runs a cross-region search: every
+    region returns its Pareto-optimal candidates and the best is chosen with
+    the same constants; the ride then moves to the winner's region. Either
+    way the driver is the one a single service would choose. After each tick,
+    drivers that crossed a border are handed off to their new region along
+    with the trip they are driving.
+
+    Rides that find no driver wait in the coordinator's PendingQueue. As in
+    DispatchService, a driver who becomes available (added, freed by a
+    dropoff, cancellation or rejection, or set back to available) gets the
+    nearest waiting ride they have not rejected, and with max_wait_ticks
+    set, rides that waited that long are FAILED.
+
+    Rides requested together are dispatched by their regions in parallel,
+    so the whole-fleet constants a region scores a ride with can still count
+    drivers another region assigned in the same call. Methods must not be
+    called concurrently.
+    """
+
+    def __init__(
+        self, shards: int, grid_width: int = 100, grid_height: int = 100, max_wait_ticks: Optional[int] = None
+    ):
+        self.grid = RegionGrid(shards, grid_width)
+        context = multiprocessing.get_context("spawn")  # no fork() from a threaded server
+        self._connections = []
+        self._processes = []
+        for region in range(shards):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_serve, args=(child, region, shards, grid_width, grid_height), daemon=True
+            )
+            process.start()
+            self._connections.append(parent)
+            self._processes.append(process)
+
+        # IDs come from counters: random 8-digit IDs collide at these volumes
+        self.driver_count = 0
+        self.rider_count = 0
+        self.ride_count = 0
+        self.riders: Dict[str, RiderEntity] = {}
+        self.driver_regions: Dict[str, int] = {}  # driver_id -> region holding the driver
+        self.ride_regions: Dict[str, int] = {}  # ride_id -> region holding the ride, archived ones included
+        self.active_request_by_rider: Dict[str, str] = {}  # rider_id -> WAITING or ASSIGNED ride_id
+        self.ride_riders: Dict[str, str] = {}  # live ride_id -> rider_id
+        self.pending = PendingQueue()  # WAITING rides that found no driver
+        self.pending_rejections: Dict[str, Set[str]] = {}  # pending ride_id -> drivers who rejected it
+        # ride_id -> when its current trip started, so each tick's events come in
+        # the order a single service reports them (its trips in start order)
+        self.trip_order: Dict[str, int] = {}
+        self.trips_started = 0
+        self.escalations = 0  # rides that needed a cross-region search
+        self.handoffs = 0
+        self.current_tick = 0
+        self.eta_weight = 0.7  # same defaults as DispatchService
+        self.fairness_weight = 0.3
+        self.max_rejection_attempts = 3
+        self.max_wait_ticks = max_wait_ticks  # Ticks a pending request waits before failing
+        # Instrumentation (a DispatchMetrics), None when disabled; only what the
+        # coordinator sees is measured: ticks, outcomes and pending waits
+        self.metrics = None
+
+        # Every mutation bumps `version` and calls the change listeners
+        self.version = 0
+        self.change_listeners: List[Callable[[], None]] = []
+        self.tick_listeners: List[Callable[[int, List[dict]], None]] = []  # called with each tick's events
+
+    @property
+    def shards(self) -> int:
+        return self.grid.shards
+
+    def close(self) -> None:
+        for connection in self._connections:
+            try:
+                connection.send(("stop", ()))
+            except OSError:  # the worker already exited, e.g. killed along with the server
+                pass
+        for process in self._processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Drivers
+
+    def add_drivers(self, locations: List[Point]) -> List[str]:
+        """Add available drivers at the given locations; returns their IDs."""
+        by_region: Dict[int, list] = {}
+        driver_ids = []
+        regions = self.grid.region_of(np.array([loc.x for loc in locations], dtype=np.int64)).tolist()
+        for loc, region in zip(locations, regions):
+            driver_id = f"driver_{self.driver_count:08x}"
+            by_region.setdefault(region, []).append((driver_id, loc.x, loc.y, self.driver_count))
+            self.driver_count += 1
+            self.driver_regions[driver_id] = region
+            driver_ids.append(driver_id)
+        self._scatter({region: ("add_drivers", (drivers,)) for region, drivers in by_region.items()})
+        for driver_id, loc in zip(driver_ids, locations):
+            self._dispatch_pending(driver_id, loc.x, loc.y)
+        self._changed()
+        return driver_ids
+
+    def remove_driver(self, driver_id: str) -> None:
+        self._call(self.driver_regions.pop(driver_id), "remove_driver", driver_id)
+        self._changed()
+
+    def set_driver_status(self, driver_id: str, status: DriverStatus) -> None:
+        x, y = self._call(self.driver_regions[driver_id], "set_driver_status", driver_id, status)
+        if status == DriverStatus.AVAILABLE:
+            self._dispatch_pending(driver_id, x, y)
+        self._changed()
+
+    def driver(self, driver_id: str) -> Optional[dict]:
+        """A driver in the shape of the Driver schema, or None if unknown."""
+        region = self.driver_regions.get(driver_id)
+        return self._call(region, "driver", driver_id) if region is not None else None
+
+    def drivers(self, box: Optional[tuple] = None) -> List[dict]:
+        """All drivers in the order they were added, or those inside the (x0, y0, x1, y1) box."""
+        replies = self._scatter({region: ("drivers", (box,)) for region in self._regions_of(box)})
+        seqs = [seq for reply in replies.values() for seq in reply[0]]
+        drivers = [driver for reply in replies.values() for driver in reply[1]]
+        return [drivers[i] for i in np.argsort(seqs, kind="stable").tolist()]
+
+    def driver_positions(self, box: Optional[tuple] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """x, y and status code columns of drivers(box), in the same order."""
+        replies = list(self._scatter({region: ("positions", (box,)) for region in self._regions_of(box)}).values())
+        seq, x, y, status = (np.concatenate([reply[i] for reply in replies]) for i in range(4))
+        order = np.argsort(seq, kind="stable")
+        return x[order], y[order], status[order]
+
+    # Riders
+
+    def add_riders(self, locations: List[Point]) -> List[str]:
+        """Add riders at the given locations; returns their IDs."""
+        riders = [RiderEntity(f"rider_{self.rider_count + i:08x}", Point.of(loc)) for i, loc in enumerate(locations)]
+        self.rider_count += len(riders)
+        self.riders.update((rider.id, rider) for rider in riders)
+        self._changed()
+        return [rider.id for rider in riders]
+
+    def remove_rider(self, rider_id: str) -> None:
+        del self.riders[rider_id]
+        self._changed()
+
+    def riders_in(self, x0: int, y0: int, x1: int, y1: int) -> List[RiderEntity]:
+        """Riders inside the box, ordered by ID."""
+        return sorted(
+            (rider for rider in self.riders.values()
+             if x0 <= rider.location.x <= x1 and y0 <= rider.location.y <= y1),
+            key=lambda rider: rider.id,
+        )
+
+    def active_request_for(self, rider_id: str) -> Optional[str]:
+        """ID of the rider's WAITING or ASSIGNED ride, if any."""
+        return self.active_request_by_rider.get(rider_id)
+
+    # Rides
+
+    def request_rides(self, requests: List[Tuple[str, Point, Point]]) -> List[Tuple[Optional[str], Optional[str]]]:
+        """
+        Create and dispatch (rider_id, pickup, dropoff) ride requests.
+        Returns (ride_id, driver_id) per request; ride_id is None when the
+        rider is unknown or already has an active ride, driver_id is None
+        when the ride is left WAITING for a driver to free up.
+        """
+        ride_ids = []
+        by_region: Dict[int, list] = {}
+        for rider_id, pickup, dropoff in requests:
+            if rider_id not in self.riders or rider_id in self.active_request_by_rider:
+                ride_ids.append(None)
+                continue
+            ride_id = f"ride_{self.ride_count:08x}"
+            self.ride_count += 1
+            self.active_request_by_rider[rider_id] = ride_id
+            self.ride_riders[ride_id] = rider_id
+            packet = RideEntity(
+                ride_id, rider_id, Point.of(pickup), Point.of(dropoff), RideStatus.WAITING
+            ).to_dict()
+            region = int(self.grid.region_of(pickup.x))
+            self.ride_regions[ride_id] = region
+            by_region.setdefault(region, []).append(packet)
+            ride_ids.append(ride_id)
+
+        # Regions dispatch their own rides in parallel, scoring against the
+        # whole fleet; the rest are searched for one by one
+        summaries = self._scatter({region: ("summary", ()) for region in range(self.shards)}) if by_region else {}
+        replies = self._scatter({
+            region: ("dispatch", (rides, combine([summaries[r] for r in range(self.shards) if r != region])))
+            for region, rides in by_region.items()
+        })
+        local = {}
+        for region, rides in by_region.items():
+            for packet, driver_id in zip(rides, replies[region]):
+                local[packet["id"]] = (region, packet, driver_id)
+
+        results = []
+        for ride_id in ride_ids:
+            if ride_id is None:
+                results.append((None, None))
+                continue
+            region, packet, driver_id = local[ride_id]
+            if driver_id is None:
+                driver_id = self._dispatch_across_regions(region, packet)
+            else:
+                self._started(ride_id)
+            if driver_id is None:
+                self._wait(packet)
+            self._count_assignment("assigned" if driver_id else "no_driver")
+            results.append((ride_id, driver_id))
+        self._changed()
+        return results
+
+    def get_ride(self, ride_id: str) -> Optional[dict]:
+        """A ride, live or archived, in the shape of the RideRequest schema, or None if unknown."""
+        region = self.ride_regions.get(ride_id)
+        return self._call(region, "ride", ride_id) if region is not None else None
+
+    def trip(self, ride_id: str) -> Optional[Tuple[str, str]]:
+        """(driver_id, step) of the ride's active trip, or None."""
+        region = self.ride_regions.get(ride_id)
+        return self._call(region, "trip", ride_id) if region is not None else None
+
+    def list_rides(
+        self,
+        after: Optional[int] = None,
+        limit: int = 100,
+        status: Optional[RideStatus] = None,
+        rider_id: Optional[str] = None,
+        driver_id: Optional[str] = None,
+    ) -> Tuple[List[dict], Optional[int]]:
+        """
+        Page through rides in creation order, like DispatchService.list_rides:
+        every region returns its first `limit` matches and the pages are
+        merged. Returns the page and the cursor for the next one (None on
+        the last page).
+        """
+        replies = self._scatter({
+            region: ("rides", (after, limit, status, rider_id, driver_id)) for region in range(self.shards)
+        })
+        merged = sorted(
+            ((_ride_number(ride["id"]), ride) for rides, _ in replies.values() for ride in rides),
+            key=lambda item: item[0],
+        )
+        more = len(merged) > limit or any(more for _, more in replies.values())
+        page = merged[:limit]
+        return [ride for _, ride in page], page[-1][0] if more and page else None
+
+    def accept_ride(self, ride_id: str, driver_id: str) -> None:
+        """Assign a WAITING ride to an AVAILABLE driver that chose it."""
+        self._assign(ride_id, driver_id)
+        self._changed()
+
+    def reject_ride(self, ride_id: str, driver_id: str) -> RideStatus:
+        """
+        A driver turns down a WAITING ride, or the ride they were assigned
+        before picking it up, as in DispatchService.reject_ride. The ride is
+        offered to the best driver left in any region; with none, it waits,
+        or fails once max_rejection_attempts drivers have rejected it.
+        Returns the ride's new status.
+        """
+        home = self.ride_regions[ride_id]
+        packet, freed = self._call(home, "reject", ride_id, driver_id)
+        if self.metrics is not None:
+            self.metrics.rejections.labels("driver").inc()
+        region = self.driver_regions[driver_id]
+        if region != home:
+            self._call(region, "note_rejection", driver_id, ride_id)
+        if ride_id in self.pending_rejections:
+            self.pending_rejections[ride_id].add(driver_id)
+        if freed is not None:
+            self._dispatch_pending(driver_id, *freed)
+
+        if self._dispatch_across_regions(home, packet) is not None:
+            status = RideStatus.ASSIGNED
+        elif len(packet["rejected_by"]) >= self.max_rejection_attempts:
+            self._fail([ride_id])
+            self._count_assignment("failed")
+            status = RideStatus.FAILED
+        else:
+            self._wait(packet)
+            status = RideStatus.WAITING
+        self._changed()
+        return status
+
+    def cancel_ride(self, ride_id: str) -> None:
+        """Cancel a WAITING or ASSIGNED ride (it becomes FAILED), freeing its driver."""
+        freed = self._call(self.ride_regions[ride_id], "cancel", ride_id)
+        self._stop_waiting(ride_id)
+        self._finish(ride_id)
+        if freed is not None:
+            self._dispatch_pending(*freed)
+        self._changed()
+
+    def pending_report(self) -> dict:
+        """Pending queue depth, outcomes and wait-time percentiles in ticks."""
+        return {**self.pending.report(self.current_tick), "max_wait_ticks": self.max_wait_ticks}
+
+    def active_trip_count(self) -> int:
+        # Every active ride is either assigned (on a trip) or waiting in the pending queue
+        return len(self.active_request_by_rider) - len(self.pending)
+
+    # Simulation
+
+    def tick(self) -> List[dict]:
+        """
+        Advance every region one tick in parallel, hand off the drivers that
+        crossed a border, then give the drivers freed by dropoffs the
+        nearest waiting rides. Returns the tick's events, like
+        DispatchService.tick.
+        """
+        events = self._tick()
+        for listener in self.tick_listeners:
+            listener(self.current_tick, events)
+        return events
+
+    def tick_many(self, n: int, summary: bool = False):
+        """
+        Advance n ticks. Returns the events grouped by tick, or, when summary
+        is True, only the pickup and dropoff counts.
+        """
+        if not summary:
+            return [self.tick() for _ in range(n)]
+
+        pickups = dropoffs = 0
+        for _ in range(n):
+            for event in self._tick():
+                if event["type"] == PICKUP:
+                    pickups += 1
+                else:
+                    dropoffs += 1
+        return {
+            "ticks": n,
+            "current_tick": self.current_tick,
+            "pickups": pickups,
+            "dropoffs": dropoffs,
+            "active_trips": self.active_trip_count()
+        }
+
+    @timed("tick_seconds")
+    def _tick(self) -> List[dict]:
+        self._expire_pending()
+        replies = self._scatter({region: ("tick", ()) for region in range(self.shards)})
+        events = []
+        incoming: Dict[int, list] = {}
+        for region in range(self.shards):
+            region_events, handoffs = replies[region]
+            events.extend(region_events)
+            for destination, packet in handoffs:
+                incoming.setdefault(destination, []).append(packet)
+                self.driver_regions[packet["id"]] = destination
+                if packet["trip"] is not None:
+                    self.ride_regions[packet["trip"]["ride"]["id"]] = destination
+                self.handoffs += 1
+        if incoming:
+            self._scatter({region: ("import_drivers", (packets,)) for region, packets in incoming.items()})
+
+        events.sort(key=lambda event: self.trip_order[event["ride_id"]])
+        dropoffs = [event for event in events if event["type"] == DROPOFF]
+        for event in dropoffs:
+            self._finish(event["ride_id"])
+        for event in dropoffs:
+            self._dispatch_pending(event["driver_id"], event["location"]["x"], event["location"]["y"])
+        self.current_tick += 1
+        self._changed()
+        return events
+
+    def _expire_pending(self) -> None:
+        """Fail the pending rides that have waited max_wait_ticks or longer."""
+        if self.max_wait_ticks is None or not self.pending:
+            return
+        expired = list(self.pending.waiting_since(self.current_tick - self.max_wait_ticks))
+        self.pending.expired += len(expired)
+        if self.metrics is not None:
+            for ride_id in expired:
+                self.metrics.pending_wait.labels("expired").observe(self.current_tick - self.pending.entries[ride_id][0])
+        self._fail(expired)
+
+    # Whole-system views
+
+    def state(self) -> dict:
+        """The full system state, in the shape of a full GET /state response."""
+        replies = self._scatter({region: ("state", ()) for region in range(self.shards)})
+        parts = [replies[region] for region in range(self.shards)]
+        seqs = [seq for part in parts for seq in part["driver_seqs"]]
+        drivers = [driver for part in parts for driver in part["drivers"]]
+        return {
+            "version": self.version,
+            "full": True,
+            "drivers": [drivers[i] for i in np.argsort(seqs, kind="stable").tolist()],
+            "riders": [rider.to_dict() for rider in self.riders.values()],
+            "ride_requests": sorted(
+                (ride for part in parts for ride in part["ride_requests"]), key=lambda ride: _ride_number(ride["id"])
+            ),
+            "archived_rides": sum(part["archived_rides"] for part in parts),
+            "active_trips": sorted(
+                (trip for part in parts for trip in part["active_trips"]), key=lambda trip: _ride_number(trip["ride_id"])
+            ),
+        }
+
+    def stats(self) -> List[dict]:
+        replies = self._scatter({region: ("stats", ()) for region in range(self.shards)})
+        return [replies[region] for region in range(self.shards)]
+
+    def check_consistency(self) -> List[str]:
+        """Every region's own check, plus the coordinator's directories and queue against the regions."""
+        stats = self.stats()
+        problems = [f"region {region['region']}: {problem}" for region in stats for problem in region["problems"]]
+        drivers_per_region = np.bincount(list(self.driver_regions.values()), minlength=self.shards).tolist()
+        for region, expected in zip(stats, drivers_per_region):
+            if region["drivers"] != expected:
+                problems.append(f"region {region['region']} holds {region['drivers']} drivers, directory says {expected}")
+        waiting = sum(region["waiting"] for region in stats)
+        if waiting != len(self.pending):
+            problems.append(f"{waiting} rides are waiting but {len(self.pending)} are pending")
+        trips = sum(region["active_trips"] for region in stats)
+        if trips != self.active_trip_count():
+            problems.append(f"{trips} active trips but {self.active_trip_count()} assigned rides")
+        return problems
+
+    # Internals
+
+    def _dispatch_across_regions(self, home: int, packet: dict) -> Optional[str]:
+        """Pick the best driver in any region for a ride left waiting in `home`."""
+        self.escalations += 1
+        pickup = packet["pickup"]
+        replies = self._scatter({
+            region: ("frontier", (pickup["x"], pickup["y"], packet["rejected_by"])) for region in range(self.shards)
+        })
+        candidates = [(region, reply) for region, reply in replies.items() if reply is not None]
+        if not candidates:
+            return None
+
+        max_eta = max(1, max(reply[0] for _, reply in candidates))
+        max_rides = max(1, max(reply[1] for _, reply in candidates))
+        best = None
+        for region, (_, _, points) in candidates:
+            for eta, rides, seq, driver_id in points:
+                score = self.eta_weight * (eta / max_eta) + self.fairness_weight * (1 - rides / max_rides)
+                if best is None or (score, seq) < best[:2]:
+                    best = (score, seq, region, driver_id)
+        driver_id = best[3]
+        self._assign(packet["id"], driver_id)
+        return driver_id
+
+    def _assign(self, ride_id: str, driver_id: str) -> None:
+        """Start the trip of a WAITING ride with an AVAILABLE driver, moving the ride to the driver's region."""
+        self._stop_waiting(ride_id)
+        home, region = self.ride_regions[ride_id], self.driver_regions[driver_id]
+        if region == home:
+            self._call(home, "assign", ride_id, driver_id)
+        else:
+            moved = self._call(home, "take_ride", ride_id)
+            self._call(region, "import_ride", moved, driver_id)
+            self.ride_regions[ride_id] = region
+        self._started(ride_id)
+
+    def _started(self, ride_id: str) -> None:
+        self.trip_order[ride_id] = self.trips_started
+        self.trips_started += 1
+
+    def _dispatch_pending(self, driver_id: str, x: int, y: int) -> None:
+        """Give a driver who just became available the nearest pending ride they have not rejected."""
+        if not self.pending:
+            return
+        ride_id = self.pending.nearest(x, y, lambda r: driver_id not in self.pending_rejections[r])
+        if ride_id is None:
+            return
+        wait = self.pending.take(ride_id, self.current_tick)
+        if self.metrics is not None:
+            self.metrics.pending_wait.labels("matched").observe(wait)
+        self._assign(ride_id, driver_id)
+
+    def _wait(self, packet: dict) -> None:
+        """Queue a WAITING ride until a driver frees up."""
+        pickup = packet["pickup"]
+        self.pending.add(packet["id"], pickup["x"], pickup["y"], self.current_tick)
+        self.pending_rejections[packet["id"]] = set(packet["rejected_by"])
+
+    def _stop_waiting(self, ride_id: str) -> None:
+        self.pending.remove(ride_id)
+        self.pending_rejections.pop(ride_id, None)
+
+    def _fail(self, ride_ids: List[str]) -> None:
+        """Fail WAITING rides in whichever regions hold them."""
+        by_region: Dict[int, list] = {}
+        for ride_id in ride_ids:
+            self._stop_waiting(ride_id)
+            self._finish(ride_id)
+            by_region.setdefault(self.ride_regions[ride_id], []).append(ride_id)
+        if by_region:
+            self._scatter({region: ("fail", (rides,)) for region, rides in by_region.items()})
+
+    def _count_assignment(self, result: str) -> None:
+        if self.metrics is not None:
+            self.metrics.assignments.labels(result).inc()
+
+    def _finish(self, ride_id: str) -> None:
+        """Forget a ride that reached a terminal status as its rider's active request."""
+        self.trip_order.pop(ride_id, None)
+        rider_id = self.ride_riders.pop(ride_id)
+        if self.active_request_by_rider.get(rider_id) == ride_id:
+            del self.active_request_by_rider[rider_id]
+
+    def _regions_of(self, box: Optional[tuple]) -> range:
+        """Regions overlapping the (x0, y0, x1, y1) box, default all."""
+        if box is None:
+            return range(self.shards)
+        first, last = self.grid.region_of(np.array([box[0], box[2]])).tolist()
+        return range(first, last + 1)
+
+    def _changed(self) -> None:
+        self.version += 1
+        for listener in self.change_listeners:
+            listener()
+
+    def _call(self, region: int, command: str, *args):
+        return self._scatter({region: (command, args)})[region]
+
+    def _scatter(self, commands: Dict[int, tuple]) -> dict:
+        """Send one command per region, then collect the replies; regions work in parallel."""
+        for region, (command, args) in commands.items():
+            self._connections[region].send((command, args))
+        replies = {}
+        errors = []
+        for region in commands:
+            ok, reply = self._connections[region].recv()
+            if ok:
+                replies[region] = reply
+            else:
+                errors.append(reply)
+        if errors:
+            raise errors[0]
+        return replies
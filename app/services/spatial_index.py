@@ -0,0 +1,296 @@
+from collections import Counter, deque
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class SpatialIndex:
+    """
+    Bucketed grid index over the drivers that are currently available.
+
+    Drivers are keyed by their FleetStore row and hashed into square buckets
+    of `cell_size` grid units so that dispatch can search outward from the
+    pickup cell ring by ring instead of scanning the whole fleet. The index also keeps running counts of the
+    rotated coordinates (x + y, x - y) and of assigned ride counts, which lets
+    the dispatcher compute the normalization maxima of the scoring function
+    without visiting every driver.
+
+    Occupied buckets are grouped into square tiles of `tile_cells` cells a
+    side, so that on a large, sparse grid a search that gets far from the
+    pickup steps outward a ring of tiles at a time and skips rings of empty
+    tiles, instead of probing every cell.
+    """
+
+    def __init__(self, cell_size: int = 8, tile_cells: int = 8):
+        self.cell_size = cell_size
+        self.tile_cells = tile_cells
+        self.buckets: Dict[Tuple[int, int], Dict[int, None]] = {}  # cell -> fleet rows
+        self.entries: Dict[int, Tuple[int, int, int]] = {}  # row -> (x, y, rides)
+        self.tiles: Dict[Tuple[int, int], Dict[Tuple[int, int], None]] = {}  # tile -> occupied cells
+        self.tile_counts = Counter()  # tile -> indexed drivers
+        self._sums = Counter()  # x + y of indexed drivers
+        self._diffs = Counter()  # x - y of indexed drivers
+        self._rides = Counter()  # assigned_rides of indexed drivers
+        self._bounds = {}  # cached (min, max) keys of the counters above, by name
+        self.generation = 0  # insertions so far
+        self._inserted = deque(maxlen=64)  # rows of the latest insertions, oldest first
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, row: int) -> bool:
+        return row in self.entries
+
+    def cell_of(self, x: int, y: int) -> Tuple[int, int]:
+        """Return the bucket coordinates containing grid point (x, y)."""
+        return x // self.cell_size, y // self.cell_size
+
+    def tile_of(self, cell: Tuple[int, int]) -> Tuple[int, int]:
+        """Return the tile coordinates containing bucket `cell`."""
+        return cell[0] // self.tile_cells, cell[1] // self.tile_cells
+
+    def insert(self, row: int, x: int, y: int, rides: int) -> None:
+        """Add a driver to the index, replacing any previous entry."""
+        if row in self.entries:
+            self.remove(row)
+        self.entries[row] = (x, y, rides)
+        self.generation += 1
+        self._inserted.append(row)
+        cell = self.cell_of(x, y)
+        bucket = self.buckets.get(cell)
+        if bucket is None:
+            bucket = self.buckets[cell] = {}
+            self.tiles.setdefault(self.tile_of(cell), {})[cell] = None
+        bucket[row] = None
+        self.tile_counts[self.tile_of(cell)] += 1
+        self._count("sums", self._sums, x + y)
+        self._count("diffs", self._diffs, x - y)
+        self._count("rides", self._rides, rides)
+
+    def remove(self, row: int) -> None:
+        """Remove a driver from the index if present."""
+        entry = self.entries.pop(row, None)
+        if entry is None:
+            return
+        x, y, rides = entry
+        cell = self.cell_of(x, y)
+        bucket = self.buckets[cell]
+        del bucket[row]
+        tile = self.tile_of(cell)
+        if not bucket:
+            del self.buckets[cell]
+            cells = self.tiles[tile]
+            del cells[cell]
+            if not cells:
+                del self.tiles[tile]
+        _decrement(self.tile_counts, tile)
+        self._discount("sums", self._sums, x + y)
+        self._discount("diffs", self._diffs, x - y)
+        self._discount("rides", self._rides, rides)
+
+    def inserted_since(self, generation: int) -> Optional[List[int]]:
+        """
+        Rows inserted (or updated) after the index was at `generation`, or
+        None when too many insertions happened since to tell.
+        """
+        count = self.generation - generation
+        if count > len(self._inserted):
+            return None
+        return list(islice(self._inserted, len(self._inserted) - count, None))
+
+    def _count(self, name: str, counter: Counter, key: int) -> None:
+        counter[key] += 1
+        bounds = self._bounds.get(name)
+        if bounds is not None and not bounds[0] <= key <= bounds[1]:
+            self._bounds[name] = (min(bounds[0], key), max(bounds[1], key))
+
+    def _discount(self, name: str, counter: Counter, key: int) -> None:
+        _decrement(counter, key)
+        bounds = self._bounds.get(name)
+        if bounds is not None and key in bounds and key not in counter:
+            del self._bounds[name]  # an extreme is gone; found again on the next read
+
+    def update(self, row: int, x: int, y: int, rides: int) -> None:
+        """Refresh the position and ride count of an indexed driver."""
+        if self.entries.get(row) != (x, y, rides):
+            self.insert(row, x, y, rides)
+
+    def max_distance(self, x: int, y: int, excluded: Iterable[int] = ()) -> int:
+        """
+        Manhattan distance from (x, y) to the farthest indexed driver.
+
+        Uses the identity |dx| + |dy| = max(|du|, |dv|) with u = x + y and
+        v = x - y, so only the extremes of u and v are needed.
+        """
+        excluded_entries = [self.entries[d] for d in excluded if d in self.entries]
+        skip_sums = Counter(ex + ey for ex, ey, _ in excluded_entries)
+        skip_diffs = Counter(ex - ey for ex, ey, _ in excluded_entries)
+        u_min, u_max = self._extremes("sums", self._sums, skip_sums)
+        v_min, v_max = self._extremes("diffs", self._diffs, skip_diffs)
+        if u_min is None:
+            return 0
+        u, v = x + y, x - y
+        return max(u_max - u, u - u_min, v_max - v, v - v_min)
+
+    def extent(self) -> Optional[Tuple[int, int, int, int]]:
+        """
+        (min, max) of x + y, then of x - y, over the indexed drivers, or None
+        when there are none: what max_distance() needs, for combining indexes.
+        """
+        u_min, u_max = self._extremes("sums", self._sums, Counter())
+        v_min, v_max = self._extremes("diffs", self._diffs, Counter())
+        return None if u_min is None else (u_min, u_max, v_min, v_max)
+
+    def max_rides(self, excluded: Iterable[int] = ()) -> int:
+        """Largest assigned ride count among indexed drivers."""
+        skip = Counter(self.entries[d][2] for d in excluded if d in self.entries)
+        _, top = self._extremes("rides", self._rides, skip)
+        return top or 0
+
+    def _extremes(self, name: str, counter: Counter, skip: Counter):
+        """
+        (min, max) of the keys of `counter` after discounting `skip`.
+
+        The bounds are cached until an extreme key leaves the counter, so on
+        a large grid with many distinct coordinates a search does not scan
+        them all; only when `skip` empties a cached extreme are they scanned.
+        """
+        if not counter:
+            return None, None
+        bounds = self._bounds.get(name)
+        if bounds is None:
+            bounds = self._bounds[name] = (min(counter), max(counter))
+        if skip and any(counter[key] <= skip.get(key, 0) for key in bounds):
+            return _extremes(counter, skip)
+        return bounds
+
+    def ring_min_distance(self, ring: int) -> int:
+        """Lower bound on the distance from a point to any bucket `ring` cells away."""
+        return 0 if ring == 0 else (ring - 1) * self.cell_size + 1
+
+    def ring(self, x: int, y: int, ring: int) -> Iterator[int]:
+        """Yield the rows of drivers in buckets at Chebyshev distance `ring` from (x, y)."""
+        return ring_members(self.buckets, self.cell_of(x, y), ring)
+
+    # A search visits bands outward from the pickup: band b < tile_cells is
+    # the ring of buckets b cells away, and band b >= tile_cells the ring of
+    # tiles b - tile_cells + 1 tiles away (leaving out the buckets already
+    # visited), so that far from the pickup it steps a tile at a time.
+
+    def band(self, x: int, y: int, band: int, limit: Optional[float] = None) -> Iterator[int]:
+        """
+        Yield the rows of drivers in search band `band` around (x, y). With
+        `limit`, the tiles of a tile ring that lie entirely farther than that
+        (Manhattan distance) from (x, y) are left out.
+        """
+        if band < self.tile_cells:
+            return self.ring(x, y, band)
+        return self._tile_ring(x, y, band - self.tile_cells + 1, limit)
+
+    def band_min_distance(self, band: int) -> int:
+        """Lower bound on the distance from a point to any driver in search band `band`."""
+        if band < self.tile_cells:
+            return self.ring_min_distance(band)
+        # A bucket in a tile n tiles away is at least (n - 1) * tile_cells + 1 cells away
+        return self.ring_min_distance(max(self.tile_cells, (band - self.tile_cells) * self.tile_cells + 1))
+
+    def next_band(self, x: int, y: int, band: int) -> int:
+        """The first band at or beyond `band` that can hold drivers, skipping rings of empty tiles."""
+        if band < self.tile_cells or not self.tiles:
+            return band
+        tile = self.tile_of(self.cell_of(x, y))
+        distance = band - self.tile_cells + 1
+        while True:
+            if 8 * distance > len(self.tiles):
+                # Few occupied tiles: measure them all at once
+                tx, ty = tile
+                distance = min(
+                    (d for d in (max(abs(ox - tx), abs(oy - ty)) for ox, oy in self.tiles) if d >= distance),
+                    default=distance,
+                )
+                break
+            if any(True for _ in ring_keys(self.tiles, tile, distance)):
+                break
+            distance += 1
+        return distance + self.tile_cells - 1
+
+    def _tile_ring(self, x: int, y: int, distance: int, limit: Optional[float]) -> Iterator[int]:
+        """Rows in the occupied tiles `distance` tiles away from the tile of (x, y), beyond the cell rings."""
+        cx, cy = cell = self.cell_of(x, y)
+        side = self.cell_size * self.tile_cells
+        for tx, ty in ring_keys(self.tiles, self.tile_of(cell), distance):
+            if limit is not None:
+                # Manhattan distance from (x, y) to the nearest point of the tile
+                dx = max(tx * side - x, x - (tx * side + side - 1), 0)
+                dy = max(ty * side - y, y - (ty * side + side - 1), 0)
+                if dx + dy > limit:
+                    continue
+            for bx, by in self.tiles[(tx, ty)]:
+                if max(abs(bx - cx), abs(by - cy)) >= self.tile_cells:
+                    yield from self.buckets[(bx, by)]
+
+
+def ring_members(buckets: Dict[Tuple[int, int], dict], cell: Tuple[int, int], ring: int) -> Iterator:
+    """Yield the members of the buckets at Chebyshev distance `ring` from `cell`."""
+    cx, cy = cell
+    if ring == 0:
+        yield from buckets.get((cx, cy), ())
+        return
+
+    # Sparse buckets: walking the occupied ones is cheaper than the ring.
+    if 8 * ring > len(buckets):
+        for (bx, by), bucket in list(buckets.items()):
+            if max(abs(bx - cx), abs(by - cy)) == ring:
+                yield from bucket
+        return
+
+    for bx in range(cx - ring, cx + ring + 1):
+        yield from buckets.get((bx, cy - ring), ())
+        yield from buckets.get((bx, cy + ring), ())
+    for by in range(cy - ring + 1, cy + ring):
+        yield from buckets.get((cx - ring, by), ())
+        yield from buckets.get((cx + ring, by), ())
+
+
+def box_tiles(tiles: Dict[Tuple[int, int], dict], tile_size: int, x0: int, y0: int, x1: int, y1: int) -> list:
+    """The occupied tiles (keys of `tiles`) overlapping the box from (x0, y0) to (x1, y1), inclusive."""
+    tx0, ty0, tx1, ty1 = x0 // tile_size, y0 // tile_size, x1 // tile_size, y1 // tile_size
+    if (tx1 - tx0 + 1) * (ty1 - ty0 + 1) > len(tiles):
+        # Fewer occupied tiles than tiles in the box: filter the occupied ones
+        return [(tx, ty) for tx, ty in tiles if tx0 <= tx <= tx1 and ty0 <= ty <= ty1]
+    return [(tx, ty) for tx in range(tx0, tx1 + 1) for ty in range(ty0, ty1 + 1) if (tx, ty) in tiles]
+
+
+def ring_keys(occupied: Dict[Tuple[int, int], dict], center: Tuple[int, int], ring: int) -> Iterator[Tuple[int, int]]:
+    """Yield the keys of `occupied` at Chebyshev distance `ring` from `center`."""
+    cx, cy = center
+    if ring == 0:
+        if center in occupied:
+            yield center
+        return
+    if 8 * ring > len(occupied):
+        for kx, ky in list(occupied):
+            if max(abs(kx - cx), abs(ky - cy)) == ring:
+                yield kx, ky
+        return
+    for kx in range(cx - ring, cx + ring + 1):
+        for key in ((kx, cy - ring), (kx, cy + ring)):
+            if key in occupied:
+                yield key
+    for ky in range(cy - ring + 1, cy + ring):
+        for key in ((cx - ring, ky), (cx + ring, ky)):
+            if key in occupied:
+                yield key
+
+
+def _decrement(counter: Counter, key: int) -> None:
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+
+def _extremes(counter: Counter, skip: Counter):
+    """Return (min, max) of the keys of `counter` after discounting `skip`."""
+    live = [k for k in counter if counter[k] > skip.get(k, 0)] if skip else counter
+    if not live:
+        return None, None
+    return min(live), max(live)
@@ -0,0 +1,206 @@
+from typing import Iterable, List, Set, Tuple
+
+import numpy as np
+
+from app.models.models import Location
+
+
+# Arrival kinds reported by TripTable.advance
+PICKUP = "pickup"
+DROPOFF = "dropoff"
+
+# TripTable.route_len of legs driven in a straight line, without a route
+STRAIGHT = -1
+# TripTable.route_pos of legs whose route has not been looked up yet
+UNROUTED = -1
+
+
+class TripTable:
+    """
+    Active trips as parallel arrays, kept in the same order as
+    DispatchService.active_trips so that bulk movement reports arrivals in
+    the order the per-trip loop used to.
+
+    Each entry holds the driver's fleet row, the current target (pickup, then
+    dropoff) and the dropoff location it switches to after the pickup.
+
+    With a road_map (app.services.roadmap) set, each leg follows a route
+    from the map, looked up when the leg starts and stored in one flat
+    buffer of (x, y, ticks) cells, so moving every driver is still a single
+    array pass. Legs that leave the map or cannot reach their target drive
+    straight there.
+    """
+
+    def __init__(self):
+        self.ride_ids = np.empty(0, dtype=object)
+        self.driver_ids = np.empty(0, dtype=object)
+        self.rows = np.empty(0, dtype=np.int64)
+        self.target_x = np.empty(0, dtype=np.int32)
+        self.target_y = np.empty(0, dtype=np.int32)
+        self.dropoff_x = np.empty(0, dtype=np.int32)
+        self.dropoff_y = np.empty(0, dtype=np.int32)
+        self.to_dropoff = np.empty(0, dtype=bool)
+
+        self.road_map = None
+        self.route_cells = np.empty((0, 3), dtype=np.int32)  # concatenated routes
+        self.route_start = np.empty(0, dtype=np.int64)  # offset of each trip's route in route_cells
+        self.route_len = np.empty(0, dtype=np.int64)  # cells in the route; STRAIGHT for straight-line legs
+        self.route_pos = np.empty(0, dtype=np.int64)  # next route cell; UNROUTED until looked up
+        self.progress = np.empty(0, dtype=np.int32)  # ticks spent on the current edge
+
+    def __len__(self) -> int:
+        return len(self.ride_ids)
+
+    def extend(self, trips: Iterable[Tuple[str, str, int, Location, Location, bool]]) -> None:
+        """Append (ride_id, driver_id, row, pickup, dropoff, to_dropoff) entries."""
+        trips = list(trips)
+        if not trips:
+            return
+        ride_ids, driver_ids, rows, pickups, dropoffs, phases = zip(*trips)
+        self.ride_ids = np.concatenate((self.ride_ids, np.array(ride_ids, dtype=object)))
+        self.driver_ids = np.concatenate((self.driver_ids, np.array(driver_ids, dtype=object)))
+        phases = np.array(phases, dtype=bool)
+        dropoff_x = np.array([d.x for d in dropoffs], dtype=np.int32)
+        dropoff_y = np.array([d.y for d in dropoffs], dtype=np.int32)
+        target_x = np.where(phases, dropoff_x, np.array([p.x for p in pickups], dtype=np.int32))
+        target_y = np.where(phases, dropoff_y, np.array([p.y for p in pickups], dtype=np.int32))
+
+        self.rows = np.concatenate((self.rows, np.array(rows, dtype=np.int64)))
+        self.target_x = np.concatenate((self.target_x, target_x))
+        self.target_y = np.concatenate((self.target_y, target_y))
+        self.dropoff_x = np.concatenate((self.dropoff_x, dropoff_x))
+        self.dropoff_y = np.concatenate((self.dropoff_y, dropoff_y))
+        self.to_dropoff = np.concatenate((self.to_dropoff, phases))
+        self.route_start = np.concatenate((self.route_start, np.zeros(len(trips), dtype=np.int64)))
+        self.route_len = np.concatenate((self.route_len, np.full(len(trips), STRAIGHT, dtype=np.int64)))
+        self.route_pos = np.concatenate((self.route_pos, np.full(len(trips), UNROUTED, dtype=np.int64)))
+        self.progress = np.concatenate((self.progress, np.zeros(len(trips), dtype=np.int32)))
+
+    def reroute(self) -> None:
+        """Look the routes of all trips up again, e.g. after the road map changed."""
+        self.route_pos[:] = UNROUTED
+        self.progress[:] = 0
+        self.route_cells = np.empty((0, 3), dtype=np.int32)
+
+    def discard(self, ride_ids: Set[str]) -> None:
+        """Drop the entries of the given rides."""
+        if ride_ids:
+            # Set lookups beat np.isin, which sorts object arrays
+            self._keep(np.fromiter(
+                (ride_id not in ride_ids for ride_id in self.ride_ids.tolist()), dtype=bool, count=len(self)
+            ))
+
+    def advance(self, x: np.ndarray, y: np.ndarray) -> List[Tuple[str, str, str, int, int]]:
+        """
+        Move every driver one cell towards its target, x first and then y
+        (or along its route, once it has spent the edge's ticks on it),
+        writing the new positions into the fleet columns `x` and `y`.
+
+        Trips that reach their pickup switch to the dropoff target; trips that
+        reach their dropoff are removed. Returns the arrivals in table order as
+        (kind, ride_id, driver_id, x, y) tuples.
+        """
+        if not len(self):
+            return []
+        rows = self.rows
+        cur_x = x[rows]
+        cur_y = y[rows]
+        step_x = np.sign(self.target_x - cur_x)
+        # Only drivers already aligned on x move along y
+        step_y = np.where(step_x == 0, np.sign(self.target_y - cur_y), 0)
+        if self.road_map is not None:
+            self._route_unrouted(cur_x, cur_y)
+            routed = np.flatnonzero(self.route_len != STRAIGHT)
+            step_x[routed] = step_y[routed] = 0
+            moving = routed[self.route_pos[routed] < self.route_len[routed]]
+            cells = self.route_cells[self.route_start[moving] + self.route_pos[moving]]
+            self.progress[moving] += 1
+            arriving = self.progress[moving] >= cells[:, 2]
+            moved, cells = moving[arriving], cells[arriving]
+            step_x[moved] = cells[:, 0] - cur_x[moved]
+            step_y[moved] = cells[:, 1] - cur_y[moved]
+            self.route_pos[moved] += 1
+            self.progress[moved] = 0
+        cur_x += step_x
+        cur_y += step_y
+        x[rows] = cur_x
+        y[rows] = cur_y
+
+        arrived = np.flatnonzero((cur_x == self.target_x) & (cur_y == self.target_y))
+        if not len(arrived):
+            return []
+
+        was_dropoff = self.to_dropoff[arrived]
+        arrivals = [
+            (DROPOFF if dropoff else PICKUP, ride_id, driver_id, px, py)
+            for ride_id, driver_id, dropoff, px, py in zip(
+                self.ride_ids[arrived].tolist(),
+                self.driver_ids[arrived].tolist(),
+                was_dropoff.tolist(),
+                cur_x[arrived].tolist(),
+                cur_y[arrived].tolist(),
+            )
+        ]
+
+        picked_up = arrived[~was_dropoff]
+        self.to_dropoff[picked_up] = True
+        self.target_x[picked_up] = self.dropoff_x[picked_up]
+        self.target_y[picked_up] = self.dropoff_y[picked_up]
+        self.route_pos[picked_up] = UNROUTED
+        self.progress[picked_up] = 0
+
+        dropped_off = arrived[was_dropoff]
+        if len(dropped_off):
+            keep = np.ones(len(self), dtype=bool)
+            keep[dropped_off] = False
+            self._keep(keep)
+        return arrivals
+
+    def _route_unrouted(self, cur_x: np.ndarray, cur_y: np.ndarray) -> None:
+        """Look up the routes of legs that just started, appending them to route_cells."""
+        unrouted = np.flatnonzero(self.route_pos == UNROUTED)
+        if not len(unrouted):
+            return
+        live = int(self.route_len[self.route_len > 0].sum())
+        if len(self.route_cells) > 2 * live + 4096:
+            self._compact_routes()
+        offset = len(self.route_cells)
+        routes = []
+        for i, sx, sy, tx, ty in zip(
+            unrouted.tolist(), cur_x[unrouted].tolist(), cur_y[unrouted].tolist(),
+            self.target_x[unrouted].tolist(), self.target_y[unrouted].tolist(),
+        ):
+            route = self.road_map.route(sx, sy, tx, ty)
+            self.route_pos[i] = 0
+            if route is None:
+                self.route_len[i] = STRAIGHT
+                continue
+            self.route_start[i] = offset
+            self.route_len[i] = len(route)
+            offset += len(route)
+            routes.append(route)
+        if routes:
+            self.route_cells = np.concatenate([self.route_cells] + routes)
+
+    def _compact_routes(self) -> None:
+        """Drop the cells of finished and discarded routes from route_cells."""
+        lengths = np.where(self.route_len > 0, self.route_len, 0)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        # Index of every kept cell: each route's old start plus 0..len-1
+        index = np.repeat(self.route_start - starts, lengths) + np.arange(lengths.sum())
+        self.route_cells = self.route_cells[index]
+        self.route_start = np.where(lengths > 0, starts, 0)
+
+    def _keep(self, mask: np.ndarray) -> None:
+        self.ride_ids = self.ride_ids[mask]
+        self.driver_ids = self.driver_ids[mask]
+        self.rows = self.rows[mask]
+        self.target_x = self.target_x[mask]
+        self.target_y = self.target_y[mask]
+        self.dropoff_x = self.dropoff_x[mask]
+        self.dropoff_y = self.dropoff_y[mask]
+        self.to_dropoff = self.to_dropoff[mask]
+        self.route_start = self.route_start[mask]
+        self.route_len = self.route_len[mask]
+        self.route_pos = self.route_pos[mask]
+        self.progress = self.progress[mask]
@@ -0,0 +1,124 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+
+class WriterBusy(Exception):
+    """Raised when the command queue is full; the caller should back off and retry."""
+
+
+class SingleWriter:
+    """
+    Runs commands against shared state one at a time on a dedicated thread.
+
+    Request handlers submit callables instead of touching the dispatch
+    service themselves, so every mutation (and every read that needs a
+    consistent view) is serialized without a lock. The queue is bounded:
+    once max_pending commands are waiting, submit() raises WriterBusy
+    rather than letting latency grow without limit. Commands submitted from
+    the writer thread itself run inline.
+    """
+
+    def __init__(self, max_pending: int = 1024, name: str = "dispatch-writer"):
+        self.max_pending = max_pending
+        self.executed = 0  # commands run so far
+        self.rejected = 0  # commands refused because the queue was full
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs) and return a Future for its result."""
+        future: Future = Future()
+        if threading.current_thread() is self._thread:
+            self._execute(future, fn, args, kwargs)
+            return future
+        try:
+            self._queue.put_nowait((future, fn, args, kwargs))
+        except queue.Full:
+            self.rejected += 1
+            raise WriterBusy(f"{self.max_pending} commands already pending")
+        return future
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn on the writer thread and wait for its result (or exception)."""
+        return self.submit(fn, *args, **kwargs).result()
+
+    async def call_async(self, fn: Callable, *args, **kwargs) -> Any:
+        """Like call(), but awaits the result instead of blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stop(self) -> None:
+        """Finish the queued commands and stop the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._execute(*item)
+
+    def _execute(self, future: Future, fn: Callable, args: tuple, kwargs: dict) -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            self.executed += 1
+
+
+class SnapshotCache:
+    """
+    Immutable read views of writer-owned state, keyed by name.
+
+    A view is tagged with the state version it was built at. Readers get the
+    cached view while the version is unchanged, without going through the
+    writer; otherwise the view is rebuilt on the writer thread, once per
+    version however many readers ask. Views must not be mutated by readers.
+    """
+
+    def __init__(self, writer: SingleWriter):
+        self.writer = writer
+        self._views: Dict[str, Tuple[int, Any]] = {}  # name -> (version, view)
+        self._encoded: Dict[str, Tuple[int, bytes]] = {}  # name -> (version, encoded view)
+
+    def get(self, name: str, version: Callable[[], int], build: Callable[[], Any]) -> Tuple[int, Any]:
+        """Return (version, view), rebuilding the view if `version()` moved on."""
+        cached = self._views.get(name)
+        if cached is not None and cached[0] == version():
+            return cached
+        return self.writer.call(self._rebuild, name, version, build)
+
+    def encoded(
+        self, name: str, version: Callable[[], int], build: Callable[[], Any], encode: Callable[[Any], bytes]
+    ) -> Tuple[int, bytes]:
+        """
+        Return (version, encoded view): the view encoded once per version, in
+        the reader's thread so encoding does not hold up the writer. Readers
+        racing on a new version may each encode it; the results are the same.
+        """
+        current, view = self.get(name, version, build)
+        cached = self._encoded.get(name)
+        if cached is None or cached[0] != current:
+            cached = self._encoded[name] = (current, encode(view))
+        return cached
+
+    def _rebuild(self, name: str, version: Callable[[], int], build: Callable[[], Any]) -> Tuple[int, Any]:
+        current = version()
+        cached = self._views.get(name)
+        if cached is None or cached[0] != current:
+            # Not already rebuilt by a command queued ahead of this one
+            cached = self._views[name] = (current, build())
+        return cached
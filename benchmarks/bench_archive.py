@@ -0,0 +1,78 @@
+"""
+Memory footprint of completed rides: hot RideEntity objects vs the
+columnar archive.
+
+Builds the same completed rides both ways and measures the allocations with
+tracemalloc; also reports RideArchive.memory_bytes() and lookup/page cost.
+
+Run with: python -m benchmarks.bench_archive
+"""
+import gc
+import random
+import time
+import tracemalloc
+
+from app.models.entities import Point, RideEntity
+from app.models.models import RideStatus
+from app.services.archive import RideArchive
+
+RIDES = 100_000
+RIDERS = 5_000
+DRIVERS = 2_000
+
+
+def make_rides(count: int, seed: int = 11):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield RideEntity(
+            id=f"ride_{i:08x}",
+            rider_id=f"rider_{rng.randrange(RIDERS):08x}",
+            pickup=Point(rng.randrange(100), rng.randrange(100)),
+            dropoff=Point(rng.randrange(100), rng.randrange(100)),
+            status=RideStatus.COMPLETED,
+            assigned_driver_id=f"driver_{rng.randrange(DRIVERS):08x}",
+            rejected_by=[f"driver_{rng.randrange(DRIVERS):08x}"] if rng.random() < 0.2 else []
+        )
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.take_snapshot()
+    kept = build()
+    gc.collect()
+    used = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(start, "filename"))
+    tracemalloc.stop()
+    return kept, used
+
+
+def main():
+    hot, hot_bytes = measure(lambda: {ride.id: ride for ride in make_rides(RIDES)})
+    del hot
+
+    def build_archive():
+        archive = RideArchive()
+        for seq, ride in enumerate(make_rides(RIDES)):
+            archive.append(ride, seq)
+        return archive
+
+    archive, archive_bytes = measure(build_archive)
+
+    print(f"{RIDES} completed rides")
+    print(f"  hot dict of RideEntity objects: {hot_bytes / RIDES:8.1f} bytes/ride")
+    print(f"  columnar archive (tracemalloc): {archive_bytes / RIDES:8.1f} bytes/ride")
+    print(f"  columnar archive (memory_bytes): {archive.memory_bytes() / RIDES:7.1f} bytes/ride")
+
+    ids = archive.ids
+    start = time.perf_counter()
+    for ride_id in random.Random(1).sample(ids, 10_000):
+        archive.get(ride_id)
+    print(f"  archived get_ride: {(time.perf_counter() - start) / 10_000 * 1e6:.1f} us")
+    start = time.perf_counter()
+    for _ in range(100):
+        archive.select(after_seq=RIDES // 2, limit=100, status=RideStatus.COMPLETED)
+    print(f"  archived page of 100: {(time.perf_counter() - start) / 100 * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Greedy vs batch dispatch under bursty demand.
+
+Every few ticks a burst of ride requests arrives around a few hotspots. The
+same seeded workload runs once per dispatch mode; the table reports fulfilled
+rides, mean pickup ETA at assignment time and batch solve times.
+
+Run with: python -m benchmarks.bench_batching
+"""
+import random
+import statistics
+
+from app.models.entities import Point, RideEntity
+from app.models.models import RideStatus
+from app.services.dispatch import DispatchService
+
+GRID = 100
+DRIVERS = 400
+TICKS = 200
+BURST_EVERY = 10
+BURST_SIZE = 150
+
+
+def run(mode: str, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    service = DispatchService(dispatch_mode=mode)
+    for i in range(DRIVERS):
+        service.add_driver(f"driver_{i}", Point(rng.randrange(GRID), rng.randrange(GRID)))
+
+    hotspots = [(rng.randrange(GRID), rng.randrange(GRID)) for _ in range(4)]
+    pickup_etas = []
+    ride_count = 0
+    for tick in range(TICKS):
+        if tick % BURST_EVERY == 0:
+            for _ in range(BURST_SIZE):
+                hx, hy = rng.choice(hotspots)
+                pickup = Point(min(GRID - 1, max(0, int(rng.gauss(hx, 8)))),
+                               min(GRID - 1, max(0, int(rng.gauss(hy, 8)))))
+                dropoff = Point(rng.randrange(GRID), rng.randrange(GRID))
+                ride_id = f"ride_{ride_count}"
+                ride_count += 1
+                service.add_ride_request(RideEntity(ride_id, ride_id, pickup, dropoff, RideStatus.WAITING))
+                service.submit_ride(ride_id)
+                if mode == "greedy" and service.ride_requests[ride_id].status == RideStatus.ASSIGNED:
+                    pickup_etas.append(service.calculate_eta(service.ride_requests[ride_id].assigned_driver_id, pickup))
+        if mode == "batch" and service.batch_queue:
+            queued = list(service.batch_queue)
+            service.flush_batch()
+            for ride_id in queued:
+                ride = service.ride_requests[ride_id]
+                if ride.status == RideStatus.ASSIGNED:
+                    pickup_etas.append(service.calculate_eta(ride.assigned_driver_id, ride.pickup))
+        service.tick()
+
+    solve_ms = [report["solve_ms"] for report in service.batch_reports]
+    return {
+        "fulfilled": len(pickup_etas),
+        "requests": ride_count,
+        "mean_eta": statistics.mean(pickup_etas) if pickup_etas else 0.0,
+        "mean_solve_ms": statistics.mean(solve_ms) if solve_ms else 0.0,
+        "max_solve_ms": max(solve_ms) if solve_ms else 0.0,
+    }
+
+
+def main():
+    print(f"{'mode':>7} {'fulfilled':>10} {'mean ETA':>9} {'solve ms (mean/max)':>20}")
+    for mode in ("greedy", "batch"):
+        result = run(mode)
+        print(f"{mode:>7} {result['fulfilled']:>5}/{result['requests']:<4} {result['mean_eta']:>9.2f}"
+              f" {result['mean_solve_ms']:>10.1f}/{result['max_solve_ms']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Server-side clock throughput: achieved tick rate against the target.
+
+Runs a SimulationClock that advances a DispatchService through a
+SingleWriter (as the app does) for a few seconds per target rate, with a
+fleet of drivers on trips, and reports the achieved rate, how many steps
+had to catch up, and how many ticks were dropped.
+
+Run with: python -m benchmarks.bench_clock --trips 10000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.models.entities import Point, RideEntity
+from app.models.models import RideStatus
+from app.services.clock import SimulationClock
+from app.services.dispatch import DispatchService
+from app.services.writer import SingleWriter
+
+GRID = 100
+RATES = (100, 500, 1000, 5000)
+
+
+def build(trips: int, seed: int = 3) -> DispatchService:
+    rng = random.Random(seed)
+    service = DispatchService()
+    for i in range(trips):
+        driver_id, ride_id = f"driver_{i}", f"ride_{i}"
+        service.add_driver(driver_id, Point(rng.randrange(GRID), rng.randrange(GRID)))
+        ride = RideEntity(ride_id, ride_id, Point(rng.randrange(GRID), rng.randrange(GRID)),
+                          Point(rng.randrange(GRID), rng.randrange(GRID)), RideStatus.WAITING)
+        service.add_ride_request(ride)
+        service.start_trip(ride, driver_id)
+    return service
+
+
+async def run(service: DispatchService, rate: float, seconds: float) -> dict:
+    writer = SingleWriter()
+    clock = SimulationClock(lambda n: writer.call_async(service.tick_many, n), rate=rate)
+    clock.start()
+    clock.resume()
+    started = time.perf_counter()
+    await asyncio.sleep(seconds)
+    clock.pause()
+    elapsed = time.perf_counter() - started
+    await clock.stop()
+    writer.stop()
+    return {**clock.status(), "achieved": clock.ticks / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--trips", type=int, default=10_000)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    print(f"{args.trips} trips, {args.seconds:.0f}s per rate")
+    print(f"{'target/s':>9}{'achieved/s':>12}{'steps':>8}{'overruns':>10}{'dropped':>9}")
+    for rate in RATES:
+        result = asyncio.run(run(build(args.trips), rate, args.seconds))
+        print(f"{rate:>9}{result['achieved']:>12.0f}{result['steps']:>8}{result['overruns']:>10}{result['dropped']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Internal __slots__ entities vs the pydantic API models.
+
+Reports memory per entity (tracemalloc) for rides, riders and points built
+both ways, and the cost of the attribute writes and rejection checks the
+dispatch loop does. (The service itself only takes RideEntities: it reads
+their status codes.)
+
+Run with: python -m benchmarks.bench_entities
+"""
+import gc
+import random
+import time
+import tracemalloc
+
+from app.models.entities import RIDE_ASSIGNED, Point, RideEntity, RiderEntity
+from app.models.models import Location, Rider, RideRequest, RideStatus
+
+COUNT = 100_000
+GRID = 100
+REJECTIONS = 20  # the rejection cutoff: a ride is dropped after this many
+
+
+def measure(build) -> float:
+    """Bytes allocated per item by build(), which returns a list of COUNT items."""
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.take_snapshot()
+    kept = build()
+    gc.collect()
+    used = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(start, "filename"))
+    tracemalloc.stop()
+    del kept
+    return used / COUNT
+
+
+def timed(fn, repeat: int) -> float:
+    """Nanoseconds per call of fn()."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e9
+
+
+def memory():
+    rng = random.Random(5)
+    coords = [(rng.randrange(GRID), rng.randrange(GRID), rng.randrange(GRID), rng.randrange(GRID))
+              for _ in range(COUNT)]
+    rejected = [f"driver_{rng.randrange(1000)}" for _ in range(COUNT)]
+    rows = [
+        ("ride", lambda: [RideRequest(id=f"ride_{i}", rider_id=f"rider_{i}", pickup=Location(x=a, y=b),
+                                      dropoff=Location(x=c, y=d), status=RideStatus.WAITING,
+                                      rejected_by=[rejected[i]])
+                          for i, (a, b, c, d) in enumerate(coords)],
+                 lambda: [RideEntity(f"ride_{i}", f"rider_{i}", Point(a, b), Point(c, d), RideStatus.WAITING,
+                                     rejected_by=(rejected[i],))
+                          for i, (a, b, c, d) in enumerate(coords)]),
+        ("rider", lambda: [Rider(id=f"rider_{i}", location=Location(x=a, y=b)) for i, (a, b, _, _) in enumerate(coords)],
+                  lambda: [RiderEntity(f"rider_{i}", Point(a, b)) for i, (a, b, _, _) in enumerate(coords)]),
+        ("point", lambda: [Location(x=a, y=b) for a, b, _, _ in coords],
+                  lambda: [Point(a, b) for a, b, _, _ in coords]),
+    ]
+    print(f"{'bytes per entity':<18}{'pydantic':>10}{'__slots__':>11}")
+    for name, model_build, entity_build in rows:
+        print(f"{name:<18}{measure(model_build):>10.0f}{measure(entity_build):>11.0f}")
+
+
+def micro_ops():
+    model = RideRequest(id="ride", rider_id="rider", pickup=Location(x=1, y=2), dropoff=Location(x=3, y=4),
+                        status=RideStatus.WAITING, rejected_by=[f"driver_{i}" for i in range(REJECTIONS)])
+    entity = RideEntity.from_model(model)
+
+    def model_status():
+        model.status = RideStatus.ASSIGNED
+
+    def entity_status():
+        entity.status_code = RIDE_ASSIGNED
+
+    def model_move():
+        model.pickup.x = 5
+
+    def entity_move():
+        entity.pickup.x = 5
+
+    def model_rejected():
+        "driver_missing" in model.rejected_by
+
+    def entity_rejected():
+        "driver_missing" in entity.rejected_by
+
+    rows = [
+        ("status write", model_status, entity_status),
+        ("location write", model_move, entity_move),
+        (f"rejected_by miss ({REJECTIONS})", model_rejected, entity_rejected),
+    ]
+    print(f"\n{'ns per op':<24}{'pydantic':>10}{'__slots__':>11}")
+    for name, model_op, entity_op in rows:
+        print(f"{name:<24}{timed(model_op, 200_000):>10.0f}{timed(entity_op, 200_000):>11.0f}")
+
+
+def main():
+    memory()
+    micro_ops()
+
+
+if __name__ == "__main__":
+    main()
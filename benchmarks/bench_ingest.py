@@ -0,0 +1,98 @@
+"""
+Ingestion throughput: single-row create endpoints vs the bulk NDJSON
+endpoints, in rows per second.
+
+Both paths go through the full FastAPI stack in process (TestClient, which
+needs httpx). Each scenario gets a fresh DispatchService so the fleet sizes
+match; rides are requested for distinct riders against the loaded fleet.
+
+Run with: python -m benchmarks.bench_ingest
+"""
+import json
+import random
+import time
+
+from fastapi.testclient import TestClient
+
+from app.api import endpoints
+from app.main import app
+from app.services.dispatch import DispatchService
+
+DRIVERS = 50_000
+RIDERS = 20_000
+RIDES = 5_000
+SINGLE_ROWS = 2_000  # the single-row path is timed on a sample and extrapolated
+
+
+def locations(count: int, rng: random.Random):
+    return [{"x": rng.randrange(100), "y": rng.randrange(100)} for _ in range(count)]
+
+
+def ndjson(rows) -> bytes:
+    return "\n".join(json.dumps(row) for row in rows).encode()
+
+
+def fresh_client() -> TestClient:
+    endpoints.dispatch_service = endpoints.runtime.backend = DispatchService()
+    return TestClient(app)
+
+
+def single(client: TestClient, path: str, rows) -> float:
+    start = time.perf_counter()
+    for row in rows:
+        client.post(path, json=row).raise_for_status()
+    return len(rows) / (time.perf_counter() - start)
+
+
+def bulk(client: TestClient, path: str, rows) -> float:
+    body = ndjson(rows)
+    start = time.perf_counter()
+    response = client.post(path, content=body, headers={"content-type": "application/x-ndjson"})
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    assert response.json()["failed"] == 0
+    return len(rows) / elapsed
+
+
+def ride_rows(rider_ids, rng: random.Random):
+    return [
+        {"rider_id": rider_id, "pickup": pickup, "dropoff": dropoff}
+        for rider_id, pickup, dropoff in zip(rider_ids, locations(len(rider_ids), rng), locations(len(rider_ids), rng))
+    ]
+
+
+def main():
+    rng = random.Random(3)
+    drivers = locations(DRIVERS, rng)
+    riders = locations(RIDERS, rng)
+    print(f"{'rows':<10}{'path':<8}{'rows/s':>12}")
+
+    client = fresh_client()
+    single_drivers = single(client, "/api/drivers/", drivers[:SINGLE_ROWS])
+    client = fresh_client()
+    bulk_drivers = bulk(client, "/api/drivers/bulk", drivers)
+    print(f"{'drivers':<10}{'single':<8}{single_drivers:>12,.0f}")
+    print(f"{'drivers':<10}{'bulk':<8}{bulk_drivers:>12,.0f}  ({bulk_drivers / single_drivers:.0f}x)")
+
+    single_riders = single(client, "/api/riders/", riders[:SINGLE_ROWS])
+    client = fresh_client()
+    bulk(client, "/api/drivers/bulk", drivers)
+    bulk_riders = bulk(client, "/api/riders/bulk", riders)
+    print(f"{'riders':<10}{'single':<8}{single_riders:>12,.0f}")
+    print(f"{'riders':<10}{'bulk':<8}{bulk_riders:>12,.0f}  ({bulk_riders / single_riders:.0f}x)")
+
+    # Rides dispatch against the 50k-driver fleet in both cases
+    rider_ids = list(endpoints.dispatch_service.riders)
+    single_rides = single(client, "/api/rides/request", ride_rows(rider_ids[:SINGLE_ROWS], rng))
+    client = fresh_client()
+    bulk(client, "/api/drivers/bulk", drivers)
+    bulk(client, "/api/riders/bulk", riders)
+    rider_ids = list(endpoints.dispatch_service.riders)
+    bulk_rides = bulk(client, "/api/rides/bulk", ride_rows(rider_ids[:RIDES], rng))
+    print(f"{'rides':<10}{'single':<8}{single_rides:>12,.0f}")
+    print(f"{'rides':<10}{'bulk':<8}{bulk_rides:>12,.0f}  ({bulk_rides / single_rides:.0f}x)")
+    assert not endpoints.dispatch_service.check_consistency()
+
+
+if __name__ == "__main__":
+    main()
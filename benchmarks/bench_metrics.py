@@ -0,0 +1,131 @@
+"""
+Cost of the metrics instrumentation.
+
+Service: replays a synthetic workload (see benchmarks.workload) on a
+DispatchService with metrics off and on, alternating runs and keeping the
+best of each, and reports the time per command; then times repeated
+find_best_driver() and tick() calls, which isolates the per-call cost from
+the replay's run-to-run noise. API: sends the same request through a
+plain route and through the timed route class used when METRICS_ENABLED is
+on. Also reports the cost of one Histogram.observe() and of rendering
+/metrics.
+
+Run with: python -m benchmarks.bench_metrics
+"""
+import asyncio
+import random
+import time
+
+import httpx
+from fastapi import APIRouter, FastAPI
+from fastapi.routing import APIRoute
+
+from benchmarks.replay import DirectTarget
+from benchmarks.workload import generate
+from app.api.common import _TimedRoute
+from app.models.entities import Point, RideEntity
+from app.models.models import RideStatus
+from app.services.dispatch import DispatchService
+from app.services.metrics import DispatchMetrics, Histogram, MetricsRegistry
+
+ROUNDS = 5
+REQUESTS = 5_000
+
+
+def service_overhead() -> dict:
+    ops = [op for op in generate(drivers=2000, riders=8000, ticks=300, demand=30, seed=1) if op["op"] != "meta"]
+    seconds = {False: [], True: []}
+    registry = None
+    for _ in range(ROUNDS):
+        for enabled in (False, True):
+            service = DispatchService()
+            if enabled:
+                registry = MetricsRegistry()
+                service.metrics = DispatchMetrics(registry)
+            target = DirectTarget(service)
+            started = time.perf_counter()
+            for op in ops:
+                target.apply(op)
+            seconds[enabled].append(time.perf_counter() - started)
+    started = time.perf_counter()
+    text = registry.render()
+    render_ms = (time.perf_counter() - started) * 1000
+    return {
+        "commands": len(ops),
+        "off_us": min(seconds[False]) / len(ops) * 1e6,
+        "on_us": min(seconds[True]) / len(ops) * 1e6,
+        "render_ms": render_ms,
+        "render_lines": text.count("\n"),
+    }
+
+
+def call_overhead(calls: int = 20_000) -> dict:
+    """Microseconds per find_best_driver() and tick() call with metrics off and on."""
+    rng = random.Random(2)
+    service = DispatchService()
+    for i in range(2000):
+        service.add_driver(f"driver_{i}", Point(rng.randrange(100), rng.randrange(100)))
+    ride = RideEntity("ride", "rider", Point(50, 50), Point(0, 0), RideStatus.WAITING)
+    metrics = DispatchMetrics(MetricsRegistry())
+    best = {}
+    for _ in range(ROUNDS):
+        for enabled in (False, True):
+            service.metrics = metrics if enabled else None
+            for name, call in (("find_best_driver", lambda: service.find_best_driver(ride)), ("tick", service.tick)):
+                started = time.perf_counter()
+                for _ in range(calls):
+                    call()
+                elapsed = (time.perf_counter() - started) / calls * 1e6
+                best[name, enabled] = min(best.get((name, enabled), elapsed), elapsed)
+    return best
+
+
+def route_overhead() -> dict:
+    """Microseconds per request through a plain route and through _TimedRoute."""
+    app = FastAPI()
+    for prefix, route_class in (("/plain", APIRoute), ("/timed", _TimedRoute)):
+        router = APIRouter(route_class=route_class)
+        router.add_api_route("/ping/{item}", lambda item: {"item": item}, methods=["GET"])
+        app.include_router(router, prefix=prefix)
+
+    async def run(path: str) -> float:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            started = time.perf_counter()
+            for i in range(REQUESTS):
+                await client.get(f"{path}/ping/{i}")
+            return (time.perf_counter() - started) / REQUESTS * 1e6
+
+    best = {"/plain": [], "/timed": []}
+    for _ in range(ROUNDS):
+        for path in best:
+            best[path].append(asyncio.run(run(path)))
+    return {"plain_us": min(best["/plain"]), "timed_us": min(best["/timed"])}
+
+
+def observe_ns() -> float:
+    histogram = Histogram((0.001, 0.01, 0.1, 1.0))
+    values = [i / 10_000 for i in range(10_000)]
+    started = time.perf_counter()
+    for _ in range(20):
+        for value in values:
+            histogram.observe(value)
+    return (time.perf_counter() - started) / histogram.count * 1e9
+
+
+def main():
+    service = service_overhead()
+    print(f"service, {service['commands']} commands: {service['off_us']:.1f} us/command with metrics off, "
+          f"{service['on_us']:.1f} us on (+{(service['on_us'] / service['off_us'] - 1) * 100:.1f}%)")
+    calls = call_overhead()
+    for name in ("find_best_driver", "tick"):
+        print(f"{name}(): {calls[name, False]:.2f} us off, {calls[name, True]:.2f} us on "
+              f"(+{calls[name, True] - calls[name, False]:.2f} us)")
+    api = route_overhead()
+    print(f"API route: {api['plain_us']:.0f} us/request plain, {api['timed_us']:.0f} us timed "
+          f"(+{api['timed_us'] - api['plain_us']:.1f} us)")
+    print(f"Histogram.observe(): {observe_ns():.0f} ns")
+    print(f"render /metrics: {service['render_ms']:.2f} ms for {service['render_lines']} lines")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Pending-demand queue under a demand peak.
+
+Requests arrive faster than the fleet can serve them for the first half of
+the run, then stop. Requests that find no driver wait in the pending queue
+and are handed to drivers as they drop off. Reports, per max_wait_ticks
+setting, how many rides were completed, failed or are still waiting, how
+many were matched from the queue and how long they waited, and the mean
+tick time (which includes the re-dispatch searches).
+
+Run with: python -m benchmarks.bench_pending --drivers 2000 --demand 40
+"""
+import argparse
+import random
+import time
+
+from app.models.entities import Point, RideEntity
+from app.models.models import RideStatus
+from app.services.dispatch import DispatchService
+
+GRID = 100
+
+
+def run(drivers: int, demand: int, ticks: int, max_wait_ticks, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    service = DispatchService(max_wait_ticks=max_wait_ticks)
+    service.add_drivers(
+        [f"driver_{i}" for i in range(drivers)],
+        [Point(rng.randrange(GRID), rng.randrange(GRID)) for _ in range(drivers)],
+    )
+    requested = 0
+    tick_seconds = 0.0
+    for tick in range(ticks):
+        if tick < ticks // 2:
+            for _ in range(demand):
+                ride_id = f"ride_{requested}"
+                requested += 1
+                service.add_ride_request(RideEntity(
+                    ride_id, ride_id, Point(rng.randrange(GRID), rng.randrange(GRID)),
+                    Point(rng.randrange(GRID), rng.randrange(GRID)), RideStatus.WAITING,
+                ))
+                service.assign_ride(ride_id)
+        started = time.perf_counter()
+        service.tick()
+        tick_seconds += time.perf_counter() - started
+
+    report = service.pending_report()
+    return {
+        "requested": requested,
+        "completed": len(service.archive.select(status=RideStatus.COMPLETED)),
+        "failed": len(service.archive.select(status=RideStatus.FAILED)),
+        "waiting": report["depth"],
+        "matched": report["matched"],
+        "wait": report["matched_wait_ticks"],
+        "tick_ms": tick_seconds / ticks * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--drivers", type=int, default=2000)
+    parser.add_argument("--demand", type=int, default=40, help="requests per tick during the peak")
+    parser.add_argument("--ticks", type=int, default=600)
+    args = parser.parse_args()
+
+    print(f"{args.drivers} drivers, {args.demand} requests/tick for {args.ticks // 2} ticks, {args.ticks} ticks")
+    print(f"{'max wait':>9}{'requested':>11}{'completed':>11}{'failed':>8}{'waiting':>9}"
+          f"{'matched':>9}{'wait p50':>10}{'wait p90':>10}{'tick ms':>9}")
+    for max_wait_ticks in (None, 200, 50):
+        result = run(args.drivers, args.demand, args.ticks, max_wait_ticks)
+        wait = result["wait"] or {"p50": 0, "p90": 0}
+        print(f"{str(max_wait_ticks):>9}{result['requested']:>11}{result['completed']:>11}{result['failed']:>8}"
+              f"{result['waiting']:>9}{result['matched']:>9}{wait['p50']:>10}{wait['p90']:>10}"
+              f"{result['tick_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
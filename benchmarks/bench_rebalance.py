@@ -0,0 +1,73 @@
+"""
+Idle-driver rebalancing on a hotspot workload.
+
+Generates a synthetic workload (see benchmarks.workload) where most pickups
+cluster around a few hotspots, and replays it with the offline simulator
+(benchmarks.tune: drivers decline pickups farther than rejection_distance)
+with rebalancing off and at a few rebalance_every settings. Reports the
+fulfilled share of requested rides, mean and p95 pickup ETA at
+acceptance, and the mean tick time (which includes rebalancing).
+
+Run with: python -m benchmarks.bench_rebalance --drivers 1000 --demand 6
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.tune import Simulation, encode
+from benchmarks.workload import generate
+from app.services.dispatch import DispatchService
+
+
+class TimedSimulation(Simulation):
+    """Simulation that also adds up the time spent in ticks."""
+
+    tick_seconds = 0.0
+    ticks = 0
+
+    def tick(self) -> None:
+        started = time.perf_counter()
+        super().tick()
+        self.tick_seconds += time.perf_counter() - started
+        self.ticks += 1
+
+
+def run(workload: np.ndarray, drivers: int, rebalance_every, drain: int) -> dict:
+    service = DispatchService(rebalance_every=rebalance_every)
+    simulation = TimedSimulation(service, drivers)
+    simulation.run(workload, drain)
+    etas = np.array(simulation.etas, dtype=np.float64)
+    return {
+        "fulfilled": simulation.completed.sum() / max(simulation.requested, 1),
+        "eta_mean": etas.mean() if len(etas) else float("nan"),
+        "eta_p95": np.percentile(etas, 95) if len(etas) else float("nan"),
+        "tick_ms": simulation.tick_seconds / max(simulation.ticks, 1) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--riders", type=int, default=5000)
+    parser.add_argument("--ticks", type=int, default=400)
+    parser.add_argument("--demand", type=float, default=6.0, help="mean ride requests per tick")
+    parser.add_argument("--hotspot-share", type=float, default=0.8)
+    parser.add_argument("--drain", type=int, default=200)
+    args = parser.parse_args()
+
+    workload = encode(generate(
+        drivers=args.drivers, riders=args.riders, ticks=args.ticks, demand=args.demand,
+        hotspots=3, hotspot_share=args.hotspot_share, seed=4,
+    ))
+    print(f"{args.drivers} drivers, {args.demand} requests/tick for {args.ticks} ticks, "
+          f"{args.hotspot_share:.0%} of pickups near 3 hotspots")
+    print(f"{'rebalance':>10}{'fulfilled':>11}{'eta mean':>10}{'eta p95':>9}{'tick ms':>9}")
+    for rebalance_every in (None, 10, 5, 1):
+        result = run(workload, args.drivers, rebalance_every, args.drain)
+        print(f"{str(rebalance_every or 'off'):>10}{result['fulfilled']:>11.2%}{result['eta_mean']:>10.2f}"
+              f"{result['eta_p95']:>9.1f}{result['tick_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
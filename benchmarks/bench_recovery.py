@@ -0,0 +1,150 @@
+"""
+Cost of persistence: event log overhead per command and restart recovery time.
+
+Write overhead: replays a synthetic workload (see benchmarks.workload) on a
+plain DispatchService and on one persisted to a temporary directory, with
+group commit and fsync, and reports the extra time per command along with
+the log's records per group commit and bytes per record.
+
+Recovery: builds a persisted service holding --rides archived rides plus a
+live fleet, snapshots it, logs --tail more ride requests (and ticks), and
+then times PersistentStore.open() on that directory: with the snapshot
+memory-mapped, with it read into memory, and (with --full-replay) by
+replaying the whole log without a snapshot.
+
+Run with: python -m benchmarks.bench_recovery --rides 1000000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.replay import DirectTarget
+from benchmarks.workload import generate
+from app.models.entities import Point, RideEntity, RiderEntity
+from app.models.models import RideStatus
+from app.services.dispatch import DispatchService
+from app.services.persistence import SNAPSHOT_PATTERN, PersistentStore
+
+DRIVERS = 10_000
+RIDERS = 100_000
+CHUNK = 10_000  # rides per add_ride_requests call while loading
+
+
+def directory_size(path) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def write_overhead(commit_interval: float, rounds: int = 3) -> dict:
+    """Per-command cost of the workload with and without the event log, best of `rounds`."""
+    ops = [op for op in generate(drivers=2000, riders=8000, ticks=300, demand=30, seed=1) if op["op"] != "meta"]
+    seconds = {False: [], True: []}
+    for _ in range(rounds):
+        for persisted in (False, True):
+            directory = tempfile.mkdtemp()
+            store = PersistentStore(directory, commit_interval=commit_interval) if persisted else None
+            service = store.open(DispatchService) if persisted else DispatchService()
+            target = DirectTarget(service)
+            started = time.perf_counter()
+            for op in ops:
+                target.apply(op)
+            seconds[persisted].append(time.perf_counter() - started)
+            if persisted:
+                log = store.log
+                store.close()
+                records, commits, log_bytes = log.next_seq - 1, log.commits, log.bytes_written
+            shutil.rmtree(directory)
+    return {
+        "commands": len(ops),
+        "plain_us": min(seconds[False]) / len(ops) * 1e6,
+        "persisted_us": min(seconds[True]) / len(ops) * 1e6,
+        "records": records,
+        "records_per_commit": records / max(1, commits),
+        "bytes_per_record": log_bytes / max(1, records),
+    }
+
+
+def build(directory: str, rides: int, tail: int) -> None:
+    """Fill a persisted service with `rides` archived rides, snapshot it, then log `tail` requests."""
+    rng = np.random.default_rng(7)
+    store = PersistentStore(directory, snapshot_every=10**12)
+    service = store.open(DispatchService)
+    points = lambda n: [Point(int(x), int(y)) for x, y in rng.integers(0, 100, (n, 2))]
+    service.add_drivers([f"driver_{i:08x}" for i in range(DRIVERS)], points(DRIVERS))
+    service.add_riders([RiderEntity(f"rider_{i:08x}", loc) for i, loc in enumerate(points(RIDERS))])
+    for start in range(0, rides, CHUNK):
+        count = min(CHUNK, rides - start)
+        pickups, dropoffs = points(count), points(count)
+        service.add_ride_requests([
+            RideEntity(
+                id=f"ride_{start + i:08x}", rider_id=f"rider_{(start + i) % RIDERS:08x}",
+                pickup=pickups[i], dropoff=dropoffs[i], status=RideStatus.COMPLETED,
+                assigned_driver_id=f"driver_{(start + i) % DRIVERS:08x}",
+            )
+            for i in range(count)
+        ])
+    started = time.perf_counter()
+    store.snapshot(service)
+    print(f"snapshot written in {time.perf_counter() - started:.2f}s, {directory_size(directory) / 2**20:.0f} MiB on disk")
+
+    # Live traffic after the snapshot: requests and ticks
+    pickups, dropoffs = points(tail), points(tail)
+    for i in range(tail):
+        rider_id = f"rider_{i % RIDERS:08x}"
+        if service.active_request_for(rider_id) is None:
+            ride_id = f"ride_{rides + i:08x}"
+            service.add_ride_request(RideEntity(ride_id, rider_id, pickups[i], dropoffs[i], RideStatus.WAITING))
+            service.submit_ride(ride_id)
+        if i % 100 == 99:
+            service.tick()
+    store.close()
+    assert len(service.archive) + len(service.ride_requests) >= rides
+
+
+def recover(directory: str, mmap: bool) -> dict:
+    store = PersistentStore(directory, mmap=mmap)
+    service = store.open(DispatchService)
+    store.close()
+    assert not service.check_consistency()
+    return {**store.recovery, "rides": service.ride_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rides", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=int, default=10_000, help="ride requests logged after the snapshot, with a tick every 100")
+    parser.add_argument("--commit-interval", type=float, default=0.005, help="group commit window, seconds")
+    parser.add_argument("--full-replay", action="store_true", help="also time recovery from the log alone")
+    args = parser.parse_args()
+
+    overhead = write_overhead(args.commit_interval)
+    print(f"write overhead: {overhead['plain_us']:.1f} -> {overhead['persisted_us']:.1f} us per command "
+          f"(+{overhead['persisted_us'] - overhead['plain_us']:.1f} us), "
+          f"{overhead['records_per_commit']:.0f} records per group commit, "
+          f"{overhead['bytes_per_record']:.0f} bytes per record")
+
+    directory = tempfile.mkdtemp()
+    try:
+        build(directory, args.rides, args.tail)
+        print(f"{'recovery':<22}{'rides':>10}{'load s':>9}{'replayed':>10}{'replay s':>10}{'total s':>9}")
+        runs = [("snapshot, mmap", True), ("snapshot, read", False)]
+        for label, mmap in runs:
+            result = recover(directory, mmap)
+            print(f"{label:<22}{result['rides']:>10,}{result['snapshot_load_s']:>9.2f}"
+                  f"{result['replayed']:>10,}{result['replay_s']:>10.2f}{result['total_s']:>9.2f}")
+        if args.full_replay:
+            for name in os.listdir(directory):
+                if SNAPSHOT_PATTERN.match(name):
+                    shutil.rmtree(os.path.join(directory, name))
+            result = recover(directory, True)
+            print(f"{'log only':<22}{result['rides']:>10,}{result['snapshot_load_s']:>9.2f}"
+                  f"{result['replayed']:>10,}{result['replay_s']:>10.2f}{result['total_s']:>9.2f}")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
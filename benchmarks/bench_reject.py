@@ -0,0 +1,65 @@
+"""
+Reject-path latency with and without cached candidate lists.
+
+Each ride is requested and then turned down by every driver it is given,
+up to the rejection limit, as drivers do through PUT /rides/{id}/reject.
+candidate_cache_size=1 keeps only the chosen driver, so every retry
+searches the fleet again (the behaviour before the cache); the default
+keeps the next best drivers and the retries take them from the list.
+
+Run with: python -m benchmarks.bench_reject
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+
+from app.models.entities import Point, RideEntity
+from app.models.models import RideStatus
+from app.services.dispatch import DispatchService
+
+GRID = 100
+REJECTIONS = 5  # retries per ride before it fails
+
+
+def run(drivers: int, rides: int, cache_size: int, seed: int = 11) -> np.ndarray:
+    """Seconds per reject_ride() call."""
+    rng = random.Random(seed)
+    service = DispatchService()
+    service.configure(candidate_cache_size=cache_size, max_rejection_attempts=REJECTIONS + 1)
+    service.add_drivers(
+        [f"driver_{i}" for i in range(drivers)],
+        [Point(rng.randrange(GRID), rng.randrange(GRID)) for _ in range(drivers)],
+    )
+    timings = []
+    for i in range(rides):
+        ride = RideEntity(f"ride_{i}", f"rider_{i}", Point(rng.randrange(GRID), rng.randrange(GRID)),
+                          Point(rng.randrange(GRID), rng.randrange(GRID)), RideStatus.WAITING)
+        service.add_ride_request(ride)
+        service.assign_ride(ride.id)
+        for _ in range(REJECTIONS):
+            started = time.perf_counter()
+            service.reject_ride(ride, ride.assigned_driver_id)
+            timings.append(time.perf_counter() - started)
+        # Finish the ride so the fleet stays the same size
+        service.cancel_ride(ride)
+    return np.array(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rides", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{args.rides} rides x {REJECTIONS} rejections, microseconds per reject")
+    print(f"{'drivers':>8}{'cache':>7}{'p50':>8}{'p99':>8}{'mean':>8}")
+    for drivers in (1_000, 10_000, 100_000):
+        for cache_size in (1, 8):
+            us = run(drivers, args.rides, cache_size) * 1e6
+            print(f"{drivers:>8}{cache_size:>7}{np.percentile(us, 50):>8.1f}{np.percentile(us, 99):>8.1f}"
+                  f"{us.mean():>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
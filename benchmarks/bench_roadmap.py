@@ -0,0 +1,109 @@
+"""
+Cost of routing on a road map.
+
+Builds a 100x100 map with walls, random closures, a slow street and a
+one-way street, then reports the time to compute one distance field, the
+find_best_driver latency with the pickup's field cached and not cached,
+and the tick time for trips that follow routes, against the open grid.
+The first tick looks up a route for every trip, which costs one distance
+field per distinct target; later ticks only route the legs that start.
+
+Run with: python -m benchmarks.bench_roadmap --trips 10000
+"""
+import argparse
+import random
+import time
+
+from app.models.entities import Point, RideEntity
+from app.models.models import RideStatus
+from app.services.dispatch import DispatchService
+from app.services.roadmap import RoadMap
+
+GRID = 100
+
+
+def city(seed: int = 9) -> dict:
+    rng = random.Random(seed)
+    blocked = sorted({
+        (x, y) for x in range(GRID) for y in range(GRID)
+        if (x % 10 == 5 and y % 20 != 3) or rng.random() < 0.08
+    })
+    return RoadMap(
+        blocked=blocked,
+        costs=[(x, 50, x + 1, 50, 3) for x in range(GRID - 1)],
+        one_way=[(x, 20, x + 1, 20) for x in range(GRID - 1)],
+    ).to_dict()
+
+
+def free_cells(spec) -> list:
+    blocked = {tuple(cell) for cell in spec["blocked"]} if spec else set()
+    return [(x, y) for x in range(GRID) for y in range(GRID) if (x, y) not in blocked]
+
+
+def field_ms(spec: dict, count: int = 50) -> float:
+    road_map = RoadMap.from_dict(spec)
+    cells = free_cells(spec)
+    rng = random.Random(1)
+    started = time.perf_counter()
+    for _ in range(count):
+        road_map.field(*rng.choice(cells))
+    return (time.perf_counter() - started) / count * 1000
+
+
+def build(spec, drivers: int, trips: int, seed: int = 3) -> DispatchService:
+    rng = random.Random(seed)
+    cells = free_cells(spec)
+    service = DispatchService()
+    if spec is not None:
+        service.set_road_map(spec)
+    service.add_drivers([f"driver_{i}" for i in range(drivers)], [Point(*rng.choice(cells)) for _ in range(drivers)])
+    for i in range(trips):
+        ride = RideEntity(f"ride_{i}", f"ride_{i}", Point(*rng.choice(cells)), Point(*rng.choice(cells)),
+                          RideStatus.WAITING)
+        service.add_ride_request(ride)
+        service.start_trip(ride, f"driver_{i}")
+    return service
+
+
+def decision_us(service: DispatchService, pickups: list, repeat: int) -> float:
+    probes = [RideEntity(f"probe_{i}", "probe", Point(x, y), Point(x, y), RideStatus.WAITING)
+              for i, (x, y) in enumerate(pickups)]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for probe in probes:
+            service.rank_drivers(probe, 1)
+    return (time.perf_counter() - started) / (repeat * len(probes)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--trips", type=int, default=10_000)
+    parser.add_argument("--drivers", type=int, default=12_000)  # the rest stay available
+    parser.add_argument("--ticks", type=int, default=50)
+    args = parser.parse_args()
+
+    spec = city()
+    print(f"map: {len(spec['blocked'])} blocked cells, one distance field in {field_ms(spec):.2f} ms "
+          f"({field_ms(RoadMap().to_dict()):.2f} ms on an open map)")
+
+    rng = random.Random(5)
+    pickups = [rng.choice(free_cells(spec)) for _ in range(200)]
+    for name, road in (("open grid", None), ("road map", spec)):
+        service = build(road, args.drivers, args.trips)
+        first = decision_us(service, pickups, 1)
+        cached = decision_us(service, pickups, 5)
+        started = time.perf_counter()
+        service.tick_many(1, summary=True)
+        first_tick_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        for _ in range(args.ticks):
+            service.tick_many(1, summary=True)
+        tick_ms = (time.perf_counter() - started) / args.ticks * 1000
+        print(f"{name:>9}: driver search {first:6.0f} us first, {cached:4.0f} us cached; "
+              f"first tick {first_tick_ms:7.0f} ms, then {tick_ms:5.2f} ms per tick with {args.trips} trips")
+        if service.road_map is not None:
+            print(f"           {service.road_map.stats()}")
+
+
+if __name__ == "__main__":
+    main()
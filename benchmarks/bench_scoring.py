@@ -0,0 +1,108 @@
+"""
+Micro-benchmark: driver scoring in find_best_driver.
+
+Compares the original pure-Python loop over pydantic Driver models with the
+fleet-store dispatch (spatial index + vectorized per-ring scoring) and with a
+single vectorized pass over every available row.
+
+Run with: python -m benchmarks.bench_scoring
+"""
+import random
+import time
+from typing import List
+
+import numpy as np
+
+from app.models.entities import Point, RideEntity
+from app.models.models import Driver, DriverStatus, Location, RideStatus
+from app.services.dispatch import DispatchService
+
+GRID = 100
+FLEET_SIZES = (1_000, 10_000, 100_000)
+QUERIES = 200
+
+
+def legacy_find_best_driver(drivers: List[Driver], ride_request: RideEntity,
+                            eta_weight: float = 0.7, fairness_weight: float = 0.3) -> Driver:
+    """The scoring loop as it was before the fleet store."""
+    pickup = ride_request.pickup
+    available = [
+        d for d in drivers
+        if d.status == DriverStatus.AVAILABLE and d.id not in ride_request.rejected_by
+    ]
+    max_eta = 1
+    max_rides = 1
+    for driver in available:
+        eta = abs(driver.location.x - pickup.x) + abs(driver.location.y - pickup.y)
+        max_eta = max(max_eta, eta)
+        max_rides = max(max_rides, driver.assigned_rides)
+    scores = []
+    for driver in available:
+        eta = abs(driver.location.x - pickup.x) + abs(driver.location.y - pickup.y)
+        score = (
+            eta_weight * (eta / max_eta) +
+            fairness_weight * (1 - driver.assigned_rides / max_rides)
+        )
+        scores.append((driver, score))
+    scores.sort(key=lambda item: item[1])
+    return scores[0][0]
+
+
+def full_pass_best_driver(service: DispatchService, ride_request: RideEntity) -> str:
+    """Score every available row in one vectorized pass, without the index."""
+    fleet = service.fleet
+    rows = fleet.rows_with_status(DriverStatus.AVAILABLE)
+    px, py = ride_request.pickup.x, ride_request.pickup.y
+    eta = np.abs(fleet.x[rows] - px) + np.abs(fleet.y[rows] - py)
+    max_eta = max(1, int(eta.max()))
+    max_rides = max(1, int(fleet.rides[rows].max()))
+    scores = fleet.score(rows, px, py, max_eta, max_rides, service.eta_weight, service.fairness_weight)
+    return fleet.ids[fleet.best(rows, scores)[1]]
+
+
+def build(size: int, rng: random.Random):
+    service = DispatchService()
+    drivers = []
+    for i in range(size):
+        driver_id = f"driver_{i}"
+        location = Location(x=rng.randrange(GRID), y=rng.randrange(GRID))
+        rides = rng.randrange(10)
+        service.add_driver(driver_id, Point.of(location))
+        service.fleet.rides[service.fleet.rows[driver_id]] = rides
+        service.set_driver_status(driver_id, DriverStatus.AVAILABLE)
+        drivers.append(Driver(id=driver_id, location=location,
+                              status=DriverStatus.AVAILABLE, assigned_rides=rides))
+    return service, drivers
+
+
+def timed(fn, requests) -> float:
+    start = time.perf_counter()
+    for request in requests:
+        fn(request)
+    return (time.perf_counter() - start) / len(requests) * 1e6
+
+
+def main():
+    rng = random.Random(42)
+    print(f"{'drivers':>8} {'legacy loop':>14} {'full vector':>14} {'indexed':>14}  (us per dispatch)")
+    for size in FLEET_SIZES:
+        service, drivers = build(size, rng)
+        requests = [
+            RideEntity(f"ride_{i}", "rider", Point(rng.randrange(GRID), rng.randrange(GRID)),
+                       Point(0, 0), RideStatus.WAITING)
+            for i in range(QUERIES)
+        ]
+        for request in requests[:20]:
+            expected = legacy_find_best_driver(drivers, request).id
+            assert service.find_best_driver(request) == expected
+            assert full_pass_best_driver(service, request) == expected
+
+        legacy_requests = requests[:max(5, QUERIES * 1_000 // size)]
+        legacy = timed(lambda r: legacy_find_best_driver(drivers, r), legacy_requests)
+        vector = timed(lambda r: full_pass_best_driver(service, r), requests)
+        indexed = timed(service.find_best_driver, requests)
+        print(f"{size:>8} {legacy:>14.1f} {vector:>14.1f} {indexed:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Serialization cost of the collection endpoints, and payload sizes.
+
+For the driver list and the full state at 10k and 100k entities, times
+encoding the way a response_model route does it (pydantic validation,
+jsonable_encoder, json.dumps), the standard library encoder alone, orjson
+(when installed), and the cached body that is served while the version
+is unchanged. The packed positions feed (GET /drivers/positions) is shown
+against the driver list for the grid view.
+
+Run with: python -m benchmarks.bench_serialization
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.api import endpoints, responses
+from app.models.entities import Point, RideEntity, RiderEntity
+from app.models.models import Driver, RideStatus
+
+GRID = 100
+
+
+def populate(entities: int, seed: int = 5) -> None:
+    """Fill a fresh service: drivers and riders half each, a tenth of the riders on a ride."""
+    rng = random.Random(seed)
+    service = endpoints.dispatch_service = endpoints.runtime.backend = endpoints.DispatchService()
+    drivers = entities // 2
+    service.add_drivers([f"driver_{i}" for i in range(drivers)],
+                        [Point(rng.randrange(GRID), rng.randrange(GRID)) for _ in range(drivers)])
+    service.add_riders([RiderEntity(f"rider_{i}", Point(rng.randrange(GRID), rng.randrange(GRID)))
+                        for i in range(entities - drivers)])
+    for i in range(0, entities - drivers, 10):
+        ride = RideEntity(f"ride_{i}", f"rider_{i}", Point(rng.randrange(GRID), rng.randrange(GRID)),
+                          Point(rng.randrange(GRID), rng.randrange(GRID)), RideStatus.WAITING)
+        service.add_ride_request(ride)
+        service.assign_ride(ride.id)
+
+
+def timed_ms(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def stdlib_dumps(content) -> bytes:
+    return json.dumps(content).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.parse_args()
+    drivers_adapter = TypeAdapter(List[Driver])
+
+    print(f"{'entities':>9}  {'payload':<16}{'build ms':>9}{'validated':>10}{'json':>8}{'orjson':>8}"
+          f"{'cached':>8}{'bytes':>11}{'gzip':>10}")
+    for entities in (10_000, 100_000):
+        populate(entities)
+        payloads = (
+            ("drivers", endpoints._all_driver_responses, drivers_adapter),
+            ("state", endpoints._full_state, None),
+        )
+        for name, build, adapter in payloads:
+            view = build()
+            body = responses.dumps(view)
+            validated = (
+                f"{timed_ms(lambda: stdlib_dumps(jsonable_encoder(adapter.validate_python(view)))):>10.1f}"
+                if adapter is not None else f"{'-':>10}"
+            )
+            fast = f"{timed_ms(lambda: responses.orjson.dumps(view)):>8.1f}" if responses.orjson else f"{'-':>8}"
+            cached = timed_ms(lambda: endpoints.EncodedJSONResponse(body))
+            plain = timed_ms(lambda: stdlib_dumps(view))
+            print(f"{entities:>9}  {name:<16}{timed_ms(build):>9.1f}{validated}{plain:>8.1f}{fast}{cached:>8.2f}"
+                  f"{len(body):>11}{len(gzip.compress(body)):>10}")
+        positions = endpoints._driver_positions()
+        print(f"{entities:>9}  {'driver positions':<16}{timed_ms(endpoints._driver_positions):>9.1f}{'-':>10}{'-':>8}"
+              f"{'-':>8}{'-':>8}{len(positions):>11}{len(gzip.compress(positions)):>10}")
+
+
+if __name__ == "__main__":
+    main()
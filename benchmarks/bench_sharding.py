@@ -0,0 +1,104 @@
+"""
+Dispatch throughput of region-sharded worker processes vs worker count.
+
+Runs the same simulation (a fleet, then a burst of ride requests and a tick,
+repeated) on a single in-process DispatchService and on ShardedDispatcher
+with 1, 2, 4 and 8 regions. Reports ride requests dispatched per second,
+ticks per second and the share of requests that needed a cross-region
+search, and checks every region's consistency at the end.
+
+Scaling depends on the cores available; the CPU count is printed first.
+
+Run with: python -m benchmarks.bench_sharding
+"""
+import os
+import random
+import time
+
+from app.models.entities import Point, RideEntity
+from app.models.models import RideStatus
+from app.services.dispatch import DispatchService
+from app.services.sharding import ShardedDispatcher
+
+DRIVERS = 40_000
+RIDERS = 60_000
+ROUNDS = 30
+REQUESTS_PER_ROUND = 1_000
+WORKER_COUNTS = (1, 2, 4, 8)
+
+
+def point(rng: random.Random) -> Point:
+    return Point(rng.randrange(100), rng.randrange(100))
+
+
+def workload(seed: int = 5):
+    rng = random.Random(seed)
+    drivers = [point(rng) for _ in range(DRIVERS)]
+    rounds = [
+        [(rng.randrange(RIDERS), point(rng), point(rng)) for _ in range(REQUESTS_PER_ROUND)]
+        for _ in range(ROUNDS)
+    ]
+    return drivers, rounds
+
+
+def run_single(drivers, rounds):
+    service = DispatchService()
+    service.add_drivers([f"driver_{i}" for i in range(len(drivers))], drivers)
+    busy = set()
+    dispatch_s = tick_s = 0.0
+    next_ride = 0
+    for requests in rounds:
+        started = time.perf_counter()
+        for rider, pickup, dropoff in requests:
+            rider_id = f"rider_{rider}"
+            if rider_id in busy or service.active_request_for(rider_id):
+                continue
+            busy.add(rider_id)
+            ride = RideEntity(f"ride_{next_ride}", rider_id, pickup, dropoff, RideStatus.WAITING)
+            next_ride += 1
+            service.add_ride_request(ride)
+            service.assign_ride(ride.id)
+        dispatch_s += time.perf_counter() - started
+        started = time.perf_counter()
+        service.tick()
+        tick_s += time.perf_counter() - started
+        busy = set(service.active_request_by_rider)
+    assert not service.check_consistency()
+    return dispatch_s, tick_s, 0
+
+
+def run_sharded(workers, drivers, rounds):
+    with ShardedDispatcher(workers) as dispatcher:
+        dispatcher.add_drivers(drivers)
+        rider_ids = dispatcher.add_riders([Point(0, 0)] * RIDERS)
+        dispatch_s = tick_s = 0.0
+        requests_made = 0
+        for requests in rounds:
+            batch = [(rider_ids[rider], pickup, dropoff) for rider, pickup, dropoff in requests]
+            requests_made += len(batch)
+            started = time.perf_counter()
+            dispatcher.request_rides(batch)
+            dispatch_s += time.perf_counter() - started
+            started = time.perf_counter()
+            dispatcher.tick()
+            tick_s += time.perf_counter() - started
+        stats = dispatcher.stats()
+        assert all(not region["problems"] for region in stats), stats
+        assert sum(region["drivers"] for region in stats) == len(drivers)
+        return dispatch_s, tick_s, dispatcher.escalations / requests_made
+
+
+def main():
+    drivers, rounds = workload()
+    requests = ROUNDS * REQUESTS_PER_ROUND
+    print(f"cpus: {os.cpu_count()}, {DRIVERS} drivers, {ROUNDS} rounds of {REQUESTS_PER_ROUND} requests + 1 tick")
+    print(f"{'setup':<14}{'requests/s':>12}{'ticks/s':>10}{'cross-region':>14}")
+    dispatch_s, tick_s, _ = run_single(drivers, rounds)
+    print(f"{'single':<14}{requests / dispatch_s:>12,.0f}{ROUNDS / tick_s:>10,.0f}{'-':>14}")
+    for workers in WORKER_COUNTS:
+        dispatch_s, tick_s, escalated = run_sharded(workers, drivers, rounds)
+        print(f"{f'{workers} workers':<14}{requests / dispatch_s:>12,.0f}{ROUNDS / tick_s:>10,.0f}{escalated:>14.1%}")
+
+
+if __name__ == "__main__":
+    main()
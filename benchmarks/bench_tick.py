@@ -0,0 +1,100 @@
+"""
+Tick engine throughput.
+
+Compares the original per-trip Python loop (pydantic drivers, _move_towards
+style movement) with the array tick engine, first one tick per call and then
+advancing many ticks at once with tick_many(summary=True).
+
+Run with: python -m benchmarks.bench_tick
+"""
+import random
+import time
+
+from app.models.entities import Point, RideEntity
+from app.models.models import Driver, DriverStatus, Location, RideRequest, RideStatus
+from app.services.dispatch import DispatchService
+
+GRID = 100
+TICKS = 200
+TRIP_COUNTS = (1_000, 10_000)
+
+
+def legacy_tick(drivers, requests, active_trips):
+    """The per-trip loop as it was before the array tick engine."""
+    events = []
+    done = []
+    for ride_id, (driver_id, step) in active_trips.items():
+        driver = drivers[driver_id]
+        request = requests[ride_id]
+        target = request.pickup if step == "to_pickup" else request.dropoff
+        dx = target.x - driver.location.x
+        dy = target.y - driver.location.y
+        if dx != 0:
+            driver.location.x += 1 if dx > 0 else -1
+        elif dy != 0:
+            driver.location.y += 1 if dy > 0 else -1
+        if driver.location.x == target.x and driver.location.y == target.y:
+            events.append({"type": "pickup" if step == "to_pickup" else "dropoff", "ride_id": ride_id,
+                           "driver_id": driver_id,
+                           "location": {"x": driver.location.x, "y": driver.location.y}})
+            if step == "to_pickup":
+                active_trips[ride_id] = (driver_id, "to_dropoff")
+            else:
+                request.status = RideStatus.COMPLETED
+                driver.status = DriverStatus.AVAILABLE
+                done.append(ride_id)
+    for ride_id in done:
+        active_trips.pop(ride_id, None)
+    return events
+
+
+def build(trips: int, seed: int = 3):
+    rng = random.Random(seed)
+    service = DispatchService()
+    drivers, requests, active = {}, {}, {}
+    for i in range(trips):
+        start = Location(x=rng.randrange(GRID), y=rng.randrange(GRID))
+        pickup = Location(x=rng.randrange(GRID), y=rng.randrange(GRID))
+        dropoff = Location(x=rng.randrange(GRID), y=rng.randrange(GRID))
+        driver_id, ride_id = f"driver_{i}", f"ride_{i}"
+        service.add_driver(driver_id, Point.of(start))
+        ride = RideEntity(ride_id, ride_id, Point.of(pickup), Point.of(dropoff), RideStatus.WAITING)
+        service.add_ride_request(ride)
+        service.start_trip(ride, driver_id)
+
+        drivers[driver_id] = Driver(id=driver_id, location=start, status=DriverStatus.ON_TRIP)
+        requests[ride_id] = RideRequest(id=ride_id, rider_id=ride_id, pickup=pickup, dropoff=dropoff,
+                                        status=RideStatus.ASSIGNED)
+        active[ride_id] = (driver_id, "to_pickup")
+    return service, (drivers, requests, active)
+
+
+def main():
+    print(f"{'trips':>7} {'legacy loop':>14} {'tick()':>14} {'tick_many':>14}  (ticks per second)")
+    for trips in TRIP_COUNTS:
+        service, legacy = build(trips)
+        start = time.perf_counter()
+        for _ in range(TICKS):
+            legacy_tick(*legacy)
+        legacy_rate = TICKS / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(TICKS):
+            service.tick()
+        single_rate = TICKS / (time.perf_counter() - start)
+
+        # The engine must land in the same state as the legacy loop
+        drivers, _, active = legacy
+        assert dict(service.active_trips) == active
+        for driver_id, driver in drivers.items():
+            assert service.fleet.location_of(service.fleet.rows[driver_id]) == (driver.location.x, driver.location.y)
+
+        service, _ = build(trips)
+        start = time.perf_counter()
+        service.tick_many(TICKS, summary=True)
+        many_rate = TICKS / (time.perf_counter() - start)
+        print(f"{trips:>7} {legacy_rate:>14.0f} {single_rate:>14.0f} {many_rate:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Tiled indexes on a large, sparse city.
+
+Places drivers in a few dense clusters on a big grid (default 10k x 10k
+with 100k drivers, 90% of them clustered) and times the tiled structures
+against the flat scans they replace:
+
+    search     best driver for a pickup inside a cluster and in an empty
+               area: ring search skipping empty rings via the tiles, the
+               same ring search probing every cell, and a full vectorized
+               scan of the available drivers
+    viewport   drivers in a 100 x 100 box (GET /drivers/?bbox=): rows of
+               the tiles under the box vs a mask over every driver
+    tiles      per-tile driver counts (GET /tiles): tile sizes vs a
+               bincount over every driver
+    demand     recording requests and reading the decayed rates: counts
+               kept per occupied tile vs one dense array for the grid
+
+Run with: python -m benchmarks.bench_tiles --size 10000 --drivers 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.models.entities import Point, RideEntity
+from app.models.models import RideStatus
+from app.services.dispatch import DispatchService
+from app.services.spatial_index import SpatialIndex
+
+
+def clustered(rng: np.random.Generator, n: int, size: int, clusters: int, spread: float, share: float):
+    """n points, `share` of them normally spread around `clusters` random centers, the rest uniform."""
+    centers = rng.integers(0, size, (clusters, 2))
+    near = rng.random(n) < share
+    points = rng.integers(0, size, (n, 2))
+    points[near] = centers[rng.integers(0, clusters, near.sum())] + rng.normal(0, spread, (near.sum(), 2)).astype(int)
+    return np.clip(points, 0, size - 1), centers
+
+
+def timed_ms(fn, repeat: int) -> float:
+    """Mean milliseconds per call over `repeat` calls."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def full_scan(service: DispatchService, ride: RideEntity) -> int:
+    """The best driver by scoring every available one, as before the spatial index."""
+    fleet = service.fleet
+    rows = np.fromiter(service.available_index.entries, dtype=np.int64, count=len(service.available_index))
+    eta = np.abs(fleet.x[rows] - ride.pickup.x) + np.abs(fleet.y[rows] - ride.pickup.y)
+    scores = fleet.score(rows, ride.pickup.x, ride.pickup.y, max(1, int(eta.max())),
+                         max(1, int(fleet.rides[rows].max())), service.eta_weight, service.fairness_weight, eta=eta)
+    return fleet.best(rows, scores)[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=10_000, help="grid width and height")
+    parser.add_argument("--drivers", type=int, default=100_000)
+    parser.add_argument("--clusters", type=int, default=8)
+    parser.add_argument("--spread", type=float, default=150.0, help="standard deviation of a cluster, in units")
+    parser.add_argument("--share", type=float, default=0.9, help="share of drivers in clusters")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    points, centers = clustered(rng, args.drivers, args.size, args.clusters, args.spread, args.share)
+    started = time.perf_counter()
+    service = DispatchService(grid_width=args.size, grid_height=args.size)
+    service.add_drivers([f"d{i}" for i in range(args.drivers)], [Point(int(x), int(y)) for x, y in points])
+    loaded = time.perf_counter() - started
+    tiled = service.available_index
+    # The same ring search with a single tile for the whole grid: no ring is ever skipped
+    untiled = SpatialIndex(tile_cells=2 ** 40)
+    for row, (x, y, rides) in tiled.entries.items():
+        untiled.insert(row, x, y, rides)
+    print(f"{args.drivers} drivers on a {args.size}x{args.size} grid, {args.share:.0%} in {args.clusters} clusters "
+          f"(loaded in {loaded:.1f}s); {len(service.fleet.tiles)} of {(-(-args.size // service.fleet.tile_size)) ** 2} "
+          f"fleet tiles occupied")
+
+    def rides(pickups):
+        return [RideEntity(f"r{i}", "rider", Point(int(x), int(y)), Point(int(x), int(y)), RideStatus.WAITING)
+                for i, (x, y) in enumerate(pickups)]
+
+    near = centers[rng.integers(0, len(centers), args.queries)] + rng.normal(0, args.spread, (args.queries, 2))
+    dense = rides(np.clip(near.astype(int), 0, args.size - 1))
+    empty_points = rng.integers(0, args.size, (args.queries * 4, 2))
+    far = np.min(np.abs(empty_points[:, None, :] - centers[None, :, :]).max(axis=2), axis=1) > 6 * args.spread
+    empty = rides(empty_points[far][:args.queries])
+
+    print(f"\n{'search (ms per pickup)':<26}{'tiled':>9}{'untiled':>9}{'full scan':>11}")
+    for name, batch in (("pickup in a cluster", dense), ("pickup in an empty area", empty)):
+        def search(index):
+            service.available_index = index
+            for ride in batch:
+                service.rank_drivers(ride, 1)
+        results = {}
+        for label, index in (("tiled", tiled), ("untiled", untiled)):
+            results[label] = timed_ms(lambda: search(index), 1) / len(batch)
+        service.available_index = tiled
+        results["full"] = timed_ms(lambda: [full_scan(service, ride) for ride in batch], 1) / len(batch)
+        assert all(service.rank_drivers(ride, 1)[0][1] == full_scan(service, ride) for ride in batch[:20])
+        print(f"{name:<26}{results['tiled']:>9.3f}{results['untiled']:>9.3f}{results['full']:>11.3f}")
+
+    fleet = service.fleet
+    view = 100
+    boxes = [(x, y, x + view - 1, y + view - 1) for x, y in
+             np.concatenate((centers[rng.integers(0, len(centers), args.queries // 2)],
+                             rng.integers(0, args.size - view, (args.queries // 2, 2)))).tolist()]
+
+    def flat_box(x0, y0, x1, y1):
+        rows = fleet.live_rows()
+        x, y = fleet.x[rows], fleet.y[rows]
+        return rows[(x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)]
+
+    assert all(np.array_equal(fleet.rows_in(*box), flat_box(*box)) for box in boxes[:20])
+    print(f"\n{'ms per query':<26}{'tiled':>9}{'flat':>9}")
+    print(f"{f'viewport {view}x{view}':<26}{timed_ms(lambda: [fleet.rows_in(*b) for b in boxes], 1) / len(boxes):>9.3f}"
+          f"{timed_ms(lambda: [flat_box(*b) for b in boxes], 1) / len(boxes):>9.3f}")
+
+    def flat_counts():
+        rows = fleet.live_rows()
+        tiles = (fleet.x[rows] // fleet.tile_size).astype(np.int64) * args.size + fleet.y[rows] // fleet.tile_size
+        return np.unique(tiles, return_counts=True)
+
+    whole = (0, 0, args.size - 1, args.size - 1)
+    print(f"{'tile counts, whole grid':<26}{timed_ms(lambda: service.tile_report(*whole), 5):>9.3f}"
+          f"{timed_ms(flat_counts, 5):>9.3f}")
+
+    demand = service.demand
+    requests = points[rng.integers(0, len(points), 20_000)].tolist()
+    dense_counts = np.zeros((demand.window, *demand.shape), dtype=np.int32)
+
+    def record_dense():
+        for x, y in requests:
+            dense_counts[(0, *demand.cell_of(x, y))] += 1
+
+    def rates_dense():
+        weights = demand.decay ** np.arange(demand.window)
+        return np.tensordot(weights, dense_counts, axes=1) / (weights.sum() * demand.bucket_ticks)
+
+    record_tiled = timed_ms(lambda: [demand.record(x, y, 0) for x, y in requests], 1) / len(requests) * 1000
+    record_flat = timed_ms(record_dense, 1) / len(requests) * 1000
+    tiled_bytes = sum(counts.nbytes for counts in demand.tiles.values())
+    print(f"\n{'demand heatmap':<26}{'tiled':>9}{'dense':>9}")
+    print(f"{'record (us per request)':<26}{record_tiled:>9.2f}{record_flat:>9.2f}")
+    print(f"{'read rates (ms)':<26}{timed_ms(lambda: demand.rates(0), 5):>9.2f}{timed_ms(rates_dense, 5):>9.2f}")
+    print(f"{'counts (MB)':<26}{tiled_bytes / 2 ** 20:>9.2f}{dense_counts.nbytes / 2 ** 20:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Replay a workload file (see benchmarks.workload) against the dispatch
+service and report latency per operation, tick throughput and memory.
+
+Two targets:
+
+    direct  calls DispatchService methods, with the same checks the
+            endpoints make
+    asgi    sends the requests through the FastAPI app in process
+            (httpx ASGITransport, no network)
+
+Operations are replayed back to back in file order, as fast as possible;
+the timestamps only define the order. Operations that do not apply to the
+current state (e.g. rejecting a ride no driver is on the way to) are
+counted as skipped rather than failed.
+
+Run with: python -m benchmarks.replay benchmarks/workload.jsonl --target direct
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+
+from benchmarks.workload import read_workload
+from app.models.entities import Point, RideEntity, RiderEntity
+from app.models.models import DriverStatus, RideStatus
+from app.services.dispatch import DispatchService
+
+OK = "ok"
+SKIPPED = "skipped"
+
+
+def rss_bytes() -> int:
+    """Current resident set size, falling back to the peak where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class DirectTarget:
+    """Applies operations straight to a DispatchService."""
+
+    def __init__(self, service: DispatchService):
+        self.service = service
+        self.ride_by_rider = {}  # workload rider ID -> latest ride ID
+        self._next_ride = 0
+
+    def apply(self, op: dict) -> str:
+        return getattr(self, op["op"])(op)
+
+    def add_driver(self, op: dict) -> str:
+        self.service.add_driver(op["id"], Point(**op["location"]))
+        return OK
+
+    def add_rider(self, op: dict) -> str:
+        self.service.add_rider(RiderEntity(op["id"], Point(**op["location"])))
+        return OK
+
+    def set_status(self, op: dict) -> str:
+        service = self.service
+        if op["driver"] not in service.fleet or service.driver_status(op["driver"]) == DriverStatus.ON_TRIP:
+            return SKIPPED
+        service.set_driver_status(op["driver"], DriverStatus(op["status"]))
+        return OK
+
+    def request_ride(self, op: dict) -> str:
+        service = self.service
+        if op["rider"] not in service.riders or service.active_request_for(op["rider"]):
+            return SKIPPED
+        ride_request = RideEntity(
+            f"ride_{self._next_ride:08x}", op["rider"],
+            Point(**op["pickup"]), Point(**op["dropoff"]), RideStatus.WAITING
+        )
+        self._next_ride += 1
+        service.add_ride_request(ride_request)
+        service.submit_ride(ride_request.id)
+        self.ride_by_rider[op["rider"]] = ride_request.id
+        return OK
+
+    def reject(self, op: dict) -> str:
+        ride_request = self._ride_of(op["rider"])
+        trip = self.service.active_trips.get(ride_request.id) if ride_request else None
+        if trip is None or trip[1] != "to_pickup":
+            return SKIPPED
+        self.service.reject_ride(ride_request, trip[0])
+        return OK
+
+    def cancel(self, op: dict) -> str:
+        ride_request = self._ride_of(op["rider"])
+        if ride_request is None or ride_request.status not in (RideStatus.WAITING, RideStatus.ASSIGNED):
+            return SKIPPED
+        self.service.cancel_ride(ride_request)
+        return OK
+
+    def tick(self, op: dict) -> str:
+        self.service.tick()
+        return OK
+
+    def _ride_of(self, rider_id: str):
+        ride_id = self.ride_by_rider.get(rider_id)
+        return self.service.get_ride(ride_id) if ride_id else None
+
+
+class AsgiTarget:
+    """Sends operations as HTTP requests to the FastAPI app, in process."""
+
+    def __init__(self, client):
+        self.client = client
+        self.ids = {}  # workload driver/rider ID -> service ID
+        self.ride_by_rider = {}  # workload rider ID -> latest ride ID
+
+    async def apply(self, op: dict) -> str:
+        return await getattr(self, op["op"])(op)
+
+    async def add_driver(self, op: dict) -> str:
+        response = await self.client.post("/api/drivers/", json=op["location"])
+        self.ids[op["id"]] = response.json()["id"]
+        return OK
+
+    async def add_rider(self, op: dict) -> str:
+        response = await self.client.post("/api/riders/", json=op["location"])
+        self.ids[op["id"]] = response.json()["id"]
+        return OK
+
+    async def set_status(self, op: dict) -> str:
+        response = await self.client.put(
+            f"/api/drivers/{self.ids[op['driver']]}/status", params={"status": op["status"]}
+        )
+        return self._outcome(response)
+
+    async def request_ride(self, op: dict) -> str:
+        response = await self.client.post("/api/rides/request", json={
+            "rider_id": self.ids[op["rider"]], "pickup": op["pickup"], "dropoff": op["dropoff"],
+        })
+        if response.status_code == 200:
+            self.ride_by_rider[op["rider"]] = response.json()["id"]
+        return self._outcome(response)
+
+    async def reject(self, op: dict) -> str:
+        ride_id = self.ride_by_rider.get(op["rider"])
+        if ride_id is None:
+            return SKIPPED
+        ride = (await self.client.get(f"/api/rides/{ride_id}")).json()
+        if ride["status"] != RideStatus.ASSIGNED.value:
+            return SKIPPED
+        response = await self.client.put(f"/api/rides/{ride_id}/reject", json=ride["assigned_driver_id"])
+        return self._outcome(response)
+
+    async def cancel(self, op: dict) -> str:
+        ride_id = self.ride_by_rider.get(op["rider"])
+        if ride_id is None:
+            return SKIPPED
+        return self._outcome(await self.client.put(f"/api/rides/{ride_id}/cancel"))
+
+    async def tick(self, op: dict) -> str:
+        return self._outcome(await self.client.post("/api/tick"))
+
+    @staticmethod
+    def _outcome(response) -> str:
+        if response.status_code == 400:
+            return SKIPPED
+        response.raise_for_status()
+        return OK
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # op -> nanoseconds
+        self.skipped = defaultdict(int)
+
+    def record(self, op: str, outcome: str, elapsed_ns: int) -> None:
+        self.latencies[op].append(elapsed_ns)
+        if outcome == SKIPPED:
+            self.skipped[op] += 1
+
+    def report(self) -> dict:
+        ops = {}
+        for op, samples in sorted(self.latencies.items()):
+            micros = np.array(samples) / 1000
+            p50, p95, p99 = np.percentile(micros, [50, 95, 99])
+            ops[op] = {
+                "count": len(samples), "skipped": self.skipped[op],
+                "p50_us": round(p50, 1), "p95_us": round(p95, 1), "p99_us": round(p99, 1),
+                "total_ms": round(micros.sum() / 1000, 1),
+            }
+        return ops
+
+
+def replay_direct(ops, service: DispatchService, recorder: Recorder) -> None:
+    target = DirectTarget(service)
+    clock = time.perf_counter_ns
+    for op in ops:
+        start = clock()
+        outcome = target.apply(op)
+        recorder.record(op["op"], outcome, clock() - start)
+
+
+async def replay_asgi(ops, service: DispatchService, recorder: Recorder) -> None:
+    import httpx
+
+    from app.api import endpoints
+    from app.main import app
+
+    endpoints.dispatch_service = endpoints.runtime.backend = service
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay") as client:
+        target = AsgiTarget(client)
+        clock = time.perf_counter_ns
+        for op in ops:
+            start = clock()
+            outcome = await target.apply(op)
+            recorder.record(op["op"], outcome, clock() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("workload")
+    parser.add_argument("--target", choices=("direct", "asgi"), default="direct")
+    parser.add_argument("--mode", choices=("greedy", "batch"), default="greedy", help="dispatch mode")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="also report Python heap growth (slows the replay down)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    ops = [op for op in read_workload(args.workload) if op["op"] != "meta"]
+    service = DispatchService(dispatch_mode=args.mode)
+    recorder = Recorder()
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    if args.target == "direct":
+        replay_direct(ops, service, recorder)
+    else:
+        asyncio.run(replay_asgi(ops, service, recorder))
+    wall = time.perf_counter() - started
+    rss_after = rss_bytes()
+
+    per_op = recorder.report()
+    ticks = per_op.get("tick", {"count": 0, "total_ms": 0})
+    report = {
+        "target": args.target,
+        "mode": args.mode,
+        "operations": len(ops),
+        "wall_s": round(wall, 3),
+        "ops_per_s": round(len(ops) / wall, 1),
+        "ticks_per_s": round(ticks["count"] / wall, 1),
+        "tick_only_per_s": round(ticks["count"] / (ticks["total_ms"] / 1000), 1) if ticks["total_ms"] else None,
+        "rss_growth_mb": round((rss_after - rss_before) / 2**20, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "per_op": per_op,
+        "consistency_problems": len(service.check_consistency()),
+    }
+    if args.tracemalloc:
+        current, peak = tracemalloc.get_traced_memory()
+        report["heap_mb"] = round(current / 2**20, 1)
+        report["heap_peak_mb"] = round(peak / 2**20, 1)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{args.target} replay, {args.mode} dispatch: {len(ops)} ops in {wall:.2f}s "
+          f"({report['ops_per_s']:,.0f} ops/s)")
+    print(f"ticks/s: {report['ticks_per_s']} overall, {report['tick_only_per_s']} tick-only")
+    print(f"memory: RSS +{report['rss_growth_mb']} MB, peak {report['peak_rss_mb']} MB"
+          + (f", heap {report['heap_mb']} MB (peak {report['heap_peak_mb']} MB)" if args.tracemalloc else ""))
+    print(f"\n{'operation':<14}{'count':>8}{'skipped':>9}{'p50 us':>10}{'p95 us':>10}{'p99 us':>10}")
+    for op, stats in per_op.items():
+        print(f"{op:<14}{stats['count']:>8}{stats['skipped']:>9}"
+              f"{stats['p50_us']:>10}{stats['p95_us']:>10}{stats['p99_us']:>10}")
+    if report["consistency_problems"]:
+        print(f"\nWARNING: {report['consistency_problems']} consistency problems after replay")
+
+
+if __name__ == "__main__":
+    main()
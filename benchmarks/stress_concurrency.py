@@ -0,0 +1,164 @@
+"""
+Concurrency stress test: many clients hammer ride requests, accept, reject,
+cancel, driver status changes, ticks and reads in parallel against a real
+uvicorn server, then the dispatch state is checked for invariants.
+
+The server runs as a separate uvicorn process so the clients do not
+compete with it for the GIL. At the end, GET /api/consistency must report no
+problems, and no update may have been lost: every ride the server
+acknowledged must still exist, and the ride, driver and rider totals must
+match what the clients created. Exits non-zero when a check fails.
+
+Run with: python -m benchmarks.stress_concurrency --clients 32 --seconds 10
+"""
+import argparse
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+import httpx
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int) -> subprocess.Popen:
+    server = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+    ])
+    for _ in range(200):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError("server did not start")
+
+
+class Client(threading.Thread):
+    """One simulated client issuing random operations until the deadline."""
+
+    OPERATIONS = ("request", "request", "accept", "reject", "cancel", "tick", "status", "read")
+
+    def __init__(self, base_url: str, drivers, riders, deadline: float, seed: int):
+        super().__init__(daemon=True)
+        self.http = httpx.Client(base_url=base_url, timeout=30)
+        self.drivers = drivers
+        self.riders = riders
+        self.deadline = deadline
+        self.rng = random.Random(seed)
+        self.rides = []  # ride IDs this client created
+        self.codes = Counter()  # (operation, status code) -> count
+        self.latencies = []
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            operation = self.rng.choice(self.OPERATIONS)
+            started = time.perf_counter()
+            response = getattr(self, operation)()
+            self.latencies.append(time.perf_counter() - started)
+            self.codes[operation, response.status_code] += 1
+
+    def request(self):
+        point = lambda: {"x": self.rng.randrange(100), "y": self.rng.randrange(100)}
+        response = self.http.post("/api/rides/request", json={
+            "rider_id": self.rng.choice(self.riders), "pickup": point(), "dropoff": point(),
+        })
+        if response.status_code == 200:
+            self.rides.append(response.json()["id"])
+        return response
+
+    def accept(self):
+        return self.http.put(f"/api/rides/{self._ride()}/accept", json=self.rng.choice(self.drivers))
+
+    def reject(self):
+        return self.http.put(f"/api/rides/{self._ride()}/reject", json=self.rng.choice(self.drivers))
+
+    def cancel(self):
+        return self.http.put(f"/api/rides/{self._ride()}/cancel")
+
+    def tick(self):
+        return self.http.post("/api/tick")
+
+    def status(self):
+        status = self.rng.choice(("available", "offline"))
+        return self.http.put(f"/api/drivers/{self.rng.choice(self.drivers)}/status", params={"status": status})
+
+    def read(self):
+        return self.http.get(self.rng.choice(("/api/drivers/", "/api/state", "/api/rides/?limit=50")))
+
+    def _ride(self) -> str:
+        return self.rng.choice(self.rides) if self.rides else "ride_missing"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--drivers", type=int, default=200)
+    parser.add_argument("--riders", type=int, default=400)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = start_server(port)
+    base_url = f"http://127.0.0.1:{port}"
+    with httpx.Client(base_url=base_url) as http:
+        point = lambda i: {"x": (i * 37) % 100, "y": (i * 61) % 100}
+        drivers = [r["id"] for r in http.post("/api/drivers/bulk", json=[point(i) for i in range(args.drivers)]).json()["results"]]
+        riders = [r["id"] for r in http.post("/api/riders/bulk", json=[point(i) for i in range(args.riders)]).json()["results"]]
+
+    deadline = time.monotonic() + args.seconds
+    clients = [Client(base_url, drivers, riders, deadline, seed) for seed in range(args.clients)]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - started
+
+    codes = sum((client.codes for client in clients), Counter())
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    created = [ride_id for client in clients for ride_id in client.rides]
+
+    with httpx.Client(base_url=base_url, timeout=60) as http:
+        problems = http.get("/api/consistency").json()["problems"]
+        missing = [ride_id for ride_id in created if http.get(f"/api/rides/{ride_id}").status_code != 200]
+        if missing:
+            problems.append(f"{len(missing)} acknowledged rides are missing, e.g. {missing[0]}")
+        state = http.get("/api/state").json()
+        ride_total = len(state["ride_requests"]) + state["archived_rides"]
+        if ride_total != len(created):
+            problems.append(f"server holds {ride_total} rides, clients created {len(created)}")
+        if len(state["drivers"]) != len(drivers) or len(state["riders"]) != len(riders):
+            problems.append("driver or rider count changed")
+    server.terminate()
+    server.wait()
+
+    print(f"{args.clients} clients, {len(latencies)} requests in {elapsed:.1f}s "
+          f"({len(latencies) / elapsed:,.0f} req/s), "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    for (operation, code), count in sorted(codes.items()):
+        print(f"  {operation:<8} {code}  {count}")
+    errors = sum(count for (_, code), count in codes.items() if code >= 500 and code != 503)
+    if errors:
+        problems.append(f"{errors} server errors")
+    if problems:
+        print("FAILED:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print(f"OK: {len(created)} rides, state consistent")
+
+
+if __name__ == "__main__":
+    main()
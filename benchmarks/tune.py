@@ -0,0 +1,271 @@
+"""
+Offline tuning of dispatch settings.
+
+Replays one workload (see benchmarks.workload) against a fresh, headless
+DispatchService for every combination of the given settings, spread over
+a process pool, and prints one row of outcomes per run. The workload is
+encoded once as an int32 array in shared memory, which every worker maps
+instead of receiving a copy. Runs are deterministic: the same workload
+and settings give the same outcome.
+
+Drivers follow the service's simulated decision model: a driver given a
+ride whose pickup is farther than rejection_distance declines it before
+pickup, and the ride goes to the next best driver; it fails once
+max_rejection_attempts drivers have declined it (fail_fast_rejections,
+which the live service leaves off). The workload's own reject and cancel operations
+are applied as in the replay benchmark. After the workload, --drain ticks
+without new demand let trips in progress finish.
+
+Columns:
+
+    fulfilled   share of requested rides that were completed
+    eta mean    pickup ETA (ticks) when a driver accepted, mean and p95
+    gini        Gini coefficient of completed rides per driver (0: even)
+    wall s      run time of the replay in its worker
+
+Run with: python -m benchmarks.tune benchmarks/workload.jsonl --eta-weight 0.5,0.7,0.9 --rejection-distance 10,20,40
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from benchmarks.workload import read_workload
+from app.models.entities import Point, RideEntity, RiderEntity
+from app.models.models import DriverStatus, RideStatus
+from app.services.dispatch import DispatchService
+from app.services.trips import DROPOFF
+
+# Operation codes of the encoded workload, one row of (code, a, b, c, d, e)
+# per operation; drivers and riders are referred to by their index
+ADD_DRIVER, ADD_RIDER, SET_STATUS, REQUEST_RIDE, REJECT, CANCEL, TICK = range(7)
+ROW_WIDTH = 6
+OFFLINE, AVAILABLE = 0, 1
+
+# Settings that can be swept, with their type
+SETTINGS = {
+    "eta_weight": float,
+    "fairness_weight": float,
+    "max_rejection_attempts": int,
+    "rejection_distance": int,
+}
+
+
+def _index(entity_id: str) -> int:
+    return int(entity_id[1:])  # "d12" -> 12
+
+
+def encode(ops) -> np.ndarray:
+    """Workload operations as an (n, ROW_WIDTH) int32 array."""
+    rows = []
+    for op in ops:
+        kind = op["op"]
+        if kind in ("add_driver", "add_rider"):
+            code = ADD_DRIVER if kind == "add_driver" else ADD_RIDER
+            rows.append((code, _index(op["id"]), op["location"]["x"], op["location"]["y"], 0, 0))
+        elif kind == "set_status":
+            status = AVAILABLE if op["status"] == DriverStatus.AVAILABLE.value else OFFLINE
+            rows.append((SET_STATUS, _index(op["driver"]), status, 0, 0, 0))
+        elif kind == "request_ride":
+            pickup, dropoff = op["pickup"], op["dropoff"]
+            rows.append((REQUEST_RIDE, _index(op["rider"]), pickup["x"], pickup["y"], dropoff["x"], dropoff["y"]))
+        elif kind == "reject":
+            rows.append((REJECT, _index(op["rider"]), 0, 0, 0, 0))
+        elif kind == "cancel":
+            rows.append((CANCEL, _index(op["rider"]), 0, 0, 0, 0))
+        elif kind == "tick":
+            rows.append((TICK, 0, 0, 0, 0, 0))
+    return np.array(rows, dtype=np.int32).reshape(-1, ROW_WIDTH)
+
+
+def gini(counts: np.ndarray) -> float:
+    """Gini coefficient of non-negative counts: 0 when all equal, towards 1 when one has everything."""
+    total = counts.sum()
+    if total == 0:
+        return 0.0
+    ranked = np.sort(counts)
+    n = len(ranked)
+    return float(2 * (np.arange(1, n + 1) * ranked).sum() / (n * total) - (n + 1) / n)
+
+
+class Simulation:
+    """One headless replay of an encoded workload against a DispatchService."""
+
+    def __init__(self, service: DispatchService, drivers: int):
+        # Without it a far pickup is declined by every available driver in turn
+        service.configure(fail_fast_rejections=True)
+        self.service = service
+        self.ride_by_rider = {}  # rider index -> latest ride ID
+        self.accepted_by = {}  # ride ID -> driver who accepted it
+        self.requested = 0
+        self.etas = []  # pickup ETA of each accepted ride
+        self.completed = np.zeros(drivers, dtype=np.int64)  # completed rides per driver index
+
+    def run(self, workload: np.ndarray, drain: int) -> None:
+        for code, a, b, c, d, e in workload.tolist():
+            if code == ADD_DRIVER:
+                self.service.add_driver(f"d{a}", Point(b, c))
+            elif code == ADD_RIDER:
+                self.service.add_rider(RiderEntity(f"r{a}", Point(b, c)))
+            elif code == SET_STATUS:
+                self.set_status(f"d{a}", DriverStatus.AVAILABLE if b == AVAILABLE else DriverStatus.OFFLINE)
+            elif code == REQUEST_RIDE:
+                self.request_ride(a, Point(b, c), Point(d, e))
+            elif code == REJECT:
+                self.reject(a)
+            elif code == CANCEL:
+                self.cancel(a)
+            elif code == TICK:
+                self.tick()
+        for _ in range(drain):
+            self.tick()
+
+    def set_status(self, driver_id: str, status: DriverStatus) -> None:
+        service = self.service
+        if driver_id in service.fleet and service.driver_status(driver_id) != DriverStatus.ON_TRIP:
+            service.set_driver_status(driver_id, status)
+
+    def request_ride(self, rider: int, pickup: Point, dropoff: Point) -> None:
+        service = self.service
+        rider_id = f"r{rider}"
+        if rider_id not in service.riders or service.active_request_for(rider_id):
+            return
+        ride_request = RideEntity(f"ride_{self.requested:08x}", rider_id, pickup, dropoff, RideStatus.WAITING)
+        self.requested += 1
+        service.add_ride_request(ride_request)
+        service.submit_ride(ride_request.id)
+        self.ride_by_rider[rider] = ride_request.id
+        self.decide(ride_request.id)
+
+    def reject(self, rider: int) -> None:
+        """The driver on the way to the rider's pickup declines the ride."""
+        ride_request = self._ride_of(rider)
+        trip = self.service.active_trips.get(ride_request.id) if ride_request else None
+        if trip is not None and trip[1] == "to_pickup":
+            self.service.reject_ride(ride_request, trip[0])
+            self.decide(ride_request.id)
+
+    def cancel(self, rider: int) -> None:
+        ride_request = self._ride_of(rider)
+        if ride_request is not None and ride_request.status in (RideStatus.WAITING, RideStatus.ASSIGNED):
+            self.service.cancel_ride(ride_request)
+
+    def tick(self) -> None:
+        for event in self.service.tick():
+            if event["type"] == DROPOFF:
+                self.completed[int(event["driver_id"][1:])] += 1
+        # Rides handed to drivers during the tick (from the pending queue)
+        for ride_id, (driver_id, step) in list(self.service.active_trips.items()):
+            if step == "to_pickup" and self.accepted_by.get(ride_id) != driver_id:
+                self.decide(ride_id)
+
+    def decide(self, ride_id: str) -> None:
+        """Let the assigned driver accept or decline the ride, until one accepts or none is left."""
+        service = self.service
+        while True:
+            trip = service.active_trips.get(ride_id)
+            if trip is None or trip[1] != "to_pickup":
+                return
+            driver_id = trip[0]
+            ride_request = service.get_ride(ride_id)
+            if service.simulate_driver_decision(driver_id, ride_id):
+                self.accepted_by[ride_id] = driver_id
+                self.etas.append(service.calculate_eta(driver_id, ride_request.pickup))
+                return
+            service.reject_ride(ride_request, driver_id)
+
+    def _ride_of(self, rider: int):
+        ride_id = self.ride_by_rider.get(rider)
+        return self.service.get_ride(ride_id) if ride_id else None
+
+
+# The shared workload, mapped once per worker process by _attach
+_memory = None
+_workload = None
+
+
+def _attach(name: str, shape: tuple) -> None:
+    global _memory, _workload
+    _memory = SharedMemory(name=name)
+    _workload = np.ndarray(shape, dtype=np.int32, buffer=_memory.buf)
+
+
+def run(settings: dict, drain: int) -> dict:
+    """Replay the shared workload with `settings` applied; the outcome row."""
+    started = time.perf_counter()
+    drivers = int(_workload[_workload[:, 0] == ADD_DRIVER, 1].max()) + 1
+    service = DispatchService()
+    service.configure(**settings)
+    simulation = Simulation(service, drivers)
+    simulation.run(_workload, drain)
+    etas = np.array(simulation.etas, dtype=np.float64)
+    return {
+        **settings,
+        "requested": simulation.requested,
+        "fulfilled": round(int(simulation.completed.sum()) / max(simulation.requested, 1), 4),
+        "eta_mean": round(float(etas.mean()), 2) if len(etas) else None,
+        "eta_p95": round(float(np.percentile(etas, 95)), 2) if len(etas) else None,
+        "gini": round(gini(simulation.completed), 4),
+        "wall_s": round(time.perf_counter() - started, 3),
+    }
+
+
+def sweep(workload: np.ndarray, grid: list, drain: int, workers: int) -> list:
+    """Run every settings dict in `grid` on a pool of `workers` processes sharing `workload`."""
+    memory = SharedMemory(create=True, size=max(workload.nbytes, 1))
+    try:
+        np.ndarray(workload.shape, dtype=np.int32, buffer=memory.buf)[:] = workload
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_attach,
+            initargs=(memory.name, workload.shape),
+        ) as pool:
+            return list(pool.map(run, grid, itertools.repeat(drain)))
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("workload")
+    for name, kind in SETTINGS.items():
+        default = getattr(DispatchService(), name)
+        parser.add_argument(f"--{name.replace('_', '-')}", default=str(default),
+                            help=f"comma-separated values to try (default {default})")
+    parser.add_argument("--drain", type=int, default=200, help="ticks without new demand after the workload")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    workload = encode(read_workload(args.workload))
+    values = {name: [kind(v) for v in getattr(args, name).split(",")] for name, kind in SETTINGS.items()}
+    grid = [dict(zip(values, combination)) for combination in itertools.product(*values.values())]
+
+    started = time.perf_counter()
+    results = sweep(workload, grid, args.drain, args.workers)
+    wall = time.perf_counter() - started
+    results.sort(key=lambda r: (-r["fulfilled"], r["eta_mean"] if r["eta_mean"] is not None else float("inf")))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{len(grid)} runs of {len(workload)} operations on {args.workers} workers in {wall:.1f}s "
+          f"({workload.nbytes / 2**20:.1f} MB workload in shared memory)")
+    print(f"{'eta w':>6}{'fair w':>7}{'attempts':>9}{'reject >':>9}{'fulfilled':>10}{'eta mean':>9}{'eta p95':>8}"
+          f"{'gini':>7}{'wall s':>8}")
+    for r in results:
+        print(f"{r['eta_weight']:>6}{r['fairness_weight']:>7}{r['max_rejection_attempts']:>9}"
+              f"{r['rejection_distance']:>9}{r['fulfilled']:>10.2%}{r['eta_mean']!s:>9}{r['eta_p95']!s:>8}"
+              f"{r['gini']:>7}{r['wall_s']:>8}")
+
+
+if __name__ == "__main__":
+    main()
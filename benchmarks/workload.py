@@ -0,0 +1,141 @@
+"""
+Synthetic workload generator for the replay benchmark.
+
+Writes one JSON operation per line, in timestamp order. Each line has a
+"ts" (seconds since the start of the run) and an "op":
+
+    meta          generator settings, first line only
+    add_driver    {"id", "location"}
+    add_rider     {"id", "location"}
+    set_status    {"driver", "status"}         driver going offline/available
+    request_ride  {"rider", "pickup", "dropoff"}
+    reject        {"rider"}                    the driver assigned to the rider's ride rejects it
+    cancel        {"rider"}                    rider cancels their ride
+    tick          {}
+
+Drivers and riders are referred to by workload IDs; rides by their rider,
+since ride IDs are only known once the service creates them. For the same
+reason a reject names no driver: whoever holds the ride at replay time
+declines it. Pickups are
+drawn uniformly or, for a share of requests, around a few hotspots.
+
+Run with: python -m benchmarks.workload --drivers 5000 --ticks 500 --out benchmarks/workload.jsonl
+"""
+import argparse
+import json
+from typing import Iterator
+
+import numpy as np
+
+GRID_SIZE = 100
+DEFAULT_OUT = "benchmarks/workload.jsonl"
+
+
+def generate(
+    drivers: int = 1000,
+    riders: int = 5000,
+    ticks: int = 200,
+    demand: float = 20.0,
+    hotspots: int = 3,
+    hotspot_share: float = 0.6,
+    hotspot_radius: float = 6.0,
+    reject_rate: float = 0.1,
+    cancel_rate: float = 0.02,
+    churn_rate: float = 0.002,
+    tick_seconds: float = 1.0,
+    seed: int = 0,
+) -> Iterator[dict]:
+    """
+    Yield workload operations in timestamp order.
+
+    `demand` is the mean number of ride requests per tick (Poisson);
+    `reject_rate` and `cancel_rate` are per-request probabilities of a
+    follow-up reject or cancel within the same tick; `churn_rate` is the
+    per-driver, per-tick probability of toggling offline/available.
+    """
+    rng = np.random.default_rng(seed)
+    yield {"ts": 0.0, "op": "meta", "grid": GRID_SIZE, "drivers": drivers, "riders": riders,
+           "ticks": ticks, "demand": demand, "hotspots": hotspots, "hotspot_share": hotspot_share,
+           "reject_rate": reject_rate, "cancel_rate": cancel_rate, "churn_rate": churn_rate, "seed": seed}
+
+    def location(x, y) -> dict:
+        return {"x": int(x), "y": int(y)}
+
+    for i, (x, y) in enumerate(rng.integers(0, GRID_SIZE, size=(drivers, 2))):
+        yield {"ts": 0.0, "op": "add_driver", "id": f"d{i}", "location": location(x, y)}
+    for i, (x, y) in enumerate(rng.integers(0, GRID_SIZE, size=(riders, 2))):
+        yield {"ts": 0.0, "op": "add_rider", "id": f"r{i}", "location": location(x, y)}
+
+    centers = rng.integers(0, GRID_SIZE, size=(max(hotspots, 1), 2))
+    offline = np.zeros(drivers, dtype=bool)
+    for tick in range(ticks):
+        start = tick * tick_seconds
+        ops = []
+
+        for driver in np.flatnonzero(rng.random(drivers) < churn_rate).tolist():
+            offline[driver] = not offline[driver]
+            ops.append({"op": "set_status", "driver": f"d{driver}",
+                        "status": "offline" if offline[driver] else "available"})
+
+        count = int(rng.poisson(demand))
+        rider_ids = rng.integers(0, riders, size=count)
+        pickups = rng.integers(0, GRID_SIZE, size=(count, 2))
+        near_hotspot = (rng.random(count) < hotspot_share) & (hotspots > 0)
+        spots = centers[rng.integers(0, len(centers), size=count)]
+        jitter = rng.normal(0, hotspot_radius, size=(count, 2)).round().astype(int)
+        pickups = np.where(near_hotspot[:, None], np.clip(spots + jitter, 0, GRID_SIZE - 1), pickups)
+        dropoffs = rng.integers(0, GRID_SIZE, size=(count, 2))
+        for rider, pickup, dropoff in zip(rider_ids.tolist(), pickups, dropoffs):
+            ops.append({"op": "request_ride", "rider": f"r{rider}",
+                        "pickup": location(*pickup), "dropoff": location(*dropoff)})
+            if rng.random() < reject_rate:
+                ops.append({"op": "reject", "rider": f"r{rider}"})
+            elif rng.random() < cancel_rate:
+                ops.append({"op": "cancel", "rider": f"r{rider}"})
+
+        # Spread the tick's operations over its interval; the tick closes it
+        offsets = np.sort(rng.random(len(ops))) * tick_seconds
+        for op, offset in zip(ops, offsets.tolist()):
+            yield {"ts": round(start + offset, 6), **op}
+        yield {"ts": round(start + tick_seconds, 6), "op": "tick"}
+
+
+def read_workload(path: str) -> Iterator[dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--drivers", type=int, default=1000)
+    parser.add_argument("--riders", type=int, default=5000)
+    parser.add_argument("--ticks", type=int, default=200)
+    parser.add_argument("--demand", type=float, default=20.0, help="mean ride requests per tick")
+    parser.add_argument("--hotspots", type=int, default=3)
+    parser.add_argument("--hotspot-share", type=float, default=0.6, help="share of pickups near a hotspot")
+    parser.add_argument("--hotspot-radius", type=float, default=6.0)
+    parser.add_argument("--reject-rate", type=float, default=0.1)
+    parser.add_argument("--cancel-rate", type=float, default=0.02)
+    parser.add_argument("--churn-rate", type=float, default=0.002)
+    parser.add_argument("--tick-seconds", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=DEFAULT_OUT)
+    args = parser.parse_args()
+
+    count = 0
+    with open(args.out, "w") as f:
+        for op in generate(
+            drivers=args.drivers, riders=args.riders, ticks=args.ticks, demand=args.demand,
+            hotspots=args.hotspots, hotspot_share=args.hotspot_share, hotspot_radius=args.hotspot_radius,
+            reject_rate=args.reject_rate, cancel_rate=args.cancel_rate, churn_rate=args.churn_rate,
+            tick_seconds=args.tick_seconds, seed=args.seed,
+        ):
+            f.write(json.dumps(op, separators=(",", ":")) + "\n")
+            count += 1
+    print(f"wrote {count} operations to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
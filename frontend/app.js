@@ -1,8 +1,14 @@
 // Configuration
 // const API_URL = 'http://localhost:8000';
 const API_URL = window.location.origin;
-const GRID_SIZE = 100;
 const GRID_SCALE = 6; // 6px per grid unit
+// The grid shows a viewport of at most this many units a side; larger
+// cities are panned, and drivers in view are fetched with ?bbox=
+const VIEW_SIZE = 100;
+// Above this many drivers the grid draws them on a canvas from the binary
+// /api/drivers/positions feed instead of one element per driver
+const CANVAS_DRIVER_THRESHOLD = 2000;
+const DRIVER_COLORS = ['#3498db', '#9b59b6', '#95a5a6']; // by status code: available, on trip, offline
 
 // State variables
 let drivers = [];
@@ -11,12 +17,32 @@ let rideRequests = [];
 let activeTrips = [];
 let gridElement;
 
+// City size from /api/grid-info, and the top-left corner of the viewport
+let gridWidth = 100;
+let gridHeight = 100;
+const viewport = { x: 0, y: 0 };
+
+// Local replica of the server state, patched with deltas from /api/state?since=
+let stateVersion = null;
+const stateMaps = {
+    drivers: new Map(),
+    riders: new Map(),
+    ride_requests: new Map(),
+    active_trips: new Map()
+};
+
 // State for grid interaction
 let gridMode = 'none'; // 'driver', 'rider', or 'none'
 
 // Loading state management
 let isLoading = false;
 
+// Server-side simulation clock state (see /api/clock)
+let clockRunning = false;
+
+// The stream sends at most one delta per this many ms, so a fast clock is sampled
+const STREAM_INTERVAL_MS = 200;
+
 // Enhanced notification system with animations
 function showNotification(message, type = 'info', duration = 3000) {
     // Remove existing notifications with fade out
@@ -185,6 +211,8 @@ window.addEventListener('load', () => {
     
     // Set up event listeners
     document.getElementById('tickButton').addEventListener('click', advanceSimulation);
+    document.getElementById('clockButton').addEventListener('click', toggleClock);
+    document.getElementById('clockRate').addEventListener('change', setClockRate);
     document.getElementById('addDriverButton').addEventListener('click', addDriver);
     document.getElementById('addRiderButton').addEventListener('click', addRider);
     document.getElementById('requestRideButton').addEventListener('click', requestRide);
@@ -196,11 +224,18 @@ window.addEventListener('load', () => {
     // Add mode toggle buttons
     addModeToggleButtons();
 
-    // Initialize the grid
-    initGrid();
-
-    // Load initial state
-    refreshState();
+    // Size the grid to the city, then load the initial state and follow
+    // server-pushed updates
+    fetch(`${API_URL}/api/grid-info`)
+        .then(res => res.json())
+        .then(info => { gridWidth = info.width; gridHeight = info.height; })
+        .catch(() => {})
+        .then(() => {
+            initGrid();
+            return refreshState();
+        })
+        .then(connectStateStream);
+    fetch(`${API_URL}/api/clock`).then(res => res.json()).then(updateClockControls).catch(() => {});
 });
 
 // Add mode toggle buttons to the grid panel
@@ -306,11 +341,11 @@ function handleGridClick(event) {
     if (gridMode === 'none') return;
     
     const rect = gridElement.getBoundingClientRect();
-    const x = Math.floor((event.clientX - rect.left) / GRID_SCALE);
-    const y = Math.floor((event.clientY - rect.top) / GRID_SCALE);
+    const x = viewport.x + Math.floor((event.clientX - rect.left) / GRID_SCALE);
+    const y = viewport.y + Math.floor((event.clientY - rect.top) / GRID_SCALE);
     
     // Ensure coordinates are within bounds
-    if (x < 0 || x >= GRID_SIZE || y < 0 || y >= GRID_SIZE) return;
+    if (!onGrid(x, y)) return;
     
     if (gridMode === 'driver') {
         addDriverAtPosition(x, y);
@@ -319,10 +354,61 @@ function handleGridClick(event) {
     }
 }
 
+function onGrid(x, y) {
+    return x >= 0 && x < gridWidth && y >= 0 && y < gridHeight;
+}
+
+function viewWidth() {
+    return Math.min(gridWidth, VIEW_SIZE);
+}
+
+function viewHeight() {
+    return Math.min(gridHeight, VIEW_SIZE);
+}
+
+function inView(location) {
+    return location.x >= viewport.x && location.x < viewport.x + viewWidth()
+        && location.y >= viewport.y && location.y < viewport.y + viewHeight();
+}
+
+// Place an entity element at a grid location, relative to the viewport
+function placeAt(element, x, y) {
+    element.style.left = `${(x - viewport.x) * GRID_SCALE}px`;
+    element.style.top = `${(y - viewport.y) * GRID_SCALE}px`;
+}
+
+// Move the viewport by (dx, dy) views, staying on the grid
+function panViewport(dx, dy) {
+    viewport.x = Math.max(0, Math.min(gridWidth - viewWidth(), viewport.x + Math.round(dx * viewWidth())));
+    viewport.y = Math.max(0, Math.min(gridHeight - viewHeight(), viewport.y + Math.round(dy * viewHeight())));
+    updateGridVisualization();
+}
+
+// Pan buttons and the visible range, shown when the city is larger than the view
+function addViewportControls() {
+    if (gridWidth <= VIEW_SIZE && gridHeight <= VIEW_SIZE) return;
+    const controls = document.createElement('div');
+    controls.id = 'viewportControls';
+    controls.style.margin = '10px 0';
+    [['⬅️', -0.5, 0], ['⬆️', 0, -0.5], ['⬇️', 0, 0.5], ['➡️', 0.5, 0]].forEach(([label, dx, dy]) => {
+        const button = document.createElement('button');
+        button.textContent = label;
+        button.className = 'secondary-btn';
+        button.addEventListener('click', () => panViewport(dx, dy));
+        controls.appendChild(button);
+    });
+    const range = document.createElement('span');
+    range.id = 'viewportRange';
+    range.style.marginLeft = '10px';
+    range.style.color = '#7f8c8d';
+    controls.appendChild(range);
+    gridElement.parentElement.insertBefore(controls, gridElement);
+}
+
 // Initialize the grid
 function initGrid() {
-    gridElement.style.width = `${GRID_SIZE * GRID_SCALE}px`;
-    gridElement.style.height = `${GRID_SIZE * GRID_SCALE}px`;
+    gridElement.style.width = `${viewWidth() * GRID_SCALE}px`;
+    gridElement.style.height = `${viewHeight() * GRID_SCALE}px`;
     gridElement.style.position = 'relative';
     gridElement.style.backgroundColor = '#f8f9fa';
     
@@ -340,6 +426,17 @@ function initGrid() {
     `;
     gridOverlay.style.backgroundSize = `${GRID_SCALE * 10}px ${GRID_SCALE * 10}px`;
     gridElement.appendChild(gridOverlay);
+    addViewportControls();
+
+    // Coordinate inputs follow the grid size
+    [['driverX', gridWidth], ['driverY', gridHeight], ['riderX', gridWidth], ['riderY', gridHeight],
+        ['dropoffX', gridWidth], ['dropoffY', gridHeight]].forEach(([id, size]) => {
+        const input = document.getElementById(id);
+        if (input) {
+            input.max = size - 1;
+            input.placeholder = `0-${size - 1}`;
+        }
+    });
 }
 
 // Enhanced refresh system state with loading feedback
@@ -349,22 +446,14 @@ async function refreshState(showLoading = false) {
             showLoadingOverlay('Refreshing system state...');
         }
         
-        const [driversRes, ridersRes, ridesRes, stateRes] = await Promise.all([
-            fetch(`${API_URL}/api/drivers/`),
-            fetch(`${API_URL}/api/riders/`),
-            fetch(`${API_URL}/api/rides/`),
-            fetch(`${API_URL}/api/state`)
-        ]);
+        const query = stateVersion === null ? '' : `?since=${stateVersion}`;
+        const stateRes = await fetch(`${API_URL}/api/state${query}`);
         
-        if (!driversRes.ok || !ridersRes.ok || !ridesRes.ok || !stateRes.ok) {
+        if (!stateRes.ok) {
             throw new Error('Failed to fetch system data');
         }
         
-        drivers = await driversRes.json();
-        riders = await ridersRes.json();
-        rideRequests = await ridesRes.json();
-        const systemState = await stateRes.json();
-        activeTrips = systemState.active_trips || [];
+        applyStateDelta(await stateRes.json());
         
         updateGridVisualization();
         updateDriversTable();
@@ -384,27 +473,70 @@ async function refreshState(showLoading = false) {
     }
 }
 
-// Update the grid visualization
+// Apply a full state or a delta (from /api/state or the /api/stream feed)
+function applyStateDelta(state) {
+    if (!state.full && (stateVersion === null || state.since > stateVersion || state.version < stateVersion)) {
+        return; // Gap or stale delta; the next refresh will catch up
+    }
+    const keyOf = (kind, entity) => kind === 'active_trips' ? entity.ride_id : entity.id;
+    Object.entries(stateMaps).forEach(([kind, map]) => {
+        if (state.full) {
+            map.clear();
+        }
+        (state[kind] || []).forEach(entity => map.set(keyOf(kind, entity), entity));
+        ((state.deleted || {})[kind] || []).forEach(id => map.delete(id));
+    });
+    stateVersion = state.version;
+    
+    drivers = Array.from(stateMaps.drivers.values());
+    riders = Array.from(stateMaps.riders.values());
+    rideRequests = Array.from(stateMaps.ride_requests.values());
+    activeTrips = Array.from(stateMaps.active_trips.values());
+}
+
+// Subscribe to server-pushed deltas so the view stays current between actions
+function connectStateStream() {
+    if (!window.EventSource) return;
+    const since = stateVersion === null ? '' : `&since=${stateVersion}`;
+    const source = new EventSource(`${API_URL}/api/stream?interval_ms=${STREAM_INTERVAL_MS}${since}`);
+    source.addEventListener('delta', event => {
+        applyStateDelta(JSON.parse(event.data));
+        updateGridVisualization();
+        updateDriversTable();
+        updateRidersTable();
+        updateRidesTable();
+        updateRiderSelect();
+    });
+}
+
+// Update the grid visualization (the part of the city inside the viewport)
 function updateGridVisualization() {
     // Clear existing elements
     gridElement.innerHTML = '';
+    const range = document.getElementById('viewportRange');
+    if (range) {
+        range.textContent = `x ${viewport.x}-${viewport.x + viewWidth() - 1}, `
+            + `y ${viewport.y}-${viewport.y + viewHeight() - 1} of ${gridWidth}x${gridHeight}`;
+    }
     
     // Draw drivers
-    drivers.forEach(driver => {
-        const driverElement = document.createElement('div');
-        driverElement.className = `entity driver ${driver.status}`;
-        driverElement.style.left = `${driver.location.x * GRID_SCALE}px`;
-        driverElement.style.top = `${driver.location.y * GRID_SCALE}px`;
-        driverElement.title = `Driver ${driver.id} (${driver.status})`;
-        gridElement.appendChild(driverElement);
-    });
+    if (drivers.length > CANVAS_DRIVER_THRESHOLD || gridWidth > VIEW_SIZE || gridHeight > VIEW_SIZE) {
+        drawDriverPositions();
+    } else {
+        drivers.forEach(driver => {
+            const driverElement = document.createElement('div');
+            driverElement.className = `entity driver ${driver.status}`;
+            placeAt(driverElement, driver.location.x, driver.location.y);
+            driverElement.title = `Driver ${driver.id} (${driver.status})`;
+            gridElement.appendChild(driverElement);
+        });
+    }
     
     // Draw riders
-    riders.forEach(rider => {
+    riders.filter(rider => inView(rider.location)).forEach(rider => {
         const riderElement = document.createElement('div');
         riderElement.className = 'entity rider';
-        riderElement.style.left = `${rider.location.x * GRID_SCALE}px`;
-        riderElement.style.top = `${rider.location.y * GRID_SCALE}px`;
+        placeAt(riderElement, rider.location.x, rider.location.y);
         riderElement.title = `Rider ${rider.id}`;
         gridElement.appendChild(riderElement);
     });
@@ -414,20 +546,22 @@ function updateGridVisualization() {
         // Only show active rides
         if (['waiting', 'assigned'].includes(ride.status)) {
             // Draw pickup point
-            const pickupElement = document.createElement('div');
-            pickupElement.className = 'entity pickup';
-            pickupElement.style.left = `${ride.pickup.x * GRID_SCALE}px`;
-            pickupElement.style.top = `${ride.pickup.y * GRID_SCALE}px`;
-            pickupElement.title = `Pickup for ride ${ride.id}`;
-            gridElement.appendChild(pickupElement);
+            if (inView(ride.pickup)) {
+                const pickupElement = document.createElement('div');
+                pickupElement.className = 'entity pickup';
+                placeAt(pickupElement, ride.pickup.x, ride.pickup.y);
+                pickupElement.title = `Pickup for ride ${ride.id}`;
+                gridElement.appendChild(pickupElement);
+            }
             
             // Draw dropoff point
-            const dropoffElement = document.createElement('div');
-            dropoffElement.className = 'entity dropoff';
-            dropoffElement.style.left = `${ride.dropoff.x * GRID_SCALE}px`;
-            dropoffElement.style.top = `${ride.dropoff.y * GRID_SCALE}px`;
-            dropoffElement.title = `Dropoff for ride ${ride.id}`;
-            gridElement.appendChild(dropoffElement);
+            if (inView(ride.dropoff)) {
+                const dropoffElement = document.createElement('div');
+                dropoffElement.className = 'entity dropoff';
+                placeAt(dropoffElement, ride.dropoff.x, ride.dropoff.y);
+                dropoffElement.title = `Dropoff for ride ${ride.id}`;
+                gridElement.appendChild(dropoffElement);
+            }
             
             // Draw path between pickup and dropoff
             drawPath(ride.pickup, ride.dropoff);
@@ -435,7 +569,38 @@ function updateGridVisualization() {
     });
 }
 
-// Draw a path between two points using small dots
+// Draw the drivers in the viewport as dots on a canvas layer, from the
+// packed positions feed (only the tiles under the viewport are read)
+async function drawDriverPositions() {
+    const canvas = document.createElement('canvas');
+    canvas.width = viewWidth() * GRID_SCALE;
+    canvas.height = viewHeight() * GRID_SCALE;
+    canvas.style.position = 'absolute';
+    canvas.style.left = '0';
+    canvas.style.top = '0';
+    canvas.style.pointerEvents = 'none';
+    gridElement.appendChild(canvas);
+
+    const { x, y } = viewport;
+    const bbox = `${x},${y},${x + viewWidth() - 1},${y + viewHeight() - 1}`;
+    const response = await fetch(`${API_URL}/api/drivers/positions?bbox=${bbox}`);
+    if (!response.ok) return;
+    const buffer = await response.arrayBuffer();
+    const count = Number(response.headers.get('X-Driver-Count'));
+    const view = new DataView(buffer);
+    const statuses = new Int8Array(buffer, 4 * count, count);
+    const context = canvas.getContext('2d');
+    for (let i = 0; i < count; i++) {
+        context.fillStyle = DRIVER_COLORS[statuses[i]];
+        context.fillRect(
+            (view.getInt16(2 * i, true) - x) * GRID_SCALE - 1,
+            (view.getInt16(2 * (count + i), true) - y) * GRID_SCALE - 1,
+            3, 3
+        );
+    }
+}
+
+// Draw a path between two points using small dots, within the viewport
 function drawPath(start, end) {
     // Calculate Manhattan path (horizontal then vertical)
     const horizontalDistance = end.x - start.x;
@@ -444,20 +609,20 @@ function drawPath(start, end) {
     // Draw horizontal segment
     for (let i = 0; i <= Math.abs(horizontalDistance); i++) {
         const x = start.x + (horizontalDistance > 0 ? i : -i);
+        if (!inView({ x, y: start.y })) continue;
         const pathElement = document.createElement('div');
         pathElement.className = 'entity path';
-        pathElement.style.left = `${x * GRID_SCALE}px`;
-        pathElement.style.top = `${start.y * GRID_SCALE}px`;
+        placeAt(pathElement, x, start.y);
         gridElement.appendChild(pathElement);
     }
     
     // Draw vertical segment
     for (let i = 0; i <= Math.abs(verticalDistance); i++) {
         const y = end.y - (verticalDistance > 0 ? i : -i);
+        if (!inView({ x: end.x, y })) continue;
         const pathElement = document.createElement('div');
         pathElement.className = 'entity path';
-        pathElement.style.left = `${end.x * GRID_SCALE}px`;
-        pathElement.style.top = `${y * GRID_SCALE}px`;
+        placeAt(pathElement, end.x, y);
         gridElement.appendChild(pathElement);
     }
 }
@@ -690,8 +855,8 @@ async function addDriver() {
     const x = parseInt(document.getElementById('driverX').value);
     const y = parseInt(document.getElementById('driverY').value);
     
-    if (isNaN(x) || isNaN(y) || x < 0 || x >= GRID_SIZE || y < 0 || y >= GRID_SIZE) {
-        alert('Please enter valid coordinates (0-99)');
+    if (isNaN(x) || isNaN(y) || !onGrid(x, y)) {
+        alert(`Please enter valid coordinates (0-${gridWidth - 1}, 0-${gridHeight - 1})`);
         return;
     }
     
@@ -745,8 +910,8 @@ async function addRider() {
     const x = parseInt(document.getElementById('riderX').value);
     const y = parseInt(document.getElementById('riderY').value);
     
-    if (isNaN(x) || isNaN(y) || x < 0 || x >= GRID_SIZE || y < 0 || y >= GRID_SIZE) {
-        alert('Please enter valid coordinates (0-99)');
+    if (isNaN(x) || isNaN(y) || !onGrid(x, y)) {
+        alert(`Please enter valid coordinates (0-${gridWidth - 1}, 0-${gridHeight - 1})`);
         return;
     }
     
@@ -792,9 +957,9 @@ async function requestRide() {
     }
     
     if (
-        isNaN(dropoffX) || isNaN(dropoffY) || dropoffX < 0 || dropoffX >= GRID_SIZE || dropoffY < 0 || dropoffY >= GRID_SIZE
+        isNaN(dropoffX) || isNaN(dropoffY) || !onGrid(dropoffX, dropoffY)
     ) {
-        alert('Please enter valid dropoff coordinates (0-99)');
+        alert(`Please enter valid dropoff coordinates (0-${gridWidth - 1}, 0-${gridHeight - 1})`);
         return;
     }
     
@@ -857,6 +1022,44 @@ async function cancelRide(rideId) {
     }
 }
 
+// Reflect the server clock's state in the Auto button and rate selector
+function updateClockControls(clock) {
+    clockRunning = clock.running;
+    document.getElementById('clockButton').textContent = clockRunning ? '⏸️ Pause' : '▶️ Auto';
+    const rateSelect = document.getElementById('clockRate');
+    if (Array.from(rateSelect.options).some(option => Number(option.value) === clock.rate)) {
+        rateSelect.value = String(clock.rate);
+    }
+}
+
+// Start or pause the server-side clock; state updates arrive over the stream
+async function toggleClock() {
+    try {
+        const response = await fetch(`${API_URL}/api/clock/${clockRunning ? 'pause' : 'resume'}`, { method: 'POST' });
+        if (!response.ok) {
+            throw new Error('Failed to change the simulation clock');
+        }
+        updateClockControls(await response.json());
+    } catch (error) {
+        console.error('Error toggling clock:', error);
+        showNotification(error.message, 'error');
+    }
+}
+
+async function setClockRate() {
+    const rate = document.getElementById('clockRate').value;
+    try {
+        const response = await fetch(`${API_URL}/api/clock/speed?rate=${rate}`, { method: 'PUT' });
+        if (!response.ok) {
+            throw new Error('Failed to change the simulation speed');
+        }
+        updateClockControls(await response.json());
+    } catch (error) {
+        console.error('Error setting clock rate:', error);
+        showNotification(error.message, 'error');
+    }
+}
+
 // Enhanced advance simulation with loading states and animations
 async function advanceSimulation() {
     try {
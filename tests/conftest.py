@@ -0,0 +1,199 @@
+"""Seeded random builders shared by the tests."""
+import random
+
+import pytest
+
+from app.models.entities import Point, RideEntity
+from app.models.models import DriverStatus, RideStatus
+from app.services.dispatch import DispatchService
+from app.services.roadmap import RoadMap
+from app.services.writer import SnapshotCache
+
+
+class Scenario:
+    """Drivers, rides and commands drawn from one seeded generator on a grid x height city (square by default)."""
+
+    def __init__(self, seed, grid: int = 100, height: int = None):
+        self.rng = random.Random(seed)
+        self.grid = grid
+        self.height = height
+
+    def point(self) -> Point:
+        return Point(self.rng.randrange(self.grid), self.rng.randrange(self.height or self.grid))
+
+    def ride(self, ride_id: str, rider_id: str = None, **fields) -> RideEntity:
+        """A WAITING ride with random pickup and dropoff, not yet added to any service."""
+        return RideEntity(ride_id, rider_id or f"u_{ride_id}", self.point(), self.point(), RideStatus.WAITING, **fields)
+
+    def add_drivers(self, service, count: int, start: int = 0) -> None:
+        """Add drivers d{start}.. at random locations."""
+        service.add_drivers([f"d{i}" for i in range(start, start + count)], [self.point() for _ in range(count)])
+
+    def request(self, service, ride_id: str, rider_id: str = None) -> RideEntity:
+        """Add a random ride to service and dispatch it (or queue it, in batch mode)."""
+        ride = self.ride(ride_id, rider_id)
+        service.add_ride_request(ride)
+        service.submit_ride(ride.id)
+        return ride
+
+    def busy_service(self, drivers: int = 200, rides: int = 150) -> DispatchService:
+        """A service with `rides` trips under way; every ride found a driver when there are enough drivers."""
+        service = DispatchService()
+        self.add_drivers(service, drivers)
+        for i in range(rides):
+            self.request(service, f"r{i}")
+        return service
+
+    def random_fleet(self, drivers: int) -> DispatchService:
+        """A service whose drivers have moved, served rides, gone offline or left."""
+        rng = self.rng
+        service = DispatchService()
+        self.add_drivers(service, drivers)
+        for i in range(drivers // 2):
+            self.request(service, f"r{i}")
+            if rng.random() < 0.3:
+                service.tick_many(rng.randrange(1, 20))
+        for i in rng.sample(range(drivers), drivers // 10):
+            driver_id = f"d{i}"
+            if service.driver_status(driver_id) == DriverStatus.ON_TRIP:
+                continue
+            if rng.random() < 0.5:
+                service.set_driver_status(driver_id, DriverStatus.OFFLINE)
+            else:
+                service.remove_driver(driver_id)
+        assert not service.check_consistency()
+        return service
+
+    def commands(self, service, steps: int, first: int = 0):
+        """
+        Run `steps` random commands on service, as the API would issue them,
+        yielding each one's name after it ran. New drivers (n*) and rides
+        (c*, each for a new rider) are numbered from `first`.
+        """
+        rng = self.rng
+        for step in range(first, first + steps):
+            op = rng.random()
+            waiting = service.rides_with_status(RideStatus.WAITING)
+            available = service.fleet.rows_with_status(DriverStatus.AVAILABLE).tolist()
+            if op < 0.1:
+                service.add_driver(f"n{step}", self.point())
+                yield "add_driver"
+            elif op < 0.4:
+                self.request(service, f"c{step}", f"u{step}")
+                yield "request"
+            elif op < 0.45 and waiting and available:
+                service.start_trip(rng.choice(waiting), service.fleet.ids[rng.choice(available)])
+                yield "accept"
+            elif op < 0.6 and service.active_trips:
+                ride_id = rng.choice(list(service.active_trips))
+                driver_id, step_name = service.active_trips[ride_id]
+                if step_name == "to_pickup" and rng.random() < 0.8:
+                    service.reject_ride(service.ride_requests[ride_id], driver_id)
+                    yield "reject"
+                else:
+                    service.cancel_ride(service.ride_requests[ride_id])
+                    yield "cancel"
+            elif op < 0.62 and waiting:
+                service.cancel_ride(rng.choice(waiting))
+                yield "cancel"
+            elif op < 0.68 and len(service.fleet):
+                driver_id = rng.choice(list(service.fleet.rows))
+                if service.driver_status(driver_id) == DriverStatus.ON_TRIP:
+                    continue
+                if rng.random() < 0.8:
+                    service.set_driver_status(driver_id, rng.choice([DriverStatus.AVAILABLE, DriverStatus.OFFLINE]))
+                    yield "status"
+                else:
+                    service.remove_driver(driver_id)
+                    yield "remove_driver"
+            elif op < 0.8:
+                service.tick_many(rng.randrange(1, 5))
+                yield "tick_many"
+            else:
+                service.tick()
+                yield "tick"
+
+    def run_commands(self, service, steps: int, first: int = 0) -> None:
+        for _ in self.commands(service, steps, first):
+            pass
+
+
+@pytest.fixture
+def scenario():
+    """Scenario factory: scenario(seed, grid=100, height=None)."""
+    return Scenario
+
+
+@pytest.fixture
+def service_state():
+    """Everything observable about a service, for comparing two of them."""
+
+    def state(service):
+        fleet = service.fleet
+        rides, _ = service.list_rides(limit=10 ** 6)
+        return (
+            service.version,
+            service.current_tick,
+            fleet.to_dicts(fleet.live_rows()),
+            [ride.to_dict() for ride in rides],
+            dict(service.active_trips),
+            sorted(service.available_index.entries.items()),
+        )
+
+    return state
+
+
+@pytest.fixture
+def checked_service(monkeypatch):
+    """
+    checked_service(scenario, road): a service whose every find_best_driver
+    call is compared with a fresh rank_drivers search, with a random road
+    map when `road` is set. Returns it with its candidate cache hit/miss
+    counts.
+    """
+
+    def build(scenario, road=False):
+        rng, grid = scenario.rng, scenario.grid
+        service = DispatchService()
+        service.configure(max_rejection_attempts=50, candidate_cache_size=rng.choice([2, 4, 8]))
+        if road:
+            blocked = [(x, y) for x in range(grid) for y in range(grid) if rng.random() < 0.1]
+            service.set_road_map(RoadMap(grid, grid, blocked=blocked).to_dict())
+
+        find_best_driver = service.find_best_driver
+        results = {"hit": 0, "miss": 0}
+
+        def checked(ride):
+            fresh = service.rank_drivers(ride, 1)
+            driver_id = find_best_driver(ride)
+            assert driver_id == (service.fleet.ids[fresh[0][1]] if fresh else None)
+            return driver_id
+
+        monkeypatch.setattr(service, "find_best_driver", checked)
+        monkeypatch.setattr(service, "_count_cache", lambda result: results.__setitem__(result, results[result] + 1))
+        return service, results
+
+    return build
+
+
+@pytest.fixture
+def api_service(monkeypatch):
+    """A fresh DispatchService installed behind the API (see `api`), reporting to the app's metrics."""
+    from app.api import endpoints
+
+    service = DispatchService()
+    service.metrics = endpoints.dispatch_service.metrics
+    monkeypatch.setattr(endpoints, "dispatch_service", service)
+    monkeypatch.setattr(endpoints.runtime, "backend", service)
+    monkeypatch.setattr(endpoints, "snapshots", SnapshotCache(endpoints.dispatch_writer))
+    return service
+
+
+@pytest.fixture
+def api(api_service):
+    """A TestClient for the app, serving api_service."""
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+
+    return TestClient(app)
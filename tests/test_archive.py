@@ -0,0 +1,53 @@
+"""Paging through rides lists each one exactly once, in creation order, while rides are archived."""
+import pytest
+
+from app.models.models import RideStatus
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_pages_cover_every_ride_while_rides_are_archived(scenario, seed):
+    rides = scenario(seed, grid=30)
+    service = rides.busy_service(drivers=20, rides=60)
+    listed, cursor, step = [], None, 0
+    while True:
+        page, cursor = service.list_rides(after=cursor, limit=rides.rng.choice([1, 3, 7]))
+        listed += [ride.id for ride in page]
+        if cursor is None:
+            break
+        # Finish, cancel and create rides between pages
+        rides.run_commands(service, 5, first=step)
+        step += 5
+    assert len(service.archive) > 0
+    everything, cursor = service.list_rides(limit=10 ** 6)
+    assert cursor is None and listed == [ride.id for ride in everything]
+    assert listed[:60] == [f"r{i}" for i in range(60)]
+    assert not service.check_consistency()
+
+
+def test_status_filters_split_hot_and_archived_rides(scenario):
+    service = scenario(1, grid=30).busy_service(drivers=20, rides=60)
+    service.tick_many(15)
+    by_status = {status: service.list_rides(limit=1000, status=status)[0] for status in RideStatus}
+    everything = service.list_rides(limit=1000)[0]
+    assert sorted(ride.id for rides in by_status.values() for ride in rides) == sorted(ride.id for ride in everything)
+    for status, rides in by_status.items():
+        assert all(ride.status == status for ride in rides)
+    assert by_status[RideStatus.COMPLETED] and all(ride.id in service.archive for ride in by_status[RideStatus.COMPLETED])
+    assert service.get_ride(by_status[RideStatus.COMPLETED][0].id).status == RideStatus.COMPLETED
+
+
+def test_api_pages_follow_the_next_cursor(api, api_service, scenario):
+    rides = scenario(2, grid=30)
+    rides.add_drivers(api_service, 10)
+    for i in range(40):
+        rides.request(api_service, f"r{i}")
+    listed, params = [], {"limit": 6}
+    while True:
+        response = api.get("/api/rides/", params=params)
+        listed += [ride["id"] for ride in response.json()]
+        api.post("/api/tick", params={"n": 10})
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+    assert listed == [f"r{i}" for i in range(40)]
+    assert len(api_service.archive) > 0
@@ -0,0 +1,101 @@
+"""Bulk NDJSON ingestion reports a result per row, in order, and never reuses an ID."""
+import itertools
+import json
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app.api import common, endpoints
+
+
+def ndjson(rows):
+    return "".join(row if isinstance(row, str) else json.dumps(row) + "\n" for row in rows).encode()
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Uploads span several chunks, so checks across chunk boundaries run
+    monkeypatch.setattr(common, "BULK_CHUNK_ROWS", 3)
+
+
+def test_mixed_valid_and_invalid_lines(api, api_service):
+    body = ndjson([
+        {"x": 1, "y": 2},
+        "not json\n",
+        {"x": 3},
+        "\n",  # blank lines are skipped, not rows
+        {"x": "far", "y": 0},
+        {"x": 4, "y": 5},
+        {"x": 6, "y": 7, "extra": True},
+    ])
+    # Streamed in pieces that split lines
+    response = api.post("/api/drivers/bulk", content=iter([body[:5], body[5:23], body[23:]]))
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["failed"]) == (3, 3)
+    results = report["results"]
+    assert ["id" in result for result in results] == [True, False, False, False, True, True]
+    assert results[1]["error"].startswith("invalid JSON")
+    assert results[2]["error"].startswith("y:")
+    assert results[3]["error"].startswith("x:")
+    driver_ids = [result["id"] for result in results if "id" in result]
+    assert sorted(driver_ids) == sorted(api_service.fleet.rows)
+    assert api.get(f"/api/drivers/{driver_ids[1]}").json()["location"] == {"x": 4, "y": 5}
+
+
+def test_json_arrays_and_malformed_bodies(api, api_service):
+    response = api.post("/api/riders/bulk", json=[{"x": i, "y": i} for i in range(7)] + [{"y": 1}])
+    report = response.json()
+    assert (report["inserted"], report["failed"]) == (7, 1)
+    assert [rider.location.x for rider in api_service.riders.values()] == list(range(7))
+    assert api.post("/api/riders/bulk", content=b"[{\"x\": 1,").status_code == 400
+    assert api.post("/api/riders/bulk", content=b"{\"x\": 1, \"y\": 1}\n").json()["inserted"] == 1
+
+
+def test_ride_rows_are_checked_against_earlier_rows(api, api_service):
+    drivers = api.post("/api/drivers/bulk", json=[{"x": 0, "y": 0}] * 3).json()["results"]
+    riders = [result["id"] for result in api.post("/api/riders/bulk", json=[{"x": 0, "y": 0}] * 5).json()["results"]]
+    busy = riders[4]
+    api.post("/api/rides/request", json={"rider_id": busy, "pickup": {"x": 1, "y": 1}, "dropoff": {"x": 2, "y": 2}})
+
+    trip = {"pickup": {"x": 1, "y": 1}, "dropoff": {"x": 5, "y": 5}}
+    rows = [
+        {"rider_id": riders[0], **trip},
+        {"rider_id": "rider_missing", **trip},
+        {"rider_id": riders[1], **trip},
+        {"rider_id": riders[0], **trip},  # second request of the upload, in another chunk
+        {"rider_id": busy, **trip},
+        {"rider_id": riders[2], "pickup": {"x": 1}},
+        {"rider_id": riders[3], **trip},
+    ]
+    results = api.post("/api/rides/bulk", content=ndjson(rows)).json()["results"]
+    assert [result.get("error") for result in results] == [
+        None, "Rider not found", None, "Rider already has an active request",
+        "Rider already has an active request", results[5]["error"], None,
+    ]
+    assert results[5]["error"].startswith("dropoff:") or results[5]["error"].startswith("pickup")
+    accepted = [result for result in results if "id" in result]
+    assert [result["status"] for result in accepted] == ["assigned"] * 2 + ["waiting"]  # three drivers, one taken
+    for result in accepted:
+        assert api.get(f"/api/rides/{result['id']}").json()["status"] == result["status"]
+    assert len(drivers) == 3 and not api_service.check_consistency()
+
+
+def test_colliding_ids_are_drawn_again(api, api_service, monkeypatch):
+    # uuid4 keeps coming back with IDs already taken, in the service or earlier in the upload
+    # (only the first 8 hex digits end up in an ID, hence the shift)
+    draws = itertools.chain(
+        (uuid.UUID(int=(n % 3) << 96) for n in range(40)), (uuid.UUID(int=n << 96) for n in itertools.count(3))
+    )
+    monkeypatch.setattr(endpoints, "uuid", SimpleNamespace(uuid4=lambda: next(draws)))
+    driver_ids = [result["id"] for result in api.post("/api/drivers/bulk", json=[{"x": 0, "y": 0}] * 5).json()["results"]]
+    rider_ids = [result["id"] for result in api.post("/api/riders/bulk", json=[{"x": 0, "y": 0}] * 5).json()["results"]]
+    trip = {"pickup": {"x": 1, "y": 1}, "dropoff": {"x": 2, "y": 2}}
+    ride_ids = [
+        result["id"] for result in
+        api.post("/api/rides/bulk", json=[{"rider_id": rider_id, **trip} for rider_id in rider_ids]).json()["results"]
+    ]
+    for ids in (driver_ids, rider_ids, ride_ids):
+        assert len(ids) == len(set(ids)) == 5
+    assert len(api_service.fleet) == len(api_service.riders) == len(api_service.ride_requests) == 5
@@ -0,0 +1,12 @@
+"""Picks from the cached candidate lists are the ones a fresh search would make."""
+import pytest
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_cached_picks_match_a_fresh_search(scenario, checked_service, seed):
+    rides = scenario(seed, grid=60)
+    service, results = checked_service(rides, road=seed % 4 == 3)
+    rides.add_drivers(service, 300)
+    rides.run_commands(service, 1000)
+    assert not service.check_consistency()
+    assert results["hit"] > 0 and results["miss"] > 0
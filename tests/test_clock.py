@@ -0,0 +1,133 @@
+"""SimulationClock pacing, on an event loop whose time only moves while it waits."""
+import asyncio
+
+import pytest
+
+from app.services.clock import SimulationClock
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """Skips ahead by the time the loop would have slept in select(), instead of sleeping."""
+
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+        self._selector = _SkippingSelector(self._selector, self)
+
+    def time(self) -> float:
+        return self.now
+
+
+class _SkippingSelector:
+    def __init__(self, selector, loop):
+        self.selector = selector
+        self.loop = loop
+
+    def select(self, timeout=None):
+        if timeout:
+            self.loop.now += timeout
+        return self.selector.select(0)
+
+    def __getattr__(self, name):
+        return getattr(self.selector, name)
+
+
+def run(test, steps=()):
+    """
+    Run `await test(clock)` on a virtual-time loop, with the clock paused at
+    8 ticks a second (so every time stays an exact binary fraction). Each
+    advance() takes the next (duration, error) from steps, then none, and
+    is logged as (start time, ticks); returns the log.
+    """
+    loop = VirtualTimeLoop()
+    steps = iter(steps)
+    calls = []
+
+    async def advance(n):
+        duration, error = next(steps, (0, None))
+        calls.append((loop.time(), n))
+        await asyncio.sleep(duration)
+        if error:
+            raise error
+
+    async def main():
+        clock = SimulationClock(advance, rate=8, max_catch_up=4)
+        clock.start()
+        try:
+            await test(clock)
+        finally:
+            await clock.stop()
+
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
+    return calls
+
+
+def test_ticks_follow_the_rate_while_running():
+    async def test(clock):
+        await asyncio.sleep(1.0625)
+        assert clock.ticks == 0  # starts paused
+        clock.resume()
+        await asyncio.sleep(1.0625)
+        assert (clock.ticks, clock.steps, clock.overruns) == (8, 8, 0)
+        clock.pause()
+        await asyncio.sleep(2.0625)
+        assert clock.ticks == 8
+        clock.set_rate(16)
+        clock.resume()
+        await asyncio.sleep(1.03125)
+        assert clock.ticks == 8 + 16
+        with pytest.raises(ValueError):
+            clock.set_rate(0)
+
+    calls = run(test)
+    assert [n for _, n in calls] == [1] * 24
+    # each resume re-anchors the schedule: the first tick comes a whole period later
+    assert calls[0][0] == 1.0625 + 1 / 8 and calls[8][0] == 4.1875 + 1 / 16
+
+
+def test_slow_steps_catch_up_without_drifting():
+    async def test(clock):
+        clock.resume()
+        await asyncio.sleep(3.0625)
+
+    calls = run(test, [(0.375, None)] * 100)  # every step takes three periods
+    assert [n for _, n in calls[:4]] == [1, 3, 3, 3]
+    advanced = 0
+    for start, n in calls:
+        advanced += n
+        assert advanced == int(start * 8)  # every tick due by then, no more
+
+
+def test_falling_far_behind_drops_ticks():
+    async def test(clock):
+        clock.resume()
+        await asyncio.sleep(2.5625)
+        assert (clock.dropped, clock.overruns, clock.ticks) == (12, 1, 8)
+
+    calls = run(test, [(2.0, None)])  # the first step stalls for sixteen periods
+    assert [n for _, n in calls] == [1, 4, 1, 1, 1]
+
+
+def test_failed_steps_leave_their_ticks_due():
+    async def test(clock):
+        clock.resume()
+        await asyncio.sleep(1.0625)
+        assert (clock.failed, clock.ticks, clock.overruns) == (1, 8, 1)
+
+    calls = run(test, [(0, RuntimeError("writer busy"))])
+    assert [n for _, n in calls[:3]] == [1, 2, 1]
+
+
+def test_clock_routes(api):
+    rate = api.get("/api/clock").json()["rate"]
+    try:
+        assert api.put("/api/clock/speed", params={"rate": 0}).status_code == 422
+        assert api.put("/api/clock/speed", params={"rate": 25}).json()["rate"] == 25
+        assert api.post("/api/clock/resume").json()["running"] is True
+        status = api.post("/api/clock/pause").json()
+        assert status["running"] is False and status["current_tick"] == 0
+    finally:
+        api.put("/api/clock/speed", params={"rate": rate})
@@ -0,0 +1,54 @@
+"""The indexed driver search ranks drivers exactly like a full scan of the fleet."""
+import pytest
+
+from app.models.entities import Point, RideEntity
+from app.models.models import DriverStatus, RideStatus
+from app.services.dispatch import DispatchService
+
+
+def full_scan(service, ride, k):
+    """(score, row) of the k best drivers for `ride`, scoring every available driver."""
+    fleet = service.fleet
+    rows = [
+        row for driver_id, row in fleet.rows.items()
+        if fleet.status_of(row) == DriverStatus.AVAILABLE and driver_id not in ride.rejected_by
+    ]
+    if not rows:
+        return []
+    px, py = ride.pickup.x, ride.pickup.y
+    eta = {row: abs(int(fleet.x[row]) - px) + abs(int(fleet.y[row]) - py) for row in rows}
+    max_eta = max(1, max(eta.values()))
+    max_rides = max(1, max(int(fleet.rides[row]) for row in rows))
+    scores = [
+        (service.eta_weight * (eta[row] / max_eta)
+         + service.fairness_weight * (1 - int(fleet.rides[row]) / max_rides), row)
+        for row in rows
+    ]
+    return sorted(scores)[:k]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_rank_drivers_matches_full_scan(scenario, seed):
+    fleet = scenario(seed)
+    rng = fleet.rng
+    fleet.grid = rng.choice([10, 100, 400])
+    service = fleet.random_fleet(rng.randrange(1, 300))
+    for query in range(30):
+        ride = fleet.ride(f"q{query}", rejected_by=[f"d{rng.randrange(20)}" for _ in range(rng.randrange(4))])
+        k = rng.choice([1, 3, 8, 50])
+        expected = full_scan(service, ride, k)
+        assert service.rank_drivers(ride, k) == expected
+        best = service.find_best_driver(ride)
+        assert best == (service.fleet.ids[expected[0][1]] if expected else None)
+
+
+def test_no_available_driver():
+    service = DispatchService()
+    service.add_driver("d0", Point(5, 5))
+    ride = RideEntity("r0", "u0", Point(0, 0), Point(1, 1), RideStatus.WAITING)
+    service.set_driver_status("d0", DriverStatus.OFFLINE)
+    assert service.find_best_driver(ride) is None
+    service.set_driver_status("d0", DriverStatus.AVAILABLE)
+    assert service.find_best_driver(ride) == "d0"
+    ride.rejected_by["d0"] = None
+    assert service.find_best_driver(ride) is None
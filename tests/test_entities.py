@@ -0,0 +1,80 @@
+"""Internal __slots__ entities convert to and from the API models without losing anything."""
+import pickle
+
+import numpy as np
+
+from app.models.entities import RIDE_ASSIGNED, RIDE_STATUS_CODES, RIDE_WAITING, Point, RideEntity, RiderEntity
+from app.models.models import Driver, DriverStatus, Location, RideRequest, RideStatus, Rider
+from app.services.fleet import STATUS_CODES, FleetStore
+
+
+def sample_request(**fields):
+    return RideRequest(**{
+        "id": "ride_1",
+        "rider_id": "rider_1",
+        "pickup": Location(x=3, y=4),
+        "dropoff": Location(x=90, y=0),
+        "status": RideStatus.ASSIGNED,
+        "assigned_driver_id": "driver_2",
+        "rejected_by": ["driver_9", "driver_1", "driver_5"],
+        **fields,
+    })
+
+
+def test_ride_round_trips_through_the_model():
+    for request in (sample_request(), sample_request(status=RideStatus.WAITING, assigned_driver_id=None, rejected_by=[])):
+        ride = RideEntity.from_model(request)
+        assert ride.to_model() == request
+        assert ride.to_dict() == request.model_dump(mode="json")
+
+
+def test_ride_round_trips_through_dicts_and_pickle():
+    ride = RideEntity.from_model(sample_request())
+    for copy in (RideEntity.from_dict(ride.to_dict()), pickle.loads(pickle.dumps(ride))):
+        assert copy.to_dict() == ride.to_dict()
+        assert list(copy.rejected_by) == ["driver_9", "driver_1", "driver_5"]  # rejection order is kept
+
+
+def test_ride_status_is_kept_as_a_code():
+    ride = RideEntity.from_model(sample_request())
+    assert ride.status_code == RIDE_ASSIGNED and type(ride.status_code) is int
+    ride.status = RideStatus.FAILED
+    assert ride.status_code == RIDE_STATUS_CODES[RideStatus.FAILED]
+    assert ride.status is RideStatus.FAILED and ride.to_dict()["status"] == "failed"
+    assert RideEntity("r", "u", Point(0, 0), Point(1, 1), RIDE_WAITING).status is RideStatus.WAITING
+    assert pickle.loads(pickle.dumps(ride)).status_code == ride.status_code
+
+
+def test_rejected_by_is_a_set():
+    ride = RideEntity.from_model(sample_request(rejected_by=["driver_1", "driver_1"]))
+    assert "driver_1" in ride.rejected_by
+    assert ride.to_dict()["rejected_by"] == ["driver_1"]
+
+
+def test_rider_and_point():
+    rider = RiderEntity("rider_1", Point.of(Location(x=7, y=8)))
+    assert Rider(**rider.to_dict()) == Rider(id="rider_1", location=Location(x=7, y=8))
+    assert pickle.loads(pickle.dumps(rider)).to_dict() == rider.to_dict()
+    assert Point(1, 2) == Point(1, 2) != Point(2, 1)
+
+
+def test_fleet_rows_match_the_driver_schema():
+    fleet = FleetStore(capacity=2)
+    fleet.add("driver_0", 1, 2)
+    fleet.add("driver_1", 3, 4, DriverStatus.OFFLINE)
+    fleet.add_many(["driver_2", "driver_3"], np.array([5, 7]), np.array([6, 8]))
+    fleet.status[fleet.rows["driver_2"]] = STATUS_CODES[DriverStatus.ON_TRIP]
+    fleet.rides[fleet.rows["driver_2"]] = 4
+    fleet.rejected_rides[fleet.rows["driver_3"]]["ride_1"] = None
+    fleet.remove("driver_0")
+
+    drivers = [Driver(**row) for row in fleet.to_dicts(fleet.live_rows())]
+    assert drivers == [
+        Driver(id="driver_1", location=Location(x=3, y=4), status=DriverStatus.OFFLINE),
+        Driver(id="driver_2", location=Location(x=5, y=6), status=DriverStatus.ON_TRIP, assigned_rides=4),
+        Driver(id="driver_3", location=Location(x=7, y=8), status=DriverStatus.AVAILABLE, rejected_rides=["ride_1"]),
+    ]
+    for status in DriverStatus:
+        fleet.status[fleet.rows["driver_1"]] = STATUS_CODES[status]
+        assert fleet.status_of(fleet.rows["driver_1"]) == status
+        assert fleet.to_dicts(np.array([fleet.rows["driver_1"]]))[0]["status"] == status.value
@@ -0,0 +1,98 @@
+"""Non-square grids: tiled viewport queries, driver search and Location bounds."""
+import pytest
+from pydantic import ValidationError
+
+from app.models import models
+from app.models.entities import RiderEntity
+from app.models.models import Location
+from app.services.dispatch import DispatchService
+from tests.test_dispatch_index import full_scan
+
+WIDTH, HEIGHT = 700, 150  # 11 x 3 tiles of 64, the last row and column partly off the grid
+
+
+def city(scenario, seed):
+    """A WIDTH x HEIGHT service whose drivers bunch up in one corner and have since moved."""
+    run = scenario(seed, grid=WIDTH, height=HEIGHT)
+    service = DispatchService(grid_width=WIDTH, grid_height=HEIGHT)
+    run.add_drivers(service, 150)
+    corner = scenario(seed + 1000, grid=120, height=50)
+    service.add_drivers([f"k{i}" for i in range(150)], [corner.point() for _ in range(150)])
+    service.add_riders([RiderEntity(f"u{i}", run.point()) for i in range(80)])
+    for i in range(40):
+        run.request(service, f"r{i}", f"u{i}")
+    service.tick_many(30)
+    return run, service
+
+
+def in_box(x, y, box):
+    x0, y0, x1, y1 = box
+    return x0 <= x <= x1 and y0 <= y <= y1
+
+
+def random_box(rng):
+    x0, y0 = rng.randrange(-10, WIDTH), rng.randrange(-10, HEIGHT)
+    return x0, y0, x0 + rng.choice([0, 5, 64, 100, 300, 1000]), y0 + rng.choice([0, 5, 64, 100, 300])
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_viewport_queries_match_a_full_scan(scenario, seed):
+    run, service = city(scenario, seed)
+    fleet = service.fleet
+    tile = fleet.tile_size
+    for _ in range(40):
+        box = random_box(run.rng)
+        assert fleet.rows_in(*box).tolist() == [
+            row for row in fleet.live_rows().tolist() if in_box(*fleet.location_of(row), box)
+        ]
+        assert [rider.id for rider in service.riders_in(*box)] == sorted(
+            rider.id for rider in service.riders.values() if in_box(rider.location.x, rider.location.y, box)
+        )
+
+        expected = {}
+        for row in fleet.live_rows().tolist():
+            x, y = fleet.location_of(row)
+            counts = expected.setdefault((x // tile, y // tile), [0, 0, 0])
+            counts[0] += 1
+            counts[1] += row in service.available_index
+        for rider in service.riders.values():
+            expected.setdefault((rider.location.x // tile, rider.location.y // tile), [0, 0, 0])[2] += 1
+        x0, y0, x1, y1 = box
+        assert service.tile_report(*box)["tiles"] == [
+            [tx, ty, *counts] for (tx, ty), counts in sorted(expected.items())
+            if x0 // tile <= tx <= x1 // tile and y0 // tile <= ty <= y1 // tile
+        ]
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_driver_search_across_tiles(scenario, seed):
+    run, service = city(scenario, seed)
+    for query in range(30):
+        ride = run.ride(f"q{query}")
+        k = run.rng.choice([1, 5, 40])
+        assert service.rank_drivers(ride, k) == full_scan(service, ride, k)
+    assert service.demand.shape == (70, 15)
+
+
+def test_locations_must_be_on_the_grid(monkeypatch):
+    monkeypatch.setitem(models.GRID_SIZE, "width", WIDTH)
+    monkeypatch.setitem(models.GRID_SIZE, "height", HEIGHT)
+    assert Location(x=WIDTH - 1, y=HEIGHT - 1).x == WIDTH - 1
+    for x, y in [(WIDTH, 0), (0, HEIGHT), (-1, 0), (0, -1)]:
+        with pytest.raises(ValidationError):
+            Location(x=x, y=y)
+
+
+def test_viewport_endpoints(api):
+    inside = api.post("/api/drivers/", json={"x": 10, "y": 10}).json()["id"]
+    api.post("/api/drivers/", json={"x": 90, "y": 90})
+    rider = api.post("/api/riders/", json={"x": 12, "y": 30}).json()["id"]
+
+    assert [driver["id"] for driver in api.get("/api/drivers/", params={"bbox": "0,0,20,20"}).json()] == [inside]
+    assert [r["id"] for r in api.get("/api/riders/", params={"bbox": "0,0,20,40"}).json()] == [rider]
+    positions = api.get("/api/drivers/positions", params={"bbox": "0,0,20,20"})
+    assert positions.headers["X-Driver-Count"] == "1"
+    assert api.get("/api/tiles", params={"bbox": "0,0,63,63"}).json()["tiles"] == [[0, 0, 1, 1, 1]]
+    for bad in ("1,2,3", "a,b,c,d", "5,0,4,10"):
+        assert api.get("/api/drivers/", params={"bbox": bad}).status_code == 400
+    assert api.post("/api/drivers/", json={"x": 100, "y": 0}).status_code == 422  # the default 100 x 100 grid
@@ -0,0 +1,17 @@
+"""The ride and driver indexes agree with a full scan after every command."""
+import pytest
+
+
+@pytest.mark.parametrize("mode", ["greedy", "batch"])
+@pytest.mark.parametrize("seed", range(4))
+def test_indexes_match_a_full_scan_after_every_step(scenario, seed, mode):
+    commands = scenario(seed, grid=40)
+    service = commands.busy_service(drivers=30, rides=10)
+    service.configure(dispatch_mode=mode)
+    ran = set()
+    for name in commands.commands(service, 400):
+        ran.add(name)
+        assert service.check_consistency() == [], name
+    assert {"request", "reject", "cancel", "tick"} <= ran
+    if mode == "batch":
+        assert "accept" in ran  # queued rides wait for the next tick
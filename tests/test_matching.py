@@ -0,0 +1,41 @@
+"""The Hungarian solver finds minimum-cost assignments."""
+import itertools
+
+import numpy as np
+import pytest
+
+from app.services.matching import UNREACHABLE, connected_components, solve_assignment
+
+
+def brute_force_cost(cost):
+    """Lowest total cost over every way of matching the smaller side completely."""
+    n, m = cost.shape
+    if n > m:
+        return brute_force_cost(cost.T)
+    return min(sum(cost[i, j] for i, j in enumerate(columns)) for columns in itertools.permutations(range(m), n))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_solve_assignment_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(30):
+        n, m = rng.integers(1, 7, 2)
+        cost = rng.random((n, m))
+        cost[rng.random((n, m)) < 0.3] = UNREACHABLE
+        pairs = solve_assignment(cost)
+
+        rows, columns = zip(*pairs) if pairs else ((), ())
+        assert len(set(rows)) == len(rows) and len(set(columns)) == len(columns)
+        assert all(cost[i, j] < UNREACHABLE for i, j in pairs)
+        total = sum(cost[i, j] for i, j in pairs) + UNREACHABLE * (min(n, m) - len(pairs))
+        assert total == pytest.approx(brute_force_cost(cost))
+
+
+def test_empty_and_integer_costs():
+    assert solve_assignment(np.zeros((0, 3))) == []
+    assert sorted(solve_assignment(np.array([[4, 1, 3], [2, 0, 5], [3, 2, 2]]))) == [(0, 1), (1, 0), (2, 2)]
+
+
+def test_connected_components():
+    groups = connected_components([[0, 1], [2], [1, 3], [], [2]])
+    assert sorted(map(sorted, groups)) == [[0, 2], [1, 4], [3]]
@@ -0,0 +1,101 @@
+"""Histograms, the `timed` decorator and the /metrics exposition format."""
+import re
+
+import pytest
+
+from app.services.dispatch import DispatchService
+from app.services.metrics import DispatchMetrics, MetricsRegistry, timed
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{([a-zA-Z_]+="(\\.|[^"\\])*",?)*\})? (\S+)$')
+
+
+def parse(text):
+    """{(name, labels): value} for the samples of an exposition, checking each line's syntax."""
+    assert text.endswith("\n")
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith("# HELP ") or line.startswith("# TYPE "):
+            continue
+        match = SAMPLE.match(line)
+        assert match, line
+        samples[(match.group(1), match.group(2) or "")] = float(match.group(5))
+    return samples
+
+
+def test_histograms_render_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("op_seconds", "Operation time", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0, 3.0):
+        histogram.observe(value)
+    requests = registry.counter("requests", "Requests", labels=("path",))
+    requests.labels('/a"b').inc(2)
+    registry.gauge("queue_depth", "Queue depth", lambda: 7)
+
+    text = registry.render()
+    assert "# TYPE op_seconds histogram\n" in text and "# TYPE requests counter\n" in text
+    samples = parse(text)
+    assert [samples[("op_seconds_bucket", '{le="%s"}' % le)] for le in ("0.1", "1.0", "+Inf")] == [2, 3, 5]
+    assert samples[("op_seconds_count", "")] == 5 and samples[("op_seconds_sum", "")] == pytest.approx(5.65)
+    assert samples[("requests_total", '{path="/a\\"b"}')] == 2
+    assert samples[("queue_depth", "")] == 7
+    with pytest.raises(ValueError):
+        registry.counter("requests", "Again")
+
+
+def test_timed_observes_every_call_even_when_it_raises():
+    class Service:
+        metrics = None
+
+        @timed("seconds")
+        def work(self, fail):
+            if fail:
+                raise KeyError(fail)
+            return "done"
+
+    service = Service()
+    assert service.work(None) == "done"  # metrics off: nothing to record into
+    service.metrics = type("Metrics", (), {})()
+    service.metrics.seconds = MetricsRegistry().histogram("work_seconds", "Work")
+    assert service.work(None) == "done"
+    with pytest.raises(KeyError):
+        service.work("boom")
+    assert service.metrics.seconds.count == 2 and service.metrics.seconds.sum > 0
+
+
+def test_dispatch_metrics_follow_the_service(scenario):
+    service = DispatchService()
+    service.metrics = metrics = DispatchMetrics(MetricsRegistry())
+    run = scenario(3)
+    run.add_drivers(service, 5)
+    for i in range(8):
+        run.request(service, f"r{i}")
+    service.tick_many(3)
+
+    assert metrics.assign_seconds.count == 8 == metrics.decision_seconds.count
+    assignments = metrics.assignments.children
+    assert assignments[("assigned",)].value == 5 and assignments[("no_driver",)].value == 3
+    assert metrics.tick_seconds.count == 3
+    assert metrics.candidates.count == 5  # no search once the fleet is busy
+
+
+def test_metrics_endpoint_serves_the_exposition(api):
+    before = parse(api.get("/api/metrics").text)
+    driver = api.post("/api/drivers/", json={"x": 1, "y": 1}).json()
+    rider = api.post("/api/riders/", json={"x": 2, "y": 2}).json()
+    api.post("/api/rides/request", json={"rider_id": rider["id"], "pickup": {"x": 2, "y": 2}, "dropoff": {"x": 9, "y": 9}})
+    api.get(f"/api/drivers/{driver['id']}")
+    response = api.get("/api/metrics")
+
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    after = parse(response.text)
+
+    def grew(name, labels=""):
+        return after[(name, labels)] - before.get((name, labels), 0)
+
+    assert grew("dispatch_assign_ride_seconds_count") == 1
+    assert grew("dispatch_assignments_total", '{result="assigned"}') == 1
+    assert after[("dispatch_drivers", '{status="on_trip"}')] == 1
+    assert after[("dispatch_active_trips", "")] == 1
+    # requests are labelled by route template, not by the ID in the path
+    route = '{method="GET",route="/api/drivers/{driver_id}",status="200",le="+Inf"}'
+    assert grew("http_request_seconds_bucket", route) == 1
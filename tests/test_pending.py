@@ -0,0 +1,124 @@
+"""Waiting rides go to the nearest driver who frees up, and fail after max_wait_ticks."""
+import random
+
+import pytest
+
+from app.models.entities import Point, RideEntity
+from app.models.models import DriverStatus, RideStatus
+from app.services.dispatch import DispatchService
+from app.services.pending import PendingQueue
+from app.services.roadmap import RoadMap
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_nearest_matches_a_full_scan(seed):
+    rng = random.Random(seed)
+    queue = PendingQueue(cell_size=rng.choice([1, 4, 8]))
+    for i in range(rng.randrange(1, 200)):
+        queue.add(f"r{i}", rng.randrange(100), rng.randrange(100), tick=rng.randrange(3) + i // 50)
+    for ride_id in rng.sample(sorted(queue.entries), len(queue) // 4):
+        queue.remove(ride_id)
+    refused = set(rng.sample(sorted(queue.entries), len(queue) // 3))
+
+    for _ in range(30):
+        x, y = rng.randrange(100), rng.randrange(100)
+        found = queue.nearest(x, y, lambda ride_id: ride_id not in refused)
+        candidates = [
+            (abs(px - x) + abs(py - y), since)
+            for ride_id, (since, px, py) in queue.entries.items() if ride_id not in refused
+        ]
+        if not candidates:
+            assert found is None
+            continue
+        since, px, py = queue.entries[found]
+        assert found not in refused
+        assert (abs(px - x) + abs(py - y), since) == min(candidates)
+
+
+def test_nearest_ranks_by_eta_when_given():
+    queue = PendingQueue(cell_size=4)
+    queue.add("walled", 12, 10, tick=0)
+    queue.add("around", 10, 16, tick=1)
+    queue.add("cut_off", 11, 10, tick=2)
+    detours = {(12, 10): 12, (10, 16): 6}
+    eta = lambda px, py: detours.get((px, py))
+    assert queue.nearest(10, 10, lambda ride_id: True) == "cut_off"
+    assert queue.nearest(10, 10, lambda ride_id: True, eta) == "around"
+
+
+def waiting_ride(service, ride_id, pickup, dropoff=Point(0, 0)):
+    ride = RideEntity(ride_id, ride_id, pickup, dropoff, RideStatus.WAITING)
+    service.add_ride_request(ride)
+    service.assign_ride(ride_id)
+    return ride
+
+
+def test_freed_drivers_take_the_nearest_waiting_ride():
+    service = DispatchService()
+    service.add_driver("d0", Point(10, 10))
+    busy = waiting_ride(service, "busy", Point(10, 10), Point(12, 10))
+    far = waiting_ride(service, "far", Point(90, 90))
+    near = waiting_ride(service, "near", Point(15, 10))
+    assert busy.assigned_driver_id == "d0"
+    assert len(service.pending) == 2
+
+    # Drops off at (12, 10) in the same tick it frees up, then goes for the nearer ride
+    assert [event["type"] for event in service.tick()] == ["pickup"]
+    service.tick()
+    assert service.tick()[0]["type"] == "dropoff"
+    assert (near.status, near.assigned_driver_id) == (RideStatus.ASSIGNED, "d0")
+    assert far.status == RideStatus.WAITING
+
+    # A driver coming online, or freed by a cancellation, is matched at once
+    service.add_driver("d1", Point(0, 0))
+    assert far.assigned_driver_id == "d1"
+    waiting = waiting_ride(service, "later", Point(50, 50))
+    service.cancel_ride(near)
+    assert waiting.assigned_driver_id == "d0"
+    service.cancel_ride(waiting)
+    service.set_driver_status("d0", DriverStatus.OFFLINE)
+    again = waiting_ride(service, "again", Point(1, 1))
+    service.set_driver_status("d0", DriverStatus.AVAILABLE)
+    assert again.assigned_driver_id == "d0"
+    assert service.pending_report()["matched"] == 4
+    assert not service.check_consistency()
+
+
+def test_drivers_are_not_given_rides_they_rejected():
+    service = DispatchService()
+    service.add_driver("d0", Point(10, 10))
+    ride = waiting_ride(service, "r0", Point(10, 10))
+    service.reject_ride(ride, "d0")
+    assert ride.status == RideStatus.WAITING and "r0" in service.pending
+    service.set_driver_status("d0", DriverStatus.OFFLINE)
+    service.set_driver_status("d0", DriverStatus.AVAILABLE)
+    assert ride.status == RideStatus.WAITING
+    service.add_driver("d1", Point(90, 90))
+    assert ride.assigned_driver_id == "d1"
+
+
+def test_rides_fail_after_max_wait_ticks():
+    service = DispatchService(max_wait_ticks=5)
+    ride = waiting_ride(service, "r0", Point(10, 10))
+    service.tick_many(4)
+    assert ride.status == RideStatus.WAITING
+    assert service.pending_report()["waiting_ticks"]["max"] == 4
+    service.tick_many(2)
+    assert service.get_ride("r0").status == RideStatus.FAILED
+    report = service.pending_report()
+    assert (report["depth"], report["expired"], report["max_wait_ticks"]) == (0, 1, 5)
+
+
+def test_freed_drivers_rank_waiting_rides_by_road_distance():
+    # A wall at x=11 with one gap at y=0: (12, 10) is close on the grid but far by road
+    service = DispatchService()
+    service.set_road_map(RoadMap(30, 30, blocked=[(11, y) for y in range(1, 30)]).to_dict())
+    busy = waiting_ride(service, "busy", Point(10, 10), Point(10, 10))
+    service.add_driver("d0", Point(10, 10))
+    assert busy.assigned_driver_id == "d0"
+    walled = waiting_ride(service, "walled", Point(12, 10))
+    around = waiting_ride(service, "around", Point(10, 16))
+    while busy.status != RideStatus.COMPLETED:
+        service.tick()
+    assert (around.status, around.assigned_driver_id) == (RideStatus.ASSIGNED, "d0")
+    assert walled.status == RideStatus.WAITING
@@ -0,0 +1,82 @@
+"""A service rebuilt from its snapshot and event log equals the one that wrote them."""
+import logging
+import threading
+
+import pytest
+
+from app.models.entities import Point
+from app.services.dispatch import DispatchService
+from app.services.persistence import PersistentStore
+
+
+@pytest.mark.parametrize("snapshot_every", [50, 10 ** 9])
+def test_recovery_rebuilds_the_same_state(tmp_path, scenario, service_state, snapshot_every):
+    commands = scenario(snapshot_every)
+    store = PersistentStore(tmp_path, snapshot_every=snapshot_every, fsync=False)
+    live = store.open(DispatchService)
+    commands.add_drivers(live, 40)
+    commands.run_commands(live, 400)
+    store.close()
+
+    store = PersistentStore(tmp_path, snapshot_every=snapshot_every, fsync=False)
+    recovered = store.open(DispatchService)
+    assert (store.snapshot_seq > 0) == (snapshot_every == 50)
+    assert store.replay_failures == 0
+    assert service_state(recovered) == service_state(live)
+    assert not recovered.check_consistency()
+
+    # The recovered service keeps journaling, and recovers again
+    commands.run_commands(recovered, 200, first=400)
+    store.close()
+    store = PersistentStore(tmp_path, snapshot_every=snapshot_every, fsync=False)
+    assert service_state(store.open(DispatchService)) == service_state(recovered)
+    store.close()
+
+
+def test_commands_that_fail_on_replay_are_logged_and_counted(tmp_path, caplog):
+    store = PersistentStore(tmp_path, fsync=False)
+    service = store.open(DispatchService)
+    service.add_driver("d0", Point(1, 1))
+    with pytest.raises(KeyError):
+        service.remove_driver("missing")
+    service.add_driver("d1", Point(2, 2))
+    store.close()
+
+    store = PersistentStore(tmp_path, fsync=False)
+    with caplog.at_level(logging.WARNING, logger="app.services.persistence"):
+        service = store.open(DispatchService)
+    assert store.replay_failures == store.recovery["replay_failures"] == 1
+    assert store.recovery["replayed"] == 3
+    assert "remove_driver" in caplog.text
+    assert sorted(service.fleet.rows) == ["d0", "d1"]
+    store.close()
+
+
+def test_snapshots_are_written_off_the_command_thread(tmp_path, monkeypatch, scenario, service_state):
+    from app.services import persistence
+
+    release = threading.Event()
+    write_snapshot = persistence.write_snapshot
+
+    def slow_write(captured, directory, seq):
+        assert release.wait(5)
+        return write_snapshot(captured, directory, seq)
+
+    monkeypatch.setattr(persistence, "write_snapshot", slow_write)
+    commands = scenario(3)
+    store = PersistentStore(tmp_path, snapshot_every=30, fsync=False)
+    live = store.open(DispatchService)
+    commands.add_drivers(live, 20)
+    commands.run_commands(live, 100)
+
+    # Commands kept running while the first snapshot was held up
+    first = store.captured_seq
+    assert 30 <= first < store.log.next_seq - 30 and store.snapshot_seq == 0
+    release.set()
+    store.close()
+    assert store.snapshot_seq == first
+
+    store = PersistentStore(tmp_path, snapshot_every=30, fsync=False)
+    assert service_state(store.open(DispatchService)) == service_state(live)
+    assert store.recovery["snapshot_seq"] == first
+    store.close()
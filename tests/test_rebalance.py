@@ -0,0 +1,88 @@
+"""The demand heatmap, and rebalancing idle drivers towards the cells it shows short of them."""
+import pytest
+
+from app.models.entities import Point, RideEntity
+from app.models.models import DriverStatus, RideStatus
+from app.services.demand import DemandHeatmap
+from app.services.dispatch import DispatchService
+
+HOT = Point(45, 45)  # center of demand cell (4, 4)
+
+
+def test_heatmap_rates_decay_and_leave_the_window():
+    demand = DemandHeatmap()
+    weights = sum(0.7 ** age for age in range(6))
+    for _ in range(10):
+        demand.record(5, 5, 0)
+    demand.record(95, 15, 5)
+    assert demand.rates(0) == {(0, 0): pytest.approx(10 / (weights * 10)), (9, 1): pytest.approx(1 / (weights * 10))}
+    assert demand.rates(10)[(0, 0)] == pytest.approx(10 * 0.7 / (weights * 10))
+    assert demand.hottest(demand.rates(10), 1) == [(0, 0)]
+    assert demand.rates(60) == {} and not demand.tiles
+    assert demand.cell_of(-3, 250) == (0, 9)
+
+
+def hot_spot(**settings):
+    """
+    A service with demand only at HOT. Idle drivers i0..i5 wait one cell
+    south, 15 to 20 units away; driver b is on a trip through HOT, driver o
+    is offline among the idle ones and driver far is out of reach.
+    """
+    service = DispatchService()
+    service.configure(rebalance_every=1, **settings)
+    service.add_driver("b", Point(44, 44))
+    service.add_ride_request(RideEntity("trip", "u_trip", Point(45, 44), Point(95, 95), RideStatus.WAITING))
+    service.submit_ride("trip")
+    service.add_drivers([f"i{n}" for n in range(6)], [Point(40 + n, 30) for n in range(6)])
+    service.add_driver("o", Point(42, 31))
+    service.set_driver_status("o", DriverStatus.OFFLINE)
+    service.add_driver("far", Point(5, 95))
+    for n in range(20):
+        service.add_ride_request(RideEntity(f"r{n}", f"u{n}", HOT, Point(0, 0), RideStatus.WAITING))
+    return service
+
+
+def location(service, driver_id):
+    return service.fleet.location_of(service.fleet.rows[driver_id])
+
+
+def to_hot(service, driver_id):
+    x, y = location(service, driver_id)
+    return abs(x - HOT.x) + abs(y - HOT.y)
+
+
+def test_idle_drivers_move_to_the_hot_cell_and_busy_ones_never_do():
+    service = hot_spot()
+    idle = {f"i{n}": service.fleet.rows[f"i{n}"] for n in range(6)}
+    service.tick()
+    assert service.repositioning == {row: HOT for row in idle.values()}
+
+    for _ in range(25):
+        distances = {driver_id: to_hot(service, driver_id) for driver_id in idle}
+        service.tick()
+        for driver_id, row in idle.items():
+            if row in service.repositioning:
+                assert to_hot(service, driver_id) == distances[driver_id] - 1
+        for driver_id in ("b", "o", "far"):
+            assert service.fleet.rows[driver_id] not in service.repositioning
+        assert service.check_consistency() == []
+
+    assert all(location(service, driver_id) == (45, 45) for driver_id in idle)
+    assert not service.repositioning
+    assert service.driver_status("b") == DriverStatus.ON_TRIP
+    assert location(service, "o") == (42, 31) and location(service, "far") == (5, 95)
+
+
+def test_each_step_sends_the_nearest_few():
+    service = hot_spot(rebalance_max_drivers=2)
+    service.tick()
+    assert sorted(service.fleet.ids[row] for row in service.repositioning) == ["i4", "i5"]
+
+
+def test_repositioning_drivers_can_still_be_dispatched():
+    service = hot_spot()
+    service.tick()
+    service.submit_ride("r0")
+    driver_id, _ = service.active_trips["r0"]
+    assert driver_id.startswith("i") and service.fleet.rows[driver_id] not in service.repositioning
+    assert service.check_consistency() == []
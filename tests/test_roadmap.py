@@ -0,0 +1,109 @@
+"""Distance fields and routes on a road map agree with Dijkstra's algorithm."""
+import heapq
+import random
+
+import pytest
+
+from app.models.entities import Point, RideEntity
+from app.models.models import RideStatus
+from app.services.dispatch import DispatchService
+from app.services.roadmap import CLOSED, DIRECTIONS, UNREACHABLE, RoadMap
+
+
+def random_map(rng, width, height):
+    cells = [(x, y) for x in range(width) for y in range(height)]
+    edges = [
+        (x, y, x + dx, y + dy) for x, y in cells for dx, dy in DIRECTIONS
+        if 0 <= x + dx < width and 0 <= y + dy < height
+    ]
+    return RoadMap(
+        width, height,
+        blocked=rng.sample(cells, len(cells) // 8),
+        one_way=rng.sample(edges, len(edges) // 20),
+        costs=[(*edge, rng.randrange(1, 6)) for edge in rng.sample(edges, len(edges) // 5)],
+    )
+
+
+def dijkstra(road_map, tx, ty):
+    """Cost from every cell to (tx, ty), following edges backwards from the destination."""
+    dist = {(tx, ty): 0}
+    heap = [(0, tx, ty)]
+    while heap:
+        d, x, y = heapq.heappop(heap)
+        if d > dist[x, y]:
+            continue
+        for direction, (dx, dy) in enumerate(DIRECTIONS):
+            sx, sy = x - dx, y - dy  # moving from (sx, sy) in this direction reaches (x, y)
+            if not road_map.contains(sx, sy):
+                continue
+            cost = int(road_map.edge_cost[direction, sx, sy])
+            if cost >= CLOSED:
+                continue
+            if d + cost < dist.get((sx, sy), UNREACHABLE):
+                dist[sx, sy] = d + cost
+                heapq.heappush(heap, (d + cost, sx, sy))
+    return dist
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_distance_fields_and_routes_match_dijkstra(seed):
+    rng = random.Random(seed)
+    width, height = rng.randrange(5, 25), rng.randrange(5, 25)
+    road_map = random_map(rng, width, height)
+    for _ in range(5):
+        tx, ty = rng.randrange(width), rng.randrange(height)
+        expected = dijkstra(road_map, tx, ty)
+        for x in range(width):
+            for y in range(height):
+                cost = expected.get((x, y), UNREACHABLE)
+                assert road_map.distance(x, y, tx, ty) == cost
+                route = road_map.route(x, y, tx, ty)
+                if cost == UNREACHABLE:
+                    assert route is None
+                    continue
+                # A route is a walk over open edges whose ticks add up to the distance
+                assert int(route[:, 2].sum()) == cost
+                cx, cy = x, y
+                for nx, ny, ticks in route.tolist():
+                    direction = DIRECTIONS.index((nx - cx, ny - cy))
+                    assert road_map.edge_cost[direction, cx, cy] == ticks
+                    cx, cy = nx, ny
+                assert (cx, cy) == (tx, ty)
+
+
+def test_open_map_is_the_open_grid():
+    road_map = RoadMap(20, 20)
+    rng = random.Random(0)
+    for _ in range(50):
+        x, y, tx, ty = (rng.randrange(20) for _ in range(4))
+        assert road_map.distance(x, y, tx, ty) == abs(x - tx) + abs(y - ty)
+        if (x, y) != (tx, ty):
+            expected = (x + (1 if tx > x else -1), y) if x != tx else (x, y + (1 if ty > y else -1))
+            assert road_map.step(x, y, tx, ty) == expected
+    assert road_map.distance(30, 5, 0, 0) == 35  # off the map: Manhattan
+
+
+def test_trips_take_the_road_distance():
+    rng = random.Random(3)
+    road_map = random_map(rng, 30, 30)
+    service = DispatchService()
+    service.set_road_map(road_map.to_dict())
+    open_cells = [(x, y) for x in range(30) for y in range(30) if (x, y) not in set(road_map.blocked)]
+    (dx, dy), (px, py), (ex, ey) = rng.sample(open_cells, 3)
+    while road_map.distance(dx, dy, px, py) == UNREACHABLE or road_map.distance(px, py, ex, ey) == UNREACHABLE:
+        (dx, dy), (px, py), (ex, ey) = rng.sample(open_cells, 3)
+
+    service.add_driver("d0", Point(dx, dy))
+    ride = RideEntity("r0", "u0", Point(px, py), Point(ex, ey), RideStatus.WAITING)
+    service.add_ride_request(ride)
+    service.assign_ride("r0")
+    assert service.calculate_eta("d0", ride.pickup) == road_map.distance(dx, dy, px, py)
+
+    arrivals = {}
+    for tick in range(1, 1000):
+        for event in service.tick():
+            arrivals[event["type"]] = tick
+        if "dropoff" in arrivals:
+            break
+    to_pickup = road_map.distance(dx, dy, px, py)
+    assert arrivals == {"pickup": to_pickup, "dropoff": to_pickup + road_map.distance(px, py, ex, ey)}
@@ -0,0 +1,133 @@
+"""Sharded dispatch agrees with a single DispatchService and keeps its directories consistent."""
+import pytest
+
+from app.models.entities import Point, RideEntity
+from app.models.models import DriverStatus, RideStatus
+from app.services.dispatch import DispatchService
+from app.services.sharding import ShardedDispatcher
+
+
+@pytest.mark.parametrize("shards", [1, 2, 4])
+def test_matches_single_service(scenario, shards):
+    # Every pick, pending match and tick event must be the single service's,
+    # whichever region the drivers and rides are in
+    points = scenario(shards)
+    rng = points.rng
+    service = DispatchService()
+    with ShardedDispatcher(shards) as dispatcher:
+        locations = [points.point() for _ in range(30)]
+        driver_ids = dispatcher.add_drivers(locations)
+        service.add_drivers(driver_ids, locations)
+        rider_ids = dispatcher.add_riders([Point(0, 0)] * 200)
+
+        for step in range(600):
+            op = rng.random()
+            if op < 0.3:
+                idle = [r for r in rider_ids if dispatcher.active_request_for(r) is None]
+                pickup, dropoff = points.point(), points.point()
+                [(ride_id, driver_id)] = dispatcher.request_rides([(rng.choice(idle), pickup, dropoff)])
+                service.add_ride_request(RideEntity(ride_id, ride_id, pickup, dropoff, RideStatus.WAITING))
+                service.assign_ride(ride_id)
+                assert service.get_ride(ride_id).assigned_driver_id == driver_id
+            elif op < 0.4 and service.active_trips:
+                ride_id = rng.choice(list(service.active_trips))
+                driver_id, step_name = service.active_trips[ride_id]
+                assert dispatcher.trip(ride_id) == (driver_id, step_name)
+                if step_name == "to_pickup":
+                    dispatcher.reject_ride(ride_id, driver_id)
+                    service.reject_ride(service.ride_requests[ride_id], driver_id)
+                else:
+                    dispatcher.cancel_ride(ride_id)
+                    service.cancel_ride(service.ride_requests[ride_id])
+            elif op < 0.45:
+                driver_id = rng.choice(driver_ids)
+                if service.driver_status(driver_id) != DriverStatus.ON_TRIP:
+                    status = rng.choice([DriverStatus.AVAILABLE, DriverStatus.OFFLINE])
+                    dispatcher.set_driver_status(driver_id, status)
+                    service.set_driver_status(driver_id, status)
+            else:
+                assert dispatcher.tick() == service.tick()
+
+        rides, more = dispatcher.list_rides(limit=10 ** 6)
+        assert not more
+        assert [(r["id"], r["status"], r["assigned_driver_id"]) for r in rides] == [
+            (ride.id, ride.status.value, ride.assigned_driver_id) for ride in service.list_rides(limit=10 ** 6)[0]
+        ]
+        assert {d["id"]: (d["location"], d["status"], d["assigned_rides"]) for d in dispatcher.drivers()} == {
+            d["id"]: (d["location"], d["status"], d["assigned_rides"]) for d in service.fleet.to_dicts(service.fleet.live_rows())
+        }
+        assert not dispatcher.check_consistency()
+        if shards > 1:
+            assert dispatcher.handoffs and dispatcher.escalations
+
+
+def test_cross_region_search_finds_the_nearest_driver():
+    # The only driver in the pickup's region is farther than the border
+    with ShardedDispatcher(2) as dispatcher:
+        far, near = dispatcher.add_drivers([Point(0, 50), Point(55, 50)])
+        [rider] = dispatcher.add_riders([Point(45, 50)])
+        [(ride_id, driver_id)] = dispatcher.request_rides([(rider, Point(45, 50), Point(90, 90))])
+        assert driver_id == near
+        assert dispatcher.trip(ride_id) == (near, "to_pickup")
+        dispatcher.tick_many(20)
+        assert dispatcher.driver(near)["location"]["x"] > 50  # handed off to the next region and back
+        assert not dispatcher.check_consistency()
+
+
+def test_random_operations_stay_consistent(scenario):
+    points = scenario(1)
+    rng = points.rng
+    with ShardedDispatcher(4, max_wait_ticks=15) as dispatcher:
+        drivers = dispatcher.add_drivers([points.point() for _ in range(20)])
+        riders = dispatcher.add_riders([points.point() for _ in range(60)])
+        for step in range(500):
+            op = rng.random()
+            if op < 0.3:
+                dispatcher.request_rides(
+                    [(rng.choice(riders), points.point(), points.point()) for _ in range(rng.randrange(1, 4))]
+                )
+            elif op < 0.45:
+                rides, _ = dispatcher.list_rides(status=RideStatus.WAITING, limit=1000)
+                if rides:
+                    ride_id = rng.choice(rides)["id"]
+                    driver_id = rng.choice(drivers)
+                    if rng.random() < 0.5:
+                        dispatcher.reject_ride(ride_id, driver_id)
+                    elif dispatcher.driver(driver_id)["status"] == "available":
+                        dispatcher.accept_ride(ride_id, driver_id)
+                    else:
+                        dispatcher.cancel_ride(ride_id)
+            elif op < 0.55:
+                rides, _ = dispatcher.list_rides(status=RideStatus.ASSIGNED, limit=1000)
+                if rides:
+                    ride_id = rng.choice(rides)["id"]
+                    driver_id, step_name = dispatcher.trip(ride_id)
+                    if step_name == "to_pickup":
+                        dispatcher.reject_ride(ride_id, driver_id)
+                    else:
+                        dispatcher.cancel_ride(ride_id)
+            elif op < 0.62:
+                driver_id = rng.choice(drivers)
+                if dispatcher.driver(driver_id)["status"] != "on_trip":
+                    dispatcher.set_driver_status(driver_id, rng.choice([DriverStatus.AVAILABLE, DriverStatus.OFFLINE]))
+            elif op < 0.65:
+                driver_id = rng.choice(drivers)
+                if dispatcher.driver(driver_id)["status"] != "on_trip":
+                    dispatcher.remove_driver(driver_id)
+                    drivers.remove(driver_id)
+            elif op < 0.68:
+                drivers += dispatcher.add_drivers([points.point()])
+            else:
+                dispatcher.tick()
+            assert not dispatcher.check_consistency(), step
+
+        # Merged pages cover every ride once, in ID order
+        seen, cursor = [], None
+        while True:
+            page, cursor = dispatcher.list_rides(after=cursor, limit=7)
+            seen += [ride["id"] for ride in page]
+            if cursor is None:
+                break
+        assert seen == sorted(set(seen))
+        assert len(seen) == dispatcher.ride_count
+        assert sorted(d["id"] for d in dispatcher.drivers()) == sorted(drivers)
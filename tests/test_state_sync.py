@@ -0,0 +1,96 @@
+"""A client that applies /state deltas ends up with the full /state, and list ETags revalidate."""
+import pytest
+
+KINDS = ("drivers", "riders", "ride_requests", "active_trips")
+
+
+def key_of(kind, entity):
+    return entity["ride_id"] if kind == "active_trips" else entity["id"]
+
+
+def apply_delta(state, delta):
+    """What frontend/app.js does with a delta."""
+    assert not delta["full"] and delta["since"] == state["version"]
+    for kind in KINDS:
+        entities = {key_of(kind, entity): entity for entity in state[kind]}
+        entities.update((key_of(kind, entity), entity) for entity in delta[kind])
+        for entity_id in delta["deleted"].get(kind, ()):
+            entities.pop(entity_id, None)
+        state[kind] = list(entities.values())
+    state["version"] = delta["version"]
+    state["archived_rides"] = delta["archived_rides"]
+
+
+def comparable(state):
+    return {
+        "version": state["version"],
+        "archived_rides": state["archived_rides"],
+        **{kind: sorted((key_of(kind, entity), entity) for entity in state[kind]) for kind in KINDS},
+    }
+
+
+def populate(api, rng, drivers, riders):
+    point = lambda: {"x": rng.randrange(30), "y": rng.randrange(30)}
+    driver_ids = [api.post("/api/drivers/", json=point()).json()["id"] for _ in range(drivers)]
+    rider_ids = [api.post("/api/riders/", json=point()).json()["id"] for _ in range(riders)]
+    return point, driver_ids, rider_ids
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_deltas_replay_to_the_full_state(api, scenario, seed):
+    rng = scenario(seed).rng
+    point, driver_ids, rider_ids = populate(api, rng, 12, 20)
+    snapshots = [api.get("/api/state").json()]
+    for step in range(150):
+        op = rng.random()
+        if op < 0.35:
+            api.post("/api/rides/request", json={"rider_id": rng.choice(rider_ids), "pickup": point(), "dropoff": point()})
+        elif op < 0.45:
+            rides = api.get("/api/rides/", params={"status": "assigned"}).json()
+            if rides:
+                api.put(f"/api/rides/{rng.choice(rides)['id']}/cancel")
+        elif op < 0.5 and driver_ids:
+            driver_id = driver_ids.pop(rng.randrange(len(driver_ids)))
+            if api.delete(f"/api/drivers/{driver_id}").status_code != 200:
+                driver_ids.append(driver_id)  # on a trip
+        elif op < 0.55:
+            rider_id = rng.choice(rider_ids)
+            if api.delete(f"/api/riders/{rider_id}").status_code == 200:
+                rider_ids.remove(rider_id)
+        elif op < 0.6:
+            driver_ids.append(api.post("/api/drivers/", json=point()).json()["id"])
+        else:
+            api.post("/api/tick")
+        if step % 15 == 14:
+            snapshots.append(api.get("/api/state").json())
+
+    full = api.get("/api/state").json()
+    assert full["full"] and full["archived_rides"] > 0
+    for old in snapshots:
+        delta = api.get("/api/state", params={"since": old["version"]}).json()
+        apply_delta(old, delta)
+        assert comparable(old) == comparable(full)
+
+
+def test_too_old_a_version_gets_the_full_state(api, api_service, scenario):
+    api_service.configure(changelog_limit=5)
+    populate(api, scenario(0).rng, 0, 10)
+    state = api.get("/api/state", params={"since": 1}).json()
+    assert state["full"] and len(state["riders"]) == 10
+
+
+@pytest.mark.parametrize("path", ["/api/drivers/", "/api/riders/", "/api/rides/"])
+def test_lists_answer_304_while_unchanged(api, scenario, path):
+    populate(api, scenario(0).rng, 3, 3)
+    first = api.get(path)
+    etag = first.headers["ETag"]
+    again = api.get(path, headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["ETag"] == etag and not again.content
+
+    # Any change to the collection moves the ETag on
+    rider_id = api.get("/api/riders/").json()[0]["id"]
+    api.post("/api/rides/request", json={"rider_id": rider_id, "pickup": {"x": 1, "y": 1}, "dropoff": {"x": 2, "y": 2}})
+    api.post("/api/drivers/", json={"x": 0, "y": 0})
+    api.post("/api/riders/", json={"x": 0, "y": 0})
+    changed = api.get(path, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
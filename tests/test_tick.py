@@ -0,0 +1,72 @@
+"""The array tick engine moves trips exactly like stepping each driver in turn."""
+import pytest
+
+from app.models.models import DriverStatus
+
+
+def reference_tick(drivers, rides, trips):
+    """One tick of per-driver stepping: x first, then y, one unit per tick."""
+    events = []
+    for ride_id, (driver_id, step) in list(trips.items()):
+        driver = drivers[driver_id]
+        target = rides[ride_id][0 if step == "to_pickup" else 1]
+        if driver[0] != target[0]:
+            driver[0] += 1 if target[0] > driver[0] else -1
+        elif driver[1] != target[1]:
+            driver[1] += 1 if target[1] > driver[1] else -1
+        if (driver[0], driver[1]) != target:
+            continue
+        events.append({
+            "type": "pickup" if step == "to_pickup" else "dropoff",
+            "ride_id": ride_id,
+            "driver_id": driver_id,
+            "location": {"x": driver[0], "y": driver[1]},
+        })
+        if step == "to_pickup":
+            trips[ride_id] = (driver_id, "to_dropoff")
+        else:
+            driver[2] = DriverStatus.AVAILABLE
+            del trips[ride_id]
+    return events
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_tick_matches_per_driver_stepping(scenario, seed):
+    service = scenario(seed, grid=50).busy_service()
+    assert not service.pending
+    fleet = service.fleet
+    drivers = {
+        driver_id: [*fleet.location_of(row), fleet.status_of(row)] for driver_id, row in fleet.rows.items()
+    }
+    rides = {
+        ride_id: ((ride.pickup.x, ride.pickup.y), (ride.dropoff.x, ride.dropoff.y))
+        for ride_id, ride in service.ride_requests.items()
+    }
+    trips = dict(service.active_trips)
+    while trips:
+        assert service.tick() == reference_tick(drivers, rides, trips)
+        assert service.active_trips == trips
+        assert {
+            driver_id: [*fleet.location_of(row), fleet.status_of(row)] for driver_id, row in fleet.rows.items()
+        } == drivers
+    assert not service.check_consistency()
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_tick_many_matches_single_ticks(scenario, service_state, seed):
+    single, batched, summarized = (scenario(seed, grid=50).busy_service() for _ in range(3))
+    events = [single.tick() for _ in range(60)]
+    assert batched.tick_many(60) == events
+    summary = summarized.tick_many(60, summary=True)
+    assert service_state(single) == service_state(batched) == service_state(summarized)
+
+    flat = [event["type"] for tick in events for event in tick]
+    assert summary == {
+        "ticks": 60,
+        "current_tick": single.current_tick,
+        "pickups": flat.count("pickup"),
+        "dropoffs": flat.count("dropoff"),
+        "active_trips": len(single.active_trips),
+    }
+    for service in (single, batched, summarized):
+        assert not service.check_consistency()
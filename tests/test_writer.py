@@ -0,0 +1,90 @@
+"""SingleWriter serializes commands from many threads and pushes back once its queue is full."""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services.writer import SingleWriter, SnapshotCache, WriterBusy
+
+
+@pytest.fixture
+def writer():
+    writer = SingleWriter(max_pending=8, name="test-writer")
+    yield writer
+    writer.stop()
+
+
+def test_commands_from_many_threads_never_interleave(writer):
+    state = {"count": 0, "log": []}
+
+    def increment(worker):
+        # A read-modify-write with a thread switch in the middle: only safe if nothing runs alongside it
+        count = state["count"]
+        time.sleep(0)
+        state["count"] = count + 1
+        state["log"].append((worker, threading.current_thread().name))
+
+    def client(worker):
+        for _ in range(50):
+            while True:
+                try:
+                    writer.call(increment, worker)
+                    break
+                except WriterBusy:
+                    time.sleep(0.001)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(client, range(8)))
+    assert state["count"] == 400
+    assert {thread for _, thread in state["log"]} == {"test-writer"}
+    assert sorted(worker for worker, _ in state["log"]) == sorted(list(range(8)) * 50)
+
+
+def test_a_full_queue_raises_writer_busy(writer):
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait()
+
+    running = writer.submit(block)
+    started.wait()
+    queued = [writer.submit(lambda n=n: n) for n in range(writer.max_pending)]
+    assert writer.pending == writer.max_pending
+    with pytest.raises(WriterBusy):
+        writer.submit(lambda: None)
+    assert writer.rejected == 1
+
+    release.set()
+    running.result()
+    assert [future.result() for future in queued] == list(range(writer.max_pending))
+    assert writer.call(lambda: "after") == "after"
+
+
+def test_nested_calls_run_inline_and_errors_reach_the_caller(writer):
+    assert writer.call(lambda: writer.call(lambda: 1) + 1) == 2
+    with pytest.raises(KeyError):
+        writer.call({}.__getitem__, "missing")
+    assert writer.call(lambda: "still running") == "still running"
+
+
+def test_snapshot_views_are_built_once_per_version(writer):
+    state = {"version": 0, "builds": 0}
+    cache = SnapshotCache(writer)
+
+    def build():
+        state["builds"] += 1
+        return (state["version"],)
+
+    def read(_):
+        return cache.get("view", lambda: state["version"], build)
+
+    with ThreadPoolExecutor(8) as pool:
+        assert set(pool.map(read, range(40))) == {(0, (0,))}
+    assert state["builds"] == 1
+
+    writer.call(state.__setitem__, "version", 1)
+    with ThreadPoolExecutor(8) as pool:
+        assert set(pool.map(read, range(40))) == {(1, (1,))}
+    assert state["builds"] == 2